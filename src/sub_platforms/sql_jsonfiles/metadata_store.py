@@ -0,0 +1,334 @@
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Partitioned storage of the files server.
+
+Metadata of a database (the json of VidexDBTaskStats) is stored under `{root}/metadata_{ip_port}_{db}/`:
+- `{section}/{db}/{table}.json.gz`: one gzip object per table of the sectioned keys (meta_dict, stats_dict)
+- `common.json.gz`: the other keys (task_id, db_config, sample_file_info ...)
+- `manifest.json`: the objects, their sizes and content hashes
+
+Objects are written to a temp file and renamed, so readers never see a partial object. Writers of a database
+are serialized by a file lock (plus a thread lock within the process), readers take the lock shared for a
+consistent view of the manifest. Saving a table costs O(table size) plus the (small) manifest.
+Saves upsert tables, a full upload (replace_tables) also deletes the stored tables it does not hold.
+
+Reads can select tables and sections, and decoded objects are cached in memory until the file changes (mtime).
+"""
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+from cachetools import LRUCache
+
+MANIFEST_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+COMMON_OBJECT = 'common.json.gz'
+LOCK_FILE = '.lock'
+# the legacy file is renamed with this suffix once migrated
+LEGACY_MIGRATED_SUFFIX = '.migrated'
+# keys of the metadata json that are {db: {table: object}}
+SECTION_KEYS = ['meta_dict', 'stats_dict']
+
+# sections that a read can select. meta is meta_dict, the others are parts of stats_dict
+SECTION_META = 'meta'
+SECTION_STATS = 'stats'
+SECTION_HIST = 'hist'
+SECTION_NDV = 'ndv'
+SECTION_MULCOL = 'mulcol'
+ALL_SECTIONS = [SECTION_META, SECTION_STATS, SECTION_HIST, SECTION_NDV, SECTION_MULCOL]
+# extra_info key of multi-column ndvs, i.e. EXTRA_INFO_KEY_mulcol of videx_metadata
+_EXTRA_INFO_KEY_MULCOL = 'mulcol'
+_STATS_IDENTITY_KEYS = ['db_name', 'table_name']
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def _safe_name(name: str) -> str:
+    """file name of a db, table or section. Quoting keeps names like '../x' inside the store directory."""
+    name = quote(name, safe='')
+    return name.replace('.', '%2E') if name in ('.', '..') else name
+
+
+def _project_stats(stats: dict, sections: set) -> dict:
+    """the selected sections of stats_dict[db][table], i.e. the json of TableStatisticsInfo"""
+    if sections.issuperset([SECTION_STATS, SECTION_HIST, SECTION_NDV, SECTION_MULCOL]):
+        return stats
+    res = {k: stats[k] for k in _STATS_IDENTITY_KEYS if k in stats}
+    extra_info = stats.get('extra_info') or {}
+    if SECTION_STATS in sections:
+        res.update({k: v for k, v in stats.items() if k not in ('histogram_dict', 'ndv_dict', 'extra_info')})
+        res['extra_info'] = {k: v for k, v in extra_info.items() if k != _EXTRA_INFO_KEY_MULCOL}
+    if SECTION_HIST in sections:
+        res['histogram_dict'] = stats.get('histogram_dict') or {}
+    if SECTION_NDV in sections:
+        res['ndv_dict'] = stats.get('ndv_dict') or {}
+    if SECTION_MULCOL in sections and _EXTRA_INFO_KEY_MULCOL in extra_info:
+        res['extra_info'] = {**res.get('extra_info', {}), _EXTRA_INFO_KEY_MULCOL: extra_info[_EXTRA_INFO_KEY_MULCOL]}
+    return res
+
+
+def _atomic_write(path: str, data: bytes):
+    dir_name = os.path.dirname(path)
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class MetadataStore:
+    """
+    Args:
+        root: the directory of the stored databases
+        cache_bytes: capacity of the cache of decoded objects, measured by the (compressed) file sizes
+    """
+
+    def __init__(self, root: str = '.', cache_bytes: int = DEFAULT_CACHE_BYTES):
+        self.root = root
+        self._thread_locks: Dict[str, threading.RLock] = {}
+        self._thread_locks_lock = threading.Lock()
+        # path -> ((mtime_ns, size, inode), size, decoded object). Cached objects are shared, never modify them.
+        self._cache = LRUCache(maxsize=cache_bytes, getsizeof=lambda item: item[1])
+        self._cache_lock = threading.Lock()
+
+    def db_dir(self, files_server_ip_port: str, db_name: str) -> str:
+        return os.path.join(self.root, f"metadata_{_safe_name(files_server_ip_port)}_{_safe_name(db_name)}")
+
+    def legacy_file(self, files_server_ip_port: str, db_name: str) -> str:
+        """the single json file written by earlier versions"""
+        return os.path.join(self.root, f"metadata_{files_server_ip_port}_{db_name}.json")
+
+    def _thread_lock(self, db_dir: str) -> threading.RLock:
+        with self._thread_locks_lock:
+            return self._thread_locks.setdefault(db_dir, threading.RLock())
+
+    @contextmanager
+    def _locked(self, db_dir: str, exclusive: bool):
+        os.makedirs(db_dir, exist_ok=True)
+        with self._thread_lock(db_dir):
+            with open(os.path.join(db_dir, LOCK_FILE), 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _cached_load(self, path: str, loader):
+        st = os.stat(path)
+        version = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._cache_lock:
+            cached = self._cache.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[2]
+        value = loader(path)
+        with self._cache_lock:
+            try:
+                self._cache[path] = (version, st.st_size, value)
+            except ValueError:
+                # larger than the whole cache
+                pass
+        return value
+
+    @staticmethod
+    def _load_json(path: str):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _load_gzip_json(path: str):
+        with gzip.open(path, 'rt') as f:
+            return json.load(f)
+
+    def _read_manifest(self, db_dir: str) -> dict:
+        path = os.path.join(db_dir, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {'format_version': MANIFEST_FORMAT_VERSION, 'common': None, 'sections': {}}
+        return self._cached_load(path, self._load_json)
+
+    @staticmethod
+    def _write_object(db_dir: str, rel_path: str, value) -> dict:
+        raw = json.dumps(value).encode('utf-8')
+        # mtime=0: the gzip header would embed the current time, and the same content must give the same object
+        data = gzip.compress(raw, mtime=0)
+        _atomic_write(os.path.join(db_dir, rel_path), data)
+        # hash of the json, not of the compressed bytes, so etags do not depend on the compression either
+        return {'file': rel_path, 'size': len(data), 'mtime': time.time(), 'sha256': hashlib.sha256(raw).hexdigest()}
+
+    def _read_object(self, db_dir: str, rel_path: str):
+        return self._cached_load(os.path.join(db_dir, rel_path), self._load_gzip_json)
+
+    def exists(self, files_server_ip_port: str, db_name: str) -> bool:
+        return (os.path.exists(os.path.join(self.db_dir(files_server_ip_port, db_name), MANIFEST_FILE))
+                or os.path.exists(self.legacy_file(files_server_ip_port, db_name)))
+
+    def _migrate_legacy(self, files_server_ip_port: str, db_name: str):
+        db_dir = self.db_dir(files_server_ip_port, db_name)
+        legacy_file = self.legacy_file(files_server_ip_port, db_name)
+
+        def migrated() -> bool:
+            return os.path.exists(os.path.join(db_dir, MANIFEST_FILE)) or not os.path.exists(legacy_file)
+
+        if migrated():
+            return
+        with self._locked(db_dir, exclusive=True):
+            # checked again under the lock: another writer may have migrated and saved newer tables meanwhile
+            if migrated():
+                return
+            logging.info(f"migrate {legacy_file} to {db_dir}")
+            self._save_locked(db_dir, self._parse_metadata(self._load_json(legacy_file)))
+            os.replace(legacy_file, legacy_file + LEGACY_MIGRATED_SUFFIX)
+
+    def save(self, files_server_ip_port: str, db_name: str, metadata, replace_tables: bool = False) -> List[str]:
+        """
+        upsert metadata. Tables of the section keys are replaced one by one, other keys update the common object.
+
+        Args:
+            metadata: json dict of VidexDBTaskStats, or its json string
+            replace_tables: metadata holds all the tables, e.g. a full upload of the database. Stored tables that
+                are not in it (dropped from the source database) are deleted.
+
+        Returns:
+            written objects
+        """
+        self._migrate_legacy(files_server_ip_port, db_name)
+        return self._save(self.db_dir(files_server_ip_port, db_name), metadata, replace_tables)
+
+    @staticmethod
+    def _parse_metadata(metadata) -> dict:
+        if isinstance(metadata, (str, bytes)):
+            metadata = json.loads(metadata)
+        if not isinstance(metadata, dict):
+            raise ValueError(f"metadata must be a json object, got {type(metadata).__name__}")
+        return metadata
+
+    def _save(self, db_dir: str, metadata, replace_tables: bool = False) -> List[str]:
+        metadata = self._parse_metadata(metadata)
+        with self._locked(db_dir, exclusive=True):
+            return self._save_locked(db_dir, metadata, replace_tables)
+
+    def _save_locked(self, db_dir: str, metadata: dict, replace_tables: bool = False) -> List[str]:
+        """_save, the caller holds the exclusive lock of db_dir"""
+        written = []
+        # the cached manifest is shared, modify a copy
+        manifest = json.loads(json.dumps(self._read_manifest(db_dir)))
+        for section in SECTION_KEYS:
+            for db, tables in (metadata.get(section) or {}).items():
+                section_tables = manifest['sections'].setdefault(section, {}).setdefault(db, {})
+                for table, value in tables.items():
+                    rel_path = os.path.join(_safe_name(section), _safe_name(db), f"{_safe_name(table)}.json.gz")
+                    section_tables[table] = self._write_object(db_dir, rel_path, value)
+                    written.append(rel_path)
+        if replace_tables:
+            self._delete_absent_tables(db_dir, manifest, metadata)
+
+        common = {k: v for k, v in metadata.items() if k not in SECTION_KEYS}
+        if common or manifest['common'] is None:
+            if manifest['common'] is not None:
+                common = {**self._read_object(db_dir, COMMON_OBJECT), **common}
+            manifest['common'] = self._write_object(db_dir, COMMON_OBJECT, common)
+            written.append(COMMON_OBJECT)
+
+        _atomic_write(os.path.join(db_dir, MANIFEST_FILE), json.dumps(manifest).encode('utf-8'))
+        return written
+
+    @staticmethod
+    def _delete_absent_tables(db_dir: str, manifest: dict, metadata: dict):
+        """delete the tables of the manifest that are not in the sections of metadata"""
+        for section, section_dbs in manifest['sections'].items():
+            uploaded = metadata.get(section) or {}
+            for db in list(section_dbs.keys()):
+                for table in [t for t in section_dbs[db] if t not in uploaded.get(db, {})]:
+                    entry = section_dbs[db].pop(table)
+                    logging.info(f"delete {section}.{db}.{table} absent from the upload of {db_dir}")
+                    path = os.path.join(db_dir, entry['file'])
+                    if os.path.exists(path):
+                        os.remove(path)
+                if not section_dbs[db]:
+                    del section_dbs[db]
+
+    @staticmethod
+    def _select(manifest: dict, tables: Optional[Iterable[str]], sections: Optional[Iterable[str]]) \
+            -> Tuple[set, List[Tuple[str, str, str, dict]]]:
+        """selected sections and manifest entries: (section key, db, table, entry)"""
+        sections = set(sections or ALL_SECTIONS)
+        if unknown := sections.difference(ALL_SECTIONS):
+            raise ValueError(f"unknown sections {sorted(unknown)}, supported: {ALL_SECTIONS}")
+        wanted = {t.lower() for t in tables} if tables else None
+        section_keys = (['meta_dict'] if SECTION_META in sections else []) + \
+                       (['stats_dict'] if sections.difference([SECTION_META]) else [])
+        entries = []
+        for section_key in section_keys:
+            for db, db_tables in manifest['sections'].get(section_key, {}).items():
+                for table, entry in db_tables.items():
+                    if wanted is None or table.lower() in wanted:
+                        entries.append((section_key, db, table, entry))
+        return sections, entries
+
+    @staticmethod
+    def _etag(manifest: dict, sections: set, entries: List[Tuple[str, str, str, dict]]) -> str:
+        def digest(entry):
+            return entry.get('sha256') or f"{entry['mtime']}:{entry['size']}"
+
+        content = json.dumps({'sections': sorted(sections),
+                              'common': digest(manifest['common']) if manifest['common'] else None,
+                              'entries': sorted([k, db, t, digest(e)] for k, db, t, e in entries)})
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def etag(self, files_server_ip_port: str, db_name: str, tables: Optional[Iterable[str]] = None,
+             sections: Optional[Iterable[str]] = None) -> Optional[str]:
+        """content hash of a read, None if the database is not stored. Only the manifest is read."""
+        self._migrate_legacy(files_server_ip_port, db_name)
+        db_dir = self.db_dir(files_server_ip_port, db_name)
+        if not os.path.exists(os.path.join(db_dir, MANIFEST_FILE)):
+            return None
+        with self._locked(db_dir, exclusive=False):
+            manifest = self._read_manifest(db_dir)
+            return self._etag(manifest, *self._select(manifest, tables, sections))
+
+    def load(self, files_server_ip_port: str, db_name: str, tables: Optional[Iterable[str]] = None,
+             sections: Optional[Iterable[str]] = None) -> Optional[dict]:
+        """the json dict of VidexDBTaskStats, None if the database is not stored"""
+        return self.load_with_etag(files_server_ip_port, db_name, tables, sections)[0]
+
+    def load_with_etag(self, files_server_ip_port: str, db_name: str, tables: Optional[Iterable[str]] = None,
+                       sections: Optional[Iterable[str]] = None) -> Tuple[Optional[dict], Optional[str]]:
+        """
+        Args:
+            tables: only these tables (case-insensitive), None for all
+            sections: subset of ALL_SECTIONS, None for all
+
+        Returns:
+            the json dict of VidexDBTaskStats and its etag, (None, None) if the database is not stored
+        """
+        self._migrate_legacy(files_server_ip_port, db_name)
+        db_dir = self.db_dir(files_server_ip_port, db_name)
+        if not os.path.exists(os.path.join(db_dir, MANIFEST_FILE)):
+            return None, None
+        with self._locked(db_dir, exclusive=False):
+            manifest = self._read_manifest(db_dir)
+            sections, entries = self._select(manifest, tables, sections)
+            metadata = dict(self._read_object(db_dir, COMMON_OBJECT)) if manifest['common'] else {}
+            metadata.update({section_key: {} for section_key in SECTION_KEYS})
+            for section_key, db, table, entry in entries:
+                value = self._read_object(db_dir, entry['file'])
+                if section_key == 'stats_dict':
+                    value = _project_stats(value, sections)
+                metadata[section_key].setdefault(db, {})[table] = value
+            return metadata, self._etag(manifest, sections, entries)
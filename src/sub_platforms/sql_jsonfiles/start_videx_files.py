@@ -1,10 +1,13 @@
 import argparse
 
 from flask import Flask, request
+import gzip
 import json
-import os
+
+from sub_platforms.sql_jsonfiles.metadata_store import MetadataStore
 
 app = Flask(__name__)
+metadata_store = MetadataStore()
 
 
 @app.route('/save_metadata', methods=['POST'])
@@ -26,19 +29,9 @@ def save_metadata():
         if metadata is None:
             return "Invalid JSON data in request body", 400
 
-        # 使用参数拼接文件名
-        file_path = f"metadata_{files_server_ip_port}_{db_name}.json"
-
-        # 保存/更新元数据文件
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                existing_metadata = json.load(f)
-            existing_metadata.update(metadata)
-        else:
-            existing_metadata = metadata
-
-        with open(file_path, 'w') as f:
-            json.dump(existing_metadata, f, indent=4)
+        # 按表保存/更新元数据，每张表一个对象。replace=true 表示全量上传，删除上传中不存在的表
+        replace_tables = request.args.get('replace', 'false').lower() in ('1', 'true')
+        metadata_store.save(files_server_ip_port, db_name, metadata, replace_tables=replace_tables)
 
         return f"Metadata for {db_name} saved successfully.", 200
     except Exception as e:
@@ -60,15 +53,31 @@ def get_metadata():
         if not db_name.isidentifier() and files_server_ip_port.isidentifier():
             return "Invalid db_name or files_server_ip_port", 400
 
-        # 安全拼接文件名
-        file_path = f"metadata_{files_server_ip_port}_{db_name}.json"
+        # 可选参数：逗号分隔的表名和 sections (meta, stats, hist, ndv, mulcol)，缺省为全部
+        tables = request.args.get('tables')
+        tables = tables.split(',') if tables else None
+        sections = request.args.get('sections')
+        sections = sections.split(',') if sections else None
+
+        try:
+            etag = metadata_store.etag(files_server_ip_port, db_name, tables, sections)
+        except ValueError as e:
+            return str(e), 400
+        if etag is None:
+            return f"No metadata available for {db_name}", 404
+        # 内容未变化时不重复传输
+        if request.if_none_match.contains(etag):
+            return "", 304, {'ETag': f'"{etag}"'}
 
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                metadata = json.load(f)
-            return json.dumps(metadata), 200
-        else:
+        metadata, etag = metadata_store.load_with_etag(files_server_ip_port, db_name, tables, sections)
+        if metadata is None:
             return f"No metadata available for {db_name}", 404
+        body = json.dumps(metadata).encode('utf-8')
+        headers = {'ETag': f'"{etag}"', 'Content-Type': 'application/json'}
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        return body, 200, headers
     except Exception as e:
         return f"Error getting metadata: {str(e)}", 500
 
@@ -82,7 +91,9 @@ if __name__ == "__main__":
     parser.add_argument('--server_ip', type=str, default='0.0.0.0', help='The IP address to bind the server to.')
     parser.add_argument('--debug', action='store_true', help='Run the server in debug mode.')
     parser.add_argument('--port', type=int, default=5002, help='The port number to run the server on.')
+    parser.add_argument('--data_dir', type=str, default='.', help='The directory to store metadata.')
 
     args = parser.parse_args()
+    metadata_store = MetadataStore(args.data_dir)
 
     app.run(debug=args.debug, threaded=True, host=args.server_ip, port=args.port, use_reloader=False)
@@ -19,6 +19,15 @@ class UnsupportedException(Exception):
         super(UnsupportedException, self).__init__(message)
 
 
+class UnsupportedSamplingException(UnsupportedException):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"Unsupported sampling Exception: {self.message}"
+
+
 class TraceLoadException(ValueError):
     def __init__(self, message):
         self.message = message
@@ -12,7 +12,8 @@ import requests
 from sub_platforms.sql_optimizer.env.rds_env import OpenMySQLEnv
 from sub_platforms.sql_optimizer.videx import videx_logging
 from sub_platforms.sql_optimizer.videx.videx_metadata import construct_videx_task_meta_from_local_files, \
-    fetch_all_meta_with_one_file
+    fetch_all_meta_with_one_file, PCT_CACHED_METHODS, PCT_CACHED_METHOD_EXACT
+from sub_platforms.sql_optimizer.videx.videx_sampling import fetch_all_meta_by_sampling, DEFAULT_SAMPLE_ROWS
 from sub_platforms.sql_optimizer.videx.videx_utils import VIDEX_IP_WHITE_LIST
 
 
@@ -57,7 +58,7 @@ def parse_connection_file_info(info):
     return files_ip, int(files_port), db_name
 
 
-def save_metadata_to_file(meta_request, db_name: str, files_server_ip_port: str):
+def save_metadata_to_file(meta_request, db_name: str, files_server_ip_port: str, replace_tables: bool = False):
     """
     将元数据保存到指定的文件系统路径
     通过POST请求调用元数据保存服务
@@ -66,6 +67,7 @@ def save_metadata_to_file(meta_request, db_name: str, files_server_ip_port: str)
         meta_request: 需要保存的元数据（字典格式）
         db_name: 数据库名称
         files_server_ip_port: 文件服务IP地址和端口（格式为"ip:port"）
+        replace_tables: 全量上传，文件服务删除上传中不存在的表（如源库已删除的表）
 
     返回:
         True: 保存成功
@@ -77,7 +79,8 @@ def save_metadata_to_file(meta_request, db_name: str, files_server_ip_port: str)
     # 准备请求参数
     params = {
         "db_name": db_name,
-        "files_server_ip_port": files_server_ip_port
+        "files_server_ip_port": files_server_ip_port,
+        "replace": str(replace_tables).lower(),
     }
 
     headers = {
@@ -128,6 +131,34 @@ if __name__ == "__main__":
     parser.add_argument('--fetch_method', type=str, default='fetch', help='fetch, partial_fetch, sampling')
     parser.add_argument('--task_id', type=str, default=None,
                         help='task id is to distinguish different videx tasks, if they have same database names.')
+    parser.add_argument('--sample_dir', type=str, default='videx_samples',
+                        help='directory to save parquet sample files if fetch_method is sampling. '
+                             'It must be readable by the VIDEX statistic server.')
+    parser.add_argument('--sample_rows', type=int, default=DEFAULT_SAMPLE_ROWS,
+                        help='sampled rows per table if fetch_method is sampling.')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted fetch from the journal `{meta_path}.journal`. '
+                             'Requires --meta_path, without it the fetch starts over. '
+                             'Not supported by fetch_method sampling.')
+    parser.add_argument('--refresh', action='store_true',
+                        help='if --meta_path exists, re-collect only tables changed since it was fetched '
+                             '(by UPDATE_TIME, TABLE_ROWS, DATA_LENGTH) and merge them into it. '
+                             'Not supported by fetch_method sampling.')
+    parser.add_argument('--pct_cached_method', type=str, default=PCT_CACHED_METHOD_EXACT,
+                        choices=PCT_CACHED_METHODS,
+                        help='how to collect the buffer pool residency of indexes. `exact` scans '
+                             'INNODB_BUFFER_PAGE, which may stall servers with large buffer pools; `timeboxed` '
+                             'limits it by MAX_EXECUTION_TIME; `estimate` derives it from innodb_buffer_pool_stats.')
+    parser.add_argument('--n_mcv', type=int, default=0,
+                        help='number of most common values recorded per column, used to estimate equality '
+                             'conditions. 0 to disable. If fetch_method is fetch, it costs a GROUP BY per column.')
+    parser.add_argument('--bucket_budget', type=int, default=None,
+                        help='total histogram buckets per table. If specified, buckets of each column are chosen by '
+                             'its ndv and skew: low-ndv columns get singleton histograms, skewed high-ndv columns '
+                             'get more buckets. By default, every column gets 16 buckets.')
+    parser.add_argument('--hist_compact_epsilon', type=float, default=None,
+                        help='if set, merge adjacent histogram buckets while the interpolated cumulative frequency '
+                             'differs by at most this ratio, e.g. 0.001.')
 
     videx_logging.initial_config()
     args = parser.parse_args()
@@ -161,6 +192,8 @@ if __name__ == "__main__":
         # Load the existing meta file or save it to a file only when the meta_path is explicitly defined.
         meta_path = None
     logging.info(f"metadata file is {meta_path}")
+    if args.resume and meta_path is None:
+        logging.warning("--resume is ignored since --meta_path is not specified")
 
     # step 2: fetch or read metadata and statistics
     task_id = f"task_id_videx_on_{db_name}"
@@ -174,7 +207,11 @@ if __name__ == "__main__":
         files = fetch_all_meta_with_one_file(meta_path=meta_path,
                                              env=target_env, target_db=target_db, all_table_names=all_table_names,
                                              n_buckets=16, hist_force=True,
-                                             hist_mem_size=200000000, drop_hist_after_fetch=True)
+                                             hist_mem_size=200000000, drop_hist_after_fetch=True,
+                                             pct_cached_method=args.pct_cached_method,
+                                             resume=args.resume, refresh=args.refresh, n_mcv=args.n_mcv,
+                                             bucket_budget=args.bucket_budget,
+                                             hist_compact_epsilon=args.hist_compact_epsilon)
         stats_file_dict, hist_file_dict, ndv_single_file_dict, ndv_mulcol_file_dict = files
         meta_request = construct_videx_task_meta_from_local_files(task_id=args.task_id,
                                                                   videx_db=videx_db,
@@ -186,13 +223,36 @@ if __name__ == "__main__":
                                                                   gt_req_resp_file=None,
                                                                   raise_error=True)
 
-        save_metadata_to_file(meta_request.to_json(), db_name, files_server_ip_port)
+        save_metadata_to_file(meta_request.to_json(), db_name, files_server_ip_port,
+                              replace_tables=all_table_names is None)
 
     elif args.fetch_method == 'sampling':
-        # We will introduce the sampling-based method soon.
-        # This method will generate metadata from the sample data.
-        # Additionally, the sample data will be employed to estimate the ndv (the number of distinct values) and cardinality.
-        raise NotImplementedError
+        # Generate histograms and single-column ndvs from the sample data, rather than scanning full tables.
+        # Sample files are also loaded by the statistic server to estimate multi-column ndv.
+        ignored = [flag for flag, on in [('--resume', args.resume), ('--refresh', args.refresh)] if on]
+        if ignored:
+            logging.warning(f"{', '.join(ignored)} ignored by fetch_method sampling, all tables are sampled again")
+        VIDEX_IP_WHITE_LIST.append(target_ip)
+        files = fetch_all_meta_by_sampling(meta_path=meta_path,
+                                           env=target_env, target_db=target_db, all_table_names=all_table_names,
+                                           sample_dir=args.sample_dir, sample_rows=args.sample_rows,
+                                           n_buckets=16, pct_cached_method=args.pct_cached_method,
+                                           n_mcv=args.n_mcv, bucket_budget=args.bucket_budget,
+                                           hist_compact_epsilon=args.hist_compact_epsilon)
+        stats_file_dict, hist_file_dict, ndv_single_file_dict, ndv_mulcol_file_dict, sample_file_info = files
+        meta_request = construct_videx_task_meta_from_local_files(task_id=args.task_id,
+                                                                  videx_db=videx_db,
+                                                                  stats_file=stats_file_dict,
+                                                                  hist_file=hist_file_dict,
+                                                                  ndv_single_file=ndv_single_file_dict,
+                                                                  ndv_mulcol_file=ndv_mulcol_file_dict,
+                                                                  gt_rec_in_ranges_file=None,
+                                                                  gt_req_resp_file=None,
+                                                                  raise_error=True,
+                                                                  sample_file_info=sample_file_info)
+
+        save_metadata_to_file(meta_request.to_json(), db_name, files_server_ip_port,
+                              replace_tables=all_table_names is None)
     else:
         raise NotImplementedError(f"Fetching method `{args.fetch_method}` not implemented, "
-                                  f"only support `analyze`, `sampling`.")
+                                  f"only support `fetch`, `partial_fetch`, `sampling`.")
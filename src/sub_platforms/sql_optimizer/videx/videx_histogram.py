@@ -6,15 +6,22 @@ SPDX-License-Identifier: MIT
 import base64
 import json
 import logging
-from collections import defaultdict
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
 from typing import List, Optional, Union, Dict, Any, Tuple
-from pydantic import BaseModel, PlainSerializer, BeforeValidator
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, PlainSerializer, BeforeValidator, PrivateAttr
 from typing_extensions import Annotated
 
+from sub_platforms.sql_optimizer.common.exceptions import UnsupportedSamplingException
 from sub_platforms.sql_optimizer.common.pydantic_utils import PydanticDataClassJsonMixin
 from sub_platforms.sql_optimizer.databases.mysql.mysql_command import MySQLVersion
 from sub_platforms.sql_optimizer.env.rds_env import Env
 from sub_platforms.sql_optimizer.meta import Table, Column
+from sub_platforms.sql_optimizer.videx.videx_journal import FetchJournal, JOURNAL_SECTION_HIST
 from sub_platforms.sql_optimizer.videx.videx_utils import BTreeKeySide, target_env_available_for_videx, parse_datetime, \
     data_type_is_int, reformat_datetime_str
 
@@ -24,6 +31,11 @@ MEANINGLESS_INT = -1357
 # Note that this NULL is distinct from "NULL"—the latter is a string with the value 'NULL'.
 NULL_STR = 'NULL'
 
+# adaptive bucket counts, see allocate_bucket_counts
+MAX_HIST_BUCKETS = 1024
+MIN_ADAPTIVE_BUCKETS = 4
+DEFAULT_SKEW_PROBE_ROWS = 10000
+
 
 def decode_base64(raw):
     """
@@ -130,6 +142,13 @@ class HistogramBucket(BaseModel, PydanticDataClassJsonMixin):
     size: int = 0
 
 
+class HistogramMCV(BaseModel, PydanticDataClassJsonMixin):
+    """a most common value of a column, freq is its ratio among all rows (including NULL)"""
+    value: Annotated[
+        Union[int, float, str, bytes], PlainSerializer(large_number_encoder), BeforeValidator(large_number_decoder)]
+    freq: float
+
+
 def init_bucket_by_type(bucket_raw: list, data_type: str, hist_type: str) -> HistogramBucket:
     """
     init HistogramBucket
@@ -207,6 +226,10 @@ class HistogramStats(BaseModel, PydanticDataClassJsonMixin):
     last_updated: Optional[str] = str(MEANINGLESS_INT)
     sampling_rate: Optional[float] = MEANINGLESS_INT
     number_of_buckets_specified: Optional[int] = MEANINGLESS_INT
+    # top-N frequent values, optional. Equality on them is answered without bucket interpolation
+    mcvs: Optional[List[HistogramMCV]] = None
+    # value -> freq of MCVs and single-value buckets, built on first point lookup
+    _point_freqs: Optional[Dict[Any, float]] = PrivateAttr(default=None)
 
     def model_post_init(self, __context: Any) -> None:
         if int(self.null_values) == MEANINGLESS_INT:
@@ -215,6 +238,8 @@ class HistogramStats(BaseModel, PydanticDataClassJsonMixin):
         for b in self.buckets:
             b.min_value = convert_str_by_type(b.min_value, self.data_type)
             b.max_value = convert_str_by_type(b.max_value, self.data_type)
+        for mcv in self.mcvs or []:
+            mcv.value = convert_str_by_type(mcv.value, self.data_type)
         if len(self.buckets) > 0:
             # check: sum(freq(buckets[-1] + null ratio) should be almost 1. if not, scale it.
             if abs(self.null_values + self.buckets[-1].cum_freq - 1) > 0.01:
@@ -223,6 +248,37 @@ class HistogramStats(BaseModel, PydanticDataClassJsonMixin):
                     bucket.cum_freq = bucket.cum_freq * scale_factor
                 self.buckets[-1].cum_freq = 1
 
+    def build_point_freqs(self) -> Dict[Any, float]:
+        """
+        value -> freq for values whose frequency is known exactly: buckets holding a single value
+        (i.e. all buckets of a singleton histogram) and MCVs.
+        Call it again after buckets or mcvs are modified.
+        """
+        point_freqs = {}
+        pre_cum_freq = 0
+        for bucket in self.buckets:
+            if bucket.min_value == bucket.max_value:
+                point_freqs[bucket.min_value] = bucket.cum_freq - pre_cum_freq
+            pre_cum_freq = bucket.cum_freq
+        for mcv in self.mcvs or []:
+            point_freqs[mcv.value] = mcv.freq
+        self._point_freqs = point_freqs
+        return point_freqs
+
+    def point_freq(self, value) -> Optional[float]:
+        """
+        frequency of `col = value` by a dict probe, None if it is not an MCV or a single-value bucket,
+        then use find_nearest_key_pos instead.
+
+        Args:
+            value: raw string in the request, 'NULL' for NULL
+        """
+        value = convert_str_by_type(value, self.data_type, str_in_base4=False)
+        if value is None:
+            return self.null_values
+        point_freqs = self._point_freqs if self._point_freqs is not None else self.build_point_freqs()
+        return point_freqs.get(value)
+
     def find_nearest_key_pos(self, value, side: BTreeKeySide) -> Union[int, float]:
         """
         Scan from left to right, find the first bucket that contains the value.
@@ -362,6 +418,122 @@ class HistogramStats(BaseModel, PydanticDataClassJsonMixin):
         )
 
 
+class HistogramCompaction(BaseModel, PydanticDataClassJsonMixin):
+    """size reduction and the worst interpolation error of compact_histogram"""
+    buckets_before: int = 0
+    buckets_after: int = 0
+    max_error: float = 0
+
+    @property
+    def reduction(self) -> float:
+        """ratio of removed buckets"""
+        return 1 - self.buckets_after / self.buckets_before if self.buckets_before > 0 else 0.
+
+    def merge(self, other: 'HistogramCompaction'):
+        self.buckets_before += other.buckets_before
+        self.buckets_after += other.buckets_after
+        self.max_error = max(self.max_error, other.max_error)
+
+    def __str__(self):
+        return f"buckets {self.buckets_before} -> {self.buckets_after} (-{self.reduction:.1%}), " \
+               f"max_error={self.max_error:.4g}"
+
+
+def _bucket_positions(data_type: str, min_value, max_value, values: list) -> np.ndarray:
+    """
+    ratio of rows <= value in a bucket [min_value, max_value] under the uniform assumption of find_nearest_key_pos
+    """
+    if data_type_is_int(data_type):
+        return (np.array(values, dtype=float) - min_value + 1) / (max_value - min_value + 1)
+    elif data_type in ['float', 'double', 'decimal']:
+        return (np.array(values, dtype=float) - min_value) / (max_value - min_value)
+    elif data_type == 'date':
+        min_date = parse_datetime(min_value).date()
+        days = [(parse_datetime(v).date() - min_date).days for v in values]
+        return (np.array(days, dtype=float) + 1) / ((parse_datetime(max_value).date() - min_date).days + 1)
+    elif data_type == 'datetime':
+        min_datetime = parse_datetime(min_value)
+        seconds = [(parse_datetime(v) - min_datetime).total_seconds() for v in values]
+        return np.array(seconds, dtype=float) / (parse_datetime(max_value) - min_datetime).total_seconds()
+    else:
+        # values other than the ends are taken as the middle of the bucket
+        return np.array([1 if v == max_value else 0.5 for v in values], dtype=float)
+
+
+def _merge_error(data_type: str, pre_cum_freq: float, run: List[HistogramBucket]) -> float:
+    """max error of cum_freq at the inner bucket boundaries if run is merged into one bucket"""
+    try:
+        positions = np.clip(_bucket_positions(data_type, run[0].min_value, run[-1].max_value,
+                                              [b.max_value for b in run[:-1]]), 0, 1)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return float('inf')
+    estimated = pre_cum_freq + (run[-1].cum_freq - pre_cum_freq) * positions
+    error = float(np.max(np.abs(estimated - np.array([b.cum_freq for b in run[:-1]]))))
+    return error if np.isfinite(error) else float('inf')
+
+
+def compact_histogram(hist: HistogramStats, epsilon: float) -> HistogramCompaction:
+    """
+    merge adjacent buckets in place, as long as the cum_freq interpolated in the merged bucket at each removed
+    bucket boundary differs from the original one by at most epsilon.
+
+    Singleton histograms and single-value buckets (frequent values of equi-height histograms) are kept,
+    since their frequencies are exact.
+
+    Args:
+        hist: histogram to compact
+        epsilon: max error of cum_freq, a ratio of table rows
+
+    Returns:
+        number of buckets before and after, and the worst error
+    """
+    buckets = hist.buckets or []
+    res = HistogramCompaction(buckets_before=len(buckets), buckets_after=len(buckets))
+    if hist.histogram_type == 'singleton' or len(buckets) < 2 or epsilon <= 0:
+        return res
+
+    compacted = []
+    pre_cum_freq = 0
+    i = 0
+    while i < len(buckets):
+        j = i
+        if buckets[i].min_value != buckets[i].max_value:
+            while j + 1 < len(buckets) and buckets[j + 1].min_value != buckets[j + 1].max_value:
+                error = _merge_error(hist.data_type, pre_cum_freq, buckets[i:j + 2])
+                if error > epsilon:
+                    break
+                res.max_error = max(res.max_error, error)
+                j += 1
+        if j == i:
+            compacted.append(buckets[i])
+        else:
+            run = buckets[i:j + 1]
+            compacted.append(HistogramBucket(min_value=run[0].min_value, max_value=run[-1].max_value,
+                                             cum_freq=run[-1].cum_freq,
+                                             row_count=sum(b.row_count for b in run),
+                                             size=sum(b.size for b in run)))
+        pre_cum_freq = buckets[j].cum_freq
+        i = j + 1
+
+    hist.buckets = compacted
+    # point frequencies are rebuilt on next lookup
+    hist._point_freqs = None
+    res.buckets_after = len(compacted)
+    return res
+
+
+def compact_hist_dict(hist_dict: Dict[str, Optional[dict]], epsilon: float) -> HistogramCompaction:
+    """compact histograms in json (column -> HistogramStats.to_dict()) in place, see compact_histogram"""
+    res = HistogramCompaction()
+    for col, hist_json in hist_dict.items():
+        if not hist_json:
+            continue
+        hist = HistogramStats.from_dict(hist_json)
+        res.merge(compact_histogram(hist, epsilon))
+        hist_dict[col] = hist.to_dict()
+    return res
+
+
 def query_histogram(env: Env, dbname: str, table_name: str, col_name: str) -> Union[HistogramStats, None]:
     """
 
@@ -375,11 +547,11 @@ def query_histogram(env: Env, dbname: str, table_name: str, col_name: str) -> Un
     """
     sql = f"SELECT HISTOGRAM FROM information_schema.column_statistics " \
           f"WHERE SCHEMA_NAME = '{dbname}' AND TABLE_NAME = '{table_name}' AND COLUMN_NAME ='{col_name}'"
-    res = env.query_for_dataframe(sql)
+    res = env.query_for_dicts(sql)
     if len(res) == 0:
         return None
-    assert len(res) == 1 and 'HISTOGRAM' in res.iloc[0].to_dict(), f"Invalid result from query_histogram: {res}"
-    hist_dict = json.loads(res.iloc[0].to_dict()['HISTOGRAM'])
+    assert len(res) == 1 and 'HISTOGRAM' in res[0], f"Invalid result from query_histogram: {res}"
+    hist_dict = json.loads(res[0]['HISTOGRAM'])
 
     return HistogramStats.init_from_mysql_json(data=hist_dict)
 
@@ -430,9 +602,9 @@ def drop_histogram(env: Env, dbname: str, table_name: str, col_name: str) -> boo
     """
     sql = f"ANALYZE TABLE `{dbname}`.`{table_name}` DROP HISTOGRAM ON {col_name};"
     logging.debug(sql)
-    res = env.query_for_dataframe(sql)
+    res = env.query_for_dicts(sql)
     if res is not None and len(res) == 1:
-        msg = res.iloc[0].to_dict().get('Msg_text')
+        msg = res[0].get('Msg_text')
         return 'Histogram statistics removed for column' in msg
     return False
 
@@ -487,12 +659,12 @@ def _get_uniform_buckets(env: Env, db_name, table_name, col_name, min_value, max
         WHERE {col_name} IS NOT NULL
         ORDER BY RAND() LIMIT 1000
         """
-        sample_df = env.query_for_dataframe(sample_sql)
+        sample_rows = env.query_for_rows(sample_sql)
 
-        if len(sample_df) <= 1:
+        if len(sample_rows) <= 1:
             bounds = [min_value, max_value]
         else:
-            sorted_samples = sorted(sample_df[col_name].tolist())
+            sorted_samples = sorted(row[0] for row in sample_rows)
 
             # init bounds
             bounds = [min_value]
@@ -551,14 +723,14 @@ def _get_uniform_buckets(env: Env, db_name, table_name, col_name, min_value, max
         FROM {db_name}.{table_name}
         WHERE {col_name} {left_op} {lower_str} AND {col_name} {right_op} {upper_str}
         """
-        bucket_df = env.query_for_dataframe(bucket_sql)
+        bucket_rows = env.query_for_dicts(bucket_sql)
 
-        if not bucket_df.empty and bucket_df['bucket_count'].iloc[0] > 0:
-            bucket_count = int(bucket_df['bucket_count'].iloc[0])
-            bucket_ndv = int(bucket_df['bucket_ndv'].iloc[0])
+        if bucket_rows and bucket_rows[0]['bucket_count'] > 0:
+            bucket_count = int(bucket_rows[0]['bucket_count'])
+            bucket_ndv = int(bucket_rows[0]['bucket_ndv'])
 
-            actual_min = bucket_df['actual_min'].iloc[0]
-            actual_max = bucket_df['actual_max'].iloc[0]
+            actual_min = bucket_rows[0]['actual_min']
+            actual_max = bucket_rows[0]['actual_max']
 
             if actual_min is not None and actual_max is not None:
                 result.append((str(actual_min), str(actual_max), bucket_count, bucket_ndv))
@@ -611,8 +783,7 @@ def get_bucket_bounds(env: Env, table_name, col_name,
     # obtain ndv if it's None
     if ndv is None:
         ndv_sql = f"SELECT COUNT(DISTINCT {col_name}) as ndv FROM {db_name}.{table_name}"
-        ndv_df = env.query_for_dataframe(ndv_sql)
-        ndv = ndv_df['ndv'].iloc[0]
+        ndv = env.query_for_rows(ndv_sql)[0][0]
         logging.debug(f"{table_name=} {col_name=} ndv is None, force fetch it, {ndv=}")
 
     # if ndv is very small, use group by to get the value count
@@ -625,10 +796,8 @@ def get_bucket_bounds(env: Env, table_name, col_name,
         GROUP BY {col_name} 
         ORDER BY {col_name}
         """
-        small_ndv_df = env.query_for_dataframe(small_ndv_sql)
-
         result = []
-        for _, row in small_ndv_df.iterrows():
+        for row in env.query_for_dicts(small_ndv_sql):
             value = row['value']
             result.append((value, value, int(row['bucket_count']), 1))
 
@@ -685,8 +854,8 @@ def force_generate_histogram_by_sdc_for_col(env: Env, db_name: str, table_name:
     data_type = column.data_type
 
     # Find the minimum and maximum values in the column
-    _df = env.query_for_dataframe(f"SELECT MIN({col_name}) as min, MAX({col_name}) as max FROM {db_name}.{table_name}")
-    min_val, max_val = _df['min'][0], _df['max'][0]
+    min_val, max_val = env.query_for_rows(
+        f"SELECT MIN({col_name}) as min, MAX({col_name}) as max FROM {db_name}.{table_name}")[0]
 
     # Calculate the bucket size
     null_values = env.mysql_util.query_for_value(
@@ -730,6 +899,223 @@ def force_generate_histogram_by_sdc_for_col(env: Env, db_name: str, table_name:
     return HistogramStats.init_from_mysql_json(res_dict)
 
 
+def _sample_value_str(value) -> str:
+    """a sampled value as in the histogram json of MySQL, bytes (e.g. of binary columns) are base64 encoded"""
+    if isinstance(value, (bytes, bytearray)):
+        return f"base64:type254:{base64.b64encode(bytes(value)).decode('ascii')}"
+    return str(value)
+
+
+def generate_histogram_from_sample(values: pd.Series, data_type: str, n_buckets: int,
+                                   table_rows: int = None, n_mcv: int = 0) -> Optional[HistogramStats]:
+    """
+    generate an equi-height (or singleton if ndv <= n_buckets) histogram from sampled column values,
+    without touching the source table.
+
+    Args:
+        values: sampled values of one column, NULL as NaN/None
+        data_type: histogram data type, e.g. int, double, decimal, date, datetime, string.
+            refer to get_column_data_type
+        n_buckets: number of buckets
+        table_rows: rows of the source table, used to record the sampling rate
+        n_mcv: number of most common values to record for equi-height histograms, 0 to disable
+
+    Returns:
+        HistogramStats, or None if the sample is empty
+    """
+    total = len(values)
+    if total == 0:
+        return None
+    not_null = values.dropna()
+    null_values = 1 - len(not_null) / total
+    n_buckets = max(1, min(1024, int(n_buckets)))
+
+    res_dict = {
+        "buckets": [],
+        "data-type": data_type,
+        "histogram-type": "singleton",
+        "null-values": null_values,
+        "collation-id": MEANINGLESS_INT,
+        # in UTC like MySQL
+        "last-updated": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f'),
+        "sampling-rate": min(1.0, total / table_rows) if table_rows else 1.0,
+        "number-of-buckets-specified": n_buckets,
+    }
+    if len(not_null) == 0:
+        return HistogramStats.init_from_mysql_json(res_dict)
+
+    # sorted distinct values and their counts
+    value_counts = not_null.value_counts(sort=False).sort_index()
+    uniques = value_counts.index.tolist()
+    cum_counts = np.cumsum(value_counts.values)
+    # cum_freq is relative to all sampled rows, i.e. buckets[-1].cum_freq = 1 - null_values
+    cum_freqs = cum_counts / total
+
+    if len(uniques) <= n_buckets:
+        res_dict["buckets"] = [[_sample_value_str(v), float(f)] for v, f in zip(uniques, cum_freqs)]
+        return HistogramStats.init_from_mysql_json(res_dict)
+
+    # equi-height: a distinct value never spans two buckets. bucket id is decided by the start position of the value
+    res_dict["histogram-type"] = "equi-height"
+    start_counts = cum_counts - value_counts.values
+    bucket_ids = start_counts * n_buckets // len(not_null)
+    _, first_pos = np.unique(bucket_ids, return_index=True)
+    last_pos = np.append(first_pos[1:], len(uniques)) - 1
+    for lo, hi in zip(first_pos, last_pos):
+        res_dict["buckets"].append([_sample_value_str(uniques[lo]), _sample_value_str(uniques[hi]),
+                                    float(cum_freqs[hi]), int(hi - lo + 1)])
+    hist = HistogramStats.init_from_mysql_json(res_dict)
+    if n_mcv > 0:
+        top_counts = value_counts.nlargest(n_mcv)
+        hist.mcvs = [HistogramMCV(value=convert_str_by_type(_sample_value_str(v), data_type), freq=float(cnt / total))
+                     for v, cnt in top_counts.items()]
+    return hist
+
+
+def value_skew(values: pd.Series) -> float:
+    """
+    skew of values: count of the most frequent value / average count of distinct values - 1.
+    0 if all values appear equally often. NULL is ignored.
+    """
+    return _skew_of_counts(values.value_counts(dropna=True).tolist())
+
+
+def _skew_of_counts(counts: List[int]) -> float:
+    """value_skew from the count of each distinct value"""
+    if len(counts) == 0:
+        return 0.
+    return float(max(counts) / (sum(counts) / len(counts))) - 1
+
+
+def probe_table_skew(env: Env, dbname: str, table_name: str, columns: List[str],
+                     probe_rows: int = DEFAULT_SKEW_PROBE_ROWS, table_rows: Optional[int] = None) -> Dict[str, float]:
+    """
+    cheap skew probe: value_skew over about probe_rows rows spread over the whole table.
+    The rows are sampled by pk range blocks as in videx_sampling. If the table can not be sampled by pk range,
+    rows are picked at random by one query, and streamed into value counts of each column.
+
+    Args:
+        table_rows: estimated rows of the table, to pick rows at random without sorting the table
+
+    Returns:
+        column -> skew, 0 for all columns if the probe fails
+    """
+    # videx_sampling imports this module
+    from sub_platforms.sql_optimizer.videx.videx_sampling import sample_table_by_pk_range
+
+    try:
+        try:
+            df_sample = sample_table_by_pk_range(env, dbname, table_name, sample_rows=probe_rows)
+            return {col: value_skew(df_sample[col]) if col in df_sample.columns else 0. for col in columns}
+        except UnsupportedSamplingException as e:
+            logging.info(f"skew probe of {dbname}.{table_name} by random rows: {e}")
+
+        cols_sql = ', '.join(f'`{col}`' for col in columns)
+        if table_rows is None:
+            where = " ORDER BY RAND(0)"
+        elif table_rows > probe_rows:
+            where = f" WHERE RAND(0) < {probe_rows / table_rows:.6g}"
+        else:
+            where = ""
+        counts = {col: Counter() for col in columns}
+        for row in env.iter_rows(f"SELECT {cols_sql} FROM `{dbname}`.`{table_name}`{where} LIMIT {int(probe_rows)}"):
+            for col, value in zip(columns, row):
+                if value is not None:
+                    counts[col][value] += 1
+    except Exception as e:
+        logging.warning(f"skew probe failed for {dbname}.{table_name}, assume no skew: {e}")
+        return {col: 0. for col in columns}
+    return {col: _skew_of_counts(list(counts[col].values())) for col in columns}
+
+
+def allocate_bucket_counts(ndvs: Dict[str, int], skews: Dict[str, float], budget: int,
+                           min_buckets: int = MIN_ADAPTIVE_BUCKETS,
+                           max_buckets: int = MAX_HIST_BUCKETS) -> Dict[str, int]:
+    """
+    choose the number of buckets of each column of a table within a total budget.
+
+    Columns are visited by ascending ndv: a column whose ndv fits into the remaining budget (keeping min_buckets
+    for each of the rest) gets ndv buckets, i.e. a singleton histogram. The remaining budget is shared by the other
+    columns in proportion to log2(ndv) * (1 + log(1 + skew)), so that skewed high-ndv columns get more buckets.
+
+    The total never exceeds the budget. If it can not give min_buckets to each of the other columns, the minimum is
+    lowered to what it can, and the buckets lost by rounding go by the largest remainder. A column gets 0 buckets,
+    i.e. no histogram, only if the budget is smaller than the number of columns.
+
+    Args:
+        ndvs: column -> ndv
+        skews: column -> skew, see value_skew. Missing columns are considered not skewed.
+        budget: total number of buckets of the table
+        min_buckets: minimum number of buckets of a non-singleton histogram
+        max_buckets: maximum number of buckets of a column, 1024 in MySQL
+
+    Returns:
+        column -> number of buckets
+    """
+    res = {}
+    remaining = budget
+    others = []
+    columns = sorted(ndvs, key=lambda col: ndvs[col])
+    for i, col in enumerate(columns):
+        ndv = max(1, int(ndvs[col]))
+        if ndv <= max_buckets and ndv <= remaining - min_buckets * (len(columns) - i - 1):
+            res[col] = ndv
+            remaining -= ndv
+        else:
+            others.append(col)
+    if not others:
+        return res
+    weights = {col: math.log2(max(2, ndvs[col])) * (1 + math.log1p(max(0., skews.get(col, 0.))))
+               for col in others}
+    floor = min(min_buckets, max(0, remaining) // len(others))
+    # columns whose proportional share is out of [floor, max_buckets] are clamped, and the rest shared again
+    shares, free = {}, list(others)
+    while free:
+        budget_left = remaining - sum(shares.values())
+        total_weight = sum(weights[col] for col in free)
+        proportional = {col: budget_left * weights[col] / total_weight for col in free}
+        clamped = {col: floor if share < floor else max_buckets
+                   for col, share in proportional.items() if share < floor or share > max_buckets}
+        if not clamped:
+            shares.update(proportional)
+            break
+        shares.update(clamped)
+        free = [col for col in free if col not in clamped]
+    for col in others:
+        res[col] = int(shares[col])
+    # buckets lost by rounding down, by the largest remainder, then to the highest-weight columns
+    leftover = remaining - sum(res[col] for col in others)
+    for col in sorted(others, key=lambda c: (res[c] - shares[c], -weights[c])):
+        if leftover <= 0:
+            break
+        if res[col] < max_buckets:
+            res[col] += 1
+            leftover -= 1
+    return res
+
+
+def fetch_col_mcvs(env: Env, dbname: str, table_name: str, col_name: str, n_mcv: int,
+                   data_type: str, total_rows: int) -> List[HistogramMCV]:
+    """
+    fetch the top-N frequent values of a column by GROUP BY, which scans the whole table.
+
+    Args:
+        data_type: data type of the histogram of the column
+        total_rows: rows of the table, e.g. Table.rows of the table meta
+
+    Returns:
+        MCVs in descending order of frequency, values are in the same format as histogram buckets
+    """
+    if not total_rows:
+        return []
+    sql = f"SELECT `{col_name}` AS value, COUNT(1) AS cnt FROM `{dbname}`.`{table_name}` " \
+          f"WHERE `{col_name}` IS NOT NULL GROUP BY `{col_name}` ORDER BY cnt DESC LIMIT {int(n_mcv)}"
+    # total_rows is an estimate, a frequency can not exceed 1
+    return [HistogramMCV(value=convert_str_by_type(str(row['value']), data_type),
+                         freq=min(1.0, row['cnt'] / total_rows))
+            for row in env.query_for_dicts(sql)]
+
+
 def fetch_col_histogram(env: Env, dbname: str, table_name: str, col_name: str, n_buckets: int = 32,
                         force: bool = False, hist_mem_size: int = None, ndv: int = None) -> HistogramStats:
     """
@@ -779,6 +1165,9 @@ def generate_fetch_histogram(env: Env, target_db: str, all_table_names: List[str
                              hist_mem_size: int,
                              ret_json: bool = False,
                              ndv_single_dict: dict = None,
+                             journal: FetchJournal = None,
+                             n_mcv: int = 0,
+                             bucket_budget: int = None,
                              ) -> Dict[str, Dict[str, Union[HistogramStats, dict]]]:
     """
     generate histogram for all specifed tables
@@ -791,6 +1180,11 @@ def generate_fetch_histogram(env: Env, target_db: str, all_table_names: List[str
         force:
         ret_json: True: return json, False: return HistogramStats
         ndv_single_dict: table_name -> col -> ndv
+        journal: if not None, checkpoint each column and table, and skip those already in the journal
+        n_mcv: number of most common values to fetch for each column without a singleton histogram, 0 to disable.
+            It costs a GROUP BY over the table per column.
+        bucket_budget: if not None, n_buckets is ignored and the buckets of each column are chosen adaptively by
+            ndv_single_dict and a skew probe, within bucket_budget buckets per table. See allocate_bucket_counts.
 
     Returns:
         lower_table -> column -> HistogramStats
@@ -806,19 +1200,44 @@ def generate_fetch_histogram(env: Env, target_db: str, all_table_names: List[str
     res_tables = defaultdict(dict)
     for table_name in all_table_names:
         table_meta: Table = env.get_table_meta(target_db, table_name)
+        done_columns = journal.columns(JOURNAL_SECTION_HIST, table_name) if journal is not None else {}
+        col_buckets = {}
+        if bucket_budget is not None:
+            todo_columns = [col.name for col in table_meta.columns if col.name not in done_columns]
+            table_ndvs = ndv_single_dict.get(table_name, {})
+            # without ndv, the column is considered as high-ndv
+            ndvs = {col: table_ndvs.get(col, table_meta.rows or MAX_HIST_BUCKETS + 1) for col in todo_columns}
+            skews = probe_table_skew(env, target_db, table_name, todo_columns,
+                                     table_rows=table_meta.rows) if todo_columns else {}
+            col_buckets = allocate_bucket_counts(ndvs, skews, bucket_budget)
+            logging.info(f"adaptive buckets of `{target_db}`.`{table_name}` within {bucket_budget}: {col_buckets}")
         # print(table_meta)
         for c_id, col in enumerate(table_meta.columns):
             col: Column
+            if col.name in done_columns:
+                hist = done_columns[col.name]
+                if hist is not None and not ret_json:
+                    hist = HistogramStats.from_dict(hist)
+                res_tables[str(table_name).lower()][col.name] = hist
+                continue
             ndv = ndv_single_dict.get(table_name, {}).get(col.name, None)
+            col_n_buckets = col_buckets.get(col.name, n_buckets)
             hist = None
+            if col_n_buckets <= 0:
+                # out of the bucket budget
+                logging.info(f"skip the histogram of `{target_db}`.`{table_name}`.`{col.name}`: no bucket left")
+                if journal is not None:
+                    journal.record(JOURNAL_SECTION_HIST, table_name, None, column=col.name)
+                res_tables[str(table_name).lower()][col.name] = None
+                continue
             try:
                 logging.info(f"Generating Histogram for `{target_db}`.`{table_name}`.`{col.name}` "
-                             f"with {n_buckets} n_buckets")
+                             f"with {col_n_buckets} n_buckets")
                 if only_sfw_fetch:
-                    hist = force_generate_histogram_by_sdc_for_col(env, target_db, table_name, col.name, n_buckets,
-                                                                   ndv=ndv)
+                    hist = force_generate_histogram_by_sdc_for_col(env, target_db, table_name, col.name,
+                                                                   col_n_buckets, ndv=ndv)
                 else:
-                    hist = fetch_col_histogram(env, target_db, table_name, col.name, n_buckets, force=force,
+                    hist = fetch_col_histogram(env, target_db, table_name, col.name, col_n_buckets, force=force,
                                                hist_mem_size=hist_mem_size,
                                                ndv=ndv,
                                                )
@@ -828,8 +1247,16 @@ def generate_fetch_histogram(env: Env, target_db: str, all_table_names: List[str
                         drop_histogram(env, target_db, table_name, col.name)
                     except Exception as e:
                         logging.error(f"drop histogram failed for {target_db}.{table_name}.{col.name}, {e}")
+            if hist is not None and n_mcv > 0 and hist.histogram_type != 'singleton':
+                hist.mcvs = fetch_col_mcvs(env, target_db, table_name, col.name, n_mcv, hist.data_type,
+                                           total_rows=table_meta.rows)
 
+            if journal is not None:
+                journal.record(JOURNAL_SECTION_HIST, table_name, hist.to_dict() if hist is not None else None,
+                               column=col.name)
             if hist is not None and ret_json:
                 hist = hist.to_dict()
             res_tables[str(table_name).lower()][col.name] = hist
+        if journal is not None and not journal.has(JOURNAL_SECTION_HIST, table_name):
+            journal.record(JOURNAL_SECTION_HIST, table_name, None)
     return res_tables
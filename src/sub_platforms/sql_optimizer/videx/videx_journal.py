@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+# sections of the fetch journal
+JOURNAL_SECTION_STATS = 'stats'
+JOURNAL_SECTION_NDV_SINGLE = 'ndv_single'
+JOURNAL_SECTION_HIST = 'hist'
+JOURNAL_SECTION_NDV_MULCOL = 'ndv_mulcol'
+
+# column of the record that marks a table as completed
+_TABLE_DONE = None
+
+
+class FetchJournal:
+    """
+    Append-only checkpoint journal of metadata collection, one json line per completed unit:
+    {"section": ..., "table": ..., "column": ..., "value": ...}
+
+    A unit is a whole section (stats, ndv_mulcol), a table (ndv_single) or a column (hist).
+    A table is completed once the record with column=None is written, i.e. column records of a table are
+    only partial results. Each record is flushed and fsynced, so a crashed collection can be resumed
+    from the last completed unit. A truncated last line (killed while writing) is ignored.
+    """
+
+    def __init__(self, path: str, resume: bool = True):
+        """
+        Args:
+            path: journal file
+            resume: if True, replay the existing journal; otherwise start over and drop it
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # section -> lower table -> column -> value
+        self._records: Dict[str, Dict[Optional[str], Dict[Optional[str], Any]]] = {}
+        if os.path.dirname(os.path.abspath(path)):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume and os.path.exists(path):
+            self._replay()
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def _replay(self):
+        with open(self.path, 'rb+') as f:
+            content = f.read()
+            if content and not content.endswith(b'\n'):
+                # drop the truncated last line, otherwise the next record would be appended to it
+                f.truncate(content.rfind(b'\n') + 1)
+        n_records = 0
+        with open(self.path, 'r') as f:
+            for line_no, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"ignore broken record at line {line_no} of journal {self.path}")
+                    continue
+                self._apply(record['section'], record['table'], record['column'], record['value'])
+                n_records += 1
+        logging.info(f"resume from journal {self.path}, {n_records} records")
+
+    def _apply(self, section: str, table: Optional[str], column: Optional[str], value: Any):
+        table = table.lower() if table is not None else None
+        self._records.setdefault(section, {}).setdefault(table, {})[column] = value
+
+    def record(self, section: str, table: Optional[str], value: Any, column: Optional[str] = _TABLE_DONE):
+        """append a completed unit"""
+        line = json.dumps({'section': section, 'table': table, 'column': column, 'value': value})
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(section, table, column, value)
+
+    def has(self, section: str, table: Optional[str] = None, column: Optional[str] = _TABLE_DONE) -> bool:
+        table = table.lower() if table is not None else None
+        return column in self._records.get(section, {}).get(table, {})
+
+    def get(self, section: str, table: Optional[str] = None, column: Optional[str] = _TABLE_DONE,
+            default: Any = None) -> Any:
+        table = table.lower() if table is not None else None
+        return self._records.get(section, {}).get(table, {}).get(column, default)
+
+    def columns(self, section: str, table: str) -> Dict[str, Any]:
+        """completed column units of a table"""
+        return {k: v for k, v in self._records.get(section, {}).get(table.lower(), {}).items() if k is not _TABLE_DONE}
+
+    def remove(self):
+        """drop the journal after the collection result is persisted"""
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._records = {}
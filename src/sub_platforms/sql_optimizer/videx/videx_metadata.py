@@ -12,6 +12,7 @@ import shutil
 import time
 from abc import ABC, abstractmethod
 from collections import defaultdict
+from datetime import datetime, timezone
 from typing import List, Dict, Tuple, Optional, Union, Any
 
 import numpy as np
@@ -27,13 +28,18 @@ from sub_platforms.sql_optimizer.databases.mysql.mysql_command import MySQLVersi
 from sub_platforms.sql_optimizer.env.rds_env import Env
 from sub_platforms.sql_optimizer.meta import Table, Column, Index
 from sub_platforms.sql_optimizer.videx.common.estimate_stats_length import estimate_data_length
-from sub_platforms.sql_optimizer.videx.videx_histogram import HistogramStats, generate_fetch_histogram
+from sub_platforms.sql_optimizer.videx.videx_histogram import HistogramStats, generate_fetch_histogram, \
+    HistogramCompaction, compact_hist_dict
+from sub_platforms.sql_optimizer.videx.videx_journal import FetchJournal, JOURNAL_SECTION_STATS, \
+    JOURNAL_SECTION_NDV_SINGLE, JOURNAL_SECTION_NDV_MULCOL
+from sub_platforms.sql_optimizer.videx.videx_meta_bundle import read_meta_bundle
 from sub_platforms.sql_optimizer.videx.videx_mysql_utils import _parse_col_names
 from sub_platforms.sql_optimizer.videx.videx_utils import load_json_from_file, dump_json_to_file, GT_Table_Return, \
     target_env_available_for_videx
 
 # VIDEX Statistic attribute keys
 EXTRA_INFO_KEY_pct_cached = 'pct_cached'
+EXTRA_INFO_KEY_pct_cached_method = 'pct_cached_method'
 EXTRA_INFO_KEY_use_gt = 'use_gt'
 EXTRA_INFO_KEY_mulcol = 'mulcol'
 EXTRA_INFO_KEY_gt_rec_in_ranges = 'gt_rec_in_ranges'
@@ -53,6 +59,19 @@ IN_MEMORY_ESTIMATE_UNKNOWN = -1.0
 # prefer to use cached pct from videx metadata
 PCT_CACHED_MODE_PREFER_META = -1
 
+# how pct_cached is collected, see fetch_pct_cached
+# exact: aggregate INFORMATION_SCHEMA.INNODB_BUFFER_PAGE, which walks the whole buffer pool
+PCT_CACHED_METHOD_EXACT = 'exact'
+# timeboxed: the exact query with MAX_EXECUTION_TIME, falls back to PCT_CACHED_METHOD_DEFAULT if interrupted
+PCT_CACHED_METHOD_TIMEBOXED = 'timeboxed'
+# estimate: buffer pool data pages from innodb_buffer_pool_stats, spread over index sizes
+PCT_CACHED_METHOD_ESTIMATE = 'estimate'
+# no residency info, VIDEX uses its default pct_cached
+PCT_CACHED_METHOD_DEFAULT = 'default'
+PCT_CACHED_METHODS = [PCT_CACHED_METHOD_EXACT, PCT_CACHED_METHOD_TIMEBOXED, PCT_CACHED_METHOD_ESTIMATE,
+                      PCT_CACHED_METHOD_DEFAULT]
+DEFAULT_PCT_CACHED_TIMEOUT_MS = 10000
+
 IO_SIZE = 4096
 
 # ############################################################################
@@ -128,21 +147,22 @@ class VidexDBTaskStats(BaseModel, PydanticDataClassJsonMixin):
         )):
             return None
 
-        target = self if inplace else copy.deepcopy(self)
+        # Table and TableStatisticsInfo objects may be shared by tasks (see videx_table_store) and are not modified
+        # by merging, so only the dicts are copied.
+        target = self if inplace else self.model_copy(update={
+            'meta_dict': {db: dict(tables) for db, tables in self.meta_dict.items()},
+            'stats_dict': {db: dict(tables) for db, tables in self.stats_dict.items()},
+            'db_config': copy.deepcopy(self.db_config),
+            'sample_file_info': copy.deepcopy(self.sample_file_info),
+        })
 
         # Merge meta_dict
         for db, tables in other.meta_dict.items():
-            if db not in target.meta_dict:
-                target.meta_dict[db] = tables
-            else:
-                target.meta_dict[db].update(tables)
+            target.meta_dict.setdefault(db, {}).update(tables)
 
         # Merge stats_dict
         for db, tables in other.stats_dict.items():
-            if db not in target.stats_dict:
-                target.stats_dict[db] = tables
-            else:
-                target.stats_dict[db].update(tables)
+            target.stats_dict.setdefault(db, {}).update(tables)
 
         # Merge sample_file_info
         if self.sample_file_info and other.sample_file_info:
@@ -371,33 +391,35 @@ def fetch_ndv_multi_col_gt(env: Env, dbname: str, table_name: str = None) -> Dic
           f"where database_name='{dbname}' and stat_name like 'n_diff%'"
     if table_name:
         sql += f" and table_name = '{table_name}' "
-    df_res = env.query_for_dataframe(sql)
+    rows = env.query_for_dicts(sql)
 
     res = defaultdict(lambda: defaultdict(dict))
 
-    for (table_name, index_name), df_index in df_res.groupby(['table_name', 'index_name']):
-        df_index.sort_values(by=['stat_name'], inplace=True)
-        for idx, row in df_index.iterrows():
-            fields = row['stat_description'].split(',')
-            last_field = fields[-1]
-            res[table_name.lower()][index_name][last_field] = {
-                'stat_name': row['stat_name'],
-                'stat_value': row['stat_value'],
-                'sample_size': row['sample_size'],
-                'stat_description': row['stat_description'],
-                'n_field': len(fields)
-            }
+    # by index, and by prefix length within an index
+    for row in sorted(rows, key=lambda r: (r['table_name'], r['index_name'], r['stat_name'])):
+        fields = row['stat_description'].split(',')
+        last_field = fields[-1]
+        res[row['table_name'].lower()][row['index_name']][last_field] = {
+            'stat_name': row['stat_name'],
+            'stat_value': row['stat_value'],
+            'sample_size': row['sample_size'],
+            'stat_description': row['stat_description'],
+            'n_field': len(fields)
+        }
 
     return res
 
 
-def fetch_ndv_single(env: Env, target_db: str, all_table_names: List[str]) \
+def fetch_ndv_single(env: Env, target_db: str, all_table_names: List[str], journal: FetchJournal = None) \
         -> Dict[str, Dict[str, Dict[str, HistogramStats]]]:
     if not target_env_available_for_videx(env):
         raise Exception(f"given env ({env.instance=}) is not in BLACKLIST, cannot fetch_ndv_single directly")
 
     res_tables = defaultdict(dict)
     for table_name in all_table_names:
+        if journal is not None and journal.has(JOURNAL_SECTION_NDV_SINGLE, table_name):
+            res_tables[str(table_name).lower()] = journal.get(JOURNAL_SECTION_NDV_SINGLE, table_name)
+            continue
         table_meta: Table = env.get_table_meta(target_db, table_name)
         for c_id, col in enumerate(table_meta.columns):
             col: Column
@@ -410,15 +432,32 @@ def fetch_ndv_single(env: Env, target_db: str, all_table_names: List[str]) \
                 ndv = INVALID_VALUE
 
             res_tables[str(table_name).lower()][col.name] = int(np.squeeze(ndv))
+        if journal is not None:
+            journal.record(JOURNAL_SECTION_NDV_SINGLE, table_name, res_tables[str(table_name).lower()])
     return res_tables
 
 
-def fetch_information_schema(env: Env, target_dbname: str) -> Dict[str, dict]:
+def _table_name_filter(column: str, table_names: Optional[List[str]]) -> str:
+    """` AND column IN (...)` restricting a query to table_names, empty if table_names is None"""
+    if table_names is None:
+        return ""
+    names = ', '.join("'%s'" % str(t).replace("'", "''") for t in table_names)
+    return f" AND {column} IN ({names})" if names else " AND FALSE"
+
+
+def fetch_information_schema(env: Env, target_dbname: str,
+                             pct_cached_method: str = PCT_CACHED_METHOD_EXACT,
+                             pct_cached_timeout_ms: int = DEFAULT_PCT_CACHED_TIMEOUT_MS,
+                             table_names: List[str] = None) -> Dict[str, dict]:
     """
     fetch metadata
     Args:
         env:
         target_dbname:
+        pct_cached_method: one of PCT_CACHED_METHODS, the method actually used is recorded in 'pct_cached_method'
+        pct_cached_timeout_ms: MAX_EXECUTION_TIME for PCT_CACHED_METHOD_TIMEBOXED
+        table_names: only fetch these tables, None for all tables of target_dbname.
+            CREATE_TIME, UPDATE_TIME and CHECK_TIME are unix timestamps converted by the server.
 
     Returns:
         lower table -> rows (to construct VidexTableStats), 不包含 db 层
@@ -435,31 +474,32 @@ def fetch_information_schema(env: Env, target_dbname: str) -> Dict[str, dict]:
         global_var_dict[key] = int(tmp_[0][1])
 
     # part 1: basic
+    # unix timestamps are converted by the server from its own session time zone, not the client's
     sql = """
         SELECT TABLE_CATALOG, TABLE_SCHEMA, TABLE_NAME, TABLE_TYPE, ENGINE, 
                VERSION, ROW_FORMAT, TABLE_ROWS, AVG_ROW_LENGTH, DATA_LENGTH, 
                MAX_DATA_LENGTH, INDEX_LENGTH, DATA_FREE, AUTO_INCREMENT, 
-               CREATE_TIME, UPDATE_TIME, CHECK_TIME, TABLE_COLLATION, 
+               UNIX_TIMESTAMP(CREATE_TIME) AS CREATE_TIME, UNIX_TIMESTAMP(UPDATE_TIME) AS UPDATE_TIME,
+               UNIX_TIMESTAMP(CHECK_TIME) AS CHECK_TIME, TABLE_COLLATION, 
                CHECKSUM, CREATE_OPTIONS, TABLE_COMMENT 
         FROM information_schema.TABLES 
-        WHERE table_schema = '%s' and ENGINE = 'InnoDB'
-    """ % target_dbname
+        WHERE table_schema = '%s' and ENGINE = 'InnoDB'%s
+    """ % (target_dbname, _table_name_filter('TABLE_NAME', table_names))
 
-    basic_list: pd.DataFrame = env.query_for_dataframe(sql).to_dict(orient='records')
+    basic_list: List[dict] = env.query_for_dicts(sql)
     res_dict = {}
+    # columns, indexes and ddl of the tables in bulk, tables absent here fall back to per-table get_table_meta
+    table_objs: Dict[str, Table] = env.get_schema_table_metas(target_dbname, table_names)
 
-    # Convert datetime objects to unix timestamp
     for row in basic_list:
         for key in ['CREATE_TIME', 'UPDATE_TIME', 'CHECK_TIME']:
-            if not pd.isna(row[key]):
-                row[key] = int(row[key].timestamp())
-            else:
-                row[key] = None
+            row[key] = None if row[key] is None else int(row[key])
         row.update(global_var_dict)
         table_name = str(row["TABLE_NAME"]).lower()
         res_dict[table_name] = row
 
-        table_obj: Table = env.get_table_meta(target_dbname, row["TABLE_NAME"])
+        table_obj: Table = table_objs.get(table_name) or env.get_table_meta(target_dbname, row["TABLE_NAME"])
+        table_objs[table_name] = table_obj
         res_dict[table_name]['columns'] = [json.loads(c.to_json()) for c in table_obj.columns]
         res_dict[table_name]['indexes'] = [json.loads(i.to_json()) for i in table_obj.indexes]
     # print(json.dumps(res_dict, indent=4))
@@ -467,9 +507,9 @@ def fetch_information_schema(env: Env, target_dbname: str) -> Dict[str, dict]:
     # part 2: innodb_table_stats
     sql = """
         select TABLE_NAME, N_ROWS,CLUSTERED_INDEX_SIZE, SUM_OF_OTHER_INDEX_SIZES 
-        from `mysql`.`innodb_table_stats` where database_name='%s';
-    """ % target_dbname
-    innodb_table_stats_list = env.query_for_dataframe(sql).to_dict(orient='records')
+        from `mysql`.`innodb_table_stats` where database_name='%s'%s;
+    """ % (target_dbname, _table_name_filter('table_name', table_names))
+    innodb_table_stats_list = env.query_for_dicts(sql)
     for row in innodb_table_stats_list:
         table_name = str(row["TABLE_NAME"]).lower()
         if table_name not in res_dict:
@@ -478,8 +518,30 @@ def fetch_information_schema(env: Env, target_dbname: str) -> Dict[str, dict]:
             res_dict[table_name].update(row)
 
     # part 3: table_in_mem_estimate
+    pct_cached_dict, used_method = fetch_pct_cached(env, target_dbname, pct_cached_method, pct_cached_timeout_ms)
+    for table_name, _dict in pct_cached_dict.items():
+        if table_name not in res_dict:
+            if table_names is not None:
+                continue
+            logging.warning(f"{table_name} not found in data_table_in_mem")
+        else:
+            res_dict[table_name]['pct_cached'] = _dict
+    for table_dict in res_dict.values():
+        table_dict['pct_cached_method'] = used_method
+
+    # part 4:  obtain ddl
+    for t, table_dict in res_dict.items():
+        table_dict['DDL'] = table_objs[t].ddl
+
+    # make sure lower case
+    res_dict = {k.lower(): v for k, v in res_dict.items()}
+    return res_dict
+
+
+def _fetch_pct_cached_from_buffer_page(env: Env, target_dbname: str, timeout_ms: int = None) -> Dict[str, dict]:
+    hint = f"/*+ MAX_EXECUTION_TIME({int(timeout_ms)}) */" if timeout_ms else ""
     sql = """
-        SELECT 
+        SELECT {}
           its.database_name as db_name,
           its.table_name as table_name,
           its.index_name as index_name,
@@ -528,36 +590,87 @@ def fetch_information_schema(env: Env, target_dbname: str) -> Dict[str, dict]:
         ON 
           its.full_table_name = ibp.TABLE_NAME and its.index_name = ibp.INDEX_NAME
         ORDER BY table_name, index_name;
-    """.format(target_dbname, target_dbname)
+    """.format(hint, target_dbname, target_dbname)
 
-    data_table_in_mem: pd.DataFrame = env.query_for_dataframe(sql)
-
-    for (db_name, table_name,), df_table in data_table_in_mem.groupby(['db_name', 'table_name']):
-        table_name = str(table_name).lower()
-        if table_name not in res_dict:
-            logging.warning(table_name, 'not found in data_table_in_mem')
+    res = {}
+    for row in sorted(env.query_for_dicts(sql), key=lambda r: (r['db_name'], r['table_name'])):
+        if row['pct_cached'] is None:
+            pct = 0
         else:
-            _dict = {}
-            for idx, row in df_table.iterrows():
-                if pd.isna(row['pct_cached']):
-                    pct = 0
-                else:
-                    pct = max(0., min(float(row['pct_cached']), 1.))
-                _dict[row['index_name']] = {
-                    'page_type': row['page_type'],
-                    'pct_cached': pct,
-                    'pool_rows': float(row['pool_rows']),
-                }
-            res_dict[table_name]['pct_cached'] = _dict
+            pct = max(0., min(float(row['pct_cached']), 1.))
+        res.setdefault(str(row['table_name']).lower(), {})[row['index_name']] = {
+            'page_type': row['page_type'],
+            'pct_cached': pct,
+            'pool_rows': float(row['pool_rows']),
+        }
+    return res
 
-    # part 4:  obtain ddl
-    for t, table_dict in res_dict.items():
-        table: Table = env.get_table_meta(target_dbname, table_dict['TABLE_NAME'])
-        table_dict['DDL'] = table.ddl
 
-    # make sure lower case
-    res_dict = {k.lower(): v for k, v in res_dict.items()}
-    return res_dict
+def _estimate_pct_cached(env: Env, target_dbname: str) -> Dict[str, dict]:
+    """
+    Assume the data pages in buffer pool are spread uniformly over all InnoDB indexes of the instance:
+    pct_cached = min(1, database pages in pool / total index pages). Only reads innodb_buffer_pool_stats
+    and the persistent stats tables, whose cost does not grow with the pool size.
+    """
+    pool_rows = env.query_for_rows(
+        "SELECT SUM(DATABASE_PAGES) AS pool_pages FROM INFORMATION_SCHEMA.INNODB_BUFFER_POOL_STATS")
+    pool_pages = 0 if len(pool_rows) == 0 or pool_rows[0][0] is None else float(pool_rows[0][0])
+    total_rows = env.query_for_rows(
+        "SELECT SUM(clustered_index_size + sum_of_other_index_sizes) AS total_pages FROM mysql.innodb_table_stats")
+    total_pages = 0 if len(total_rows) == 0 or total_rows[0][0] is None else float(total_rows[0][0])
+    ratio = 0. if total_pages <= 0 else max(0., min(pool_pages / total_pages, 1.))
+
+    sql = """
+        SELECT its.table_name AS table_name, iis.index_name AS index_name, its.n_rows AS total_rows
+        FROM mysql.innodb_table_stats its
+        JOIN (SELECT DISTINCT database_name, table_name, index_name FROM mysql.innodb_index_stats
+              WHERE database_name = '%s') iis
+        USING (database_name, table_name)
+        WHERE its.database_name = '%s'
+    """ % (target_dbname, target_dbname)
+    res = defaultdict(dict)
+    for row in env.query_for_dicts(sql):
+        total_rows = 0 if row['total_rows'] is None else float(row['total_rows'])
+        res[str(row['table_name']).lower()][row['index_name']] = {
+            'page_type': 'INDEX',
+            'pct_cached': ratio,
+            'pool_rows': ratio * total_rows,
+        }
+    return dict(res)
+
+
+def fetch_pct_cached(env: Env, target_dbname: str, method: str = PCT_CACHED_METHOD_EXACT,
+                     timeout_ms: int = DEFAULT_PCT_CACHED_TIMEOUT_MS) -> Tuple[Dict[str, dict], str]:
+    """
+    fetch the fraction of each index resident in the InnoDB buffer pool
+
+    Args:
+        env:
+        target_dbname:
+        method: one of PCT_CACHED_METHODS
+        timeout_ms: MAX_EXECUTION_TIME of the buffer page query for PCT_CACHED_METHOD_TIMEBOXED
+
+    Returns:
+        lower table -> index_name -> {'page_type', 'pct_cached', 'pool_rows'}, and the method actually used
+    """
+    if method not in PCT_CACHED_METHODS:
+        raise ValueError(f"unknown pct_cached method: {method}, expected one of {PCT_CACHED_METHODS}")
+    st = time.perf_counter()
+    if method == PCT_CACHED_METHOD_EXACT:
+        res = _fetch_pct_cached_from_buffer_page(env, target_dbname)
+    elif method == PCT_CACHED_METHOD_TIMEBOXED:
+        try:
+            res = _fetch_pct_cached_from_buffer_page(env, target_dbname, timeout_ms)
+        except Exception as e:
+            logging.warning(f"fetch pct_cached from buffer page exceeds {timeout_ms} ms or failed, "
+                            f"use default pct_cached: {e}")
+            res, method = {}, PCT_CACHED_METHOD_DEFAULT
+    elif method == PCT_CACHED_METHOD_ESTIMATE:
+        res = _estimate_pct_cached(env, target_dbname)
+    else:
+        res = {}
+    logging.info(f"fetch pct_cached of {target_dbname} by {method}, use {time.perf_counter() - st:.2f} seconds")
+    return res, method
 
 
 def fetch_all_meta_for_videx(env: Env, target_db: str, all_table_names: List[str] = None,
@@ -567,6 +680,11 @@ def fetch_all_meta_for_videx(env: Env, target_db: str, all_table_names: List[str
                              drop_hist_after_fetch: bool = True,
                              hist_mem_size: int = None,
                              histogram_data: dict = None,
+                             pct_cached_method: str = PCT_CACHED_METHOD_EXACT,
+                             journal: FetchJournal = None,
+                             n_mcv: int = 0,
+                             bucket_budget: int = None,
+                             hist_compact_epsilon: float = None,
                              ) -> Tuple[dict, dict, dict, dict]:
     """
 
@@ -578,6 +696,13 @@ def fetch_all_meta_for_videx(env: Env, target_db: str, all_table_names: List[str
         hist_force: 是否强制重新计算直方图，如果为True则会重新计算，否则会读取已有的直方图结果
         drop_hist_after_fetch: 为了避免hist 对 videx 的干扰，获取 hist 之后 drop histogram
         histogram_data: 如果非空，则不直接采集直方图，而是直接使用传入的 histogram_data
+        pct_cached_method: pct_cached 的采集方式，见 PCT_CACHED_METHODS
+        journal: 如果非空，每完成一张表（直方图为每一列）就追加写入 journal，并跳过 journal 中已完成的部分，
+            用于中断后续跑
+        n_mcv: 每列额外采集的高频值（MCV）个数，用于等值查询的估算，0 表示不采集。每列需要一次 GROUP BY 全表扫描
+        bucket_budget: 如果非空，忽略 n_buckets，根据单列 ndv 和偏斜探测在每张表 bucket_budget 个桶的预算内
+            自适应地决定每列的桶数，ndv 不超过预算的列使用 singleton 直方图。见 allocate_bucket_counts
+        hist_compact_epsilon: 如果非空，合并相邻的直方图桶，合并后插值得到的累计频率误差不超过该值。见 compact_histogram
 
     Returns:
         如果 result_dir 为 None，返回四部分 metadata dict，否则保存到文件下，返回文件路径：
@@ -600,8 +725,13 @@ def fetch_all_meta_for_videx(env: Env, target_db: str, all_table_names: List[str
     # 直接抓取 stats_dict
     if result_dir is not None and os.path.exists(os.path.join(result_dir, stats_file)):
         stats_dict = load_json_from_file(os.path.join(result_dir, stats_file))
+    elif journal is not None and journal.has(JOURNAL_SECTION_STATS):
+        stats_dict = journal.get(JOURNAL_SECTION_STATS)
     else:
-        stats_dict = fetch_information_schema(env, target_db)
+        stats_dict = fetch_information_schema(env, target_db, pct_cached_method=pct_cached_method,
+                                              table_names=all_table_names or None)
+        if journal is not None:
+            journal.record(JOURNAL_SECTION_STATS, None, stats_dict)
 
     if all_table_names is None or len(all_table_names) == 0:
         all_table_names = list(stats_dict.keys())
@@ -617,7 +747,7 @@ def fetch_all_meta_for_videx(env: Env, target_db: str, all_table_names: List[str
     if len(miss_ndv_tables) > 0:
         logging.info(f"fetch meta for videx: {ndv_single_file = } not found in {result_dir = }, or exist ndv single "
                      f"is not enough.fetch it: {sorted(ndv_single_dict.keys()) = } {miss_ndv_tables=}")
-        tmp_ndv_single_dict = fetch_ndv_single(env, target_db, miss_ndv_tables)
+        tmp_ndv_single_dict = fetch_ndv_single(env, target_db, miss_ndv_tables, journal=journal)
         ndv_single_dict.update(tmp_ndv_single_dict)
 
     # <<<<<<<<<<<<<<< ndv_single_dict end <<<<<<<<<<<<<<<<
@@ -646,7 +776,15 @@ def fetch_all_meta_for_videx(env: Env, target_db: str, all_table_names: List[str
                                                  ret_json=True,
                                                  hist_mem_size=hist_mem_size,
                                                  ndv_single_dict=ndv_single_dict,
+                                                 journal=journal,
+                                                 n_mcv=n_mcv,
+                                                 bucket_budget=bucket_budget,
                                                  )
+        if hist_compact_epsilon:
+            compaction = HistogramCompaction()
+            for table_hist in tmp_hist_dict.values():
+                compaction.merge(compact_hist_dict(table_hist, hist_compact_epsilon))
+            logging.info(f"compact histograms of {target_db} with epsilon={hist_compact_epsilon}: {compaction}")
         hist_dict.update(tmp_hist_dict)
 
     # <<<<<<<<<<<<<<< hist dict end <<<<<<<<<<<<<<<<
@@ -654,8 +792,12 @@ def fetch_all_meta_for_videx(env: Env, target_db: str, all_table_names: List[str
     # >>>>>>>>>>>>>>>> ndv_mulcol_dict >>>>>>>>>>>>>
     if result_dir is not None and os.path.exists(os.path.join(result_dir, ndv_mulcol_file)):
         ndv_mulcol_dict = load_json_from_file(os.path.join(result_dir, ndv_mulcol_file))
+    elif journal is not None and journal.has(JOURNAL_SECTION_NDV_MULCOL):
+        ndv_mulcol_dict = journal.get(JOURNAL_SECTION_NDV_MULCOL)
     else:
         ndv_mulcol_dict = fetch_ndv_multi_col_gt(env, target_db)
+        if journal is not None:
+            journal.record(JOURNAL_SECTION_NDV_MULCOL, None, ndv_mulcol_dict)
     # <<<<<<<<<<<<<<< ndv_mulcol_dict end <<<<<<<<<<<<<<<<
 
     logging.info(f"fetch result: {all_table_names=}, {result_dir=}")
@@ -680,6 +822,176 @@ def fetch_all_meta_for_videx(env: Env, target_db: str, all_table_names: List[str
     return stats_dict, hist_dict, ndv_single_dict, ndv_mulcol_dict
 
 
+class MetaRefreshThresholds(BaseModel, PydanticDataClassJsonMixin):
+    """
+    When refreshing a metadata bundle, a table is re-collected if its drift exceeds any threshold.
+    Tables whose UPDATE_TIME has not moved since the previous bundle are treated as unchanged.
+    """
+    # relative change of TABLE_ROWS, |live - prev| / prev
+    rows_ratio: float = 0.1
+    # relative change of DATA_LENGTH
+    data_length_ratio: float = 0.1
+    # re-collect if the table is updated more than hist_stale_seconds after its histograms are built. None to disable
+    hist_stale_seconds: Optional[int] = None
+
+
+def fetch_table_change_brief(env: Env, target_dbname: str, table_names: List[str] = None) -> Dict[str, dict]:
+    """
+    cheap per-table change indicators from information_schema.TABLES
+
+    Args:
+        table_names: only these tables, None for all tables of target_dbname
+
+    Returns:
+        lower table -> {'TABLE_ROWS', 'DATA_LENGTH', 'UPDATE_TIME'}, UPDATE_TIME is unix timestamp (UTC) or None
+    """
+    sql = """
+        SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, UNIX_TIMESTAMP(UPDATE_TIME) AS UPDATE_TIME 
+        FROM information_schema.TABLES 
+        WHERE table_schema = '%s' and ENGINE = 'InnoDB'%s
+    """ % (target_dbname, _table_name_filter('TABLE_NAME', table_names))
+    res = {}
+    for row in env.query_for_dicts(sql):
+        row['UPDATE_TIME'] = None if row['UPDATE_TIME'] is None else int(row['UPDATE_TIME'])
+        res[str(row['TABLE_NAME']).lower()] = row
+    return res
+
+
+def _hist_last_updated_ts(table_hist: dict) -> Optional[float]:
+    """the oldest `last_updated` of histograms of a table, None if unknown"""
+    oldest = None
+    for hist in (table_hist or {}).values():
+        if not hist:
+            continue
+        last_updated = hist.last_updated if isinstance(hist, HistogramStats) else hist.get('last_updated')
+        for fmt in ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S']:
+            try:
+                ts = datetime.strptime(str(last_updated), fmt).replace(tzinfo=timezone.utc).timestamp()
+                break
+            except ValueError:
+                ts = None
+        if ts is not None and (oldest is None or ts < oldest):
+            oldest = ts
+    return oldest
+
+
+def _drift_ratio(prev, live) -> float:
+    prev = 0 if prev is None or pd.isna(prev) else float(prev)
+    live = 0 if live is None or pd.isna(live) else float(live)
+    return abs(live - prev) / max(prev, 1.)
+
+
+def detect_changed_tables(prev_metadata: dict, live_brief: Dict[str, dict],
+                          thresholds: MetaRefreshThresholds = None) -> Dict[str, str]:
+    """
+    compare the previous metadata bundle with live information_schema.TABLES
+
+    Args:
+        prev_metadata: {'stats_dict', 'hist_dict', 'ndv_single_dict', 'ndv_mulcol_dict'}, tables in lower case
+        live_brief: result of fetch_table_change_brief
+        thresholds:
+
+    Returns:
+        lower table -> reason, for tables to re-collect
+    """
+    thresholds = thresholds or MetaRefreshThresholds()
+    prev_stats = prev_metadata.get('stats_dict', {})
+    prev_hist = prev_metadata.get('hist_dict', {})
+    prev_ndv = prev_metadata.get('ndv_single_dict', {})
+
+    changed = {}
+    for table, live in live_brief.items():
+        prev = prev_stats.get(table)
+        if prev is None:
+            changed[table] = 'new'
+            continue
+        if table not in prev_hist or table not in prev_ndv:
+            changed[table] = 'missing'
+            continue
+        prev_update_time, live_update_time = prev.get('UPDATE_TIME'), live.get('UPDATE_TIME')
+        if prev_update_time is not None and live_update_time is not None and live_update_time <= prev_update_time:
+            continue
+        rows_drift = _drift_ratio(prev.get('TABLE_ROWS'), live.get('TABLE_ROWS'))
+        if rows_drift > thresholds.rows_ratio:
+            changed[table] = f'rows drift {rows_drift:.3f}'
+            continue
+        length_drift = _drift_ratio(prev.get('DATA_LENGTH'), live.get('DATA_LENGTH'))
+        if length_drift > thresholds.data_length_ratio:
+            changed[table] = f'data_length drift {length_drift:.3f}'
+            continue
+        if thresholds.hist_stale_seconds is not None and live_update_time is not None:
+            hist_ts = _hist_last_updated_ts(prev_hist.get(table))
+            if hist_ts is not None and live_update_time - hist_ts > thresholds.hist_stale_seconds:
+                changed[table] = f'histogram stale {int(live_update_time - hist_ts)}s'
+    return changed
+
+
+def refresh_meta_for_videx(env: Env, target_db: str, prev_metadata: dict,
+                           all_table_names: List[str] = None,
+                           thresholds: MetaRefreshThresholds = None,
+                           n_buckets=64,
+                           hist_force: bool = True,
+                           drop_hist_after_fetch: bool = True,
+                           hist_mem_size: int = None,
+                           pct_cached_method: str = PCT_CACHED_METHOD_EXACT,
+                           n_mcv: int = 0,
+                           bucket_budget: int = None,
+                           hist_compact_epsilon: float = None,
+                           ) -> Tuple[dict, Dict[str, str]]:
+    """
+    Incrementally refresh a metadata bundle: only tables detected by detect_changed_tables are re-collected
+    by fetch_all_meta_for_videx and merged into the bundle, tables dropped from target_db are removed.
+
+    Args:
+        prev_metadata: {'stats_dict', 'hist_dict', 'ndv_single_dict', 'ndv_mulcol_dict'}, not modified
+        all_table_names: tables to keep fresh. None for all tables in target_db
+
+    Returns:
+        the refreshed bundle, and lower table -> reason of re-collected tables
+    """
+    if not target_env_available_for_videx(env):
+        raise Exception(f"given env ({env.instance=}) is not in BLACKLIST, cannot fetch raw metadata directly")
+    live_brief = fetch_table_change_brief(env, target_db, all_table_names or None)
+
+    metadata = {key: copy.deepcopy(prev_metadata.get(key, {}))
+                for key in ['stats_dict', 'hist_dict', 'ndv_single_dict', 'ndv_mulcol_dict']}
+    if not all_table_names:
+        for table in [t for t in metadata['stats_dict'] if t not in live_brief]:
+            logging.info(f"refresh meta for videx: {target_db}.{table} is dropped")
+            for section in metadata.values():
+                section.pop(table, None)
+
+    changed = detect_changed_tables(metadata, live_brief, thresholds)
+    logging.info(f"refresh meta for videx: {len(changed)}/{len(live_brief)} tables of {target_db} changed, {changed=}")
+    if not changed:
+        return metadata, changed
+
+    stats_dict, hist_dict, ndv_single_dict, ndv_mulcol_dict = fetch_all_meta_for_videx(
+        env, target_db, sorted(changed),
+        n_buckets=n_buckets,
+        hist_force=hist_force,
+        drop_hist_after_fetch=drop_hist_after_fetch,
+        hist_mem_size=hist_mem_size,
+        pct_cached_method=pct_cached_method,
+        n_mcv=n_mcv,
+        bucket_budget=bucket_budget,
+        hist_compact_epsilon=hist_compact_epsilon,
+    )
+    for table in changed:
+        for key, fetched in [('stats_dict', stats_dict), ('hist_dict', hist_dict),
+                             ('ndv_single_dict', ndv_single_dict), ('ndv_mulcol_dict', ndv_mulcol_dict)]:
+            if table in fetched:
+                metadata[key][table] = fetched[table]
+            else:
+                metadata[key].pop(table, None)
+    return metadata, changed
+
+
+def get_journal_path(meta_path: str) -> str:
+    """checkpoint journal of fetching metadata to meta_path"""
+    return f"{meta_path}.journal"
+
+
 def fetch_all_meta_with_one_file(meta_path: Union[str, dict],
                                  env: Env, target_db: str, all_table_names: List[str] = None,
                                  n_buckets=64,
@@ -687,6 +999,13 @@ def fetch_all_meta_with_one_file(meta_path: Union[str, dict],
                                  drop_hist_after_fetch: bool = True,
                                  hist_mem_size: int = None,
                                  histogram_data: dict = None,
+                                 pct_cached_method: str = PCT_CACHED_METHOD_EXACT,
+                                 resume: bool = False,
+                                 refresh: bool = False,
+                                 refresh_thresholds: MetaRefreshThresholds = None,
+                                 n_mcv: int = 0,
+                                 bucket_budget: int = None,
+                                 hist_compact_epsilon: float = None,
                                  ) -> Tuple[dict, dict, dict, dict]:
     """Fetch all metadata and store/load it in a single file.
 
@@ -705,6 +1024,16 @@ def fetch_all_meta_with_one_file(meta_path: Union[str, dict],
         drop_hist_after_fetch: Whether to drop histogram data after fetching
         hist_mem_size: Memory size limit for histogram
         histogram_data: Existing histogram data
+        pct_cached_method: How to collect pct_cached, one of PCT_CACHED_METHODS
+        resume: If meta_path is a path, progress is checkpointed to `{meta_path}.journal` while fetching.
+            True to continue from the journal of an interrupted run, False to start over.
+        refresh: If meta_path exists, re-collect only the changed tables (see refresh_meta_for_videx)
+            and save the merged bundle back, instead of loading it as is.
+        refresh_thresholds: Drift thresholds for refresh
+        n_mcv: Number of most common values to fetch per column, 0 to disable
+        bucket_budget: If not None, n_buckets is ignored and bucket counts are chosen per column by ndv and skew,
+            within this number of buckets per table
+        hist_compact_epsilon: If not None, merge adjacent histogram buckets within this cum_freq error
 
     Returns:
         Tuple of (stats_dict, hist_dict, ndv_single_dict, ndv_mulcol_dict)
@@ -730,15 +1059,28 @@ def fetch_all_meta_with_one_file(meta_path: Union[str, dict],
     if meta_path is not None and isinstance(meta_path, str) and os.path.exists(meta_path):
         # Load existing metadata file if it exists
         metadata = load_json_from_file(meta_path)
+        if refresh:
+            metadata, changed = refresh_meta_for_videx(env, target_db, metadata, all_table_names,
+                                                       thresholds=refresh_thresholds,
+                                                       n_buckets=n_buckets,
+                                                       hist_force=hist_force,
+                                                       drop_hist_after_fetch=drop_hist_after_fetch,
+                                                       hist_mem_size=hist_mem_size,
+                                                       pct_cached_method=pct_cached_method,
+                                                       n_mcv=n_mcv, bucket_budget=bucket_budget,
+                                                       hist_compact_epsilon=hist_compact_epsilon)
+            if changed:
+                dump_json_to_file(meta_path, metadata)
         # Recursively process the loaded dictionary
         return fetch_all_meta_with_one_file(metadata, env, target_db, all_table_names,
                                             n_buckets, hist_force, drop_hist_after_fetch,
-                                            hist_mem_size, histogram_data)
+                                            hist_mem_size, histogram_data, pct_cached_method, resume)
 
     # Generate new metadata if file is None, or file doesn't exist
     # Create temporary directory with timestamp
     temp_dir = f"temp_meta_{int(time.time())}"
     os.makedirs(temp_dir, exist_ok=True)
+    journal = FetchJournal(get_journal_path(meta_path), resume=resume) if isinstance(meta_path, str) else None
 
     try:
         # Fetch all metadata components using the core function
@@ -749,7 +1091,12 @@ def fetch_all_meta_with_one_file(meta_path: Union[str, dict],
             hist_force=hist_force,
             drop_hist_after_fetch=drop_hist_after_fetch,
             hist_mem_size=hist_mem_size,
-            histogram_data=histogram_data
+            histogram_data=histogram_data,
+            pct_cached_method=pct_cached_method,
+            journal=journal,
+            n_mcv=n_mcv,
+            bucket_budget=bucket_budget,
+            hist_compact_epsilon=hist_compact_epsilon,
         )
 
         if isinstance(meta_path, str):
@@ -763,6 +1110,8 @@ def fetch_all_meta_with_one_file(meta_path: Union[str, dict],
 
             # Save combined metadata to file
             dump_json_to_file(meta_path, metadata)
+            # the journal is useless once all metadata is saved
+            journal.remove()
 
         return stats_dict, hist_dict, ndv_single_dict, ndv_mulcol_dict
 
@@ -841,10 +1190,17 @@ def extract_rec_in_range_gt_from_explain(env: Env, sql: str,
                                          ret_trace: bool = True,
                                          verbose: bool = True,
                                          need_set_trace: bool = True,
+                                         need_set_session: bool = True,
+                                         conn=None,
                                          ) -> Tuple[pd.DataFrame, Optional[dict], Optional[List[dict]]]:
     """
     Conduct explain range_rows
 
+    Args:
+        need_set_session: set the VIDEX session variables and optimizer_switch of the target version
+        conn: connection to run on, e.g. kept by a worker across calls with need_set_trace and need_set_session
+            only for the first one. A new connection of env is opened if None.
+
     Returns:
         explain_result, trace_result, rec_in_range_gt
 
@@ -853,22 +1209,23 @@ def extract_rec_in_range_gt_from_explain(env: Env, sql: str,
     sql = sql.strip()
     if not sql.lower().startswith("explain"):
         sql = 'EXPLAIN ' + sql
-    conn = env.mysql_util.get_connection()
+    if conn is None:
+        conn = env.mysql_util.get_connection()
     with conn.cursor() as cursor:
         if ret_trace and need_set_trace:
             # turn on optimizer_trace
             cursor.execute('SET SESSION optimizer_trace="enabled=on", SESSION optimizer_trace_max_mem_size=4294967295;')
-        if videx_py_ip_port is not None and videx_py_ip_port != '127.0.0.1:5001':
+        if need_set_session and videx_py_ip_port is not None and videx_py_ip_port != '127.0.0.1:5001':
             # '127.0.0.1:5001' is default value in VIDEX engine.
             cursor.execute(f"SET @VIDEX_SERVER='{videx_py_ip_port}';")
             if verbose:
                 logging.info(f"SET @VIDEX_SERVER='{videx_py_ip_port}';")
-        if videx_options is not None:
+        if need_set_session and videx_options is not None:
             videx_options = json.dumps(videx_options)
             cursor.execute(f"SET @VIDEX_OPTIONS='{videx_options}';")
             if verbose:
                 logging.info(f"SET @VIDEX_OPTIONS='{videx_options}';")
-        if target_version == MySQLVersion.MySQL_57:
+        if need_set_session and target_version == MySQLVersion.MySQL_57:
             optimizer_switch = ("SESSION optimizer_switch='subquery_to_derived=off,block_nested_loop=on,hash_join=off,"
                                 "semijoin=off,firstmatch=off,loosescan=off,duplicateweedout=off,materialization=off';")
             cursor.execute(f"SET {optimizer_switch}")
@@ -961,6 +1318,7 @@ def meta_dict_to_sample_file(
                 # EXTRA_INFO_KEY_use_gt: self.use_gt,
                 EXTRA_INFO_KEY_mulcol: multi_ndv_dict.get(db_name, {}).get(table_name),
                 EXTRA_INFO_KEY_pct_cached: table_raw_stat_dict.get("pct_cached"),
+                EXTRA_INFO_KEY_pct_cached_method: table_raw_stat_dict.get("pct_cached_method"),
                 # 作为测试性的内容，我们只能将 gt_rec_in_ranges 和 gt_req_resp 重复的放到每一个 table 中
                 EXTRA_INFO_KEY_gt_rec_in_ranges: gt_rec_in_ranges.get(db_name, []),
                 EXTRA_INFO_KEY_gt_req_resp: gt_req_resp.get(db_name, {}),
@@ -978,9 +1336,12 @@ def construct_videx_task_meta_from_local_files(task_id, videx_db,
                                                hist_file: Union[str, dict],
                                                ndv_single_file: Union[str, dict],
                                                ndv_mulcol_file: Union[str, dict] = None,
-                                               gt_rec_in_ranges_file: Union[str, dict] = None,
+                                               gt_rec_in_ranges_file: Union[str, dict, list] = None,
                                                gt_req_resp_file: Union[str, dict] = None,
                                                raise_error: bool = False,
+                                               sample_file_info: Union[SampleFileInfo, dict] = None,
+                                               meta_bundle_file: str = None,
+                                               tables: List[str] = None,
                                                ) -> VidexDBTaskStats:
     """
     Add task metadata from a local file.
@@ -994,14 +1355,37 @@ def construct_videx_task_meta_from_local_files(task_id, videx_db,
             but it might not be provided at all, in which case rely on single column ndv estimation.
 
 
-        gt_rec_in_ranges_file:
+        gt_rec_in_ranges_file: path of the json file, or its content: trace items of range_scan_alternatives
         gt_req_resp_file:
         raise_error:
+        sample_file_info: sample files collected from the target db. They are re-keyed to videx_db,
+            and the statistic server estimates ndv based on them.
+        meta_bundle_file: arrow metadata bundle (see videx_meta_bundle). If given, stats, hist and ndv are
+            read from it, and stats_file, hist_file, ndv_single_file and ndv_mulcol_file are ignored.
+        tables: only load these tables from meta_bundle_file, None for all
 
     Returns:
         bool: true if added successfully
 
     """
+    if meta_bundle_file is not None:
+        if not os.path.exists(meta_bundle_file):
+            err_msg = f"meta_bundle_file not exists: {meta_bundle_file}, return"
+            if raise_error:
+                raise Exception(err_msg)
+            logging.error(err_msg)
+            return False
+        bundle = read_meta_bundle(meta_bundle_file, tables=tables)
+        unknown_tables = sorted({t.lower() for t in tables or []} - {t.lower() for t in bundle['stats_dict']})
+        if unknown_tables:
+            err_msg = f"tables not in meta_bundle_file: {unknown_tables}, return"
+            if raise_error:
+                raise Exception(err_msg)
+            logging.error(err_msg)
+            return False
+        stats_file, hist_file = bundle['stats_dict'], bundle['hist_dict']
+        ndv_single_file, ndv_mulcol_file = bundle['ndv_single_dict'], bundle['ndv_mulcol_dict']
+
     if isinstance(stats_file, dict):
         stats_dict = stats_file
     else:
@@ -1043,7 +1427,7 @@ def construct_videx_task_meta_from_local_files(task_id, videx_db,
         else:
             ndv_mulcol_dict = {}
 
-    if isinstance(gt_rec_in_ranges_file, dict):
+    if isinstance(gt_rec_in_ranges_file, (dict, list)):
         gt_rec_in_ranges = gt_rec_in_ranges_file
     else:
         if gt_rec_in_ranges_file and os.path.exists(gt_rec_in_ranges_file):
@@ -1105,10 +1489,31 @@ def construct_videx_task_meta_from_local_files(task_id, videx_db,
             other_index_sizes=table_dict['SUM_OF_OTHER_INDEX_SIZES'],
         )
 
+    if isinstance(sample_file_info, dict):
+        sample_file_info = SampleFileInfo.from_dict(sample_file_info)
+    if sample_file_info is not None:
+        # like other metadata, sample files are keyed by videx_db rather than the target db
+        table_files, table_load_rows = {}, {}
+        for db_tables in sample_file_info.sample_file_dict.values():
+            table_files.update({t.lower(): files for t, files in db_tables.items()})
+        for db_tables in (sample_file_info.table_load_rows or {}).values():
+            table_load_rows.update({t.lower(): rows for t, rows in db_tables.items()})
+        sample_file_info = SampleFileInfo(local_path_prefix=sample_file_info.local_path_prefix,
+                                          tos_path_prefix=sample_file_info.tos_path_prefix,
+                                          sample_file_dict={videx_db.lower(): table_files},
+                                          table_load_rows={videx_db.lower(): table_load_rows}
+                                          if table_load_rows else None)
+        for table_name, files in table_files.items():
+            table_stat_info = db_stat_dict.get(videx_db.lower(), {}).get(table_name)
+            if table_stat_info is not None:
+                table_stat_info.local_path_prefix = sample_file_info.local_path_prefix
+                table_stat_info.sample_file_list = files
+
     req_obj = VidexDBTaskStats(task_id=task_id,
                                meta_dict=meta_dict,
                                stats_dict=db_stat_dict,
                                db_config=db_config,
+                               sample_file_info=sample_file_info,
                                )
     return req_obj
 
@@ -5,10 +5,13 @@ SPDX-License-Identifier: MIT
 DB connection pool DBUtils https://webwareforpython.github.io/DBUtils/main.html
 """
 import logging
+import threading
 import traceback
 import urllib.parse
+from collections import OrderedDict
 from enum import Enum
-from typing import Optional
+from functools import partial
+from typing import Iterator, List, Optional, Union
 
 import pandas as pd
 from dbutils.persistent_db import PersistentDB
@@ -38,6 +41,8 @@ class MySQLConnectionConfig(BaseModel, PydanticDataClassJsonMixin):
     read_timeout: Optional[int] = 30
     write_timeout: Optional[int] = 30
     connect_timeout: Optional[int] = 10
+    # connection pools of at most this number of databases are kept open, see AbstractMySQLUtils.switch_db
+    max_db_pools: Optional[int] = 8
 
 
 def get_mysql_utils(config: MySQLConnectionConfig):
@@ -48,8 +53,15 @@ def get_mysql_utils(config: MySQLConnectionConfig):
 
 
 class AbstractMySQLUtils(object):
+    """
+    Connection pools are kept per database: `pool` is the pool of the current `database`, and switch_db only
+    selects the pool of another database, keeping the connections of the others warm. Pools of at most
+    max_db_pools databases are open, the least recently used one is closed beyond that, so the connections are
+    bounded by max_db_pools * max_connections.
+    """
 
-    def __init__(self, mysql_type, database, charset, read_timeout=30, write_timeout=30, connect_timeout=10):
+    def __init__(self, mysql_type, database, charset, read_timeout=30, write_timeout=30, connect_timeout=10,
+                 max_db_pools=8):
         self.mysql_type = mysql_type
         self.database = database
         self.charset = charset
@@ -58,24 +70,61 @@ class AbstractMySQLUtils(object):
         self.read_timeout = read_timeout
         self.write_timeout = write_timeout
         self.connect_timeout = connect_timeout
-        pass
+        self.max_db_pools = max(1, max_db_pools or 1)
+        # database -> pool, from the least recently used
+        self.db_pools: OrderedDict = OrderedDict()
+        self._pool_lock = threading.RLock()
 
-    def get_connection(self):
+    def get_connection(self, database: str = None):
+        """a new connection to database, default to the current database"""
         pass
 
     def switch_db(self, db_name):
         if db_name == self.database:
             return
-        self.database = db_name
-        self.reconstruct_pool()
+        with self._pool_lock:
+            self.database = db_name
+            # created on use if the database has no pool yet
+            self.pool = self.db_pools.get(db_name)
+            if self.pool is not None:
+                self.db_pools.move_to_end(db_name)
 
     def reconstruct_pool(self):
-        if self.pool is not None:
-            self.pool.close()
-            if self.pool_type == 'PooledDB':
-                self.get_shared_pool()
-            else:
-                self.get_persistent_pool()
+        """close and rebuild the pool of the current database"""
+        with self._pool_lock:
+            if self.pool is not None:
+                self.pool.close()
+                if self.pool_type == 'PooledDB':
+                    self.get_shared_pool()
+                else:
+                    self.get_persistent_pool()
+
+    def _set_pool(self, pool):
+        """set the pool of the current database, close the replaced one and the least recently used beyond max"""
+        with self._pool_lock:
+            replaced = self.db_pools.pop(self.database, None)
+            self.db_pools[self.database] = pool
+            self.pool = pool
+            to_close = [] if replaced is None or replaced is pool else [replaced]
+            while len(self.db_pools) > self.max_db_pools:
+                db_name, lru_pool = self.db_pools.popitem(last=False)
+                logging.info(f"close the connection pool of {db_name}, more than {self.max_db_pools} databases")
+                to_close.append(lru_pool)
+        for old_pool in to_close:
+            old_pool.close()
+
+    def _get_pool(self):
+        """the pool of the current database, created with the type of the other pools if it does not exist"""
+        pool = self.pool
+        if pool is not None:
+            return pool
+        with self._pool_lock:
+            if self.pool is None:
+                if self.pool_type == 'PersistentDB':
+                    self.get_persistent_pool()
+                else:
+                    self.get_shared_pool()
+            return self.pool
 
     def get_shared_pool(self, initial_connections=1, max_connections=10):
         """
@@ -89,9 +138,12 @@ class AbstractMySQLUtils(object):
         Returns:
 
         """
-        self.pool = PooledDB(self.get_connection, mincached=initial_connections, maxconnections=max_connections)
+        # connections of the pool always connect to its database, whatever the current database is later
+        pool = PooledDB(partial(self.get_connection, self.database), mincached=initial_connections,
+                        maxconnections=max_connections)
         self.pool_type = 'PooledDB'
-        return self.pool
+        self._set_pool(pool)
+        return pool
 
     def get_persistent_pool(self):
         """
@@ -101,26 +153,45 @@ class AbstractMySQLUtils(object):
         Returns:
 
         """
-        self.pool = PersistentDB(self.get_connection)
+        pool = PersistentDB(partial(self.get_connection, self.database))
         self.pool_type = 'PersistentDB'
-        return self.pool
+        self._set_pool(pool)
+        return pool
 
     def query_for_dataframe(self, sql_template: str, params: list = None) -> pd.DataFrame:
-        if self.pool is None:
-            self.pool = self.get_shared_pool()
-        with self.pool.connection(True) as connection:
+        with self._get_pool().connection(True) as connection:
             return query_for_dataframe(connection, sql_template, params)
 
     def query_for_value(self, sql_template: str, params: list = None):
-        if self.pool is None:
-            self.pool = self.get_shared_pool()
-        with self.pool.connection(True) as connection:
+        with self._get_pool().connection(True) as connection:
             return query_for_value(connection, sql_template, params)
 
+    def query_for_rows(self, sql_template: str, params: list = None) -> List[tuple]:
+        """rows of a small result as tuples, without building a DataFrame"""
+        with self._get_pool().connection(True) as connection:
+            return query_for_rows(connection, sql_template, params)
+
+    def query_for_dicts(self, sql_template: str, params: list = None) -> List[dict]:
+        """rows of a small result as {column name: value}"""
+        with self._get_pool().connection(True) as connection:
+            return query_for_rows(connection, sql_template, params, as_dict=True)
+
+    def iter_rows(self, sql_template: str, params: list = None, as_dict: bool = False,
+                  batch_size: int = 1000) -> Iterator[Union[tuple, dict]]:
+        """
+        Streams the rows of a large result with an unbuffered cursor (SSCursor), so that they are never all
+        held in memory. The connection is not shared and goes back to the pool when the iteration ends or
+        the iterator is closed.
+
+        Args:
+            as_dict: yield {column name: value} instead of tuples
+            batch_size: rows fetched from the server at a time
+        """
+        with self._get_pool().connection(False) as connection:
+            yield from iter_query_rows(connection, sql_template, params, as_dict=as_dict, batch_size=batch_size)
+
     def execute_query(self, sql: str, params: list = None):
-        if self.pool is None:
-            self.pool = self.get_shared_pool()
-        with self.pool.connection() as c:
+        with self._get_pool().connection() as c:
             with c.cursor() as cursor:
                 cursor.execute(sql, params)
                 c.commit()
@@ -130,9 +201,7 @@ class AbstractMySQLUtils(object):
                     return None
 
     def execute_manyquery(self, sql: str, params: list = None):
-        if self.pool is None:
-            self.pool = self.get_shared_pool()
-        with self.pool.connection() as c:
+        with self._get_pool().connection() as c:
             with c.cursor() as cursor:
                 cursor.executemany(sql, params)
                 c.commit()
@@ -142,9 +211,7 @@ class AbstractMySQLUtils(object):
                     return None
 
     def execute_insert_with_transaction(self, sql: str, params: list = None):
-        if self.pool is None:
-            self.pool = self.get_shared_pool()
-        with self.pool.connection() as c:
+        with self._get_pool().connection() as c:
             with c.cursor() as cursor:
                 cursor.execute(sql, params)
                 inserted_id = cursor.lastrowid
@@ -154,9 +221,7 @@ class AbstractMySQLUtils(object):
 
     def batch_execute_with_transaction(self, sql_list: list) -> bool:
         success = True
-        if self.pool is None:
-            self.pool = self.get_shared_pool()
-        with self.pool.connection() as c:
+        with self._get_pool().connection() as c:
             with c.cursor() as cursor:
                 try:
                     for sql in sql_list:
@@ -164,24 +229,38 @@ class AbstractMySQLUtils(object):
                     c.commit()
                     success = True
                 except Exception as e:
-                    print(e)
+                    logging.error(f"batch_execute_with_transaction failed, sql: {sql}, error: {e}")
                     c.rollback()
                     success = False
             c.close()
         return success
 
+    def execute_batch(self, sql_list: list):
+        """execute the statements in order over one connection, and raise the error of the failed statement"""
+        with self._get_pool().connection() as c:
+            with c.cursor() as cursor:
+                for sql in sql_list:
+                    try:
+                        cursor.execute(sql)
+                    except Exception as e:
+                        logging.error(f"execute_batch failed, sql: {sql}, error: {e}")
+                        raise
+            c.commit()
+
     def execute_with_rollback(self, sql: str, params):
-        if self.pool is None:
-            self.pool = self.get_shared_pool()
-        with self.pool.connection() as c:
+        with self._get_pool().connection() as c:
             with c.cursor() as cursor:
                 cursor.execute(sql, params)
                 c.rollback()
 
     def destory(self):
-        if self.pool is not None:
+        with self._pool_lock:
+            pools = list(self.db_pools.values())
+            self.db_pools.clear()
+            self.pool = None
+        for pool in pools:
             try:
-                self.pool.close()
+                pool.close()
             except Exception as e:
                 logging.warning(f"close connection pool failed, {e}, {traceback.format_exc()}")
 
@@ -193,17 +272,17 @@ class OpenMySQLUtils(AbstractMySQLUtils):
 
     def __init__(self, config: MySQLConnectionConfig):
         super().__init__('open_mysql', config.schema, config.charset,
-                         config.read_timeout, config.write_timeout, config.connect_timeout)
+                         config.read_timeout, config.write_timeout, config.connect_timeout, config.max_db_pools)
         self.host = config.host
         self.port = config.port
         self.user = config.user
         self.password = config.pwd
 
-    def get_connection(self):
+    def get_connection(self, database: str = None):
         import pymysql
         return pymysql.connect(user=self.user,
                                password=self.password,
-                               db=self.database,
+                               db=database if database is not None else self.database,
                                charset=self.charset if self.charset is not None else 'utf8',
                                host=self.host,
                                port=self.port,
@@ -262,3 +341,41 @@ def query_for_value(connection, sql_template: str, params: list = None):
             except Exception as e:
                 logging.error(f"query_for_value failed, sql: {cursor.mogrify(sql_template, params)}, error: {e}")
                 raise e
+
+
+def query_for_rows(connection, sql_template: str, params: list = None, as_dict: bool = False) -> list:
+    with connection:
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(sql_template, params)
+                col_names = _parse_col_names(cursor)
+                data = cursor.fetchall()
+                connection.commit()
+                if as_dict:
+                    return [dict(zip(col_names, row)) for row in data]
+                return [tuple(row) for row in data]
+            except Exception as e:
+                logging.error(f"query_for_rows failed, sql: {cursor.mogrify(sql_template, params)}, error: {e}")
+                raise e
+
+
+def iter_query_rows(connection, sql_template: str, params: list = None, as_dict: bool = False,
+                    batch_size: int = 1000):
+    """rows of the query fetched batch by batch with an unbuffered cursor"""
+    from pymysql.cursors import SSCursor
+
+    with connection:
+        with connection.cursor(SSCursor) as cursor:
+            try:
+                cursor.execute(sql_template, params)
+                col_names = [desc[0] for desc in cursor.description or []]
+            except Exception as e:
+                logging.error(f"iter_query_rows failed, sql: {cursor.mogrify(sql_template, params)}, error: {e}")
+                raise e
+            while True:
+                data = cursor.fetchmany(batch_size)
+                if not data:
+                    break
+                for row in data:
+                    yield dict(zip(col_names, row)) if as_dict else tuple(row)
+            connection.commit()
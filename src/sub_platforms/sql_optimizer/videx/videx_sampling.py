@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import logging
+import math
+import os
+from collections import defaultdict
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sub_platforms.sql_optimizer.common.exceptions import UnsupportedSamplingException
+from sub_platforms.sql_optimizer.common.sample_file_info import SampleFileInfo
+from sub_platforms.sql_optimizer.common.sample_info import SampleColumnInfo
+from sub_platforms.sql_optimizer.env.rds_env import Env
+from sub_platforms.sql_optimizer.meta import Table
+from sub_platforms.sql_optimizer.videx.videx_histogram import generate_histogram_from_sample, allocate_bucket_counts, \
+    value_skew, compact_hist_dict, HistogramCompaction
+from sub_platforms.sql_optimizer.videx.videx_metadata import fetch_information_schema, fetch_ndv_multi_col_gt, \
+    fetch_all_meta_for_videx, PCT_CACHED_METHOD_EXACT
+from sub_platforms.sql_optimizer.videx.videx_utils import target_env_available_for_videx, data_type_is_int, \
+    get_column_data_type, load_json_from_file, dump_json_to_file
+
+DEFAULT_SAMPLE_ROWS = 100000
+DEFAULT_SAMPLE_BLOCKS = 100
+# large columns are sampled with a prefix, which is enough for histogram bounds and ndv
+LARGE_COLUMN_SAMPLE_LENGTH = 255
+LARGE_COLUMN_TYPES = {'text', 'tinytext', 'mediumtext', 'longtext', 'blob', 'tinyblob', 'mediumblob', 'longblob',
+                      'json'}
+
+
+def sample_file_rel_path(target_db: str, table_name: str) -> str:
+    """relative path of a table's sample file under SampleFileInfo.local_path_prefix"""
+    return os.path.join(target_db.lower(), f"{table_name.lower()}.parquet")
+
+
+def gee_ndv_from_sample(values: pd.Series, table_rows: int) -> float:
+    """
+    GEE estimator: e = sqrt(n/r) * f_1 + sum_{j=2}^r f_j,
+    same as NDVEstimator.gee_estimate in the statistic server.
+
+    Args:
+        values: sampled values of one column
+        table_rows: rows of the source table
+
+    Returns:
+        estimated ndv, NULL is not counted
+    """
+    values = values.dropna()
+    r = len(values)
+    if r == 0:
+        return 0
+    counts = values.value_counts(sort=False).values
+    d = len(counts)
+    if table_rows is None or table_rows <= r:
+        return d
+    f1 = int(np.sum(counts == 1))
+    estimated = d - f1 + math.sqrt(table_rows / r) * f1
+    return min(max(estimated, d), table_rows)
+
+
+def sample_table_by_pk_range(env: Env, target_db: str, table_name: str,
+                             sample_rows: int = DEFAULT_SAMPLE_ROWS,
+                             n_blocks: int = DEFAULT_SAMPLE_BLOCKS,
+                             seed: int = 0) -> pd.DataFrame:
+    """
+    Block sampling by primary key range. The range [min_pk, max_pk] of the leading pk column is split into
+    n_blocks segments, and a block of contiguous rows is read from a random start in each segment.
+    Each block is a pk-range scan, so the cost is proportional to sample_rows, not table size.
+
+    Args:
+        env:
+        target_db:
+        table_name:
+        sample_rows: expected rows of the sample
+        n_blocks: number of blocks
+        seed: random seed, sampling is deterministic for the same seed and data
+
+    Returns:
+        sampled data, large columns are truncated to LARGE_COLUMN_SAMPLE_LENGTH
+
+    Raises:
+        UnsupportedSamplingException: no primary key, or leading primary key is not an integer
+    """
+    table_meta: Table = env.get_table_meta(target_db, table_name)
+    pk_cols = env.get_pk_columns(target_db, table_name)
+    if not pk_cols:
+        raise UnsupportedSamplingException(f"{target_db}.{table_name} has no primary key")
+    lead_col = env.get_column_meta(target_db, table_name, pk_cols[0].name)
+    if lead_col is None or not data_type_is_int(lead_col.data_type):
+        raise UnsupportedSamplingException(f"leading pk of {target_db}.{table_name} is not integer: "
+                                           f"{None if lead_col is None else lead_col.data_type}")
+    pk_names = [pk_col.name for pk_col in pk_cols]
+    sample_cols = [SampleColumnInfo.from_column(col, LARGE_COLUMN_SAMPLE_LENGTH
+                                                if col.data_type.lower() in LARGE_COLUMN_TYPES else 0)
+                   for col in table_meta.columns]
+
+    pk_range = env.get_pk_id_range(target_db, table_name, 0)
+    lo = int(pk_range['min_id'][0]['Value'])
+    hi = int(pk_range['max_id'][0]['Value'])
+
+    n_blocks = max(1, min(n_blocks, hi - lo + 1))
+    block_rows = max(1, int(math.ceil(sample_rows / n_blocks)))
+    if table_meta.rows is not None and int(table_meta.rows) <= sample_rows:
+        # small table, read all of it in one block
+        n_blocks, block_rows = 1, max(sample_rows, int(table_meta.rows) * 2)
+
+    rng = np.random.default_rng(seed)
+    bounds = np.linspace(lo, hi + 1, n_blocks + 1).astype(np.int64)
+    blocks = []
+    for i in range(n_blocks):
+        seg_lo, seg_hi = int(bounds[i]), int(bounds[i + 1]) - 1
+        if seg_hi < seg_lo:
+            continue
+        start = seg_lo if n_blocks == 1 else int(rng.integers(seg_lo, seg_hi + 1))
+        min_id = [{"ColumnName": pk_names[0], "Value": str(start)}]
+        max_id = [{"ColumnName": pk_names[0], "Value": str(seg_hi)}]
+        df_block = env.get_sample_data(target_db, table_name, table_meta, set(sample_cols), pk_names,
+                                       min_id, max_id, limit=block_rows, orderby='asc')
+        if df_block is not None and not df_block.empty:
+            blocks.append(df_block)
+    if len(blocks) == 0:
+        return pd.DataFrame({col.column_name: [] for col in sample_cols})
+    df_sample = pd.concat(blocks, ignore_index=True)
+    # keep the column order of table meta
+    return df_sample[[col.name for col in table_meta.columns if col.name in df_sample.columns]]
+
+
+def write_sample_file(df_sample: pd.DataFrame, path: str):
+    """write a sample to parquet, column that pyarrow cannot infer (e.g. mixed types) is stored as string"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    try:
+        arrow_table = pa.Table.from_pandas(df_sample, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        logging.warning(f"convert sample to arrow failed, fallback to string for object columns: {e}")
+        df_sample = df_sample.copy()
+        for col in df_sample.columns:
+            if df_sample[col].dtype == object:
+                df_sample[col] = df_sample[col].map(lambda v: None if v is None else str(v))
+        arrow_table = pa.Table.from_pandas(df_sample, preserve_index=False)
+    pq.write_table(arrow_table, path)
+
+
+def compute_table_stats_from_sample(df_sample: pd.DataFrame, table_meta: Table, n_buckets: int,
+                                    n_mcv: int = 0, bucket_budget: int = None) \
+        -> Tuple[Dict[str, Optional[dict]], Dict[str, int]]:
+    """
+    Args:
+        n_mcv: number of most common values recorded in equi-height histograms, 0 to disable
+        bucket_budget: if not None, n_buckets is ignored and the buckets of each column are chosen by its ndv and
+            skew in the sample, within bucket_budget buckets for the table. See allocate_bucket_counts.
+
+    Returns:
+        hist_dict: column -> histogram json, columns with unsupported types are skipped
+        ndv_single_dict: column -> ndv
+    """
+    table_rows = int(table_meta.rows) if table_meta.rows is not None else len(df_sample)
+    hist_dict, ndv_dict = {}, {}
+    hist_columns: Dict[str, str] = {}
+    for col in table_meta.columns:
+        if col.name not in df_sample.columns:
+            continue
+        ndv_dict[col.name] = int(math.ceil(gee_ndv_from_sample(df_sample[col.name], table_rows)))
+        data_type = get_column_data_type(col.data_type.lower())
+        if data_type is None or data_type == 'json':
+            continue
+        hist_columns[col.name] = data_type
+
+    col_buckets = {}
+    if bucket_budget is not None:
+        col_buckets = allocate_bucket_counts({col: ndv_dict[col] for col in hist_columns},
+                                             {col: value_skew(df_sample[col]) for col in hist_columns},
+                                             bucket_budget)
+    for col, data_type in hist_columns.items():
+        if col_buckets.get(col, n_buckets) <= 0:
+            # out of the bucket budget
+            continue
+        try:
+            hist = generate_histogram_from_sample(df_sample[col], data_type, col_buckets.get(col, n_buckets),
+                                                  table_rows, n_mcv)
+        except Exception as e:
+            logging.error(f"generate histogram from sample failed for {table_meta.name}.{col}: {e}")
+            continue
+        if hist is not None:
+            hist_dict[col] = hist.to_dict()
+    return hist_dict, ndv_dict
+
+
+def fetch_all_meta_by_sampling(meta_path: Optional[str],
+                               env: Env, target_db: str, all_table_names: List[str] = None,
+                               sample_dir: str = 'videx_samples',
+                               sample_rows: int = DEFAULT_SAMPLE_ROWS,
+                               n_blocks: int = DEFAULT_SAMPLE_BLOCKS,
+                               n_buckets: int = 64,
+                               seed: int = 0,
+                               pct_cached_method: str = PCT_CACHED_METHOD_EXACT,
+                               n_mcv: int = 0,
+                               bucket_budget: int = None,
+                               hist_compact_epsilon: float = None,
+                               ) -> Tuple[dict, dict, dict, dict, SampleFileInfo]:
+    """
+    Fetch metadata based on sampling. Only cheap metadata (information_schema, innodb_index_stats) is fetched
+    from the target instance. Histograms and single-column ndvs are derived from the sample locally,
+    and samples are saved as parquet files to be loaded by the statistic server.
+
+    Tables that cannot be sampled (e.g. without integer primary key) fall back to fetch_all_meta_for_videx.
+
+    Args:
+        meta_path: if it exists, load metadata from it; otherwise fetch and save to it if not None
+        env:
+        target_db:
+        all_table_names:
+        sample_dir: local directory to store sample files, i.e. SampleFileInfo.local_path_prefix
+        sample_rows: expected sampled rows per table
+        n_blocks: blocks per table
+        n_buckets: number of buckets for histogram
+        seed:
+        pct_cached_method: how to collect pct_cached, see fetch_information_schema
+        n_mcv: number of most common values recorded in histograms, 0 to disable
+        bucket_budget: if not None, choose the buckets of each column adaptively within this number per table
+        hist_compact_epsilon: if not None, merge adjacent histogram buckets within this cum_freq error
+
+    Returns:
+        Tuple of (stats_dict, hist_dict, ndv_single_dict, ndv_mulcol_dict, sample_file_info)
+    """
+    if meta_path is not None and os.path.exists(meta_path):
+        metadata = load_json_from_file(meta_path)
+        sample_file_info = metadata.get('sample_file_info')
+        return (metadata.get('stats_dict', {}), metadata.get('hist_dict', {}),
+                metadata.get('ndv_single_dict', {}), metadata.get('ndv_mulcol_dict', {}),
+                SampleFileInfo.from_dict(sample_file_info) if sample_file_info else None)
+
+    if not target_env_available_for_videx(env):
+        raise Exception(f"given env ({env.instance=}) is not in BLACKLIST, cannot fetch raw metadata directly")
+    logging.info(f"fetch_all_meta_by_sampling. {target_db=} {sample_dir=} {sample_rows=} {n_blocks=} "
+                 f"{n_buckets=} {all_table_names=}")
+
+    stats_dict = fetch_information_schema(env, target_db, pct_cached_method=pct_cached_method)
+    if all_table_names is None or len(all_table_names) == 0:
+        all_table_names = list(stats_dict.keys())
+    else:
+        stats_dict = {k: v for k, v in stats_dict.items() if k.lower() in set(t.lower() for t in all_table_names)}
+
+    hist_dict, ndv_single_dict = {}, {}
+    compaction = HistogramCompaction()
+    sample_file_dict: Dict[str, List[str]] = defaultdict(list)
+    unsupported_tables = []
+    for t_id, table_name in enumerate(all_table_names):
+        lower_table = table_name.lower()
+        try:
+            df_sample = sample_table_by_pk_range(env, target_db, table_name, sample_rows, n_blocks, seed)
+        except UnsupportedSamplingException as e:
+            logging.warning(f"sampling not supported, fallback to fetch: {e}")
+            unsupported_tables.append(table_name)
+            continue
+        logging.info(f"sampled {target_db}.{table_name} [{t_id}/{len(all_table_names)}]: {len(df_sample)} rows")
+
+        rel_path = sample_file_rel_path(target_db, table_name)
+        write_sample_file(df_sample, os.path.join(sample_dir, rel_path))
+        sample_file_dict[lower_table].append(rel_path)
+
+        table_meta = env.get_table_meta(target_db, table_name)
+        hist_dict[lower_table], ndv_single_dict[lower_table] = \
+            compute_table_stats_from_sample(df_sample, table_meta, n_buckets, n_mcv, bucket_budget)
+        if hist_compact_epsilon:
+            compaction.merge(compact_hist_dict(hist_dict[lower_table], hist_compact_epsilon))
+
+    if unsupported_tables:
+        _, fb_hist_dict, fb_ndv_single_dict, _ = fetch_all_meta_for_videx(
+            env, target_db, unsupported_tables, n_buckets=n_buckets, hist_force=True, drop_hist_after_fetch=True,
+            n_mcv=n_mcv, bucket_budget=bucket_budget, hist_compact_epsilon=hist_compact_epsilon)
+        hist_dict.update(fb_hist_dict)
+        ndv_single_dict.update(fb_ndv_single_dict)
+    if hist_compact_epsilon:
+        logging.info(f"compact sampled histograms of {target_db} with epsilon={hist_compact_epsilon}: {compaction}")
+
+    ndv_mulcol_dict = fetch_ndv_multi_col_gt(env, target_db)
+    sample_file_info = SampleFileInfo(local_path_prefix=os.path.abspath(sample_dir),
+                                      tos_path_prefix='',
+                                      sample_file_dict={target_db.lower(): dict(sample_file_dict)})
+
+    if meta_path is not None:
+        dump_json_to_file(meta_path, {
+            'stats_dict': stats_dict,
+            'hist_dict': hist_dict,
+            'ndv_single_dict': ndv_single_dict,
+            'ndv_mulcol_dict': ndv_mulcol_dict,
+            'sample_file_info': sample_file_info.to_dict(),
+        })
+    return stats_dict, hist_dict, ndv_single_dict, ndv_mulcol_dict, sample_file_info
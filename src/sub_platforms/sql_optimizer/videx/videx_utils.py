@@ -596,5 +596,30 @@ def parse_timestamp(timestamp):
         raise ValueError("Integer timestamp length is not compatible: '{}'".format(timestamp))
 
 
+def get_column_data_type(column_type: str):
+    """
+    convert mysql data type to inner type
+    """
+    data_type = None
+    if 'int' in column_type:
+        data_type = 'int'
+    elif column_type == 'float':
+        data_type = 'float'
+    elif column_type == 'double':
+        data_type = 'double'
+    elif column_type == 'decimal':
+        data_type = 'decimal'
+    elif column_type in ['date', 'timestamp']:
+        data_type = 'date'
+    elif column_type == 'datetime':
+        # histogram 需要区分 datetime 和 date，因为 videx find_nearest_buckets 会用到
+        data_type = 'datetime'
+    elif column_type in ['string', 'varchar', 'char', 'text', 'longtext']:
+        data_type = 'string'
+    elif column_type == 'json':
+        data_type = 'json'
+    return data_type
+
+
 if __name__ == '__main__':
     pass
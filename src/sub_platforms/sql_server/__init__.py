@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+The VIDEX statistic server and the tools to collect its metadata.
+
+The server imports most modules of this package at start but needs few third-party packages to answer requests.
+pandas, sqlalchemy, sqlglot, requests, estndv and pyarrow.dataset are used by the collectors, the clients and
+the sample-based estimators only, so they are imported at the top of the functions that use them, and annotations
+naming them are quoted and resolved under TYPE_CHECKING. Importing such a package at module level slows down the
+start of every server, see test/videx/test_startup.py.
+"""
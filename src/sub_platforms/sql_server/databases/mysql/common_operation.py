@@ -6,17 +6,19 @@ SPDX-License-Identifier: MIT
 import logging
 
 import numpy as np
-import pandas as pd
-from typing import List, Dict
-
-import sqlglot.expressions
+from typing import List, Dict, TYPE_CHECKING
 
 from sub_platforms.sql_server.meta import Column, Index, Table, mysql_to_pandas_type
 from sub_platforms.sql_server.common.exceptions import UnsupportedException
-from sqlglot.dialects.mysql import MySQL
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 def parse_from_expression(expression):
+    import sqlglot.expressions
+    from sqlglot.dialects.mysql import MySQL
+
     ast = sqlglot.parse_one(expression, read=MySQL)
     for node in ast.dfs():
         if isinstance(node, sqlglot.expressions.Column):
@@ -65,7 +67,9 @@ def replace_illegal_value(data, expected_pd_type):
     return data
 
 
-def correct_df_type_by_mysql_type(df_sample_raw: pd.DataFrame, table_meta: Table) -> pd.DataFrame:
+def correct_df_type_by_mysql_type(df_sample_raw: 'pd.DataFrame', table_meta: Table) -> 'pd.DataFrame':
+    import pandas as pd
+
     col_meta_dict = {column.name.lower(): column for column in table_meta.columns}
 
     for col in df_sample_raw.columns:
@@ -106,7 +110,9 @@ def correct_df_type_by_mysql_type(df_sample_raw: pd.DataFrame, table_meta: Table
     return df_sample_raw
 
 
-def parse_sample_data_to_dataframe(data: List[Dict[str, str]], table_meta: Table) -> pd.DataFrame:
+def parse_sample_data_to_dataframe(data: List[Dict[str, str]], table_meta: Table) -> 'pd.DataFrame':
+    import pandas as pd
+
     if data is None:
         return pd.DataFrame({})
     df_dict = {}
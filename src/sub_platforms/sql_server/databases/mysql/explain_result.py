@@ -2,12 +2,14 @@
 Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
 SPDX-License-Identifier: MIT
 """
-import pandas as pd
-from typing import List, Optional, Union
+from typing import List, Optional, Union, TYPE_CHECKING
 from pydantic import BaseModel, Field
 
 from sub_platforms.sql_server.common.pydantic_utils import PydanticDataClassJsonMixin
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 class MySQLExplainItem(BaseModel, PydanticDataClassJsonMixin):
     id: Optional[int] = None
@@ -33,7 +35,7 @@ class MySQLExplainResult(BaseModel, PydanticDataClassJsonMixin):
     trace_dict: Optional[dict] = Field(default=None, exclude=True, skip_dumps=True)
 
     @staticmethod
-    def from_df(explain_df: pd.DataFrame) -> 'MySQLExplainResult':
+    def from_df(explain_df: 'pd.DataFrame') -> 'MySQLExplainResult':
         """
         基于 df-like 的结果构造 MySQLExplainResult
         """
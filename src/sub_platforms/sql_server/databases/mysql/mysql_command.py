@@ -8,7 +8,7 @@ import logging
 import re
 import math
 from enum import Enum
-from typing import List
+from typing import List, Dict, TYPE_CHECKING
 
 import numpy as np
 from numpy import datetime64
@@ -20,6 +20,9 @@ from sub_platforms.sql_server.databases.mysql.common_operation import mapping_in
 from sub_platforms.sql_server.databases.mysql.explain_result import MySQLExplainResult, MySQLExplainItem
 from sub_platforms.sql_server.sql_opt_utils.sqlbrain_constants import UNSUPPORTED_MYSQL_DATATYPE
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 class MySQLVersion(Enum):
     MySQL_57 = 'mysql5.7'
@@ -37,10 +40,10 @@ class MySQLVersion(Enum):
 
 def get_mysql_version(mysql_util: AbstractMySQLUtils):
     sql = "show variables like 'version';"
-    df = mysql_util.query_for_dataframe(sql)
-    if len(df) == 0:
+    rows = mysql_util.query_for_rows(sql)
+    if len(rows) == 0:
         return MySQLVersion.MySQL_57
-    version_str = df['Value'].values[0]
+    version_str = rows[0][1]
     if version_str.startswith('8.0'):
         return MySQLVersion.MySQL_8
     return MySQLVersion.MySQL_57
@@ -59,19 +62,20 @@ class MySQLCommand:
         self.mysql_util = mysql_util
         self.version = version
 
-    def get_table_columns(self, db_name, table_name) -> List[Column]:
-        sql = f"""
+    def _columns_sql(self, where: str) -> str:
+        return f"""
             select table_schema, table_name, column_name, ordinal_position, is_nullable,
                 data_type, character_maximum_length, character_octet_length, numeric_precision,
                 numeric_scale, datetime_precision, character_set_name, collation_name,
                 column_type, column_key, extra 
             from information_schema.columns 
-            where table_schema='{db_name}' and table_name='{table_name}'
+            where {where}
         """
-        df = self.mysql_util.query_for_dataframe(sql)
+
+    @staticmethod
+    def _build_columns(rows, db_name, table_name) -> List[Column]:
         columns = []
-        np = df.to_numpy()
-        for row in np:
+        for row in rows:
             column = Column()
             column.db = row[0]
             column.table = row[1]
@@ -96,7 +100,31 @@ class MySQLCommand:
 
         return columns
 
-    def get_table_indexes(self, db_name, table_name) -> List[Index]:
+    def get_table_columns(self, db_name, table_name) -> List[Column]:
+        sql = self._columns_sql(f"table_schema='{db_name}' and table_name='{table_name}'")
+        return self._build_columns(self.mysql_util.query_for_rows(sql), db_name, table_name)
+
+    def get_schema_columns(self, db_name) -> Dict[str, List[Column]]:
+        """
+        columns of all tables in db_name with one query.
+        Tables with unsupported datatype are skipped, get_table_columns raises for them.
+
+        Returns:
+            lower table name -> columns
+        """
+        sql = self._columns_sql(f"table_schema='{db_name}'") + " order by table_name, ordinal_position"
+        df = self.mysql_util.query_for_dataframe(sql)
+        result = {}
+        if len(df) == 0:
+            return result
+        for table_name, df_table in df.groupby(df.columns[1], sort=False):
+            try:
+                result[str(table_name).lower()] = self._build_columns(df_table.to_numpy(), db_name, table_name)
+            except UnsupportedException as e:
+                logging.warning(f"skip {db_name}.{table_name} in get_schema_columns: {e}")
+        return result
+
+    def _indexes_sql(self, where: str) -> str:
         if self.version == MySQLVersion.MySQL_8:
             sql = f"""
                 select table_schema as dbname, table_name as table_name, index_name as index_name, 
@@ -105,7 +133,7 @@ class MySQLCommand:
                             sub_part as sub_part, is_visible as is_visible,
                             expression as expression, collation as collation, index_type as index_type
                 from information_schema.statistics
-                where table_schema = '{db_name}' and table_name='{table_name}'
+                where {where}
             """
         else:
             sql = f"""
@@ -115,9 +143,12 @@ class MySQLCommand:
                             sub_part as sub_part, 'YES' as is_visible, 
                             'NULL' as expression, collation as collation, index_type as index_type
                         from information_schema.statistics
-                        where table_schema = '{db_name}' and table_name='{table_name}'
+                        where {where}
                     """
-        df = self.mysql_util.query_for_dataframe(sql)
+        return sql
+
+    @staticmethod
+    def _build_indexes(df: 'pd.DataFrame') -> List[Index]:
         if len(df) == 0:
             return []
         df['sub_part'] = df['sub_part'].replace({np.nan: 0}).astype('int')
@@ -149,7 +180,7 @@ class MySQLCommand:
             index.columns = []
             sorted_columns = column_info.sort_values(by=['seq_in_index'])
             for idx, row in sorted_columns.iterrows():
-                column = IndexColumn.simple_column(row['column_name'], db_name, table_name)
+                column = IndexColumn.simple_column(row['column_name'], index_info[0], index_info[1])
                 column.cardinality = row['cardinality']
                 column.sub_part = row['sub_part']
                 column.expression = row['expression']
@@ -160,13 +191,28 @@ class MySQLCommand:
 
         return indexes
 
-    def get_table_meta(self, db_name, table_name):
-        # Note: 无需处理 sharding 的情况
-        sql = f"show table status in `{db_name}` like '{table_name}'"
-        df = self.mysql_util.query_for_dataframe(sql)
+    def get_table_indexes(self, db_name, table_name) -> List[Index]:
+        sql = self._indexes_sql(f"table_schema = '{db_name}' and table_name='{table_name}'")
+        return self._build_indexes(self.mysql_util.query_for_dataframe(sql))
 
+    def get_schema_indexes(self, db_name) -> Dict[str, List[Index]]:
+        """
+        indexes of all tables in db_name with one query.
+
+        Returns:
+            lower table name -> indexes
+        """
+        df = self.mysql_util.query_for_dataframe(self._indexes_sql(f"table_schema = '{db_name}'"))
+        result = {}
         if len(df) == 0:
-            raise TableNotFoundException("table not in env", table_name)
+            return result
+        for table_name, df_table in df.groupby('table_name', sort=False):
+            result[str(table_name).lower()] = self._build_indexes(df_table.copy())
+        return result
+
+    @staticmethod
+    def _build_table_from_status(db_name, table_name, df: 'pd.DataFrame') -> Table:
+        """build Table from one row of `show table status`"""
         table = Table()
         table.name = table_name
         table.db = db_name
@@ -184,6 +230,22 @@ class MySQLCommand:
         table.update_time = int(update_time.timestamp()) if update_time is not None else None
         check_time = datetime64_to_datetime(df['Check_time'].values[0])
         table.check_time = int(check_time.timestamp()) if check_time is not None else None
+        return table
+
+    def get_table_ddl(self, db_name, table_name) -> str:
+        rows = self.mysql_util.query_for_rows(f'show create table `{db_name}`.`{table_name}`')
+        ddl = rows[0][1]
+        ddl = re.sub(r'\b(AUTO_INCREMENT|auto_increment)=\d+\b', "", ddl)
+        return ddl
+
+    def get_table_meta(self, db_name, table_name):
+        # Note: 无需处理 sharding 的情况
+        sql = f"show table status in `{db_name}` like '{table_name}'"
+        df = self.mysql_util.query_for_dataframe(sql)
+
+        if len(df) == 0:
+            raise TableNotFoundException("table not in env", table_name)
+        table = self._build_table_from_status(db_name, table_name, df)
         table.columns = self.get_table_columns(db_name, table_name)
         table.indexes = self.get_table_indexes(db_name, table_name)
         mapping_index_columns(table)
@@ -193,21 +255,72 @@ class MySQLCommand:
             table_stats_sql = f"select n_rows, clustered_index_size, sum_of_other_index_sizes from mysql.innodb_table_stats " \
                               f"where database_name='{db_name}' and table_name='{table_name}'"
 
-            df = self.mysql_util.query_for_dataframe(table_stats_sql)
-            if df is not None and len(df) == 1:
-                table.rows = int(df['n_rows'].values[0])
-                table.cluster_index_size = int(df['clustered_index_size'].values[0])
-                table.other_index_sizes = int(df['sum_of_other_index_sizes'].values[0])
+            rows = self.mysql_util.query_for_dicts(table_stats_sql)
+            if len(rows) == 1:
+                table.rows = int(rows[0]['n_rows'])
+                table.cluster_index_size = int(rows[0]['clustered_index_size'])
+                table.other_index_sizes = int(rows[0]['sum_of_other_index_sizes'])
         except Exception as e:
             logging.warning(f"get table stats failed, {e}")
 
-        df = self.mysql_util.query_for_dataframe(f'show create table `{db_name}`.`{table_name}`')
-        # ddl = self.mysql_util.query_for_value(f'show create table {db_name}.{table_name}')
-        ddl = df.values[0][1]
-        ddl = re.sub(r'\b(AUTO_INCREMENT|auto_increment)=\d+\b', "", ddl)
-        table.ddl = ddl
+        table.ddl = self.get_table_ddl(db_name, table_name)
         return table
 
+    def get_schema_table_metas(self, db_name, table_names: List[str] = None) -> Dict[str, Table]:
+        """
+        get_table_meta for all tables in db_name. Columns, indexes, table status and innodb_table_stats are fetched
+        by schema-wide queries, only `show create table` is issued per table.
+        Tables that cannot be built (e.g. views, unsupported datatype) are skipped with a warning.
+
+        Args:
+            db_name:
+            table_names: if given, only build these tables (case-insensitive)
+
+        Returns:
+            lower table name -> Table
+        """
+        status_df = self.mysql_util.query_for_dataframe(f"show table status in `{db_name}`")
+        if len(status_df) == 0:
+            return {}
+        if table_names is not None:
+            target = {t.lower() for t in table_names}
+            status_df = status_df[status_df['Name'].str.lower().isin(target)].reset_index(drop=True)
+        columns_dict = self.get_schema_columns(db_name)
+        indexes_dict = self.get_schema_indexes(db_name)
+
+        table_stats_dict = {}
+        try:
+            table_stats_sql = f"select table_name, n_rows, clustered_index_size, sum_of_other_index_sizes " \
+                              f"from mysql.innodb_table_stats where database_name='{db_name}'"
+            table_stats_dict = {str(row['table_name']).lower(): row
+                                for row in self.mysql_util.query_for_dicts(table_stats_sql)}
+        except Exception as e:
+            logging.warning(f"get table stats failed, {e}")
+
+        tables = {}
+        for i in range(len(status_df)):
+            df = status_df.iloc[i:i + 1].reset_index(drop=True)
+            table_name = df['Name'].values[0]
+            lower_table_name = str(table_name).lower()
+            if lower_table_name not in columns_dict:
+                continue
+            try:
+                table = self._build_table_from_status(db_name, table_name, df)
+                table.columns = columns_dict[lower_table_name]
+                table.indexes = indexes_dict.get(lower_table_name, [])
+                mapping_index_columns(table)
+                if lower_table_name in table_stats_dict:
+                    row = table_stats_dict[lower_table_name]
+                    table.rows = int(row['n_rows'])
+                    table.cluster_index_size = int(row['clustered_index_size'])
+                    table.other_index_sizes = int(row['sum_of_other_index_sizes'])
+                table.ddl = self.get_table_ddl(db_name, table_name)
+            except Exception as e:
+                logging.warning(f"skip {db_name}.{table_name} in get_schema_table_metas: {e}")
+                continue
+            tables[lower_table_name] = table
+        return tables
+
     def explain(self, sql: str, format: str = None) -> MySQLExplainResult:
         result = MySQLExplainResult()
         result.format = format
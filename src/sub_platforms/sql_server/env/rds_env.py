@@ -9,8 +9,7 @@ import re
 import os
 import traceback
 from abc import ABC, abstractmethod
-import pandas as pd
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, TYPE_CHECKING
 from pymysql import InternalError
 
 from sub_platforms.sql_server.common.db_variable import VariablesAboutIndex, MysqlVariable
@@ -21,6 +20,9 @@ from sub_platforms.sql_server.databases.mysql.mysql_command import MySQLCommand,
 from sub_platforms.sql_server.meta import Table, Column, IndexColumn, IndexType
 from sub_platforms.sql_server.videx.videx_mysql_utils import get_mysql_utils, MySQLConnectionConfig, DBTYPE
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 def add_backquote(name):
     """
@@ -29,13 +31,20 @@ def add_backquote(name):
     return name if name.startswith('`') and name.endswith('`') else f"`{name}`"
 
 
-def unify_col_with_value(df: pd.DataFrame):
+def unify_col_with_value(df: 'pd.DataFrame'):
     """
     Convert the first row of the DataFrame into a list in the format [{ColumnName: column_name, Value: column_value}, ]
     """
     assert df is not None and not df.empty, f"Empty DataFrame {df}"
+    return unify_row_with_value(df.iloc[0].to_dict())
+
+
+def unify_row_with_value(row: dict):
+    """
+    Convert a row of query_for_dicts into a list in the format [{ColumnName: column_name, Value: column_value}, ]
+    """
     # Note: Adding str to Value is intended to convert all types to str, ensuring correctness when dumping to a file later
-    return [{"ColumnName": key, "Value": str(val)} for key, val in df.iloc[0].to_dict().items()]
+    return [{"ColumnName": key, "Value": str(val)} for key, val in row.items()]
 
 
 def extract_pk_contents(pk_c_v: List[Dict[str, str]], pk_names: List[str]):
@@ -61,6 +70,8 @@ class Env(ABC):
         self.mysql_util = None
         self.worker_id = None
         self.mysql_command = None
+        # dbs whose tables have all been fetched by get_schema_table_metas
+        self._schema_fetched_dbs: Set[str] = set()
 
     def get_default_db(self):
         return self.default_db
@@ -99,6 +110,37 @@ class Env(ABC):
             self.meta_info[db_name][lower_table_name] = self._request_meta_info(db_name, table_name, logic_db=db_name)
         return self.meta_info[db_name][lower_table_name]
 
+    def get_schema_table_metas(self, db_name, table_names: List[str] = None) -> Dict[str, Table]:
+        """get table metas of a whole schema (or the given tables) in bulk, memoized in meta_info like get_table_meta
+        Args:
+            db_name (str): database name
+            table_names (List[str]): if None, all tables in db_name
+
+        Returns:
+            tables (Dict[str, Table]): lower table name -> table meta. Tables that bulk fetch cannot build are absent,
+                use get_table_meta for them.
+
+        """
+        if db_name is None or db_name.strip() == '':
+            db_name = self.default_db
+        if db_name not in self.meta_info:
+            self.meta_info[db_name] = {}
+        cached = self.meta_info[db_name]
+
+        if table_names is None:
+            if db_name not in self._schema_fetched_dbs:
+                for lower_table_name, table in self._request_schema_meta_info(db_name, None).items():
+                    cached.setdefault(lower_table_name, table)
+                self._schema_fetched_dbs.add(db_name)
+            return dict(cached)
+
+        lower_table_names = [t.lower() for t in table_names]
+        missing = [t for t in lower_table_names if t not in cached]
+        if missing and db_name not in self._schema_fetched_dbs:
+            for lower_table_name, table in self._request_schema_meta_info(db_name, missing).items():
+                cached.setdefault(lower_table_name, table)
+        return {t: cached[t] for t in lower_table_names if t in cached}
+
     def remove_table_meta(self, db_name, table_name):
         if db_name is None or db_name.strip() == '' or table_name is None or table_name.strip() == '':
             logging.warning("db_name or table_name is empty, no need to remove")
@@ -107,6 +149,7 @@ class Env(ABC):
             lower_table_name = table_name.lower()
             if lower_table_name in self.meta_info[db_name]:
                 del self.meta_info[db_name][lower_table_name]
+        self._schema_fetched_dbs.discard(db_name)
 
     def get_column_meta(self, db_name: str, table_name: str, column_name: str) -> Optional[Column]:
         table: Table = self.get_table_meta(db_name, table_name)
@@ -180,6 +223,11 @@ class Env(ABC):
     def _request_meta_info(self, db_name, table_name, logic_db) -> Table:
         raise NotImplementedError
 
+    def _request_schema_meta_info(self, db_name, table_names: Optional[List[str]]) -> Dict[str, Table]:
+        """bulk version of _request_meta_info, lower table name -> Table.
+        Envs without schema-wide queries return nothing and callers fall back to get_table_meta."""
+        return {}
+
     @abstractmethod
     def execute(self, sql, params=None):
         raise NotImplementedError
@@ -192,10 +240,25 @@ class Env(ABC):
     def execute_manyquery(self, sql, params=None):
         raise NotImplementedError
 
+    def execute_batch(self, sql_list: List[str]):
+        """execute the statements in order, envs with a connection pool send them over one connection"""
+        for sql in sql_list:
+            self.execute(sql)
+
     @abstractmethod
     def query_for_dataframe(self, sql, params=None):
         raise NotImplementedError
 
+    def query_for_rows(self, sql, params=None) -> List[tuple]:
+        raise NotImplementedError
+
+    def query_for_dicts(self, sql, params=None) -> List[dict]:
+        raise NotImplementedError
+
+    def iter_rows(self, sql, params=None, as_dict: bool = False, batch_size: int = 1000):
+        """streams the rows of a large result, see AbstractMySQLUtils.iter_rows"""
+        raise NotImplementedError
+
     @abstractmethod
     def change_index(self, ddl):
         raise NotImplementedError
@@ -237,6 +300,9 @@ class DirectConnectMySQLEnv(Env, ABC):
     def _request_meta_info(self, db_name, table_name, logic_db) -> Table:
         return self.mysql_command.get_table_meta(db_name, table_name)
 
+    def _request_schema_meta_info(self, db_name, table_names: Optional[List[str]]) -> Dict[str, Table]:
+        return self.mysql_command.get_schema_table_metas(db_name, table_names)
+
     def get_sample_data(self, db_name: str, table_name: str, table_meta: Table, sample_cols: Set[SampleColumnInfo], pk_names: List[str],
                         min_id: List[Dict], max_id: List[Dict], limit: int = 10, random=False,
                         orderby='desc', shard_no: int = 0):
@@ -283,19 +349,19 @@ class DirectConnectMySQLEnv(Env, ABC):
         # request lower bound
         min_query = (f"select {','.join(pk_names)} from `{db_name}`.`{table_name}` order by "
                      f"{','.join([f'{pk_name} asc' for pk_name in pk_names])} limit 1")
-        df_min = self.mysql_util.query_for_dataframe(min_query)
-        if df_min is None or df_min.empty:
+        min_rows = self.mysql_util.query_for_dicts(min_query)
+        if not min_rows:
             raise Exception(f'get_pk_id_range lower bound {pk_names} from {db_name}.{table_name} failed')
 
         # request upper bound
         max_query = (f"select {','.join(pk_names)} from `{db_name}`.`{table_name}` order by "
                      f"{','.join([f'{pk_name} desc' for pk_name in pk_names])} limit 1")
-        df_max = self.mysql_util.query_for_dataframe(max_query)
-        if df_max is None or df_max.empty:
+        max_rows = self.mysql_util.query_for_dicts(max_query)
+        if not max_rows:
             raise Exception(f'get_pk_id_range upper bound {pk_names} from {db_name}.{table_name} failed')
 
-        pk_info = {"min_id": unify_col_with_value(df_min),
-                   "max_id": unify_col_with_value(df_max)}
+        pk_info = {"min_id": unify_row_with_value(min_rows[0]),
+                   "max_id": unify_row_with_value(max_rows[0])}
 
         return pk_info
 
@@ -308,9 +374,21 @@ class DirectConnectMySQLEnv(Env, ABC):
     def execute_manyquery(self, sql, params=None):
         return self.mysql_util.execute_manyquery(sql, params=params)
 
+    def execute_batch(self, sql_list: List[str]):
+        self.mysql_util.execute_batch(sql_list)
+
     def query_for_dataframe(self, sql, params=None):
         return self.mysql_util.query_for_dataframe(sql, params)
 
+    def query_for_rows(self, sql, params=None) -> List[tuple]:
+        return self.mysql_util.query_for_rows(sql, params)
+
+    def query_for_dicts(self, sql, params=None) -> List[dict]:
+        return self.mysql_util.query_for_dicts(sql, params)
+
+    def iter_rows(self, sql, params=None, as_dict: bool = False, batch_size: int = 1000):
+        return self.mysql_util.iter_rows(sql, params, as_dict=as_dict, batch_size=batch_size)
+
     def change_index(self, ddl):
         return self.mysql_util.execute_query(ddl)
 
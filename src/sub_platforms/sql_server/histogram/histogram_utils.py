@@ -3,7 +3,314 @@
 Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
 SPDX-License-Identifier: MIT
 """
+import datetime
+import logging
+import numbers
+import os
+import threading
+import weakref
+from typing import List, Optional, Dict, Tuple, Iterable, TYPE_CHECKING
+
+import numpy as np
+
+from sub_platforms.sql_server.common.sample_file_info import SampleFileInfo, UNKNOWN_LOAD_ROWS
+from sub_platforms.sql_server.videx.videx_histogram import convert_str_by_type, NULL_STR
 from sub_platforms.sql_server.videx.videx_metadata import VidexTableStats
 
-def load_sample_file(table_stats: VidexTableStats):
-    raise NotImplementedError("Will integrated in next stage")
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# code of NULL in VidexSample
+NULL_CODE = -1
+
+
+class VidexSample:
+    """
+    Sample data of a table, loaded column by column from memory-mapped parquet files.
+
+    Each column is encoded once into int32 codes over its sorted distinct values (NULL is NULL_CODE),
+    i.e. code order is value order. Raw values are dropped after encoding, so the memory is
+    num_rows * 4 bytes + distinct values per loaded column.
+
+    A VidexSample is shared by all models (tasks) that point to the same sample files, see get_shared_sample.
+    """
+
+    def __init__(self, paths: List[str], load_rows: int = UNKNOWN_LOAD_ROWS):
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        self.paths = list(paths)
+        self.load_rows = load_rows
+        self._dataset = ds.dataset(self.paths, format='parquet', filesystem=fs.LocalFileSystem(use_mmap=True))
+        self._lower_columns = {name.lower(): name for name in self._dataset.schema.names}
+        # key: column, value: (codes, uniques), published together so readers never see one without the other
+        self._encoded: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # key: columns, value: codes of each column, rows sorted by (columns[0], columns[1], ...)
+        self._sorted_codes: Dict[Tuple[str, ...], List[np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.num_rows = self._dataset.count_rows()
+        if self.load_rows != UNKNOWN_LOAD_ROWS:
+            self.num_rows = min(self.num_rows, self.load_rows)
+
+    def __len__(self):
+        return self.num_rows
+
+    @property
+    def sample_columns(self) -> List[str]:
+        """all columns in sample files"""
+        return list(self._dataset.schema.names)
+
+    @property
+    def columns(self) -> List[str]:
+        """columns that have been loaded"""
+        return list(self._encoded.keys())
+
+    def resolve_column(self, col: str) -> Optional[str]:
+        """column name in sample files, case-insensitive. None if the column is not sampled"""
+        return self._lower_columns.get(col.lower())
+
+    def load_columns(self, columns: Iterable[str]):
+        """load and encode columns that are not loaded yet. Columns not in sample files are ignored"""
+        with self._lock:
+            to_load = sorted({c for c in map(self.resolve_column, columns) if c is not None} - set(self._encoded))
+            if not to_load:
+                return
+            arrow_table = self._dataset.head(self.num_rows, columns=to_load)
+            for col in to_load:
+                self._encoded[col] = _encode_column(arrow_table.column(col).to_pandas())
+
+    def _encoded_column(self, col: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(codes, uniques) of a column, loaded if needed. None if the column is not sampled"""
+        name = self.resolve_column(col)
+        if name is None:
+            return None
+        encoded = self._encoded.get(name)
+        if encoded is None:
+            self.load_columns([name])
+            encoded = self._encoded[name]
+        return encoded
+
+    def codes(self, col: str) -> Optional[np.ndarray]:
+        encoded = self._encoded_column(col)
+        return None if encoded is None else encoded[0]
+
+    def uniques(self, col: str) -> Optional[np.ndarray]:
+        """sorted distinct values of a column, codes are indexes of this array"""
+        encoded = self._encoded_column(col)
+        return None if encoded is None else encoded[1]
+
+    def values(self, col: str) -> Optional['pd.Series']:
+        """decoded values of a column, NULL as None"""
+        import pandas as pd
+
+        encoded = self._encoded_column(col)
+        if encoded is None:
+            return None
+        codes, uniques = encoded
+        values = pd.Series(uniques.take(np.maximum(codes, 0)), dtype=object)
+        values[codes == NULL_CODE] = None
+        return values
+
+    def value_profile(self, cols: List[str]) -> List[int]:
+        """
+        profile of the combined value of cols: f_j is the number of distinct values that appear j times.
+        refer to NEVUtils.build_column_profile
+        """
+        encoded = [self._encoded_column(col) for col in cols]
+        if len(encoded) == 1:
+            _, counts = np.unique(encoded[0][0], return_counts=True)
+        else:
+            _, counts = np.unique(_combine_codes([codes for codes, _ in encoded],
+                                                 [len(uniques) for _, uniques in encoded]), return_counts=True)
+        # trailing zeros (f_j for j > max count) are omitted
+        return np.bincount(counts, minlength=3).tolist()
+
+    def sorted_codes(self, cols: List[str]) -> Optional[List[np.ndarray]]:
+        """
+        codes of cols with rows sorted like an index on cols (NULL first), built once per column list.
+        None if any column is not sampled
+        """
+        names = tuple(self.resolve_column(c) for c in cols)
+        if None in names:
+            return None
+        res = self._sorted_codes.get(names)
+        if res is None:
+            code_list = [self.codes(name) for name in names]
+            # np.lexsort sorts by the last key first
+            order = np.lexsort(code_list[::-1])
+            res = [codes[order] for codes in code_list]
+            with self._lock:
+                res = self._sorted_codes.setdefault(names, res)
+        return res
+
+    def code_range(self, col: str, min_value: Optional[str], min_op: Optional[str],
+                   max_value: Optional[str], max_op: Optional[str]) -> Tuple[int, int]:
+        """
+        convert a range condition of RangeCond (values in MySQL format, 'NULL' as NULL) into an inclusive range
+        of codes. NULL is smaller than any value, like in InnoDB indexes. lo > hi if the range is empty.
+
+        Args:
+            col: column name
+            min_value, min_op: lower bound, min_op is one of '=', '>', '>=', None if no lower bound
+            max_value, max_op: upper bound, max_op is one of '=', '<', '<=', None if no upper bound
+
+        Returns:
+            lo, hi
+        """
+        uniques = self.uniques(col)
+        lo, hi = NULL_CODE, len(uniques) - 1
+        if min_op is not None:
+            value = _to_sample_value(min_value, uniques)
+            if value is None:
+                lo = NULL_CODE + 1 if min_op == '>' else NULL_CODE
+            else:
+                lo = int(np.searchsorted(uniques, value, side='right' if min_op == '>' else 'left'))
+        if max_op is not None:
+            value = _to_sample_value(max_value, uniques)
+            if value is None:
+                hi = NULL_CODE - 1 if max_op == '<' else NULL_CODE
+            else:
+                hi = int(np.searchsorted(uniques, value, side='left' if max_op == '<' else 'right')) - 1
+        return lo, hi
+
+    def count_in_ranges(self, cols: List[str], code_ranges: List[Tuple[int, int]]) -> int:
+        """
+        number of sample rows whose codes of cols are all in code_ranges.
+
+        Rows are sorted by cols, so rows matching a prefix of equalities (and the first non-equal range after them)
+        are a contiguous block, found by binary search. The remaining ranges are checked by vectorized masks
+        over the block only.
+        """
+        sorted_codes = self.sorted_codes(cols)
+        start, end = 0, self.num_rows
+        for i, (lo, hi) in enumerate(code_ranges):
+            if lo > hi:
+                return 0
+            block = sorted_codes[i][start:end]
+            # search with int32 keys, python ints make numpy cast the whole block
+            start, end = start + int(np.searchsorted(block, np.int32(lo), side='left')), \
+                start + int(np.searchsorted(block, np.int32(hi), side='right'))
+            if lo != hi and i + 1 < len(code_ranges):
+                # the block is not sorted by the next columns
+                mask = np.ones(end - start, dtype=bool)
+                for codes, (lo_j, hi_j) in zip(sorted_codes[i + 1:], code_ranges[i + 1:]):
+                    block = codes[start:end]
+                    mask &= (block >= np.int32(lo_j)) & (block <= np.int32(hi_j))
+                return int(np.count_nonzero(mask))
+        return end - start
+
+    def to_dataframe(self, cols: List[str] = None) -> 'pd.DataFrame':
+        import pandas as pd
+
+        cols = self.columns if cols is None else [self.resolve_column(c) for c in cols if self.resolve_column(c)]
+        return pd.DataFrame({col: self.values(col) for col in cols})
+
+
+def _encode_column(values: 'pd.Series') -> Tuple[np.ndarray, np.ndarray]:
+    import pandas as pd
+
+    try:
+        codes, uniques = pd.factorize(values, sort=True, use_na_sentinel=True)
+    except TypeError:
+        # values are not comparable, e.g. mixed types
+        codes, uniques = pd.factorize(values.map(lambda v: None if v is None else str(v)), sort=True)
+    return codes.astype(np.int32), np.asarray(uniques, dtype=object)
+
+
+def _to_sample_value(raw: Optional[str], uniques: np.ndarray):
+    """convert a value of RangeCond into the type of sampled values, None for NULL"""
+    if raw is None or raw == NULL_STR:
+        return None
+    value = convert_str_by_type(raw, 'string', str_in_base4=False)
+    if len(uniques) == 0:
+        return value
+    import pandas as pd
+
+    sample_value = uniques[0]
+    if isinstance(sample_value, (bool, np.bool_)):
+        return value.lower() in ('1', 'true')
+    if isinstance(sample_value, numbers.Number):
+        return float(value)
+    if isinstance(sample_value, datetime.datetime):
+        return pd.Timestamp(value)
+    if isinstance(sample_value, datetime.date):
+        return pd.Timestamp(value).date()
+    if isinstance(sample_value, bytes):
+        return value.encode('utf-8')
+    return value
+
+
+def _combine_codes(code_list: List[np.ndarray], cardinalities: List[int]) -> np.ndarray:
+    """combine codes of several columns into one key per row"""
+    total = 1
+    for card in cardinalities:
+        total *= card + 1
+    if total < np.iinfo(np.int64).max:
+        key = np.zeros(len(code_list[0]), dtype=np.int64)
+        for codes, card in zip(code_list, cardinalities):
+            key = key * (card + 1) + (codes.astype(np.int64) + 1)
+        return key
+    # too many combinations, fallback to the row-wise unique
+    _, key = np.unique(np.stack(code_list, axis=1), axis=0, return_inverse=True)
+    return key.reshape(-1)
+
+
+_shared_samples: "weakref.WeakValueDictionary[Tuple, VidexSample]" = weakref.WeakValueDictionary()
+_shared_samples_lock = threading.Lock()
+
+
+def get_shared_sample(paths: List[str], load_rows: int = UNKNOWN_LOAD_ROWS) -> VidexSample:
+    """
+    get the VidexSample of the sample files. Models of different tasks pointing to the same files share one object,
+    which is released once no model refers to it.
+    """
+    key = (tuple(os.path.abspath(p) for p in paths), load_rows)
+    with _shared_samples_lock:
+        sample = _shared_samples.get(key)
+        if sample is None:
+            sample = VidexSample(list(key[0]), load_rows)
+            _shared_samples[key] = sample
+        return sample
+
+
+def get_sample_file_paths(sample_file_info: SampleFileInfo, db_name: str, table_name: str) -> List[str]:
+    """absolute paths of the sample files of a table, empty if the table is not sampled"""
+    rel_paths = sample_file_info.sample_file_dict.get(db_name.lower(), {}).get(table_name.lower(), [])
+    return [os.path.join(sample_file_info.local_path_prefix, p) for p in rel_paths]
+
+
+def get_index_columns(table_stats: VidexTableStats) -> Optional[List[str]]:
+    """columns that appear in indexes, None if index metadata is missing"""
+    table_meta = table_stats.table_meta
+    if table_meta is None or not table_meta.indexes:
+        return None
+    return list(dict.fromkeys(col.name for index in table_meta.indexes for col in index.columns if col.name))
+
+
+def load_sample_file(table_stats: VidexTableStats, columns: List[str] = None) -> Optional[VidexSample]:
+    """
+    load the sample data of a table from parquet files referred by table_stats.sample_file_info.
+
+    Args:
+        table_stats:
+        columns: columns to load eagerly. By default, the index columns (or all columns if indexes are unknown).
+            Other columns are loaded on first access.
+
+    Returns:
+        the shared VidexSample, or None if the table has no sample files
+    """
+    sample_file_info = table_stats.sample_file_info
+    if sample_file_info is None:
+        return None
+    paths = get_sample_file_paths(sample_file_info, table_stats.dbname, table_stats.table_name)
+    if len(paths) == 0:
+        logging.warning(f"no sample file found for {table_stats.dbname}.{table_stats.table_name}")
+        return None
+
+    load_rows = sample_file_info.get_table_load_row(table_stats.dbname.lower(), table_stats.table_name.lower())
+    sample = get_shared_sample(paths, load_rows)
+    if columns is None:
+        columns = get_index_columns(table_stats) or sample.sample_columns
+    sample.load_columns(columns)
+    return sample
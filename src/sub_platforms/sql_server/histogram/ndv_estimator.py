@@ -5,14 +5,16 @@ SPDX-License-Identifier: MIT
 """
 import math
 from collections import Counter
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Union, TYPE_CHECKING
 
 import numpy as np
-from estndv import ndvEstimator
-from pandas import DataFrame
 
+from sub_platforms.sql_server.histogram.histogram_utils import VidexSample
 from sub_platforms.sql_server.videx.videx_utils import safe_tolist
 
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
 
 class NEVUtils:
     def __init__(self) -> None:
@@ -141,7 +143,7 @@ class NDVEstimator:
         return ndv
 
 
-    def estimate(self, all_sampled_data: DataFrame) -> Dict[str, float]:
+    def estimate(self, all_sampled_data: 'DataFrame') -> Dict[str, float]:
         """input all data and estimate NDV
         """
         columns = all_sampled_data.columns
@@ -261,12 +263,17 @@ class NDVEstimator:
         return estimated
 
     def LS_estimate(self, profile: List[int]):
+        from estndv import ndvEstimator
+
         estimator = ndvEstimator()
         estimated = estimator.profile_predict(f=profile, N=self.original_num)
         return estimated
 
-    def estimate_multi_columns(self, all_sampled_data: DataFrame, target_columns: List[str], method='error_bound') -> float:
+    def estimate_multi_columns(self, all_sampled_data: Union['DataFrame', VidexSample], target_columns: List[str],
+                               method='error_bound') -> float:
         """输入全部的采样数据和目标列（可以为多列），估计其NDV"""
+        if isinstance(all_sampled_data, VidexSample):
+            return self._estimate_multi_columns_by_codes(all_sampled_data, target_columns, method)
         if target_columns[0] not in all_sampled_data.columns:
             target_columns = [target_column.upper() for target_column in target_columns]
         # 暂时忽略没有采样的列，返回mock值10
@@ -283,3 +290,14 @@ class NDVEstimator:
         else:
             ndv = self.estimator(len(all_sampled_data), profile, method)
         return ndv
+
+    def _estimate_multi_columns_by_codes(self, sample: VidexSample, target_columns: List[str], method: str) -> float:
+        """estimate_multi_columns on encoded sample, profile is built by numpy instead of python tuples"""
+        # 与 DataFrame 一致：缺列时仅估计采样中存在的列
+        target_columns = [col for col in target_columns if sample.resolve_column(col) is not None]
+        if len(target_columns) == 0 or len(sample) == 0:
+            return 1
+        if method == 'block_split':
+            tuple_list = list(zip(*[sample.codes(col).tolist() for col in target_columns]))
+            return self.block_split_estimate(tuple_list)
+        return self.estimator(len(sample), sample.value_profile(target_columns), method)
@@ -53,7 +53,6 @@ from sub_platforms.sql_server.videx.model.videx_model_innodb import VidexModelIn
 from sub_platforms.sql_server.videx.videx_metadata import VidexTableStats
 from sub_platforms.sql_server.videx.model.videx_strategy import VidexStrategy
 from sub_platforms.sql_server.videx.videx_utils import IndexRangeCond
-from estndv import ndvEstimator
 
 class ExtendedVidexModelExample(VidexModelInnoDB):
     """
@@ -61,6 +60,8 @@ class ExtendedVidexModelExample(VidexModelInnoDB):
     """
 
     def __init__(self, stats: VidexTableStats, **kwargs):
+        from estndv import ndvEstimator
+
         super().__init__(stats, **kwargs)
         self.strategy = VidexStrategy.example
         self.ndv_estimator = ndvEstimator()
@@ -100,13 +101,12 @@ class ExtendedVidexModelExample(VidexModelInnoDB):
         估算不同值数量
         使用 estndv 库来估算不同值数量
         """
-        if self.table_stats.sample_file_info is not None:
+        if self.df_sample_raw is not None:
             table_rows = self.table_stats.records
-            df_sample_raw = self.load_sample_file(self.table_stats)
 
             for field in field_list:
-                if field in df_sample_raw.columns:
-                    col_data = df_sample_raw[field].dropna().tolist()
+                if self.df_sample_raw.resolve_column(field) is not None:
+                    col_data = self.df_sample_raw.values(field).dropna().tolist()
                     # 假设这里使用 sample_predict 方法
                     ndv = self.ndv_estimator.sample_predict(S=col_data, N=table_rows)
                     return ndv
@@ -114,10 +114,6 @@ class ExtendedVidexModelExample(VidexModelInnoDB):
         # 如果没有采样数据，使用独立分布假设估算
         return calc_mulcol_ndv_independent(field_list, self.table_stats.ndvs_single, self.table_stats.records)
 
-    def load_sample_file(self, table_stats):
-        # 这里假设 load_sample_file 函数已经定义
-        return load_sample_file(table_stats)
-
 def calc_mulcol_ndv_independent(col_names: List[str], ndvs_single: dict, table_rows: int) -> int:
     """
     基于多列 NDV 独立分布的假设，从单列 NDV 计算多列的 NDV
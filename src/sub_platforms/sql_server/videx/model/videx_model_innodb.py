@@ -7,7 +7,7 @@ import json
 import logging
 import time
 import traceback
-from typing import List
+from typing import List, Optional
 
 import numpy as np
 from cachetools import TTLCache
@@ -19,6 +19,10 @@ from sub_platforms.sql_server.videx.videx_metadata import VidexTableStats, PCT_C
 from sub_platforms.sql_server.videx.model.videx_strategy import VidexModelBase, VidexStrategy, calc_mulcol_ndv_independent
 from sub_platforms.sql_server.videx.videx_utils import IndexRangeCond, RangeCond
 
+# records_in_range is estimated on the sample if at least this number of sample rows match the ranges,
+# otherwise by histograms
+DEFAULT_SAMPLE_MIN_HITS = 10
+
 
 class VidexModelInnoDB(VidexModelBase):
     """
@@ -44,6 +48,10 @@ class VidexModelInnoDB(VidexModelBase):
         # ndv is usually stable and calculation is costly, thus we cache it in task-level.
         # key: table, fields list
         self.ndv_cache = TTLCache(maxsize=1000, ttl=1200)
+        # opt-in: if a sample is loaded, estimate records_in_range of multi-column ranges on it,
+        # which captures the correlation between columns ignored by per-column histograms
+        self.sample_cardinality: bool = kwargs.get('sample_cardinality', False)
+        self.sample_min_hits: int = kwargs.get('sample_min_hits', DEFAULT_SAMPLE_MIN_HITS)
         self.ndv_model = None
         self.df_sample_raw = None
         self.loading_ndv_model()
@@ -83,6 +91,11 @@ class VidexModelInnoDB(VidexModelBase):
 
 
         ranges = idx_range_cond.get_valid_ranges(self.ignore_range_after_neq)
+        if self.sample_cardinality:
+            records_in_ranges = self.cardinality_by_sample(ranges)
+            if records_in_ranges is not None:
+                return records_in_ranges
+
         min_freqs, max_freqs = [0] * len(ranges), [1] * len(ranges)
         for c, rc in enumerate(ranges):
             rc: RangeCond
@@ -95,13 +108,18 @@ class VidexModelInnoDB(VidexModelBase):
 
             # for multi-column, the first few columns cannot be processed as the usual manner.
             # Refer to the parsing method of `range_cond`.
-            if rc.has_min():
-                # TODO Handle the case for NULL < c.
-                #  In MySQL conditions, NULL is represented as the string 'NULL',
-                #  and the string 'NULL' is represented as "'NULL'".
-                min_freqs[c] = col_hist.find_nearest_key_pos(rc.min_value, rc.min_key_pos_side)
-            if rc.has_max():
-                max_freqs[c] = col_hist.find_nearest_key_pos(rc.max_value, rc.max_key_pos_side)
+            point_freq = col_hist.point_freq(rc.min_value) if rc.is_singlepoint() else None
+            if point_freq is not None:
+                # equality on a value whose frequency is known, i.e. an MCV or a value of a singleton histogram
+                min_freqs[c], max_freqs[c] = 0, point_freq
+            else:
+                if rc.has_min():
+                    # TODO Handle the case for NULL < c.
+                    #  In MySQL conditions, NULL is represented as the string 'NULL',
+                    #  and the string 'NULL' is represented as "'NULL'".
+                    min_freqs[c] = col_hist.find_nearest_key_pos(rc.min_value, rc.min_key_pos_side)
+                if rc.has_max():
+                    max_freqs[c] = col_hist.find_nearest_key_pos(rc.max_value, rc.max_key_pos_side)
             if min_freqs[c] > max_freqs[c]:
                 if abs(min_freqs[c] - max_freqs[c]) / max(min_freqs[c], max_freqs[c]) < 0.01:
                     # both min and max are non-zero and very closed, may be an estimation error
@@ -124,14 +142,43 @@ class VidexModelInnoDB(VidexModelBase):
 
         return records_in_ranges
 
+    def cardinality_by_sample(self, ranges: List[RangeCond]) -> Optional[int]:
+        """
+        count the sample rows matching all ranges and scale it to the table.
+
+        Returns:
+            estimated records_in_range, None if there is no sample, a column is not sampled,
+            or too few sample rows match the ranges
+        """
+        sample = self.df_sample_raw
+        if sample is None or len(sample) == 0 or len(ranges) == 0:
+            return None
+        cols = [rc.col for rc in ranges]
+        if any(sample.resolve_column(col) is None for col in cols):
+            return None
+        try:
+            code_ranges = [sample.code_range(rc.col, rc.min_value, rc.min_op, rc.max_value, rc.max_op)
+                           for rc in ranges]
+        except (ValueError, TypeError) as e:
+            logging.warning(f"sample cardinality: cannot compare {ranges} with sampled values of "
+                            f"{self.table_name}, use histograms. {e}")
+            return None
+        hits = sample.count_in_ranges(cols, code_ranges)
+        if hits < self.sample_min_hits:
+            logging.debug(f"sample cardinality: {hits=} < {self.sample_min_hits} for {ranges}, use histograms")
+            return None
+        records_in_ranges = max(1, int(self.table_stats.records * hits / len(sample)))
+        logging.debug(f"sample cardinality ({self.table_name}({self.table_stats.records})): {ranges} "
+                      f"{hits=}/{len(sample)}, {records_in_ranges=}")
+        return records_in_ranges
+
     def ndv(self, index_name, field_list: List[str]) -> int:
         ndv = self.table_stats.get_ideal_ndv(index_name, field_list)
         if ndv is None:
-            if self.table_stats.sample_file_info is not None:
-                table_rows = self.table_stats.records
+            if self.df_sample_raw is not None:
                 # table_ndv_estimator = NDVEstimator(table_rows)
                 st = time.perf_counter()
-                ndv = self.ndv_model.estimate_multi_columns(self.df_sample_raw, field_list, table_rows)
+                ndv = self.ndv_model.estimate_multi_columns(self.df_sample_raw, field_list)
                 # ndv = table_ndv_estimator.estimate_multi_columns(df_sample_raw, field_list)
                 elapsed_time = time.perf_counter() - st
                 logging.info(f"ndv calculate: {ndv=} {elapsed_time=:.2f}s")
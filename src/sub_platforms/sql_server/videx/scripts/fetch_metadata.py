@@ -6,21 +6,24 @@ SPDX-License-Identifier: MIT
 import argparse
 import json
 import logging
-import re
 import requests
-import gzip
+from typing import Dict, List, Optional
+
 from pymysql import InternalError
 
 from sub_platforms.sql_optimizer.env.rds_env import Env
 from sub_platforms.sql_optimizer.videx.videx_metadata import VidexDBTaskStats
 from sub_platforms.sql_optimizer.env.rds_env import OpenMySQLEnv
 from sub_platforms.sql_optimizer.videx import videx_logging
+from sub_platforms.sql_server.videx.videx_ddl_sync import sync_videx_db, execute_in_batches, videx_create_table_ddl
+from sub_platforms.sql_server.videx.videx_service import post_add_videx_meta_dedup
 
 
 def create_videx_env_multi_db(videx_env: Env,
                               meta_dict: dict,
                               new_engine: str = 'VIDEX',
-                              ):
+                              sync: bool = False,
+                              ) -> Optional[Dict[str, Dict[str, List[str]]]]:
     """
     Specify a target database (`target_db`), retrieve metadata, and create it on the `videx_db` within the `videx_env`.
 
@@ -35,9 +38,15 @@ def create_videx_env_multi_db(videx_env: Env,
             Element is a tuple of three: request json, response json, turn_on (whether to enable).
             If a request matches an enabled element, it returns directly.
         new_engine: Name of the engine to be created.
+        sync: If True, keep the existing databases and only apply the DDL of tables and indexes that differ
+            (see videx_ddl_sync), otherwise drop and create the databases again.
     Returns:
-
+        if sync, target_db -> {'created', 'dropped', 'recreated', 'altered', 'unchanged'}: table names
     """
+    if sync:
+        return {target_db: sync_videx_db(videx_env, target_db, table_dict, new_engine)
+                for target_db, table_dict in meta_dict.items()}
+
     # Create a test database named after `target_db` in videx-db and save the table schema.
     for target_db, table_dict in meta_dict.items():
         videx_env.execute(f"DROP DATABASE IF EXISTS `{target_db}`")
@@ -49,41 +58,24 @@ def create_videx_env_multi_db(videx_env: Env,
         videx_default_db = videx_env.default_db
         try:
             videx_env.set_default_db(target_db)
-            for table in table_dict.values():
-                create_table_ddl = re.sub(r"ENGINE=\w+", "ENGINE={}".format(new_engine), table.ddl)
-                # remove secondary index
-                match = re.search(r'SECONDARY_ENGINE=(\w+)', create_table_ddl)
-                if match:
-                    value = match.group(1)
-                    logging.warning(f"find SECONDARY_ENGINE={value}, remove it from CREATE TABLE DDL")
-                    create_table_ddl = re.sub(r'SECONDARY_ENGINE=\w+', '', create_table_ddl)
-                videx_env.execute(create_table_ddl)
+            execute_in_batches(videx_env, [videx_create_table_ddl(table.ddl, new_engine)
+                                           for table in table_dict.values()])
         finally:
             videx_env.set_default_db(videx_default_db)
+    return None
 
 
-def post_add_videx_meta(req: VidexDBTaskStats, videx_server_ip_port: str, use_gzip: bool):
-    # 1. 将 src_meta 导入videx-py
-    json_data = req.to_json().encode('utf-8')
-    if use_gzip:
-        # 转换 JSON 数据为字符串，并用 UTF-8 编码为 bytes
-        json_data = gzip.compress(json_data)  # 使用 gzip 进行压缩
-        headers = {'Content-Encoding': 'gzip', 'Content-Type': 'application/json'}
-    else:
-        headers = {'Content-Type': 'application/json'}
-    # send request
-    logging.info(f"post videx metadata to {videx_server_ip_port}")
-    return requests.post(f'http://{videx_server_ip_port}/create_task_meta', data=json_data, headers=headers)
-
-
-def load_metadata_from_file(db_name: str, files_server_ip_port: str):
+def load_metadata_from_file(db_name: str, files_server_ip_port: str, tables: List[str] = None,
+                            sections: List[str] = None):
     """
     从文件系统服务加载指定表的元数据信息
-    通过HTTP GET请求调用元数据服务
+    通过HTTP GET请求调用元数据服务，响应经 gzip 压缩
 
     参数:
         db_name: 数据库名称
         files_server_ip_port: 请求地址
+        tables: 只加载这些表，None 为全部
+        sections: 只加载这些部分 (meta, stats, hist, ndv, mulcol)，None 为全部
 
     返回:
         包含元数据的字典 (成功时)
@@ -97,10 +89,14 @@ def load_metadata_from_file(db_name: str, files_server_ip_port: str):
         'db_name': db_name,
         'files_server_ip_port': files_server_ip_port
     }
+    if tables:
+        params['tables'] = ','.join(tables)
+    if sections:
+        params['sections'] = ','.join(sections)
 
     try:
         # 发起GET请求
-        response = requests.get(url, params=params)
+        response = requests.get(url, params=params, headers={'Accept-Encoding': 'gzip'})
 
         # 检查响应状态
         if response.status_code == 200:
@@ -174,6 +170,11 @@ if __name__ == "__main__":
                              'If not provided, access "{videx_ip}:5001".')
     parser.add_argument('--task_id', type=str, default=None,
                         help='task id is to distinguish different videx tasks, if they have same database names.')
+    parser.add_argument('--tables', type=str, default=None,
+                        help='comma separated tables to load from the file system, load all tables if not provided.')
+    parser.add_argument('--sync_ddl', action='store_true',
+                        help='keep the existing videx database and only apply the DDL of changed tables and indexes, '
+                             'instead of dropping and creating it again.')
 
     """
     videx_server_ip_port: IP and port information, Videx MySQL will inform Videx Python about this address and send Videx queries to it.
@@ -209,12 +210,13 @@ if __name__ == "__main__":
 
     # step 2: 统计服务器层从文件系统拉取元数据，创建虚拟表并导入元数据
     task_id = f"task_id_videx_on_{db_name}"
-    meta_request = VidexDBTaskStats.from_json(load_metadata_from_file(db_name, files_server_ip_port))
+    meta_request = VidexDBTaskStats.from_dict(load_metadata_from_file(
+        db_name, files_server_ip_port, tables=args.tables.split(',') if args.tables else None))
 
     # 向 VIDEX-MySQL 中建表
-    create_videx_env_multi_db(videx_env, meta_dict=meta_request.meta_dict, )
-    # 向 VIDEX-Server 中导入数据
-    response = post_add_videx_meta(meta_request, videx_server_ip_port=videx_server_ip_port, use_gzip=True)
+    create_videx_env_multi_db(videx_env, meta_dict=meta_request.meta_dict, sync=args.sync_ddl)
+    # 向 VIDEX-Server 中导入数据, tables the server already has are sent as digests only
+    response = post_add_videx_meta_dedup(meta_request, videx_server_ip_port=videx_server_ip_port, use_gzip=True)
     assert response.status_code == 200
 
     logging.info(get_usage_message(args, videx_ip, videx_port, videx_db, videx_user, videx_pwd, videx_server_ip_port))
@@ -0,0 +1,60 @@
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import argparse
+import json
+import logging
+
+from sub_platforms.sql_server.videx.videx_capture import read_capture
+from sub_platforms.sql_server.videx.videx_meta_getter import FilesServerMetaGetter
+from sub_platforms.sql_server.videx.videx_replay import replay_in_process, replay_over_http
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton
+from sub_platforms.sql_server.videx.videx_utils import load_json_from_file
+
+if __name__ == '__main__':
+    """
+    Replays a capture of start_videx_server.py --capture_file, and reports the latencies.
+
+    Examples:
+        # to a running statistic server, 8 threads at 1000 requests per second
+        python replay_videx_requests.py --capture_file /tmp/videx_capture.jsonl.gz \
+            --videx_server 127.0.0.1:5001 --concurrency 8 --rate 1000
+        # in-process, task metadata pulled from the files server
+        python replay_videx_requests.py --capture_file /tmp/videx_capture.jsonl.gz --files_server 127.0.0.1:5002
+    """
+    parser = argparse.ArgumentParser(description='Replay captured requests to the Videx stats server.')
+    parser.add_argument('--capture_file', type=str, required=True, help='capture of start_videx_server.py')
+    parser.add_argument('--videx_server', type=str, default=None,
+                        help='ip:port of the statistic server. If not set, requests are replayed in-process.')
+    parser.add_argument('--files_server', type=str, default=None,
+                        help='in-process: ip:port of the files server to pull the metadata of captured tasks')
+    parser.add_argument('--meta_files', type=str, nargs='*', default=[],
+                        help='in-process: json files of VidexDBTaskStats (as posted to /create_task_meta) to load')
+    parser.add_argument('--concurrency', type=int, default=1, help='number of threads sending requests')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='requests per second. If not set, requests are sent as fast as possible.')
+    parser.add_argument('--no_compare', action='store_true',
+                        help='do not compare responses with the captured ones')
+    parser.add_argument('--output', type=str, default=None, help='write the report as json to this file')
+
+    args = parser.parse_args()
+
+    records = list(read_capture(args.capture_file))
+    logging.info(f"loaded {len(records)} requests from {args.capture_file}")
+    replay_kwargs = dict(concurrency=args.concurrency, rate=args.rate, compare=not args.no_compare)
+    if args.videx_server:
+        report = replay_over_http(records, args.videx_server, **replay_kwargs)
+    else:
+        load_meta_by_task_id_func = None
+        if args.files_server:
+            load_meta_by_task_id_func = FilesServerMetaGetter(args.files_server).get_meta_by_task_id
+        singleton = VidexSingleton(load_meta_by_task_id_func=load_meta_by_task_id_func)
+        for meta_file in args.meta_files:
+            singleton.add_task_meta(load_json_from_file(meta_file))
+        report = replay_in_process(records, singleton, **replay_kwargs)
+
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report.to_dict(), f, indent=2)
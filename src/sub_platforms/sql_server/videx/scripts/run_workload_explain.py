@@ -0,0 +1,80 @@
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import argparse
+import json
+import logging
+
+from sub_platforms.sql_server.env.rds_env import OpenMySQLEnv
+from sub_platforms.sql_server.videx import videx_logging
+from sub_platforms.sql_server.videx.videx_workload import run_workload_explain, load_gt_rec_in_ranges, \
+    explain_diff_report
+
+
+def parse_connection_info(info):
+    ip, port, db, user, pwd = info.split(':')
+    return ip, int(port), db, user, pwd
+
+
+def read_sqls(sql_file):
+    """statements separated by ';', or a json list of statements"""
+    with open(sql_file, 'r') as f:
+        content = f.read()
+    if sql_file.endswith('.json'):
+        return json.loads(content)
+    return [sql.strip() for sql in content.split(';') if sql.strip()]
+
+
+if __name__ == '__main__':
+    """
+    EXPLAIN a workload on InnoDB and VIDEX in parallel, then write the rec_in_ranges GT and the explain diff report.
+
+    Examples:
+        python run_workload_explain.py --innodb 127.0.0.1:13308:tpch_tiny:user:password \
+            --videx 127.0.0.1:13309:videx_tpch_tiny:user:password --videx_server 127.0.0.1:5001 \
+            --task_id tpch_tiny --sql_file workload.sql --workers 8 --output workload_explain.jsonl.gz \
+            --gt_output gt_rec_in_ranges.json
+    """
+    parser = argparse.ArgumentParser(description='Parallel EXPLAIN of a workload on InnoDB and VIDEX.')
+    parser.add_argument('--innodb', type=str, required=True,
+                        help='Connection info for the InnoDB instance, in the format of "ip:port:db:user:password"')
+    parser.add_argument('--videx', type=str, default=None,
+                        help='Connection info for the VIDEX instance, in the format of "ip:port:db:user:password". '
+                             'If not provided, only InnoDB is explained.')
+    parser.add_argument('--videx_server', type=str, default=None,
+                        help='ip:port of the videx server, set as @VIDEX_SERVER')
+    parser.add_argument('--task_id', type=str, default=None, help='task id of the videx metadata')
+    parser.add_argument('--sql_file', type=str, required=True,
+                        help="statements separated by ';', or a .json file of a list of statements")
+    parser.add_argument('--workers', type=int, default=4, help='connections to each instance')
+    parser.add_argument('--output', type=str, default='workload_explain.jsonl.gz',
+                        help='gzip json lines of the explain, GT and diff of each statement')
+    parser.add_argument('--gt_output', type=str, default=None,
+                        help='write the rec_in_ranges GT of InnoDB to this json file, '
+                             'to be used as gt_rec_in_ranges_file')
+
+    videx_logging.initial_config()
+    args = parser.parse_args()
+
+    innodb_ip, innodb_port, innodb_db, innodb_user, innodb_pwd = parse_connection_info(args.innodb)
+    innodb_env = OpenMySQLEnv(ip=innodb_ip, port=innodb_port, usr=innodb_user, pwd=innodb_pwd, db_name=innodb_db,
+                              read_timeout=300, write_timeout=300, connect_timeout=10)
+    videx_env = None
+    if args.videx:
+        videx_ip, videx_port, videx_db, videx_user, videx_pwd = parse_connection_info(args.videx)
+        videx_env = OpenMySQLEnv(ip=videx_ip, port=videx_port, usr=videx_user, pwd=videx_pwd, db_name=videx_db,
+                                 read_timeout=300, write_timeout=300, connect_timeout=10)
+
+    sqls = read_sqls(args.sql_file)
+    logging.info(f"loaded {len(sqls)} statements from {args.sql_file}")
+    summary = run_workload_explain(innodb_env, sqls, args.output, videx_env=videx_env, n_workers=args.workers,
+                                   videx_py_ip_port=args.videx_server,
+                                   videx_options={'task_id': args.task_id} if args.task_id else None,
+                                   target_version=innodb_env.mysql_command.version)
+    print(summary)
+    if args.gt_output:
+        with open(args.gt_output, 'w') as f:
+            json.dump(load_gt_rec_in_ranges(args.output), f, indent=2)
+    if videx_env is not None:
+        print(json.dumps(explain_diff_report(args.output), indent=2))
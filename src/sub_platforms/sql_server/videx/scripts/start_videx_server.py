@@ -6,6 +6,7 @@ import argparse
 from typing import Type
 
 from sub_platforms.sql_server.videx.videx_metadata import PCT_CACHED_MODE_PREFER_META
+from sub_platforms.sql_server.videx.videx_meta_getter import FilesServerMetaGetter
 from sub_platforms.sql_server.videx.videx_service import startup_videx_server
 from sub_platforms.sql_server.videx.model.videx_strategy import VidexStrategy, VidexModelBase
 from sub_platforms.sql_server.videx.model.videx_model_innodb import VidexModelInnoDB
@@ -15,6 +16,8 @@ if __name__ == '__main__':
     """
     Examples:
         python start_videx_server.py --port 5001
+        python start_videx_server.py --port 5001 --files_server 127.0.0.1:5002 --meta_cache_dir /tmp/videx_meta
+        python start_videx_server.py --port 5001 --capture_file /tmp/videx_capture.jsonl.gz
     """
     parser = argparse.ArgumentParser(description='Start the Videx stats server.')
     parser.add_argument('--server_ip', type=str, default='0.0.0.0', help='The IP address to bind the server to.')
@@ -25,6 +28,25 @@ if __name__ == '__main__':
                         help='Table loaded cache percentage can significantly impact table scan costs. '
                              'If set to -1, it prefers to use values calculated from the system table. '
                              'If set to a float between 0 and 1, it forces the use of the specified value.')
+    parser.add_argument('--files_server', type=str, default=None,
+                        help='ip:port of the files server. If set, metadata of tasks not in the cache is pulled '
+                             'from it, and the task_id is the database name saved on it.')
+    parser.add_argument('--meta_cache_dir', type=str, default=None,
+                        help='local disk cache of the metadata pulled from the files server.')
+    parser.add_argument('--hist_compact_epsilon', type=float, default=None,
+                        help='if set, merge adjacent histogram buckets of loaded tasks while the interpolated '
+                             'cumulative frequency differs by at most this ratio, e.g. 0.001.')
+    parser.add_argument('--sample_cardinality', action='store_true',
+                        help='estimate records_in_range of multi-column ranges on the loaded samples of tables, '
+                             'falling back to histograms. Disabled by default.')
+    parser.add_argument('--capture_file', type=str, default=None,
+                        help='if set, requests to /ask_videx are appended to this gzip file, '
+                             'see replay_videx_requests.py')
+    parser.add_argument('--profile_dir', type=str, default=None,
+                        help='directory where /admin/profile can dump profiles (output_file), disabled by default')
+    parser.add_argument('--timing_header', action='store_true',
+                        help='return the time of each phase of /ask_videx in the Server-Timing header. '
+                             'Without it, the header is returned only to requests with X-Videx-Timing.')
 
     args = parser.parse_args()
 
@@ -39,5 +61,16 @@ if __name__ == '__main__':
     else:
         raise NotImplementedError(f"Unsupported strategy: {args.strategy}")
 
+    load_meta_by_task_id_func = None
+    if args.files_server:
+        load_meta_by_task_id_func = FilesServerMetaGetter(args.files_server,
+                                                          cache_dir=args.meta_cache_dir).get_meta_by_task_id
+
     startup_videx_server(start_ip=args.server_ip, debug=args.debug, port=args.port,
-                         VidexModelClass=MainVidexModelClass, cache_pct=args.cache_pct,)
+                         VidexModelClass=MainVidexModelClass, cache_pct=args.cache_pct,
+                         load_meta_by_task_id_func=load_meta_by_task_id_func,
+                         hist_compact_epsilon=args.hist_compact_epsilon,
+                         sample_cardinality=args.sample_cardinality,
+                         capture_file=args.capture_file,
+                         timing_header=args.timing_header,
+                         profile_dir=args.profile_dir)
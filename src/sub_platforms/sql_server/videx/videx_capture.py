@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Capture of /ask_videx requests, replayed by videx_replay.
+
+A capture is a gzip file of json lines, one record per request:
+    {"ts": 1700000000.123, "task_id": "task1", "req": {...}, "code": 200, "resp": {...}, "elapsed": 0.0012}
+Appending to an existing capture adds a new gzip member, which is still a valid gzip file.
+"""
+import gzip
+import json
+import logging
+import threading
+import time
+import zlib
+from typing import Iterator, Optional
+
+
+class RequestCapture:
+    """
+    Appends requests to a gzip capture file, thread-safe.
+
+    Args:
+        path: the capture file, appended if it exists
+        flush_every: records are flushed every `flush_every` requests, so that a killed server loses at most these
+    """
+
+    def __init__(self, path: str, flush_every: int = 100):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self.lock = threading.Lock()
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+
+    def record(self, req_json_item: dict, task_id: Optional[str], code: int, resp: dict, elapsed: float):
+        line = json.dumps({'ts': time.time(), 'task_id': task_id, 'req': req_json_item,
+                           'code': code, 'resp': resp, 'elapsed': elapsed})
+        with self.lock:
+            if self._file is None:
+                return
+            self._file.write(line + '\n')
+            self.count += 1
+            if self.count % self.flush_every == 0:
+                # Z_SYNC_FLUSH, the records so far can be decompressed
+                self._file.flush()
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        logging.info(f"request capture {self.path} closed, {self.count} requests captured")
+
+
+def read_capture(path: str) -> Iterator[dict]:
+    """
+    records of a capture in the order of capture. A capture truncated by a killed server ends at its last
+    complete record.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.endswith('\n'):
+                    yield json.loads(line)
+        except (EOFError, zlib.error) as e:
+            logging.warning(f"capture {path} is truncated: {e}")
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Incremental DDL sync of a VIDEX database: instead of dropping the database and creating every table again,
+read the tables, columns and indexes already in the VIDEX database, diff them with the target tables and apply
+only the needed DDL:
+- new tables are created, tables absent from the target are dropped;
+- tables whose columns, primary key or engine changed are dropped and created again (VIDEX tables hold no data);
+- added, dropped and changed secondary indexes of a table are applied by one ALTER TABLE.
+
+MySQL commits DDL implicitly, so statements can not share a transaction. They are executed one by one in batches
+over one pooled connection (Env.execute_batch), instead of taking a connection for each statement. The DROP and
+CREATE of a recreated table are adjacent, so a failed statement leaves at most that table dropped, and its error
+is raised.
+"""
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_DDL_BATCH_SIZE = 100
+
+
+def videx_create_table_ddl(ddl: str, new_engine: str = 'VIDEX') -> str:
+    """the CREATE TABLE DDL of the target table with the engine of the VIDEX database"""
+    create_table_ddl = re.sub(r"ENGINE=\w+", "ENGINE={}".format(new_engine), ddl)
+    # remove secondary index
+    match = re.search(r'SECONDARY_ENGINE=(\w+)', create_table_ddl)
+    if match:
+        value = match.group(1)
+        logging.warning(f"find SECONDARY_ENGINE={value}, remove it from CREATE TABLE DDL")
+        create_table_ddl = re.sub(r'SECONDARY_ENGINE=\w+', '', create_table_ddl)
+    return create_table_ddl
+
+
+def _expression(index_column) -> Optional[str]:
+    # MySQL 5.7 has no functional index, its expression is fetched as the string 'NULL'
+    expression = index_column.expression
+    return None if expression in [None, '', 'NULL'] else expression
+
+
+def _columns_signature(columns) -> Optional[Tuple]:
+    if not columns:
+        return None
+    return tuple((str(c.name).lower(), str(c.column_type).lower(), c.is_nullable) for c in columns)
+
+
+def index_signature(index) -> Tuple:
+    columns = tuple((None if _expression(c) else str(c.name).lower(), int(c.sub_part or 0), _expression(c),
+                     c.collation or 'asc') for c in index.columns)
+    return index.is_unique, str(index.index_type or 'BTREE').upper(), index.is_visible, columns
+
+
+def index_definition(index) -> str:
+    """
+    the index definition of ALTER TABLE ... ADD, e.g.
+    UNIQUE KEY `uk_a_b` (`a`,`b`(10) DESC), KEY `idx_expr` ((`a` + 1)) INVISIBLE
+    """
+    parts = []
+    for column in index.columns:
+        expression = _expression(column)
+        if expression:
+            part = f"({expression})"
+        else:
+            part = f"`{column.name}`" + (f"({int(column.sub_part)})" if column.sub_part else "")
+        if column.collation == 'desc':
+            part += " DESC"
+        parts.append(part)
+    index_type = str(index.index_type or '').upper()
+    if index.name == 'PRIMARY':
+        prefix = "PRIMARY KEY"
+    elif index_type in ['FULLTEXT', 'SPATIAL']:
+        prefix = f"{index_type} KEY `{index.name}`"
+    elif index.is_unique:
+        prefix = f"UNIQUE KEY `{index.name}`"
+    else:
+        prefix = f"KEY `{index.name}`"
+    return f"{prefix} ({','.join(parts)})" + ("" if index.is_visible else " INVISIBLE")
+
+
+def diff_table(target_table, videx_columns, videx_indexes) -> Optional[List[str]]:
+    """
+    Args:
+        target_table: Table to sync into the VIDEX database
+        videx_columns: columns of the table in the VIDEX database
+        videx_indexes: indexes of the table in the VIDEX database
+
+    Returns:
+        None if the table has to be created again, otherwise the ALTER TABLE clauses (empty if unchanged)
+    """
+    target_columns = _columns_signature(target_table.columns)
+    if target_columns is None or target_columns != _columns_signature(videx_columns):
+        return None
+    target_indexes = {index.name: index for index in target_table.indexes or []}
+    existing_indexes = {index.name: index for index in videx_indexes or []}
+    target_pk, existing_pk = target_indexes.pop('PRIMARY', None), existing_indexes.pop('PRIMARY', None)
+    if (target_pk is None) != (existing_pk is None) or \
+            (target_pk is not None and index_signature(target_pk) != index_signature(existing_pk)):
+        return None
+
+    clauses = []
+    for name, index in existing_indexes.items():
+        if name not in target_indexes or index_signature(index) != index_signature(target_indexes[name]):
+            clauses.append(f"DROP INDEX `{name}`")
+    for name, index in target_indexes.items():
+        if name not in existing_indexes or index_signature(index) != index_signature(existing_indexes[name]):
+            clauses.append(f"ADD {index_definition(index)}")
+    return clauses
+
+
+def execute_in_batches(videx_env, sql_list: List[str], batch_size: int = DEFAULT_DDL_BATCH_SIZE):
+    for i in range(0, len(sql_list), batch_size):
+        videx_env.execute_batch(sql_list[i:i + batch_size])
+
+
+def sync_videx_db(videx_env, target_db: str, table_dict: dict, new_engine: str = 'VIDEX',
+                  batch_size: int = DEFAULT_DDL_BATCH_SIZE) -> Dict[str, List[str]]:
+    """
+    Sync the tables of target_db in the VIDEX database to table_dict, see the module doc.
+    The default db of videx_env is switched to target_db and back.
+
+    Args:
+        videx_env: Env of VIDEX-MySQL
+        target_db: the VIDEX database, created if it does not exist
+        table_dict: table name -> Table, with ddl, columns and indexes
+        new_engine: engine of the VIDEX tables
+        batch_size: DDL statements sent at a time
+
+    Returns:
+        {'created', 'dropped', 'recreated', 'altered', 'unchanged'}: names of the tables
+    """
+    videx_env.execute(f"CREATE DATABASE IF NOT EXISTS `{target_db}`")
+    rows = videx_env.query_for_rows("SELECT TABLE_NAME, ENGINE FROM information_schema.TABLES "
+                                    "WHERE TABLE_SCHEMA = %s AND TABLE_TYPE = 'BASE TABLE'", [target_db])
+    existing_tables = {str(name).lower(): (name, engine) for name, engine in rows}
+    columns_dict = videx_env.mysql_command.get_schema_columns(target_db) if existing_tables else {}
+    indexes_dict = videx_env.mysql_command.get_schema_indexes(target_db) if existing_tables else {}
+
+    target_tables = {str(table.name).lower(): table for table in table_dict.values()}
+    res = {'created': [], 'dropped': [], 'recreated': [], 'altered': [], 'unchanged': []}
+    # recreates: DROP and CREATE of each recreated table, next to each other
+    drops, recreates, creates, alters = [], [], [], []
+    for lower_name, (name, engine) in existing_tables.items():
+        if lower_name not in target_tables:
+            res['dropped'].append(name)
+            drops.append(f"DROP TABLE IF EXISTS `{target_db}`.`{name}`")
+    for lower_name, table in target_tables.items():
+        create_table_ddl = videx_create_table_ddl(table.ddl, new_engine)
+        if lower_name not in existing_tables:
+            res['created'].append(table.name)
+            creates.append(create_table_ddl)
+            continue
+        name, engine = existing_tables[lower_name]
+        clauses = None
+        if str(engine).upper() == new_engine.upper():
+            clauses = diff_table(table, columns_dict.get(lower_name), indexes_dict.get(lower_name))
+        if clauses is None:
+            res['recreated'].append(table.name)
+            recreates += [f"DROP TABLE IF EXISTS `{target_db}`.`{name}`", create_table_ddl]
+        elif clauses:
+            res['altered'].append(table.name)
+            alters.append(f"ALTER TABLE `{target_db}`.`{name}` {', '.join(clauses)}")
+        else:
+            res['unchanged'].append(table.name)
+
+    # CREATE TABLE DDL does not include db_name, switch to target_db and revert to the default_db after execution.
+    videx_default_db = videx_env.default_db
+    try:
+        videx_env.set_default_db(target_db)
+        execute_in_batches(videx_env, drops + recreates + creates + alters, max(1, batch_size))
+    finally:
+        videx_env.set_default_db(videx_default_db)
+    logging.info(f"sync videx db {target_db}: " + ', '.join(f"{len(v)} {k}" for k, v in res.items()))
+    return res
@@ -8,7 +8,8 @@ import json
 import logging
 from collections import defaultdict
 from typing import List, Optional, Union, Dict, Any, Tuple
-from pydantic import BaseModel, PlainSerializer, BeforeValidator
+import numpy as np
+from pydantic import BaseModel, PlainSerializer, BeforeValidator, PrivateAttr
 from typing_extensions import Annotated
 
 from sub_platforms.sql_server.common.pydantic_utils import PydanticDataClassJsonMixin
@@ -16,6 +17,7 @@ from sub_platforms.sql_server.databases.mysql.mysql_command import MySQLVersion
 from sub_platforms.sql_server.env.rds_env import Env
 from sub_platforms.sql_server.meta import Table, Column
 from sub_platforms.sql_server.videx import videx_logging
+from sub_platforms.sql_server.videx.videx_journal import FetchJournal, JOURNAL_SECTION_HIST
 from sub_platforms.sql_server.videx.videx_utils import BTreeKeySide, target_env_available_for_videx, parse_datetime, \
     data_type_is_int, reformat_datetime_str
 
@@ -129,6 +131,12 @@ class HistogramBucket(BaseModel, PydanticDataClassJsonMixin):
     size: int = 0
 
 
+class HistogramMCV(BaseModel, PydanticDataClassJsonMixin):
+    """a most common value of a column, freq is its ratio among all rows (including NULL)"""
+    value: Annotated[Union[int, float, str, bytes], PlainSerializer(large_number_encoder), BeforeValidator(large_number_decoder)]
+    freq: float
+
+
 def init_bucket_by_type(bucket_raw: list, data_type: str, hist_type: str) -> HistogramBucket:
     """
     init HistogramBucket
@@ -206,6 +214,10 @@ class HistogramStats(BaseModel, PydanticDataClassJsonMixin):
     last_updated: Optional[str] = str(MEANINGLESS_INT)
     sampling_rate: Optional[float] = MEANINGLESS_INT
     number_of_buckets_specified: Optional[int] = MEANINGLESS_INT
+    # top-N frequent values, optional. Equality on them is answered without bucket interpolation
+    mcvs: Optional[List[HistogramMCV]] = None
+    # value -> freq of MCVs and single-value buckets, built on first point lookup
+    _point_freqs: Optional[Dict[Any, float]] = PrivateAttr(default=None)
 
     def model_post_init(self, __context: Any) -> None:
         if int(self.null_values) == MEANINGLESS_INT:
@@ -214,6 +226,8 @@ class HistogramStats(BaseModel, PydanticDataClassJsonMixin):
         for b in self.buckets:
             b.min_value = convert_str_by_type(b.min_value, self.data_type)
             b.max_value = convert_str_by_type(b.max_value, self.data_type)
+        for mcv in self.mcvs or []:
+            mcv.value = convert_str_by_type(mcv.value, self.data_type)
         if len(self.buckets) > 0:
             # check: sum(freq(buckets[-1] + null ratio) should be almost 1. if not, scale it.
             if abs(self.null_values + self.buckets[-1].cum_freq - 1) > 0.01:
@@ -222,6 +236,37 @@ class HistogramStats(BaseModel, PydanticDataClassJsonMixin):
                     bucket.cum_freq = bucket.cum_freq * scale_factor
                 self.buckets[-1].cum_freq = 1
 
+    def build_point_freqs(self) -> Dict[Any, float]:
+        """
+        value -> freq for values whose frequency is known exactly: buckets holding a single value
+        (i.e. all buckets of a singleton histogram) and MCVs.
+        Call it again after buckets or mcvs are modified.
+        """
+        point_freqs = {}
+        pre_cum_freq = 0
+        for bucket in self.buckets:
+            if bucket.min_value == bucket.max_value:
+                point_freqs[bucket.min_value] = bucket.cum_freq - pre_cum_freq
+            pre_cum_freq = bucket.cum_freq
+        for mcv in self.mcvs or []:
+            point_freqs[mcv.value] = mcv.freq
+        self._point_freqs = point_freqs
+        return point_freqs
+
+    def point_freq(self, value) -> Optional[float]:
+        """
+        frequency of `col = value` by a dict probe, None if it is not an MCV or a single-value bucket,
+        then use find_nearest_key_pos instead.
+
+        Args:
+            value: raw string in the request, 'NULL' for NULL
+        """
+        value = convert_str_by_type(value, self.data_type, str_in_base4=False)
+        if value is None:
+            return self.null_values
+        point_freqs = self._point_freqs if self._point_freqs is not None else self.build_point_freqs()
+        return point_freqs.get(value)
+
     def find_nearest_key_pos(self, value, side: BTreeKeySide) -> Union[int, float]:
         """
         Scan from left to right, find the first bucket that contains the value.
@@ -360,6 +405,122 @@ class HistogramStats(BaseModel, PydanticDataClassJsonMixin):
         )
 
 
+class HistogramCompaction(BaseModel, PydanticDataClassJsonMixin):
+    """size reduction and the worst interpolation error of compact_histogram"""
+    buckets_before: int = 0
+    buckets_after: int = 0
+    max_error: float = 0
+
+    @property
+    def reduction(self) -> float:
+        """ratio of removed buckets"""
+        return 1 - self.buckets_after / self.buckets_before if self.buckets_before > 0 else 0.
+
+    def merge(self, other: 'HistogramCompaction'):
+        self.buckets_before += other.buckets_before
+        self.buckets_after += other.buckets_after
+        self.max_error = max(self.max_error, other.max_error)
+
+    def __str__(self):
+        return f"buckets {self.buckets_before} -> {self.buckets_after} (-{self.reduction:.1%}), " \
+               f"max_error={self.max_error:.4g}"
+
+
+def _bucket_positions(data_type: str, min_value, max_value, values: list) -> np.ndarray:
+    """
+    ratio of rows <= value in a bucket [min_value, max_value] under the uniform assumption of find_nearest_key_pos
+    """
+    if data_type_is_int(data_type):
+        return (np.array(values, dtype=float) - min_value + 1) / (max_value - min_value + 1)
+    elif data_type in ['float', 'double', 'decimal']:
+        return (np.array(values, dtype=float) - min_value) / (max_value - min_value)
+    elif data_type == 'date':
+        min_date = parse_datetime(min_value).date()
+        days = [(parse_datetime(v).date() - min_date).days for v in values]
+        return (np.array(days, dtype=float) + 1) / ((parse_datetime(max_value).date() - min_date).days + 1)
+    elif data_type == 'datetime':
+        min_datetime = parse_datetime(min_value)
+        seconds = [(parse_datetime(v) - min_datetime).total_seconds() for v in values]
+        return np.array(seconds, dtype=float) / (parse_datetime(max_value) - min_datetime).total_seconds()
+    else:
+        # values other than the ends are taken as the middle of the bucket
+        return np.array([1 if v == max_value else 0.5 for v in values], dtype=float)
+
+
+def _merge_error(data_type: str, pre_cum_freq: float, run: List[HistogramBucket]) -> float:
+    """max error of cum_freq at the inner bucket boundaries if run is merged into one bucket"""
+    try:
+        positions = np.clip(_bucket_positions(data_type, run[0].min_value, run[-1].max_value,
+                                              [b.max_value for b in run[:-1]]), 0, 1)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return float('inf')
+    estimated = pre_cum_freq + (run[-1].cum_freq - pre_cum_freq) * positions
+    error = float(np.max(np.abs(estimated - np.array([b.cum_freq for b in run[:-1]]))))
+    return error if np.isfinite(error) else float('inf')
+
+
+def compact_histogram(hist: HistogramStats, epsilon: float) -> HistogramCompaction:
+    """
+    merge adjacent buckets in place, as long as the cum_freq interpolated in the merged bucket at each removed
+    bucket boundary differs from the original one by at most epsilon.
+
+    Singleton histograms and single-value buckets (frequent values of equi-height histograms) are kept,
+    since their frequencies are exact.
+
+    Args:
+        hist: histogram to compact
+        epsilon: max error of cum_freq, a ratio of table rows
+
+    Returns:
+        number of buckets before and after, and the worst error
+    """
+    buckets = hist.buckets or []
+    res = HistogramCompaction(buckets_before=len(buckets), buckets_after=len(buckets))
+    if hist.histogram_type == 'singleton' or len(buckets) < 2 or epsilon <= 0:
+        return res
+
+    compacted = []
+    pre_cum_freq = 0
+    i = 0
+    while i < len(buckets):
+        j = i
+        if buckets[i].min_value != buckets[i].max_value:
+            while j + 1 < len(buckets) and buckets[j + 1].min_value != buckets[j + 1].max_value:
+                error = _merge_error(hist.data_type, pre_cum_freq, buckets[i:j + 2])
+                if error > epsilon:
+                    break
+                res.max_error = max(res.max_error, error)
+                j += 1
+        if j == i:
+            compacted.append(buckets[i])
+        else:
+            run = buckets[i:j + 1]
+            compacted.append(HistogramBucket(min_value=run[0].min_value, max_value=run[-1].max_value,
+                                             cum_freq=run[-1].cum_freq,
+                                             row_count=sum(b.row_count for b in run),
+                                             size=sum(b.size for b in run)))
+        pre_cum_freq = buckets[j].cum_freq
+        i = j + 1
+
+    hist.buckets = compacted
+    # point frequencies are rebuilt on next lookup
+    hist._point_freqs = None
+    res.buckets_after = len(compacted)
+    return res
+
+
+def compact_hist_dict(hist_dict: Dict[str, Optional[dict]], epsilon: float) -> HistogramCompaction:
+    """compact histograms in json (column -> HistogramStats.to_dict()) in place, see compact_histogram"""
+    res = HistogramCompaction()
+    for col, hist_json in hist_dict.items():
+        if not hist_json:
+            continue
+        hist = HistogramStats.from_dict(hist_json)
+        res.merge(compact_histogram(hist, epsilon))
+        hist_dict[col] = hist.to_dict()
+    return res
+
+
 def query_histogram(env: Env, dbname: str, table_name: str, col_name: str) -> Union[HistogramStats, None]:
     """
 
@@ -373,11 +534,11 @@ def query_histogram(env: Env, dbname: str, table_name: str, col_name: str) -> Un
     """
     sql = f"SELECT HISTOGRAM FROM information_schema.column_statistics " \
           f"WHERE SCHEMA_NAME = '{dbname}' AND TABLE_NAME = '{table_name}' AND COLUMN_NAME ='{col_name}'"
-    res = env.query_for_dataframe(sql)
+    res = env.query_for_dicts(sql)
     if len(res) == 0:
         return None
-    assert len(res) == 1 and 'HISTOGRAM' in res.iloc[0].to_dict(), f"Invalid result from query_histogram: {res}"
-    hist_dict = json.loads(res.iloc[0].to_dict()['HISTOGRAM'])
+    assert len(res) == 1 and 'HISTOGRAM' in res[0], f"Invalid result from query_histogram: {res}"
+    hist_dict = json.loads(res[0]['HISTOGRAM'])
 
     return HistogramStats.init_from_mysql_json(data=hist_dict)
 
@@ -428,9 +589,9 @@ def drop_histogram(env: Env, dbname: str, table_name: str, col_name: str) -> boo
     """
     sql = f"ANALYZE TABLE `{dbname}`.`{table_name}` DROP HISTOGRAM ON {col_name};"
     logging.debug(sql)
-    res = env.query_for_dataframe(sql)
+    res = env.query_for_dicts(sql)
     if res is not None and len(res) == 1:
-        msg = res.iloc[0].to_dict().get('Msg_text')
+        msg = res[0].get('Msg_text')
         return 'Histogram statistics removed for column' in msg
     return False
 
@@ -485,12 +646,12 @@ def _get_uniform_buckets(env: Env, db_name, table_name, col_name, min_value, max
         WHERE {col_name} IS NOT NULL
         ORDER BY RAND() LIMIT 1000
         """
-        sample_df = env.query_for_dataframe(sample_sql)
+        sample_rows = env.query_for_rows(sample_sql)
 
-        if len(sample_df) <= 1:
+        if len(sample_rows) <= 1:
             bounds = [min_value, max_value]
         else:
-            sorted_samples = sorted(sample_df[col_name].tolist())
+            sorted_samples = sorted(row[0] for row in sample_rows)
 
             # init bounds
             bounds = [min_value]
@@ -549,14 +710,14 @@ def _get_uniform_buckets(env: Env, db_name, table_name, col_name, min_value, max
         FROM {db_name}.{table_name}
         WHERE {col_name} {left_op} {lower_str} AND {col_name} {right_op} {upper_str}
         """
-        bucket_df = env.query_for_dataframe(bucket_sql)
+        bucket_rows = env.query_for_dicts(bucket_sql)
 
-        if not bucket_df.empty and bucket_df['bucket_count'].iloc[0] > 0:
-            bucket_count = int(bucket_df['bucket_count'].iloc[0])
-            bucket_ndv = int(bucket_df['bucket_ndv'].iloc[0])
+        if bucket_rows and bucket_rows[0]['bucket_count'] > 0:
+            bucket_count = int(bucket_rows[0]['bucket_count'])
+            bucket_ndv = int(bucket_rows[0]['bucket_ndv'])
 
-            actual_min = bucket_df['actual_min'].iloc[0]
-            actual_max = bucket_df['actual_max'].iloc[0]
+            actual_min = bucket_rows[0]['actual_min']
+            actual_max = bucket_rows[0]['actual_max']
 
             if actual_min is not None and actual_max is not None:
                 result.append((str(actual_min), str(actual_max), bucket_count, bucket_ndv))
@@ -608,8 +769,7 @@ def get_bucket_bounds(env: Env, table_name, col_name,
     # obtain ndv if it's None
     if ndv is None:
         ndv_sql = f"SELECT COUNT(DISTINCT {col_name}) as ndv FROM {db_name}.{table_name}"
-        ndv_df = env.query_for_dataframe(ndv_sql)
-        ndv = ndv_df['ndv'].iloc[0]
+        ndv = env.query_for_rows(ndv_sql)[0][0]
         logging.debug(f"{table_name=} {col_name=} ndv is None, force fetch it, {ndv=}")
 
     # if ndv is very small, use group by to get the value count
@@ -622,10 +782,8 @@ def get_bucket_bounds(env: Env, table_name, col_name,
         GROUP BY {col_name} 
         ORDER BY {col_name}
         """
-        small_ndv_df = env.query_for_dataframe(small_ndv_sql)
-
         result = []
-        for _, row in small_ndv_df.iterrows():
+        for row in env.query_for_dicts(small_ndv_sql):
             value = row['value']
             result.append((value, value, int(row['bucket_count']), 1))
 
@@ -682,8 +840,8 @@ def force_generate_histogram_by_sdc_for_col(env: Env, db_name: str, table_name:
     data_type = column.data_type
 
     # Find the minimum and maximum values in the column
-    _df = env.query_for_dataframe(f"SELECT MIN({col_name}) as min, MAX({col_name}) as max FROM {db_name}.{table_name}")
-    min_val, max_val = _df['min'][0], _df['max'][0]
+    min_val, max_val = env.query_for_rows(
+        f"SELECT MIN({col_name}) as min, MAX({col_name}) as max FROM {db_name}.{table_name}")[0]
 
     # Calculate the bucket size
     null_values = env.mysql_util.query_for_value(
@@ -776,6 +934,7 @@ def generate_fetch_histogram(env: Env, target_db: str, all_table_names: List[str
                              hist_mem_size: int,
                              ret_json: bool = False,
                              ndv_single_dict: dict = None,
+                             journal: FetchJournal = None,
                              ) -> Dict[str, Dict[str, Union[HistogramStats, dict]]]:
     """
     generate histogram for all specifed tables
@@ -788,6 +947,7 @@ def generate_fetch_histogram(env: Env, target_db: str, all_table_names: List[str
         force:
         ret_json: True: return json, False: return HistogramStats
         ndv_single_dict: table_name -> col -> ndv
+        journal: if not None, checkpoint each column and table, and skip those already in the journal
 
     Returns:
         lower_table -> column -> HistogramStats
@@ -803,9 +963,16 @@ def generate_fetch_histogram(env: Env, target_db: str, all_table_names: List[str
     res_tables = defaultdict(dict)
     for table_name in all_table_names:
         table_meta: Table = env.get_table_meta(target_db, table_name)
+        done_columns = journal.columns(JOURNAL_SECTION_HIST, table_name) if journal is not None else {}
         # print(table_meta)
         for c_id, col in enumerate(table_meta.columns):
             col: Column
+            if col.name in done_columns:
+                hist = done_columns[col.name]
+                if hist is not None and not ret_json:
+                    hist = HistogramStats.from_dict(hist)
+                res_tables[str(table_name).lower()][col.name] = hist
+                continue
             ndv = ndv_single_dict.get(table_name, {}).get(col.name, None)
             hist = None
             try:
@@ -826,9 +993,14 @@ def generate_fetch_histogram(env: Env, target_db: str, all_table_names: List[str
                     except Exception as e:
                         logging.error(f"drop histogram failed for {target_db}.{table_name}.{col.name}, {e}")
 
+            if journal is not None:
+                journal.record(JOURNAL_SECTION_HIST, table_name, hist.to_dict() if hist is not None else None,
+                               column=col.name)
             if hist is not None and ret_json:
                 hist = hist.to_dict()
             res_tables[str(table_name).lower()][col.name] = hist
+        if journal is not None and not journal.has(JOURNAL_SECTION_HIST, table_name):
+            journal.record(JOURNAL_SECTION_HIST, table_name, None)
     return res_tables
 
 
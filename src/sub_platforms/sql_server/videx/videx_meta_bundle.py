@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Binary metadata bundle: the columnar counterpart of the json metadata file
+{'stats_dict', 'hist_dict', 'ndv_single_dict', 'ndv_mulcol_dict'}.
+
+A bundle consists of two files:
+- `{path}`: numeric table stats, single-column ndvs, histograms and histogram buckets, each as an
+  Arrow IPC file (section), concatenated into one file. Rows of each section are grouped by table.
+- `{path}.json`: the sidecar. Section offsets, per-table row ranges, and everything not numeric per table:
+  table meta (DDL, columns, indexes, pct_cached ...) and multi-column ndvs.
+
+Readers memory-map the bundle and only materialize rows of the requested tables.
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pyarrow as pa
+
+META_BUNDLE_FORMAT_VERSION = 1
+META_BUNDLE_SECTIONS = ['stats', 'ndv_single', 'hist', 'buckets']
+META_BUNDLE_KEYS = ['stats_dict', 'hist_dict', 'ndv_single_dict', 'ndv_mulcol_dict']
+
+_HIST_ATTRS = [('data_type', pa.string()), ('histogram_type', pa.string()), ('null_values', pa.float64()),
+               ('collation_id', pa.int64()), ('last_updated', pa.string()), ('sampling_rate', pa.float64()),
+               ('number_of_buckets_specified', pa.int64())]
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+# how bucket boundaries of a histogram are stored
+_VALUE_KIND_INT = 'int'
+_VALUE_KIND_FLOAT = 'float'
+_VALUE_KIND_STR = 'str'
+# mixed types or ints beyond int64 (e.g. BIGINT UNSIGNED), json encoded into the str columns to keep them exact
+_VALUE_KIND_JSON = 'json'
+
+
+def meta_bundle_sidecar_path(path: str) -> str:
+    return f"{path}.json"
+
+
+def _is_int(v) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def _is_number(v) -> bool:
+    return _is_int(v) or isinstance(v, float)
+
+
+def _is_int64(v) -> bool:
+    return _is_int(v) and _INT64_MIN <= v <= _INT64_MAX
+
+
+def _is_exact_float(v) -> bool:
+    """a float, or an int that float64 holds exactly (e.g. not 2 ** 64 - 1)"""
+    return isinstance(v, float) or (_is_int(v) and abs(v) < 2 ** 1023 and int(float(v)) == v)
+
+
+def _value_kind(values: List) -> str:
+    if all(_is_int64(v) for v in values):
+        return _VALUE_KIND_INT
+    if all(_is_exact_float(v) for v in values):
+        return _VALUE_KIND_FLOAT
+    if all(isinstance(v, str) for v in values):
+        return _VALUE_KIND_STR
+    return _VALUE_KIND_JSON
+
+
+def _write_section(f, columns: Dict[str, pa.Array]) -> Tuple[int, int]:
+    offset = f.tell()
+    table = pa.table(columns) if columns else pa.table({'table': pa.array([], pa.string())})
+    with pa.ipc.new_file(f, table.schema) as writer:
+        writer.write_table(table)
+    return offset, f.tell() - offset
+
+
+def write_meta_bundle(path: str, metadata: dict):
+    """
+    write a metadata bundle (and its sidecar)
+
+    Args:
+        path: bundle file, the sidecar is written to meta_bundle_sidecar_path(path)
+        metadata: {'stats_dict', 'hist_dict', 'ndv_single_dict', 'ndv_mulcol_dict'}, lower table -> ...
+    """
+    stats_dict = metadata.get('stats_dict') or {}
+    hist_dict = metadata.get('hist_dict') or {}
+    ndv_single_dict = metadata.get('ndv_single_dict') or {}
+    tables = sorted(set(stats_dict) | set(hist_dict) | set(ndv_single_dict))
+
+    # stats: numeric keys go to arrow, one row per table. Others stay in the sidecar as table meta,
+    # including numbers that the int64 or float64 column can not hold exactly.
+    key_values: Dict[str, list] = {}
+    for row in stats_dict.values():
+        for k, v in row.items():
+            key_values.setdefault(k, []).append(v)
+    numeric_keys = [k for k, values in key_values.items()
+                    if all(v is None or _is_number(v) for v in values)
+                    and (all(v is None or _is_int64(v) for v in values)
+                         or all(v is None or _is_exact_float(v) for v in values))]
+
+    sidecar_tables = {t: {'ranges': {}} for t in tables}
+    stats_tables, stats_columns = [], {k: [] for k in numeric_keys}
+    ndv_tables, ndv_columns, ndv_values = [], [], []
+    hist_columns = {name: [] for name in ['table', 'column', 'is_null', 'value_kind', 'bucket_start', 'bucket_count',
+                                          'mcvs']}
+    hist_columns.update({name: [] for name, _ in _HIST_ATTRS})
+    bucket_columns = {name: [] for name in ['min_int', 'max_int', 'min_float', 'max_float', 'min_str', 'max_str',
+                                            'cum_freq', 'row_count', 'size']}
+
+    for t in tables:
+        info = sidecar_tables[t]
+        if t in stats_dict:
+            row = stats_dict[t]
+            info['ranges']['stats'] = [len(stats_tables), 1]
+            stats_tables.append(t)
+            for k in numeric_keys:
+                stats_columns[k].append(row.get(k))
+            missing = [k for k in numeric_keys if k not in row]
+            if missing:
+                info['missing_keys'] = missing
+            info['table_meta'] = {k: v for k, v in row.items() if k not in stats_columns}
+
+        if t in ndv_single_dict:
+            info['ranges']['ndv_single'] = [len(ndv_tables), len(ndv_single_dict[t])]
+            for col, ndv in ndv_single_dict[t].items():
+                ndv_tables.append(t)
+                ndv_columns.append(col)
+                ndv_values.append(ndv)
+
+        if t in hist_dict:
+            info['ranges']['hist'] = [len(hist_columns['table']), len(hist_dict[t])]
+            bucket_begin = len(bucket_columns['cum_freq'])
+            for col, hist in hist_dict[t].items():
+                hist_columns['table'].append(t)
+                hist_columns['column'].append(col)
+                hist_columns['is_null'].append(hist is None)
+                hist = hist or {}
+                buckets = hist.get('buckets') or []
+                bounds = [b['min_value'] for b in buckets] + [b['max_value'] for b in buckets]
+                kind = _value_kind(bounds)
+                hist_columns['value_kind'].append(kind)
+                hist_columns['bucket_start'].append(len(bucket_columns['cum_freq']))
+                hist_columns['bucket_count'].append(len(buckets))
+                for name, _ in _HIST_ATTRS:
+                    hist_columns[name].append(hist.get(name))
+                # few per column, kept as json
+                hist_columns['mcvs'].append(json.dumps(hist['mcvs']) if hist.get('mcvs') else None)
+                for b in buckets:
+                    for side in ['min', 'max']:
+                        v = b[f'{side}_value']
+                        bucket_columns[f'{side}_int'].append(v if kind == _VALUE_KIND_INT else None)
+                        bucket_columns[f'{side}_float'].append(float(v) if kind == _VALUE_KIND_FLOAT else None)
+                        bucket_columns[f'{side}_str'].append(v if kind == _VALUE_KIND_STR else
+                                                             json.dumps(v) if kind == _VALUE_KIND_JSON else None)
+                    bucket_columns['cum_freq'].append(b['cum_freq'])
+                    bucket_columns['row_count'].append(b['row_count'])
+                    bucket_columns['size'].append(b.get('size', 0))
+            info['ranges']['buckets'] = [bucket_begin, len(bucket_columns['cum_freq']) - bucket_begin]
+
+    stats_arrays = {'table': pa.array(stats_tables, pa.string())}
+    for k in numeric_keys:
+        values = stats_columns[k]
+        is_int = all(v is None or _is_int64(v) for v in values)
+        stats_arrays[k] = pa.array(values, pa.int64() if is_int else pa.float64())
+    sections = {
+        'stats': stats_arrays,
+        'ndv_single': {'table': pa.array(ndv_tables, pa.string()), 'column': pa.array(ndv_columns, pa.string()),
+                       'ndv': pa.array(ndv_values, pa.int64())},
+        'hist': {
+            'table': pa.array(hist_columns['table'], pa.string()),
+            'column': pa.array(hist_columns['column'], pa.string()),
+            'is_null': pa.array(hist_columns['is_null'], pa.bool_()),
+            'value_kind': pa.array(hist_columns['value_kind'], pa.string()),
+            'bucket_start': pa.array(hist_columns['bucket_start'], pa.int64()),
+            'bucket_count': pa.array(hist_columns['bucket_count'], pa.int64()),
+            'mcvs': pa.array(hist_columns['mcvs'], pa.string()),
+            **{name: pa.array(hist_columns[name], dtype) for name, dtype in _HIST_ATTRS},
+        },
+        'buckets': {
+            'min_int': pa.array(bucket_columns['min_int'], pa.int64()),
+            'max_int': pa.array(bucket_columns['max_int'], pa.int64()),
+            'min_float': pa.array(bucket_columns['min_float'], pa.float64()),
+            'max_float': pa.array(bucket_columns['max_float'], pa.float64()),
+            'min_str': pa.array(bucket_columns['min_str'], pa.string()),
+            'max_str': pa.array(bucket_columns['max_str'], pa.string()),
+            'cum_freq': pa.array(bucket_columns['cum_freq'], pa.float64()),
+            'row_count': pa.array(bucket_columns['row_count'], pa.float64()),
+            'size': pa.array(bucket_columns['size'], pa.int64()),
+        },
+    }
+
+    if os.path.dirname(os.path.abspath(path)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    section_offsets = {}
+    with open(path, 'wb') as f:
+        for name in META_BUNDLE_SECTIONS:
+            section_offsets[name] = _write_section(f, sections[name])
+
+    sidecar = {
+        'format_version': META_BUNDLE_FORMAT_VERSION,
+        'sections': section_offsets,
+        'tables': sidecar_tables,
+        'ndv_mulcol_dict': metadata.get('ndv_mulcol_dict') or {},
+        'extra': {k: v for k, v in metadata.items() if k not in META_BUNDLE_KEYS},
+    }
+    with open(meta_bundle_sidecar_path(path), 'w') as f:
+        json.dump(sidecar, f)
+
+
+def load_meta_bundle_sidecar(path: str) -> dict:
+    with open(meta_bundle_sidecar_path(path), 'r') as f:
+        sidecar = json.load(f)
+    if sidecar.get('format_version') != META_BUNDLE_FORMAT_VERSION:
+        raise Exception(f"unsupported meta bundle format {sidecar.get('format_version')} of {path}")
+    return sidecar
+
+
+def _decode_bounds(buckets: pa.Table, side: str, kind: str) -> List:
+    if kind == _VALUE_KIND_INT:
+        return buckets.column(f'{side}_int').to_pylist()
+    if kind == _VALUE_KIND_FLOAT:
+        return buckets.column(f'{side}_float').to_pylist()
+    values = buckets.column(f'{side}_str').to_pylist()
+    return values if kind == _VALUE_KIND_STR else [json.loads(v) for v in values]
+
+
+def read_meta_bundle(path: str, tables: Optional[Iterable[str]] = None, sidecar: dict = None) -> dict:
+    """
+    read a metadata bundle into the json metadata format
+
+    Args:
+        path: bundle file
+        tables: only load these tables (case-insensitive), None for all
+        sidecar: the loaded sidecar, loaded from meta_bundle_sidecar_path(path) if None
+
+    Returns:
+        {'stats_dict', 'hist_dict', 'ndv_single_dict', 'ndv_mulcol_dict'} and extra keys written with the bundle
+    """
+    sidecar = sidecar or load_meta_bundle_sidecar(path)
+    table_infos: Dict[str, dict] = sidecar['tables']
+    if tables is not None:
+        wanted = {t.lower() for t in tables}
+        table_infos = {t: info for t, info in table_infos.items() if t in wanted}
+
+    # zero-copy: arrays are views of the memory-mapped file, only sliced rows are materialized
+    with pa.memory_map(path, 'r') as source:
+        buffer = source.read_buffer()
+    sections = {name: pa.ipc.open_file(buffer.slice(offset, length)).read_all()
+                for name, (offset, length) in sidecar['sections'].items()}
+
+    stats_dict, hist_dict, ndv_single_dict = {}, {}, {}
+    numeric_keys = [k for k in sections['stats'].column_names if k != 'table']
+    for t, info in table_infos.items():
+        ranges = info['ranges']
+        if 'stats' in ranges:
+            row = sections['stats'].slice(*ranges['stats']).to_pylist()[0]
+            missing = set(info.get('missing_keys', []))
+            stats_row = {k: row[k] for k in numeric_keys if k not in missing}
+            stats_row.update(info.get('table_meta', {}))
+            stats_dict[t] = stats_row
+
+        if 'ndv_single' in ranges:
+            ndv = sections['ndv_single'].slice(*ranges['ndv_single'])
+            ndv_single_dict[t] = dict(zip(ndv.column('column').to_pylist(), ndv.column('ndv').to_pylist()))
+
+        if 'hist' in ranges:
+            table_hist = {}
+            for h in sections['hist'].slice(*ranges['hist']).to_pylist():
+                if h['is_null']:
+                    table_hist[h['column']] = None
+                    continue
+                buckets = sections['buckets'].slice(h['bucket_start'], h['bucket_count'])
+                min_values = _decode_bounds(buckets, 'min', h['value_kind'])
+                max_values = _decode_bounds(buckets, 'max', h['value_kind'])
+                table_hist[h['column']] = {
+                    'buckets': [{'min_value': mi, 'max_value': ma, 'cum_freq': cf, 'row_count': rc, 'size': sz}
+                                for mi, ma, cf, rc, sz in zip(min_values, max_values,
+                                                              buckets.column('cum_freq').to_pylist(),
+                                                              buckets.column('row_count').to_pylist(),
+                                                              buckets.column('size').to_pylist())],
+                    **{name: h[name] for name, _ in _HIST_ATTRS},
+                }
+                if h.get('mcvs'):
+                    table_hist[h['column']]['mcvs'] = json.loads(h['mcvs'])
+            hist_dict[t] = table_hist
+
+    ndv_mulcol_dict = {t: v for t, v in sidecar.get('ndv_mulcol_dict', {}).items() if t in table_infos}
+    return {
+        'stats_dict': stats_dict,
+        'hist_dict': hist_dict,
+        'ndv_single_dict': ndv_single_dict,
+        'ndv_mulcol_dict': ndv_mulcol_dict,
+        **sidecar.get('extra', {}),
+    }
+
+
+def convert_json_to_meta_bundle(json_path: str, bundle_path: str):
+    with open(json_path, 'r') as f:
+        metadata = json.load(f)
+    write_meta_bundle(bundle_path, metadata)
+
+
+def convert_meta_bundle_to_json(bundle_path: str, json_path: str, tables: Optional[Iterable[str]] = None):
+    metadata = read_meta_bundle(bundle_path, tables)
+    with open(json_path, 'w') as f:
+        json.dump(metadata, f, indent=4)
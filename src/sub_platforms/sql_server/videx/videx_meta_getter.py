@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+VidexMetaGetter that pulls task metadata from the files server (sql_jsonfiles), so that statistic servers
+are stateless pull caches:
+
+    getter = FilesServerMetaGetter('127.0.0.1:5002', cache_dir='/tmp/videx_meta_cache')
+    startup_videx_server(load_meta_by_task_id_func=getter.get_meta_by_task_id)
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING
+
+from sub_platforms.sql_server.videx.videx_metadata import VidexMetaGetter, VidexDBTaskStats
+
+if TYPE_CHECKING:
+    import requests
+
+
+class FilesServerMetaGetter(VidexMetaGetter):
+    """
+    Args:
+        files_server_ip_port: ip:port of the files server
+        cache_dir: metadata and its ETag are cached here, requests carry If-None-Match. None to disable.
+        task_db_resolver: task_id -> names of the databases saved on the files server.
+            By default, the task_id is the database name (videx_build_env --files ip:port:db_name).
+        namespace: files_server_ip_port under which the metadata is saved, defaults to files_server_ip_port
+        timeout: seconds of each request
+    """
+
+    def __init__(self, files_server_ip_port: str, cache_dir: Optional[str] = None,
+                 task_db_resolver: Callable[[str], List[str]] = None,
+                 namespace: str = None, timeout: float = 60):
+        self.files_server_ip_port = files_server_ip_port
+        self.cache_dir = cache_dir
+        self.task_db_resolver = task_db_resolver or (lambda task_id: [task_id])
+        self.namespace = namespace or files_server_ip_port
+        self.timeout = timeout
+        # keep-alive connections, one session per thread since requests.Session is not thread-safe
+        self._local = threading.local()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def session(self) -> 'requests.Session':
+        import requests
+
+        if getattr(self._local, 'session', None) is None:
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _cache_paths(self, db_name: str) -> Tuple[str, str]:
+        key = hashlib.sha256(f"{self.namespace}/{db_name}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.etag")
+
+    def _read_cache(self, db_name: str) -> Tuple[Optional[str], Optional[bytes]]:
+        if not self.cache_dir:
+            return None, None
+        data_path, etag_path = self._cache_paths(db_name)
+        if not os.path.exists(data_path) or not os.path.exists(etag_path):
+            return None, None
+        with open(etag_path, 'r') as f:
+            etag = f.read().strip()
+        with open(data_path, 'rb') as f:
+            return etag, f.read()
+
+    def _write_cache(self, db_name: str, etag: Optional[str], data: bytes):
+        if not self.cache_dir or not etag:
+            return
+        data_path, etag_path = self._cache_paths(db_name)
+        # data before etag: a crash in between leaves an etag of the older data, which only costs a full download
+        for path, content in [(data_path, data), (etag_path, etag.encode('utf-8'))]:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp_')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+    def fetch_db_metadata(self, db_name: str) -> Optional[dict]:
+        """the json dict of VidexDBTaskStats of a database, from the disk cache if it is not modified"""
+        import requests
+
+        cached_etag, cached_data = self._read_cache(db_name)
+        headers = {'Accept-Encoding': 'gzip'}
+        if cached_etag:
+            headers['If-None-Match'] = cached_etag
+        try:
+            resp = self.session.get(f'http://{self.files_server_ip_port}/get_metadata',
+                                    params={'db_name': db_name, 'files_server_ip_port': self.namespace},
+                                    headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            if cached_data is None:
+                logging.error(f"failed to get metadata of {db_name} from {self.files_server_ip_port}: {e}")
+                return None
+            logging.warning(f"failed to get metadata of {db_name} from {self.files_server_ip_port}, "
+                            f"use the local cache: {e}")
+            return json.loads(cached_data)
+
+        if resp.status_code == 304 and cached_data is not None:
+            logging.info(f"metadata of {db_name} is not modified, use the local cache")
+            return json.loads(cached_data)
+        if resp.status_code != 200:
+            logging.error(f"failed to get metadata of {db_name} from {self.files_server_ip_port}: "
+                          f"{resp.status_code} - {resp.text}")
+            return None
+        self._write_cache(db_name, resp.headers.get('ETag'), resp.content)
+        return resp.json()
+
+    def get_meta_by_task_id(self, task_id: str) -> Optional[VidexDBTaskStats]:
+        """
+        Returns:
+            metadata of all databases of the task, None if any of them is unavailable
+        """
+        res = None
+        for db_name in self.task_db_resolver(task_id):
+            metadata = self.fetch_db_metadata(db_name)
+            if metadata is None:
+                return None
+            db_meta = VidexDBTaskStats.from_dict({**metadata, 'task_id': task_id})
+            if res is not None and res.merge_with(db_meta, inplace=True) is None:
+                logging.error(f"metadata of {db_name} can not be merged into task {task_id}, "
+                              f"sample files are in different places")
+                return None
+            res = res or db_meta
+        return res
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Profiling of the statistic server:
+- RequestProfiler: cProfile of sampled /ask_videx requests for the next N requests or T seconds,
+  aggregated by function. Started by POST /admin/profile and read by GET /admin/profile.
+  Profiles are dumped only into output_dir, clients name the file but not the directory.
+- PhaseTimer: the time of each phase of /ask_videx, returned in the Server-Timing header.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from typing import Dict, List, Optional
+
+# phases of VidexSingleton.ask, in order, then the serialization of the /ask_videx response
+PHASE_TASK_LOOKUP = 'task_lookup'
+PHASE_EXPECT_RESPONSE = 'expect_response'
+PHASE_MODEL_BUILD = 'model_build'
+PHASE_ESTIMATE = 'estimate'
+PHASE_SERIALIZATION = 'serialization'
+
+
+class PhaseTimer:
+    """
+    Times consecutive phases, each lap ends the current phase:
+
+        timer = PhaseTimer()
+        ...  # task lookup
+        timer.lap(PHASE_TASK_LOOKUP)
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self._last = time.perf_counter()
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.) + now - self._last
+        self._last = now
+
+    def skip(self):
+        """ends the current interval without counting it to any phase"""
+        self._last = time.perf_counter()
+
+    def to_server_timing(self) -> str:
+        """Server-Timing header, durations in milliseconds"""
+        return ', '.join(f"{phase};dur={seconds * 1000:.3f}" for phase, seconds in self.phases.items())
+
+    def __str__(self):
+        return ' '.join(f"{phase}={seconds * 1000:.3f}ms" for phase, seconds in self.phases.items())
+
+
+class RequestProfiler:
+    """
+    Profiles requests with cProfile while a session is active. A session ends after n_requests profiled
+    requests or `seconds`, whichever comes first. Profiles of the requests are aggregated by function.
+
+    Each request is profiled in its own thread, so concurrent requests do not mix. Requests that can not
+    be profiled (e.g. a profiler is already active in the interpreter) are counted as skipped.
+    """
+
+    def __init__(self, output_dir: str = None):
+        """
+        Args:
+            output_dir: directory of the dumped profiles, dumping is disabled if None
+        """
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.active = False
+        self.n_requests: Optional[int] = None
+        self.deadline: Optional[float] = None
+        self.sample_every = 1
+        self.output_file: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self.seen = 0
+        self.profiled = 0
+        self.skipped = 0
+        self._stats: Optional[pstats.Stats] = None
+
+    def start(self, n_requests: int = None, seconds: float = None, sample_every: int = 1,
+              output_file: str = None):
+        """
+        Args:
+            n_requests: stop after profiling this number of requests
+            seconds: stop after this number of seconds. If neither is given, stop after 100 requests.
+            sample_every: profile one of every `sample_every` requests
+            output_file: dump the aggregated profile (pstats format) to this file of output_dir when the
+                session ends. A file name, not a path.
+        """
+        output_file = self.resolve_output_file(output_file) if output_file else None
+        with self.lock:
+            self.active = True
+            self.n_requests = n_requests if n_requests or seconds else 100
+            self.deadline = time.time() + seconds if seconds else None
+            self.sample_every = max(1, int(sample_every))
+            self.output_file = output_file
+            self.started_at, self.stopped_at = time.time(), None
+            self.seen = self.profiled = self.skipped = 0
+            self._stats = None
+        logging.info(f"start profiling: n_requests={self.n_requests} seconds={seconds} "
+                     f"sample_every={self.sample_every} output_file={output_file}")
+
+    def resolve_output_file(self, file_name: str) -> str:
+        """path of a profile file in output_dir. Raises ValueError if dumping is disabled or it is not a file name"""
+        if self.output_dir is None:
+            raise ValueError("output_file is not supported, the server has no profile directory")
+        if os.path.basename(file_name) != file_name or file_name in ('.', '..') or '\\' in file_name:
+            raise ValueError(f"output_file must be a file name, got {file_name!r}")
+        return os.path.join(self.output_dir, file_name)
+
+    def stop(self):
+        with self.lock:
+            self._stop()
+
+    def _stop(self):
+        if not self.active:
+            return
+        self.active = False
+        self.stopped_at = time.time()
+        if self.output_file and self._stats is not None:
+            # called at the end of a request, a failed dump must not fail the request
+            try:
+                self._stats.dump_stats(self.output_file)
+            except OSError as e:
+                logging.error(f"dump profile to {self.output_file} failed: {e}")
+        logging.info(f"stop profiling: {self.profiled} requests profiled, {self.skipped} skipped, "
+                     f"output_file={self.output_file}")
+
+    def begin(self) -> Optional[cProfile.Profile]:
+        """called before a request, returns the profile of the request if it is sampled"""
+        if not self.active:
+            return None
+        with self.lock:
+            if not self.active:
+                return None
+            if self.deadline is not None and time.time() >= self.deadline:
+                self._stop()
+                return None
+            self.seen += 1
+            if (self.seen - 1) % self.sample_every != 0:
+                return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            with self.lock:
+                self.skipped += 1
+            return None
+        return profile
+
+    def end(self, profile: Optional[cProfile.Profile]):
+        """called after a request with the return of begin"""
+        if profile is None:
+            return
+        profile.disable()
+        with self.lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile, stream=io.StringIO())
+            else:
+                self._stats.add(profile)
+            self.profiled += 1
+            if self.active and self.n_requests is not None and self.profiled >= self.n_requests:
+                self._stop()
+
+    def report(self, top: int = 30, sort: str = 'cumulative') -> dict:
+        """
+        Args:
+            top: number of functions
+            sort: 'cumulative' or 'tottime'
+
+        Returns:
+            the session status and its top functions: {'func': file:line(name), 'ncalls', 'tottime', 'cumtime'},
+            times in seconds
+        """
+        with self.lock:
+            res = {'active': self.active, 'started_at': self.started_at, 'stopped_at': self.stopped_at,
+                   'profiled': self.profiled, 'skipped': self.skipped, 'output_file': self.output_file,
+                   'functions': []}
+            if self._stats is None:
+                return res
+            functions: List[dict] = []
+            for (filename, lineno, name), (cc, nc, tt, ct, _) in self._stats.stats.items():
+                functions.append({'func': f"{filename}:{lineno}({name})", 'ncalls': nc,
+                                  'tottime': tt, 'cumtime': ct})
+        key = 'tottime' if sort == 'tottime' else 'cumtime'
+        res['functions'] = sorted(functions, key=lambda f: f[key], reverse=True)[:top]
+        return res
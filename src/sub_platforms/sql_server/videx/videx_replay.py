@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Deterministic replay of /ask_videx captures (see videx_capture), either in-process through VidexSingleton.ask
+or over HTTP, to benchmark the statistic server with real EXPLAIN traffic:
+
+    records = list(read_capture('/tmp/videx_capture.jsonl.gz'))
+    report = replay_in_process(records, singleton, concurrency=8, rate=2000)
+    report = replay_over_http(records, '127.0.0.1:5001', concurrency=8)
+    print(report)
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+from pydantic import BaseModel
+
+from sub_platforms.sql_server.common.pydantic_utils import PydanticDataClassJsonMixin
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton, str2VidexFunc
+
+# (code, resp) of a request
+AskFunc = Callable[[dict], Tuple[int, dict]]
+
+
+class LatencyStats(BaseModel, PydanticDataClassJsonMixin):
+    count: int = 0
+    errors: int = 0
+    mismatches: int = 0
+    mean_ms: float = 0
+    p50_ms: float = 0
+    p99_ms: float = 0
+    max_ms: float = 0
+
+    @classmethod
+    def from_latencies(cls, latencies: List[float], errors: int, mismatches: int) -> 'LatencyStats':
+        if len(latencies) == 0:
+            return cls(errors=errors, mismatches=mismatches)
+        ms = np.array(latencies) * 1000
+        return cls(count=len(ms), errors=errors, mismatches=mismatches, mean_ms=float(np.mean(ms)),
+                   p50_ms=float(np.percentile(ms, 50)), p99_ms=float(np.percentile(ms, 99)), max_ms=float(np.max(ms)))
+
+    def __str__(self):
+        return f"count={self.count} errors={self.errors} mismatches={self.mismatches} mean={self.mean_ms:.3f}ms " \
+               f"p50={self.p50_ms:.3f}ms p99={self.p99_ms:.3f}ms max={self.max_ms:.3f}ms"
+
+
+class ReplayReport(BaseModel, PydanticDataClassJsonMixin):
+    """
+    errors are requests not answered with code 200, mismatches are answers different from the captured ones
+    """
+    duration: float = 0
+    throughput: float = 0
+    total: LatencyStats = LatencyStats()
+    by_func: Dict[str, LatencyStats] = {}
+
+    def __str__(self):
+        lines = [f"{self.total.count} requests in {self.duration:.2f}s, {self.throughput:.1f} req/s",
+                 f"  total: {self.total}"]
+        lines += [f"  {func}: {stats}" for func, stats in sorted(self.by_func.items())]
+        return '\n'.join(lines)
+
+
+class _ReplayResult:
+    __slots__ = ['func', 'latency', 'error', 'mismatch']
+
+    def __init__(self, func: str, latency: float, error: bool, mismatch: bool):
+        self.func = func
+        self.latency = latency
+        self.error = error
+        self.mismatch = mismatch
+
+
+def _build_report(results: List[_ReplayResult], duration: float) -> ReplayReport:
+    groups: Dict[str, List[_ReplayResult]] = {}
+    for res in results:
+        groups.setdefault(res.func, []).append(res)
+
+    def stats(group: List[_ReplayResult]) -> LatencyStats:
+        return LatencyStats.from_latencies([r.latency for r in group], errors=sum(r.error for r in group),
+                                           mismatches=sum(r.mismatch for r in group))
+
+    return ReplayReport(duration=duration, throughput=len(results) / duration if duration > 0 else 0,
+                        total=stats(results), by_func={func: stats(group) for func, group in groups.items()})
+
+
+def replay(records: List[dict], ask_func: AskFunc, concurrency: int = 1, rate: Optional[float] = None,
+           compare: bool = True) -> ReplayReport:
+    """
+    Replays captured records in the order of capture.
+
+    Args:
+        records: records of read_capture
+        ask_func: sends a request, returns (code, resp)
+        concurrency: number of threads sending requests
+        rate: requests per second, request i is not sent before start + i / rate. None for as fast as possible.
+        compare: count responses different from the captured ones as mismatches
+
+    Returns:
+        latencies of all requests and of each VidexFunc
+    """
+    results: List[Optional[_ReplayResult]] = [None] * len(records)
+    next_idx = iter(range(len(records)))
+    idx_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def worker():
+        while True:
+            with idx_lock:
+                idx = next(next_idx, None)
+            if idx is None:
+                return
+            if rate:
+                delay = start + idx / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            record = records[idx]
+            func = str2VidexFunc(record['req'].get('properties', {}).get('function', '')).value
+            st = time.perf_counter()
+            try:
+                code, resp = ask_func(record['req'])
+            except Exception:
+                code, resp = None, None
+            latency = time.perf_counter() - st
+            mismatch = compare and code == record.get('code') == 200 and resp != record.get('resp')
+            results[idx] = _ReplayResult(func, latency, code != 200, mismatch)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return _build_report(results, time.perf_counter() - start)
+
+
+def replay_in_process(records: List[dict], singleton: VidexSingleton, **kwargs) -> ReplayReport:
+    """replay through VidexSingleton.ask, metadata of the captured tasks must be loadable by the singleton"""
+
+    def ask_func(req: dict) -> Tuple[int, dict]:
+        code, _, resp = singleton.ask(req)
+        return code, resp
+
+    return replay(records, ask_func, **kwargs)
+
+
+def replay_over_http(records: List[dict], videx_server_ip_port: str, timeout: float = 60, **kwargs) -> ReplayReport:
+    """replay to /ask_videx of a running statistic server"""
+    local = threading.local()
+    url = f"http://{videx_server_ip_port}/ask_videx"
+
+    def ask_func(req: dict) -> Tuple[int, dict]:
+        # keep-alive connections, requests.Session is not thread-safe
+        if getattr(local, 'session', None) is None:
+            local.session = requests.Session()
+        resp = local.session.post(url, json=req, timeout=timeout).json()
+        return resp['code'], resp['data']
+
+    return replay(records, ask_func, **kwargs)
@@ -7,29 +7,42 @@ import enum
 import gzip
 import json
 import logging
-import re
+import os
+import tempfile
 import threading
 import time
 import traceback
 from dataclasses import dataclass, field
-from typing import List, Tuple, Union, Callable, Type, Dict, Optional
+from typing import List, Tuple, Union, Callable, Type, Dict, Optional, TYPE_CHECKING
 
-import requests
 from cachetools import TTLCache
 from flask import Flask, request, jsonify
 from flask_restx import Api, Resource, fields, Namespace
-from requests import Response
 
 from sub_platforms.sql_server.env.rds_env import Env
 from sub_platforms.sql_server.videx import videx_logging
 from sub_platforms.sql_server.videx.videx_metadata import VidexTableStats, VidexDBTaskStats, EXTRA_INFO_KEY_pct_cached, \
-    EXTRA_INFO_KEY_mulcol, EXTRA_INFO_KEY_gt_rec_in_ranges, construct_videx_task_meta_from_local_files
+    EXTRA_INFO_KEY_mulcol, EXTRA_INFO_KEY_gt_rec_in_ranges, construct_videx_task_meta_from_local_files, \
+    compact_task_histograms
+from sub_platforms.sql_server.videx.videx_capture import RequestCapture
+from sub_platforms.sql_server.videx.videx_ddl_sync import sync_videx_db, execute_in_batches, videx_create_table_ddl
+from sub_platforms.sql_server.videx.videx_histogram import HistogramCompaction
+from sub_platforms.sql_server.videx.videx_meta_bundle import meta_bundle_sidecar_path
+from sub_platforms.sql_server.videx.videx_profiler import RequestProfiler, PhaseTimer, PHASE_TASK_LOOKUP, \
+    PHASE_EXPECT_RESPONSE, PHASE_MODEL_BUILD, PHASE_ESTIMATE, PHASE_SERIALIZATION
+from sub_platforms.sql_server.videx.videx_table_store import SharedTableStore, SharedTable, \
+    MissingTableDigestException, TABLE_REFS_KEY, task_table_digests, strip_known_tables
 from sub_platforms.sql_server.videx.model.videx_strategy import VidexModelBase
 from sub_platforms.sql_server.videx.model.videx_model_innodb import VidexModelInnoDB
 from sub_platforms.sql_server.videx.videx_utils import GT_Table_Return, get_local_ip, get_func_with_parent
 
+if TYPE_CHECKING:
+    from requests import Response
+
 app = Flask(__name__)
 ENV_KEY_POST_VIDEX_META = 'POST_VIDEX_META'
+# request header of /ask_videx to return the time of each phase in the Server-Timing header
+TIMING_HEADER = 'X-Videx-Timing'
 
 # Create API object
 api = Api(
@@ -66,7 +79,12 @@ task_meta_model = api.model('TaskMeta', {
     'task_id': NullableString(required=True, description='Task ID'),
     'meta_dict': fields.Raw(required=True, description='Meta Dictionary'),
     'stats_dict': fields.Raw(required=True, description='Stats Dictionary'),
-    'db_config': fields.Raw(required=True, description='DB Config')
+    'db_config': fields.Raw(required=True, description='DB Config'),
+    TABLE_REFS_KEY: fields.Raw(required=False, description='{db: {table: digest}} of tables the server already has')
+})
+
+check_table_digests_model = api.model('CheckTableDigests', {
+    'digests': fields.List(fields.String, required=True, description='table digests')
 })
 
 ask_videx_model = api.model('AskVidex', {
@@ -81,6 +99,15 @@ ask_videx_model = api.model('AskVidex', {
     'data': fields.List(fields.Raw, required=True, description='List of data items')
 })
 
+profile_model = api.model('Profile', {
+    'n_requests': fields.Integer(required=False, description='stop after profiling this number of requests'),
+    'seconds': fields.Float(required=False, description='stop after this number of seconds'),
+    'sample_every': fields.Integer(required=False, description='profile one of every N requests, default 1'),
+    'output_file': fields.String(required=False, description='dump the profile (pstats) to this file of the '
+                                                              'profile directory of the server at the end'),
+    'stop': fields.Boolean(required=False, description='stop the current session'),
+})
+
 clear_cache_model = api.model('ClearCache', {
     'key_list': fields.List(fields.String, required=False, description='List of keys to clear')
 })
@@ -124,6 +151,9 @@ class VidexTaskCache:
     """
     model_cache_dict: Optional[Dict[str, Dict[str, Optional[VidexModelBase]]]] = field(default_factory=dict)
 
+    # (db, table) -> SharedTable referred by db_tasks_stats, keeps the entries of SharedTableStore alive
+    shared_tables: Dict[Tuple[str, str], SharedTable] = field(default_factory=dict)
+
     def __post_init__(self):
         self.model_cache_dict = {k.lower(): {k1.lower(): v1 for k1, v1 in v.items()} for k, v in
                                  self.model_cache_dict.items()}
@@ -163,6 +193,7 @@ class VidexSingleton:
                  load_meta_by_task_id_func: Callable[[str], VidexDBTaskStats] = None,
                  VidexModelClass: Type[VidexModelBase] = VidexModelInnoDB,
                  logging_package=videx_logging,
+                 hist_compact_epsilon: float = None,
                  **model_kwargs,
                  ):
         self.lock = threading.RLock()
@@ -171,11 +202,22 @@ class VidexSingleton:
         self.cache: TTLCache[str, VidexTaskCache] = TTLCache(maxsize=1000, ttl=300)
         # non task cache is regarded as long-term cache, item is evicted only if exceeding cache size.
         self.non_task_cache: VidexTaskCache = VidexTaskCache(db_tasks_stats=None)
+        # identical tables of different tasks are shared
+        self.table_store = SharedTableStore()
         # load meta by task_id
         self.load_meta_by_task_id_func = load_meta_by_task_id_func
         self.VidexModelClass = VidexModelClass
         self.request_count = 0
         self.model_kwargs = model_kwargs
+        # if set, histograms of incoming tasks are compacted with this max cum_freq error, see compact_histogram
+        self.hist_compact_epsilon = hist_compact_epsilon
+        self.hist_compaction = HistogramCompaction()
+        # if set, /ask_videx requests are appended to it, see videx_replay
+        self.capture: Optional[RequestCapture] = None
+        # profiles sampled /ask_videx requests when started by /admin/profile
+        self.profiler = RequestProfiler()
+        # if True, /ask_videx always returns the Server-Timing header, otherwise only if X-Videx-Timing is set
+        self.timing_header = False
         self.logging_package = logging_package
         self.logging_package.initial_config()
 
@@ -188,8 +230,13 @@ class VidexSingleton:
         else:
             return task_id
 
-    def ask(self, req_json_item: dict, result2str: bool = True, raise_out: bool = False) \
-            -> Tuple[int, str, dict]:
+    def ask(self, req_json_item: dict, result2str: bool = True, raise_out: bool = False,
+            timer: Optional[PhaseTimer] = None) -> Tuple[int, str, dict]:
+        """
+        Args:
+            timer: if given, the time of each phase (see videx_profiler) is recorded in it. The serialization
+                phase is recorded by the caller, around its own serialization of the response.
+        """
         if req_json_item.get('properties') is None or not isinstance(req_json_item['properties'], dict):
             return 502, f"miss 'properties' or properties is not dict", {}
         properties = req_json_item['properties']
@@ -228,8 +275,13 @@ class VidexSingleton:
             if db_task_stats is None:
                 logging.error(f"=== loading task_meta failed by using func {func_name}. {task_id=} {req_json_item=}")
                 return 502, f"load task_meta using func={func_name}, ", {}
+            # as uploads, identical tables of loaded tasks are shared, keyed by their content before compaction
+            digests = task_table_digests(json.loads(db_task_stats.to_json()))
+            if self.hist_compact_epsilon:
+                self._report_compaction(task_id, db_task_stats.compact_histograms(self.hist_compact_epsilon))
+            shared_tables = self.table_store.share(db_task_stats, digests)
 
-            task_cache = VidexTaskCache(db_task_stats)
+            task_cache = VidexTaskCache(db_task_stats, shared_tables=shared_tables)
             before_keys = list(self.cache.keys())
             self.cache[task_id] = task_cache
             now_keys = list(self.cache.keys())
@@ -244,10 +296,14 @@ class VidexSingleton:
                         f"videx_db={videx_db}, we have: {list(self.cache.keys())}", {}
 
         success_code, success_msg = 200, "OK"
+        if timer is not None:
+            timer.lap(PHASE_TASK_LOOKUP)
 
         # If an expect request already exists, return immediately.
         # The new version has removed the use of `use_gt`. Control the usage of gt by passing {req_json_item: expect_resp}.
         expect_resp = db_task_stats.get_expect_response(req_json_item, result2str)
+        if timer is not None:
+            timer.lap(PHASE_EXPECT_RESPONSE)
         if expect_resp is not None:
             return success_code, success_msg, expect_resp
 
@@ -259,6 +315,8 @@ class VidexSingleton:
 
         # TODO  For ease of debugging, directly construct the InnoDB model.
         table_model = self.get_videx_table_stats(task_cache, videx_db, table_name)
+        if timer is not None:
+            timer.lap(PHASE_MODEL_BUILD)
         resp = {}
         single_resp = lambda v: {"value": v}
         # #########################################################
@@ -286,6 +344,8 @@ class VidexSingleton:
             final_resp = {k: str(v) for k, v in resp.items()}
         else:
             final_resp = resp
+        if timer is not None:
+            timer.lap(PHASE_ESTIMATE)
         return success_code, success_msg, final_resp
 
     def get_videx_table_stats(self, task_cache: VidexTaskCache, db_name: str, table_name: str) -> VidexModelBase:
@@ -331,8 +391,10 @@ class VidexSingleton:
                                        gt_req_resp_file: Union[str, dict] = None,
                                        raise_error: bool = False,
                                        server_ip_port: str = None,
+                                       meta_bundle_file: str = None,
+                                       tables: List[str] = None,
                                        **kwargs
-                                       ) -> Union[bool, Response]:
+                                       ) -> Union[bool, 'Response']:
         """
         Add task metadata from a local file.
         Args:
@@ -349,6 +411,9 @@ class VidexSingleton:
             gt_rec_in_ranges_file:
             gt_req_resp_file:
             raise_error:
+            meta_bundle_file: arrow metadata bundle, replaces stats, hist and ndv files if given.
+                With server_ip_port, the bundle is posted as is rather than as json.
+            tables: only load these tables from meta_bundle_file, None for all
 
         Returns:
             bool: true if added successfully
@@ -364,12 +429,17 @@ class VidexSingleton:
                                                              gt_rec_in_ranges_file=gt_rec_in_ranges_file,
                                                              gt_req_resp_file=gt_req_resp_file,
                                                              raise_error=raise_error,
+                                                             meta_bundle_file=meta_bundle_file,
+                                                             tables=tables,
                                                              )
         if not server_ip_port:
             self.add_task_meta(req_obj.to_dict())
             return True
+        elif meta_bundle_file is not None:
+            return post_add_videx_meta_bundle(meta_bundle_file, server_ip_port, task_id=task_id, videx_db=videx_db,
+                                              tables=tables)
         else:
-            return post_add_videx_meta(req_obj, server_ip_port, use_gzip=True)
+            return post_add_videx_meta_dedup(req_obj, server_ip_port, use_gzip=True)
 
     def add_task_meta(self, req_dict: dict):
         """
@@ -380,11 +450,33 @@ class VidexSingleton:
             "meta_dict": {},
         }
 
-        Returns:
+        Tables given by digest in req_dict[TABLE_REFS_KEY] are referred from the shared store.
 
+        Raises:
+            MissingTableDigestException: a referred table is not in the store
         """
-        videx_request: VidexDBTaskStats = VidexDBTaskStats.from_dict(req_dict)
-
+        # tables are keyed by the upload as received, which is what clients digest (post_add_videx_meta_dedup)
+        digests = task_table_digests(req_dict)
+        if self.hist_compact_epsilon:
+            self._report_compaction(req_dict.get('task_id'),
+                                    compact_task_histograms(req_dict, self.hist_compact_epsilon))
+        videx_request, shared_tables = self.table_store.ingest(req_dict, digests)
+        self._cache_task_stats(videx_request, shared_tables)
+
+    def add_task_stats(self, task_stats: VidexDBTaskStats):
+        """
+        add an already parsed task, e.g. read from a metadata bundle, without a round trip through json.
+        Identical tables are shared as in add_task_meta.
+        """
+        # keyed by the content before compaction, as uploads; share() computes them if nothing is compacted
+        digests = None
+        if self.hist_compact_epsilon:
+            digests = task_table_digests(json.loads(task_stats.to_json()))
+            self._report_compaction(task_stats.task_id, task_stats.compact_histograms(self.hist_compact_epsilon))
+        shared_tables = self.table_store.share(task_stats, digests)
+        self._cache_task_stats(task_stats, shared_tables)
+
+    def _cache_task_stats(self, videx_request: VidexDBTaskStats, shared_tables: dict):
         db_tables = {db: {tb for tb in v} for db, v in videx_request.stats_dict.items()}
 
         if videx_request.key_is_none():
@@ -393,6 +485,7 @@ class VidexSingleton:
                 before_meta_keys = self.non_task_cache.db_tasks_stats.get_meta_info_keys()
 
             self.non_task_cache.add_db_tasks_stats(videx_request)
+            self.non_task_cache.shared_tables.update(shared_tables)
 
             after_meta_keys = self.non_task_cache.db_tasks_stats.get_meta_info_keys()
             logging.info(f"=== load NON-TASK-ID task_meta. "
@@ -400,12 +493,17 @@ class VidexSingleton:
             return
 
         before_keys = list(self.cache.keys())
-        self.cache[videx_request.key] = VidexTaskCache(videx_request)
+        self.cache[videx_request.key] = VidexTaskCache(videx_request, shared_tables=shared_tables)
         now_keys = list(self.cache.keys())
         # 只有这里可能要加锁
         logging.info(f"=== load task_meta for key={videx_request.key} db:tables={db_tables} {before_keys=} {now_keys=}")
 
 
+    def _report_compaction(self, task_id: str, compaction: HistogramCompaction):
+        with self.lock:
+            self.hist_compaction.merge(compaction)
+        logging.info(f"compact histograms of task {task_id} with epsilon={self.hist_compact_epsilon}: {compaction}")
+
     def clear_cache(self, req_dict):
         key_list = req_dict.get('key_list', [])
         before_keys = list(self.cache.keys())
@@ -446,8 +544,61 @@ class CreateTaskMeta(Resource):
     def post(self):
         req_json_item = api.payload
         global videx_meta_singleton
-        videx_meta_singleton.add_task_meta(req_json_item)
-    
+        try:
+            videx_meta_singleton.add_task_meta(req_json_item)
+        except MissingTableDigestException as e:
+            return jsonify(code=409, message=str(e), data={'missing': e.missing})
+
+        code, message, response_data = 200, "OK", {}
+        return jsonify(code=code, message=message, data=response_data)
+
+
+@ns.route('/check_table_digests')
+class CheckTableDigests(Resource):
+    @ns.doc('Check which table digests are not in the shared table store')
+    @ns.expect(check_table_digests_model)
+    @ns.response(200, 'Success', response_model)
+    def post(self):
+        global videx_meta_singleton
+        missing = videx_meta_singleton.table_store.missing(api.payload['digests'])
+        code, message, response_data = 200, "OK", {'missing': missing}
+        return jsonify(code=code, message=message, data=response_data)
+
+
+@ns.route('/create_task_meta_bundle')
+class CreateTaskMetaBundle(Resource):
+    @ns.doc('Create Task Meta from an arrow metadata bundle',
+            params={'bundle': 'bundle file (multipart)', 'sidecar': 'sidecar json file (multipart)',
+                    'videx_db': 'videx db', 'task_id': 'task id, empty for non-task meta',
+                    'tables': 'comma separated tables to load, empty for all',
+                    'sample_file_info': 'json of SampleFileInfo'})
+    @ns.response(200, 'Success', response_model)
+    @ns.response(400, 'Validation Error')
+    def post(self):
+        if 'bundle' not in request.files or 'sidecar' not in request.files or not request.form.get('videx_db'):
+            return jsonify(code=400, message="required files: bundle, sidecar and form: videx_db", data={})
+        tables = request.form.get('tables')
+        sample_file_info = request.form.get('sample_file_info')
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                bundle_file = os.path.join(tmp_dir, 'meta.arrow')
+                request.files['bundle'].save(bundle_file)
+                request.files['sidecar'].save(meta_bundle_sidecar_path(bundle_file))
+                req_obj = construct_videx_task_meta_from_local_files(
+                    task_id=request.form.get('task_id') or None,
+                    videx_db=request.form['videx_db'],
+                    stats_file=None, hist_file=None, ndv_single_file=None,
+                    raise_error=True,
+                    sample_file_info=json.loads(sample_file_info) if sample_file_info else None,
+                    meta_bundle_file=bundle_file,
+                    tables=tables.split(',') if tables else None,
+                )
+        except Exception as e:
+            logging.error(f"invalid task meta bundle: {e}, {traceback.format_exc()}")
+            return jsonify(code=400, message=f"invalid task meta bundle: {e}", data={})
+        global videx_meta_singleton
+        videx_meta_singleton.add_task_stats(req_obj)
+
         code, message, response_data = 200, "OK", {}
         return jsonify(code=code, message=message, data=response_data)
 
@@ -520,15 +671,63 @@ class AskVidex(Resource):
         videx_meta_singleton.request_count += 1
         logging.info(f"[{req_idx}] ==== receive data, {json.dumps(req_json_item)}")
 
+        timer = None
+        if videx_meta_singleton.timing_header or request.headers.get(TIMING_HEADER):
+            timer = PhaseTimer()
         st = time.perf_counter()
-        code, message, response_data = videx_meta_singleton.ask(req_json_item)
+        profile = videx_meta_singleton.profiler.begin()
+        try:
+            code, message, response_data = videx_meta_singleton.ask(req_json_item, timer=timer)
+        finally:
+            videx_meta_singleton.profiler.end(profile)
         elapsed_time = time.perf_counter() - st
-        
+        if videx_meta_singleton.capture is not None:
+            videx_meta_singleton.capture.record(req_json_item, task_id, code, response_data, elapsed_time)
+
         if code == 200:
             logging.info(f"[{req_idx}] == [{code=}] use {elapsed_time:.2f}s response data: {json.dumps(response_data)}")
         else:
             logging.error(f"[{req_idx}] == [{code=}] use {elapsed_time:.2f}s {message=} "
                           f"response data: ={json.dumps(response_data)}")
+        if timer is not None:
+            # capture and logging are not a phase of the request
+            timer.skip()
+        resp = jsonify(code=code, message=message, data=response_data)
+        if timer is not None:
+            timer.lap(PHASE_SERIALIZATION)
+            logging.info(f"[{req_idx}] == phases: {timer}")
+            resp.headers['Server-Timing'] = timer.to_server_timing()
+        return resp
+
+
+@ns.route('/admin/profile')
+class AdminProfile(Resource):
+    @ns.doc('Start profiling the next requests, or stop the current session')
+    @ns.expect(profile_model)
+    @ns.response(200, 'Success', response_model)
+    def post(self):
+        req = api.payload or {}
+        global videx_meta_singleton
+        if req.get('stop'):
+            videx_meta_singleton.profiler.stop()
+        else:
+            try:
+                videx_meta_singleton.profiler.start(n_requests=req.get('n_requests'), seconds=req.get('seconds'),
+                                                    sample_every=req.get('sample_every') or 1,
+                                                    output_file=req.get('output_file'))
+            except ValueError as e:
+                return jsonify(code=400, message=str(e), data={})
+        code, message, response_data = 200, "OK", videx_meta_singleton.profiler.report(top=0)
+        return jsonify(code=code, message=message, data=response_data)
+
+    @ns.doc('Profile of the current or the last session',
+            params={'top': 'number of functions', 'sort': 'cumulative or tottime'})
+    @ns.response(200, 'Success', response_model)
+    def get(self):
+        global videx_meta_singleton
+        report = videx_meta_singleton.profiler.report(top=int(request.args.get('top', 30)),
+                                                      sort=request.args.get('sort', 'cumulative'))
+        code, message, response_data = 200, "OK", report
         return jsonify(code=code, message=message, data=response_data)
 
 
@@ -551,11 +750,48 @@ class Status(Resource):
     @ns.response(200, 'Success', response_model)
     def get(self):
         # 返回 videx_meta_singleton 当前的缓存大小。
-        code, message, response_data = 200, "OK", {'cache': dict(videx_meta_singleton.cache)}
+        code, message, response_data = 200, "OK", {'cache': dict(videx_meta_singleton.cache),
+                                                   'table_store': videx_meta_singleton.table_store.stats(),
+                                                   'hist_compaction': videx_meta_singleton.hist_compaction.to_dict()}
         return jsonify(code=code, message=message, data=response_data)
 
 
+def _post_json(url: str, req_dict: dict, use_gzip: bool) -> 'Response':
+    import requests
+
+    json_data = json.dumps(req_dict).encode('utf-8')
+    if use_gzip:
+        json_data = gzip.compress(json_data)
+        headers = {'Content-Encoding': 'gzip', 'Content-Type': 'application/json'}
+    else:
+        headers = {'Content-Type': 'application/json'}
+    return requests.post(url, data=json_data, headers=headers)
+
+
+def post_add_videx_meta_dedup(req: VidexDBTaskStats, videx_server_ip_port: str, use_gzip: bool) -> 'Response':
+    """
+    post videx metadata, tables that the server already has (same content digest) are sent as digests only.
+    Falls back to the full upload if the server drops some of them in between.
+    """
+    req_dict = json.loads(req.to_json())
+    digests = task_table_digests(req_dict)
+    all_digests = [d for tables in digests.values() for d in tables.values()]
+    resp = _post_json(f'http://{videx_server_ip_port}/check_table_digests', {'digests': all_digests}, False)
+    missing = set(resp.json()['data']['missing'])
+    known = {db: {t: d for t, d in tables.items() if d not in missing} for db, tables in digests.items()}
+    logging.info(f"post videx metadata to {videx_server_ip_port}, "
+                 f"{len(all_digests) - len(missing)}/{len(all_digests)} tables sent as digest")
+    resp = _post_json(f'http://{videx_server_ip_port}/create_task_meta', strip_known_tables(req_dict, known),
+                      use_gzip)
+    if resp.json().get('code') == 409:
+        logging.warning(f"tables are dropped by {videx_server_ip_port}, post in full")
+        resp = _post_json(f'http://{videx_server_ip_port}/create_task_meta', req_dict, use_gzip)
+    return resp
+
+
 def post_add_videx_meta(req: VidexDBTaskStats, videx_server_ip_port: str, use_gzip: bool):
+    import requests
+
     # 1. 将 src_meta 导入videx-py
     json_data = req.to_json().encode('utf-8')
     if use_gzip:
@@ -569,10 +805,24 @@ def post_add_videx_meta(req: VidexDBTaskStats, videx_server_ip_port: str, use_gz
     return requests.post(f'http://{videx_server_ip_port}/create_task_meta', data=json_data, headers=headers)
 
 
+def post_add_videx_meta_bundle(meta_bundle_file: str, videx_server_ip_port: str, videx_db: str,
+                               task_id: str = None, tables: List[str] = None):
+    import requests
+
+    # upload the bundle and its sidecar as is, the server loads the (selected) tables from them
+
+    data = {'videx_db': videx_db, 'task_id': task_id or '', 'tables': ','.join(tables or [])}
+    logging.info(f"post videx metadata bundle {meta_bundle_file} to {videx_server_ip_port}")
+    with open(meta_bundle_file, 'rb') as bundle, open(meta_bundle_sidecar_path(meta_bundle_file), 'rb') as sidecar:
+        return requests.post(f'http://{videx_server_ip_port}/create_task_meta_bundle', data=data,
+                             files={'bundle': bundle, 'sidecar': sidecar})
+
+
 def create_videx_env_multi_db(videx_env: Env,
                               meta_dict: dict,
                               new_engine: str = 'VIDEX',
-                              ):
+                              sync: bool = False,
+                              ) -> Optional[Dict[str, Dict[str, List[str]]]]:
     """
     Specify a target database (`target_db`), retrieve metadata, and create it on the `videx_db` within the `videx_env`.
 
@@ -587,9 +837,15 @@ def create_videx_env_multi_db(videx_env: Env,
             Element is a tuple of three: request json, response json, turn_on (whether to enable).
             If a request matches an enabled element, it returns directly.
         new_engine: Name of the engine to be created.
+        sync: If True, keep the existing databases and only apply the DDL of tables and indexes that differ
+            (see videx_ddl_sync), otherwise drop and create the databases again.
     Returns:
-
+        if sync, target_db -> {'created', 'dropped', 'recreated', 'altered', 'unchanged'}: table names
     """
+    if sync:
+        return {target_db: sync_videx_db(videx_env, target_db, table_dict, new_engine)
+                for target_db, table_dict in meta_dict.items()}
+
     # Create a test database named after `target_db` in videx-db and save the table schema.
     for target_db, table_dict in meta_dict.items():
         videx_env.execute(f"DROP DATABASE IF EXISTS `{target_db}`")
@@ -601,20 +857,14 @@ def create_videx_env_multi_db(videx_env: Env,
         videx_default_db = videx_env.default_db
         try:
             videx_env.set_default_db(target_db)
-            for table in table_dict.values():
-                create_table_ddl = re.sub(r"ENGINE=\w+", "ENGINE={}".format(new_engine), table.ddl)
-                # remove secondary index
-                match = re.search(r'SECONDARY_ENGINE=(\w+)', create_table_ddl)
-                if match:
-                    value = match.group(1)
-                    logging.warning(f"find SECONDARY_ENGINE={value}, remove it from CREATE TABLE DDL")
-                    create_table_ddl = re.sub(r'SECONDARY_ENGINE=\w+', '', create_table_ddl)
-                videx_env.execute(create_table_ddl)
+            execute_in_batches(videx_env, [videx_create_table_ddl(table.ddl, new_engine)
+                                           for table in table_dict.values()])
         finally:
             videx_env.set_default_db(videx_default_db)
+    return None
 
 
-def post_to_clear_videx_server_cache(videx_server: str, task_ids: List[str]) -> Response:
+def post_to_clear_videx_server_cache(videx_server: str, task_ids: List[str]) -> 'Response':
     """Send a request to the specified server to clear the specified task IDs.
 
     Args:
@@ -624,6 +874,8 @@ def post_to_clear_videx_server_cache(videx_server: str, task_ids: List[str]) ->
     Returns:
         _type_: _description_
     """
+    import requests
+
     resp = requests.post(f'http://{videx_server}/clear_cache',
                          data=json.dumps({"key_list": task_ids}).encode('utf-8'),
                          headers={'Content-Type': 'application/json'})
@@ -636,9 +888,16 @@ def startup_videx_server(
         load_meta_by_task_id_func: Callable[[str], VidexDBTaskStats] = None,
         start_ip="0.0.0.0", debug=False,
         logging_package=videx_logging,
+        capture_file: str = None,
+        timing_header: bool = False,
+        profile_dir: str = None,
         **model_kwargs,
 ):
     """
+    If capture_file is set, requests to /ask_videx are appended to it, and can be replayed by videx_replay.
+    If timing_header is set, /ask_videx returns the time of each phase in the Server-Timing header.
+    If profile_dir is set, /admin/profile can dump profiles into it, otherwise its output_file is rejected.
+
     curl --location --request POST 'http://127.0.0.1:5001/ask_videx' \
     --header 'Content-Type: application/json' \
     --data-raw '{
@@ -678,6 +937,13 @@ def startup_videx_server(
         logging_package=logging_package,
         **model_kwargs,
     )
+    videx_meta_singleton.timing_header = timing_header
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        videx_meta_singleton.profiler.output_dir = profile_dir
+    if capture_file:
+        videx_meta_singleton.capture = RequestCapture(capture_file)
+        logging.info(f"capture requests to {capture_file}")
 
     # Start the service.
     logging.info(f"\n{'- ' * 30}\n"
@@ -688,5 +954,9 @@ def startup_videx_server(
                  f"{'- ' * 30}\n"
                  )
 
-    app.run(debug=debug, threaded=True, host=start_ip, port=port, use_reloader=False)
+    try:
+        app.run(debug=debug, threaded=True, host=start_ip, port=port, use_reloader=False)
+    finally:
+        if videx_meta_singleton.capture is not None:
+            videx_meta_singleton.capture.close()
 
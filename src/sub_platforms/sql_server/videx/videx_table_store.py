@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Content-addressed store of table statistics shared by tasks.
+
+Tasks targeting the same database snapshot upload identical tables. Each table (its `Table` meta and
+`TableStatisticsInfo`, including the parsed histograms) is keyed by the digest of its content, and tasks
+reference the shared objects instead of holding their own copies. Shared objects are immutable by contract.
+"""
+import copy
+import hashlib
+import json
+import threading
+import weakref
+from typing import Dict, List, Tuple
+
+from sub_platforms.sql_server.column_statastics.statistics_info import TableStatisticsInfo
+from sub_platforms.sql_server.meta import Table
+from sub_platforms.sql_server.videx.videx_metadata import VidexDBTaskStats
+
+# key of the upload: {db: {table: digest}} of tables omitted from meta_dict and stats_dict
+TABLE_REFS_KEY = 'table_refs'
+
+
+class MissingTableDigestException(Exception):
+    def __init__(self, message, missing: List[str]):
+        self.message = message
+        self.missing = missing
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"Missing table digest Exception: {self.message}, missing: {self.missing}"
+
+
+def table_digest(table_meta: dict, table_stats: dict) -> str:
+    """digest of the json dict of a table, i.e. meta_dict[db][table] and stats_dict[db][table] of the upload"""
+    content = json.dumps({'meta': table_meta, 'stats': table_stats}, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def task_table_digests(req_dict: dict) -> Dict[str, Dict[str, str]]:
+    """
+    digests of the tables of an upload (the json dict of VidexDBTaskStats)
+
+    Returns:
+        {db: {table: digest}}, lower db and table, only tables having both meta and stats
+    """
+    meta_dict = {db.lower(): {t.lower(): v for t, v in tables.items()} for db, tables in req_dict['meta_dict'].items()}
+    res = {}
+    for db, tables in req_dict['stats_dict'].items():
+        for table, stats in tables.items():
+            meta = meta_dict.get(db.lower(), {}).get(table.lower())
+            if meta is not None:
+                res.setdefault(db.lower(), {})[table.lower()] = table_digest(meta, stats)
+    return res
+
+
+class SharedTable:
+    """the shared (immutable) objects of one table"""
+
+    def __init__(self, digest: str, table: Table, stats: TableStatisticsInfo):
+        self.digest = digest
+        self.table = table
+        self.stats = stats
+
+
+class SharedTableStore:
+    """
+    digest -> SharedTable. A task holds the SharedTable of its tables (see VidexTaskCache.shared_tables),
+    so an entry is referenced by all tasks using it and released once none of them is cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables: 'weakref.WeakValueDictionary[str, SharedTable]' = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._tables)
+
+    def __contains__(self, digest: str):
+        return digest in self._tables
+
+    def missing(self, digests: List[str]) -> List[str]:
+        """digests that the store does not have"""
+        with self._lock:
+            return [d for d in digests if d not in self._tables]
+
+    def stats(self) -> dict:
+        return {'tables': len(self._tables), 'hits': self.hits, 'misses': self.misses}
+
+    def ingest(self, req_dict: dict, digests: Dict[str, Dict[str, str]] = None) \
+            -> Tuple[VidexDBTaskStats, Dict[Tuple[str, str], SharedTable]]:
+        """
+        parse an upload. Tables already in the store are not parsed but referenced, so are tables given by digest
+        only (req_dict[TABLE_REFS_KEY]). Other tables are parsed and added to the store.
+
+        Args:
+            digests: task_table_digests of the upload as received, if req_dict has been modified since,
+                e.g. by compact_task_histograms. Computed from req_dict if None.
+
+        Returns:
+            VidexDBTaskStats referring the shared objects, and (db, table) -> SharedTable used by it
+
+        Raises:
+            MissingTableDigestException: a referred digest is not in the store, the upload should be sent in full
+        """
+        if digests is None:
+            digests = task_table_digests(req_dict)
+        refs = {db.lower(): {t.lower(): d for t, d in tables.items()}
+                for db, tables in (req_dict.get(TABLE_REFS_KEY) or {}).items()}
+
+        shared: Dict[Tuple[str, str], SharedTable] = {}
+        with self._lock:
+            missing = [d for tables in refs.values() for d in tables.values() if d not in self._tables]
+            if missing:
+                raise MissingTableDigestException("referred tables are not in the store", missing)
+            for db, tables in list(digests.items()) + list(refs.items()):
+                for table, digest in tables.items():
+                    if (entry := self._tables.get(digest)) is not None:
+                        shared[(db, table)] = entry
+                        self.hits += 1
+
+            # parse only the new tables
+            to_parse = {k: v for k, v in req_dict.items() if k != TABLE_REFS_KEY}
+            for key in ['meta_dict', 'stats_dict']:
+                to_parse[key] = {db: {t: v for t, v in tables.items() if (db.lower(), t.lower()) not in shared}
+                                 for db, tables in req_dict[key].items()}
+            videx_request: VidexDBTaskStats = VidexDBTaskStats.from_dict(to_parse)
+
+            for db, tables in digests.items():
+                for table, digest in tables.items():
+                    if (db, table) in shared:
+                        continue
+                    entry = SharedTable(digest, videx_request.meta_dict[db][table], videx_request.stats_dict[db][table])
+                    self._tables[digest] = entry
+                    shared[(db, table)] = entry
+                    self.misses += 1
+
+        for (db, table), entry in shared.items():
+            videx_request.meta_dict.setdefault(db, {})[table] = entry.table
+            videx_request.stats_dict.setdefault(db, {})[table] = entry.stats
+        return videx_request, shared
+
+    def share(self, task_stats: VidexDBTaskStats, digests: Dict[str, Dict[str, str]] = None) \
+            -> Dict[Tuple[str, str], SharedTable]:
+        """
+        share the tables of a parsed task, e.g. loaded by load_meta_by_task_id_func. Tables already in the store
+        replace the ones of task_stats in place, the others are added to the store.
+
+        Args:
+            digests: task_table_digests of the task as loaded, if task_stats has been modified since.
+                Computed from task_stats if None.
+
+        Returns:
+            (db, table) -> SharedTable used by task_stats
+        """
+        if digests is None:
+            # digests of the json as posted by the clients, e.g. post_add_videx_meta_dedup
+            digests = task_table_digests(json.loads(task_stats.to_json()))
+        shared: Dict[Tuple[str, str], SharedTable] = {}
+        with self._lock:
+            for db, tables in digests.items():
+                for table, digest in tables.items():
+                    entry = self._tables.get(digest)
+                    if entry is None:
+                        entry = SharedTable(digest, task_stats.meta_dict[db][table], task_stats.stats_dict[db][table])
+                        self._tables[digest] = entry
+                        self.misses += 1
+                    else:
+                        self.hits += 1
+                    shared[(db, table)] = entry
+        for (db, table), entry in shared.items():
+            task_stats.meta_dict[db][table] = entry.table
+            task_stats.stats_dict[db][table] = entry.stats
+        return shared
+
+
+def strip_known_tables(req_dict: dict, known_digests: Dict[str, Dict[str, str]]) -> dict:
+    """
+    replace tables whose digest the server already has with digest references
+
+    Args:
+        req_dict: the json dict of VidexDBTaskStats
+        known_digests: {db: {table: digest}} the server has
+
+    Returns:
+        a new upload, req_dict is not modified
+    """
+    res = {k: v for k, v in req_dict.items() if k not in ['meta_dict', 'stats_dict']}
+    res[TABLE_REFS_KEY] = copy.deepcopy(known_digests)
+    for key in ['meta_dict', 'stats_dict']:
+        res[key] = {db: {t: v for t, v in tables.items() if t.lower() not in known_digests.get(db.lower(), {})}
+                    for db, tables in req_dict[key].items()}
+    return res
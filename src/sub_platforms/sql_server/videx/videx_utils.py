@@ -13,15 +13,17 @@ from collections import defaultdict
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import List, Dict, Union, Tuple, Set, Optional
+from typing import List, Dict, Union, Tuple, Set, Optional, TYPE_CHECKING
 
 import msgpack
 import numpy as np
-import pandas as pd
 
 from sub_platforms.sql_server.env.rds_env import Env, OpenMySQLEnv
 from sub_platforms.sql_server.meta import TableId, Index, IndexColumn
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 # VIDEX obtains four statistical information through fetch_all_meta_for_videx.
 # All four functions will directly access the original database.
 # Especially, ndv and histogram impose a heavy load on the original database.
@@ -941,6 +943,8 @@ def is_datetime_like(series):
     Note: for data like pd.Series([date(2023, 1, 1), date(2023, 1, 2)]), its dtype is object,
     so we need to check the first non-empty value to determine whether it is a datetime like.
     """
+    import pandas as pd
+
     if pd.api.types.is_datetime64_any_dtype(series) or pd.api.types.is_period_dtype(series):
         return True
 
@@ -954,7 +958,7 @@ def is_datetime_like(series):
     return False
 
 
-def safe_tolist(series: pd.Series) -> list:
+def safe_tolist(series: 'pd.Series') -> list:
     """
     Safely convert a pandas Series to a Python list, with optimized performance.
 
@@ -972,6 +976,8 @@ def safe_tolist(series: pd.Series) -> list:
         >>> safe_tolist(series)
         [datetime.datetime(2000, 1, 1, 0, 0), 1, 'string']
     """
+    import pandas as pd
+
     # Fast path for safe types
     if not is_datetime_like(series):
         return series.values.tolist()
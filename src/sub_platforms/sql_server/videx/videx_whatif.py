@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+What-if EXPLAIN of index configurations on VIDEX-MySQL, with a client-side cache.
+
+Index advisors create an index, EXPLAIN a query and drop the index, and often evaluate the same configuration
+again. WhatIfExplainer keeps the index set each table should have, and only when an EXPLAIN is not cached it
+applies the pending index changes of the tables of the query and runs EXPLAIN FORMAT=JSON. A plan is cached by:
+- the fingerprint of the SQL: parsed by sqlglot and printed back without comments, so formatting does not matter;
+- the visible indexes of each table of the query, by definition: a configuration re-created with other index
+  names hits the cache, and index names in the cached plan are renamed to the current ones;
+- the stats version of the task, e.g. task_stats_version(task) of the VidexDBTaskStats loaded to the server.
+
+    explainer = WhatIfExplainer(videx_env, stats_version=task_stats_version(task))
+    explainer.add_index(simple_index(db, 'orders', 'idx_tmp_1', ['o_custkey', 'o_orderdate']))
+    res = explainer.explain(sql)  # {'plan': {...}, 'cost': 1234.5, 'cached': False}
+    explainer.reset()             # back to the indexes of the tables, no DDL until the next uncached EXPLAIN
+    explainer.close()             # drops the indexes left on VIDEX-MySQL
+"""
+import copy
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+
+from sub_platforms.sql_server.env.rds_env import Env
+from sub_platforms.sql_server.meta import Index, IndexColumn, IndexType
+from sub_platforms.sql_server.videx.videx_ddl_sync import index_definition, index_signature
+
+DEFAULT_WHATIF_CACHE_SIZE = 10000
+
+
+def task_stats_version(task) -> str:
+    """hash of the metadata and statistics of a VidexDBTaskStats, regardless of its task_id"""
+    return hashlib.md5(task.model_dump_json(exclude={'task_id'}).encode('utf-8')).hexdigest()
+
+
+def simple_index(db_name: str, table_name: str, name: str, columns: List[str], is_unique: bool = False) -> Index:
+    """a BTREE index on columns"""
+    index = Index(type=IndexType.UNIQUE if is_unique else IndexType.NORMAL, db_name=db_name, table_name=table_name,
+                  name=name, is_unique=is_unique, index_type='BTREE')
+    index.columns = [IndexColumn.simple_column(column, db_name, table_name) for column in columns]
+    return index
+
+
+def parse_sql(sql: str, default_db: str) -> Tuple[str, Optional[List[Tuple[str, str]]]]:
+    """
+    Returns:
+        fingerprint of the SQL, and the (db, table) it reads. Tables are None if sqlglot can not parse the SQL.
+    """
+    import sqlglot
+    from sqlglot import exp
+
+    try:
+        ast = sqlglot.parse_one(sql, read='mysql')
+    except sqlglot.errors.ParseError as e:
+        logging.warning(f"what-if: can not parse {sql=}: {e}")
+        ast = None
+    if ast is None or isinstance(ast, exp.Command):
+        return hashlib.sha1(' '.join(sql.split()).encode('utf-8')).hexdigest(), None
+
+    cte_names = {cte.alias.lower() for cte in ast.find_all(exp.CTE)}
+    tables = set()
+    for table in ast.find_all(exp.Table):
+        if not table.name or (not table.db and table.name.lower() in cte_names):
+            continue
+        tables.add((table.db or default_db, table.name))
+    normalized = ast.sql(dialect='mysql', comments=False)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest(), sorted(tables)
+
+
+def rename_plan_keys(plan, names: Dict[str, str], _pattern: re.Pattern = None):
+    """
+    copy of an EXPLAIN FORMAT=JSON plan, with the index names in `key` and `possible_keys` renamed.
+    The `key` of an index merge holds several names, e.g. "union(idx_a,intersect(idx_b,idx_c))",
+    each of them is renamed.
+    """
+    if not names:
+        return copy.deepcopy(plan)
+    if _pattern is None:
+        # longest first, and not a part of a longer name or a merge function name like `union(`
+        alternatives = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+        _pattern = re.compile(rf'(?<![\w$])({alternatives})(?![\w$(])')
+    if isinstance(plan, list):
+        return [rename_plan_keys(item, names, _pattern) for item in plan]
+    if not isinstance(plan, dict):
+        return plan
+    res = {}
+    for k, v in plan.items():
+        if k == 'key' and isinstance(v, str):
+            res[k] = names[v] if v in names else _pattern.sub(lambda m: names[m.group(1)], v)
+        elif k == 'possible_keys' and isinstance(v, list):
+            res[k] = [names.get(name, name) for name in v]
+        else:
+            res[k] = rename_plan_keys(v, names, _pattern)
+    return res
+
+
+class WhatIfExplainCache:
+    """LRU cache of what-if plans, can be shared by explainers of different threads"""
+
+    def __init__(self, max_entries: int = DEFAULT_WHATIF_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry: dict):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class _TableIndexes:
+    """indexes of a table: when it was loaded, on VIDEX-MySQL now, and wanted by the advisor"""
+
+    def __init__(self, db_name: str, table_name: str, indexes: List[Index]):
+        self.db_name = db_name
+        self.table_name = table_name
+        self.base: Dict[str, Index] = {index.name: index for index in indexes}
+        self.physical = dict(self.base)
+        self.desired = dict(self.base)
+
+    def visible(self) -> List[Tuple[Tuple, str]]:
+        """(signature, name) of the wanted visible indexes, sorted by signature"""
+        return sorted(((index_signature(index), name) for name, index in self.desired.items() if index.is_visible),
+                      key=lambda item: (repr(item[0]), item[1]))
+
+    def alter_clauses(self) -> List[str]:
+        clauses = []
+        for name, index in self.physical.items():
+            if name not in self.desired or index_signature(index) != index_signature(self.desired[name]):
+                clauses.append(f"DROP INDEX `{name}`" if name != 'PRIMARY' else "DROP PRIMARY KEY")
+        for name, index in self.desired.items():
+            if name not in self.physical or index_signature(index) != index_signature(self.physical[name]):
+                clauses.append(f"ADD {index_definition(index)}")
+        return clauses
+
+
+class WhatIfExplainer:
+    """
+    What-if EXPLAIN on one connection of VIDEX-MySQL, see the module doc. Not thread-safe, use an explainer per
+    thread and share the cache.
+    """
+
+    def __init__(self, videx_env: Env, stats_version: str = '', cache: WhatIfExplainCache = None,
+                 videx_py_ip_port: str = None, videx_options: dict = None):
+        """
+        Args:
+            videx_env: env of VIDEX-MySQL
+            stats_version: version of the statistics of the task, set it again when the statistics change
+            cache: shared cache, a new one if None
+            videx_py_ip_port: @VIDEX_SERVER of the connection
+            videx_options: @VIDEX_OPTIONS of the connection, e.g. {'task_id': ...}
+        """
+        self.env = videx_env
+        self.stats_version = stats_version
+        self.cache = cache if cache is not None else WhatIfExplainCache()
+        self.videx_py_ip_port = videx_py_ip_port
+        self.videx_options = videx_options
+        self.tables: Dict[Tuple[str, str], _TableIndexes] = {}
+        self.conn = None
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = self.env.mysql_util.get_connection()
+            with self.conn.cursor() as cursor:
+                if self.videx_py_ip_port is not None:
+                    cursor.execute(f"SET @VIDEX_SERVER='{self.videx_py_ip_port}';")
+                if self.videx_options is not None:
+                    cursor.execute(f"SET @VIDEX_OPTIONS='{json.dumps(self.videx_options)}';")
+        return self.conn
+
+    def _table(self, db_name: str, table_name: str) -> _TableIndexes:
+        key = (str(db_name).lower(), str(table_name).lower())
+        if key not in self.tables:
+            indexes = self.env.mysql_command.get_table_indexes(db_name, table_name)
+            self.tables[key] = _TableIndexes(db_name, table_name, indexes)
+        return self.tables[key]
+
+    def add_index(self, index: Index):
+        table = self._table(index.db_name, index.table_name)
+        if index.name in table.desired:
+            raise ValueError(f"index {index.name} already exists on {index.db_name}.{index.table_name}")
+        table.desired[index.name] = index
+
+    def drop_index(self, db_name: str, table_name: str, index_name: str):
+        table = self._table(db_name, table_name)
+        if index_name not in table.desired:
+            raise ValueError(f"index {index_name} does not exist on {db_name}.{table_name}")
+        del table.desired[index_name]
+
+    def reset(self):
+        """back to the indexes the tables had when they were loaded"""
+        for table in self.tables.values():
+            table.desired = dict(table.base)
+
+    def _apply(self, table: _TableIndexes):
+        clauses = table.alter_clauses()
+        if not clauses:
+            return
+        with self._connection().cursor() as cursor:
+            cursor.execute(f"ALTER TABLE `{table.db_name}`.`{table.table_name}` {', '.join(clauses)}")
+        table.physical = dict(table.desired)
+
+    def explain(self, sql: str) -> dict:
+        """
+        Args:
+            sql: the query, without EXPLAIN
+
+        Returns:
+            {'plan': EXPLAIN FORMAT=JSON as a dict, 'cost': query_cost or None, 'cached': whether from the cache}
+        """
+        fingerprint, table_names = parse_sql(sql, self.env.default_db)
+        if table_names is None:
+            # the tables are unknown, apply all pending changes and do not cache
+            for table in self.tables.values():
+                self._apply(table)
+            plan = self._explain(sql)
+            return {'plan': plan, 'cost': _query_cost(plan), 'cached': False}
+
+        tables = [self._table(db_name, table_name) for db_name, table_name in table_names]
+        configs = [((table.db_name.lower(), table.table_name.lower()), table.visible()) for table in tables]
+        key = (fingerprint, self.stats_version,
+               tuple((table_key, tuple(sig for sig, _ in visible)) for table_key, visible in configs))
+        names = [[name for _, name in visible] for _, visible in configs]
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            renames = _index_renames(entry['names'], names)
+            if renames is not None:
+                plan = rename_plan_keys(entry['plan'], renames) if renames else copy.deepcopy(entry['plan'])
+                return {'plan': plan, 'cost': entry['cost'], 'cached': True}
+            # an index name of the cached plan is renamed differently on two tables, explain again
+
+        for table in tables:
+            self._apply(table)
+        plan = self._explain(sql)
+        cost = _query_cost(plan)
+        self.cache.put(key, {'plan': plan, 'cost': cost, 'names': names})
+        return {'plan': copy.deepcopy(plan), 'cost': cost, 'cached': False}
+
+    def _explain(self, sql: str) -> dict:
+        with self._connection().cursor() as cursor:
+            cursor.execute(f"EXPLAIN FORMAT=JSON {sql}")
+            row = cursor.fetchone()
+        return json.loads(row[0])
+
+    def close(self, restore: bool = True):
+        """
+        Args:
+            restore: drop the added indexes and add back the dropped ones on VIDEX-MySQL
+        """
+        try:
+            if restore:
+                self.reset()
+                for table in self.tables.values():
+                    self._apply(table)
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        logging.info(f"what-if explainer closed, cache: {self.cache.stats()}")
+
+
+def _index_renames(old_names: List[List[str]], new_names: List[List[str]]) -> Optional[Dict[str, str]]:
+    """old name -> new name of the indexes of the same definitions, None if an old name has several new names"""
+    renames = {}
+    for old_name, new_name in zip(chain.from_iterable(old_names), chain.from_iterable(new_names)):
+        if renames.setdefault(old_name, new_name) != new_name:
+            return None
+    return {old: new for old, new in renames.items() if old != new}
+
+
+def _query_cost(plan: dict) -> Optional[float]:
+    cost = ((plan or {}).get('query_block') or {}).get('cost_info', {}).get('query_cost')
+    return float(cost) if cost is not None else None
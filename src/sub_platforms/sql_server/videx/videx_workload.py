@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Parallel EXPLAIN of a SQL workload on InnoDB and, optionally, VIDEX.
+
+Each worker thread keeps one connection per env for the whole run, so optimizer_trace and the VIDEX session
+variables are set once per connection. The explain, the rec_in_ranges GT parsed from the optimizer trace and the
+explain diff of each SQL are streamed to a gzip json-lines file as soon as they are ready:
+
+    {"idx": 0, "sql": "...",
+     "innodb": {"explain": [...], "gt_rec_in_ranges": [...], "error": null, "elapsed_s": 0.01},
+     "videx": {...}, "compare": {"score": 1.0, "msg": "", "diff": {}}}
+
+load_gt_rec_in_ranges turns the file into the gt_rec_in_ranges of construct_videx_task_meta_from_local_files,
+explain_diff_report summarizes the diffs.
+"""
+import gzip
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
+
+from sub_platforms.sql_server.databases.mysql.mysql_command import MySQLVersion
+from sub_platforms.sql_server.env.rds_env import Env
+from sub_platforms.sql_server.videx.videx_metadata import extract_rec_in_range_gt_from_explain
+from sub_platforms.sql_server.videx.videx_utils import compare_explain
+
+ENV_INNODB = 'innodb'
+ENV_VIDEX = 'videx'
+
+
+class _ExplainWorkers:
+    """runs EXPLAIN with trace on one env, each thread on its own connection"""
+
+    def __init__(self, env: Env, target_version: MySQLVersion, videx_py_ip_port: str = None,
+                 videx_options: dict = None):
+        self.env = env
+        self.target_version = target_version
+        self.videx_py_ip_port = videx_py_ip_port
+        self.videx_options = videx_options
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.env.mysql_util.get_connection()
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+            return conn, True
+        return conn, False
+
+    def explain(self, sql: str) -> dict:
+        st = time.perf_counter()
+        res = {'explain': None, 'gt_rec_in_ranges': [], 'error': None}
+        try:
+            conn, is_new = self._connection()
+            df_explain, _, gt = extract_rec_in_range_gt_from_explain(
+                self.env, sql, target_version=self.target_version, videx_py_ip_port=self.videx_py_ip_port,
+                videx_options=self.videx_options, verbose=False, need_set_trace=is_new,
+                need_set_session=is_new, conn=conn)
+            if df_explain is not None:
+                res['explain'] = df_explain.to_dict(orient='records')
+                if 'code' in df_explain.columns and 'message' in df_explain.columns:
+                    res['error'] = str(res['explain'][0]['message'])
+            if res['error'] is None:
+                # the trace of a failed EXPLAIN is left by the previous statement of the connection
+                res['gt_rec_in_ranges'] = gt or []
+        except Exception as e:
+            logging.error(f"explain failed on {self.env.instance}, {sql=}: {e}")
+            res['error'] = str(e)
+            # the connection may be broken, the next SQL of this thread opens a new one
+            self.local.conn = None
+        res['elapsed_s'] = time.perf_counter() - st
+        return res
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logging.warning(f"close connection failed: {e}")
+
+
+def run_workload_explain(innodb_env: Env, sqls: List[str], output_file: str, videx_env: Env = None,
+                         n_workers: int = 4, videx_py_ip_port: str = None, videx_options: dict = None,
+                         target_version: MySQLVersion = MySQLVersion.MySQL_8) -> dict:
+    """
+    EXPLAIN (with optimizer trace) each SQL on innodb_env and videx_env in parallel, and stream the results to
+    output_file (gzip json lines, see the module doc). Records are written in the order they complete.
+
+    Args:
+        innodb_env: env of the InnoDB instance, the source of GT
+        sqls: the workload
+        output_file: e.g. workload_explain.jsonl.gz
+        videx_env: env of VIDEX-MySQL, skipped if None
+        n_workers: connections to each env
+        videx_py_ip_port: @VIDEX_SERVER of videx_env
+        videx_options: @VIDEX_OPTIONS of videx_env, e.g. {'task_id': ...}
+        target_version: MySQL version of the InnoDB instance
+
+    Returns:
+        {'n_sqls', 'n_errors', 'n_gt', 'avg_score', 'elapsed_s'}, avg_score is None without videx_env
+    """
+    st = time.perf_counter()
+    envs = {ENV_INNODB: _ExplainWorkers(innodb_env, target_version)}
+    if videx_env is not None:
+        envs[ENV_VIDEX] = _ExplainWorkers(videx_env, target_version, videx_py_ip_port, videx_options)
+    executors = {name: ThreadPoolExecutor(max_workers=max(1, n_workers), thread_name_prefix=f"explain_{name}")
+                 for name in envs}
+    n_errors, n_gt, scores = 0, 0, []
+    # results of a SQL wait here until all envs finished it
+    pending: Dict[int, dict] = {}
+    try:
+        futures = {}
+        for idx, sql in enumerate(sqls):
+            for name, workers in envs.items():
+                futures[executors[name].submit(workers.explain, sql)] = (idx, name)
+        with gzip.open(output_file, 'wt', encoding='utf-8') as f:
+            for future in as_completed(futures):
+                # drop the reference, records are not kept once written
+                idx, name = futures.pop(future)
+                record = pending.setdefault(idx, {'idx': idx, 'sql': sqls[idx]})
+                record[name] = future.result()
+                if any(env_name not in record for env_name in envs):
+                    continue
+                del pending[idx]
+                if ENV_VIDEX in record:
+                    innodb_explain, videx_explain = record[ENV_INNODB]['explain'], record[ENV_VIDEX]['explain']
+                    if innodb_explain and videx_explain and not record[ENV_INNODB]['error'] \
+                            and not record[ENV_VIDEX]['error']:
+                        record['compare'] = compare_explain(innodb_explain, videx_explain)
+                        scores.append(record['compare']['score'])
+                n_errors += any(record[env_name]['error'] for env_name in envs)
+                n_gt += len(record[ENV_INNODB]['gt_rec_in_ranges'])
+                f.write(json.dumps(record, default=str) + '\n')
+    finally:
+        for executor in executors.values():
+            # nothing is left unless writing failed
+            executor.shutdown(wait=True, cancel_futures=True)
+        for workers in envs.values():
+            workers.close()
+    res = {'n_sqls': len(sqls), 'n_errors': n_errors, 'n_gt': n_gt,
+           'avg_score': sum(scores) / len(scores) if scores else None, 'elapsed_s': time.perf_counter() - st}
+    logging.info(f"run workload explain: {res}, output_file={output_file}")
+    return res
+
+
+def iter_workload_results(output_file: str) -> Iterator[dict]:
+    with gzip.open(output_file, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_gt_rec_in_ranges(output_file: str) -> List[dict]:
+    """
+    rec_in_ranges GT of InnoDB in the output of run_workload_explain, in the format of gt_rec_in_ranges_file
+    (see GT_Table_Return.parse_raw_gt_rec_in_range_list). Ranges seen in several SQLs are kept once.
+    """
+    # records are in the order they completed, keep the order of the workload
+    gt_by_idx = sorted((record['idx'], record[ENV_INNODB]['gt_rec_in_ranges'])
+                       for record in iter_workload_results(output_file))
+    res, seen = [], set()
+    for _, items in gt_by_idx:
+        for item in items:
+            key = (item.get('table'), item.get('index'), tuple(item.get('ranges') or []))
+            if key in seen:
+                continue
+            seen.add(key)
+            res.append(item)
+    return res
+
+
+def explain_diff_report(output_file: str, top: Optional[int] = 20) -> dict:
+    """
+    Returns:
+        {'n_sqls', 'n_compared', 'n_matched', 'avg_score', 'mismatches'}, mismatches are the `top` compared SQLs
+        with the lowest score: {'idx', 'sql', 'score', 'msg'}
+    """
+    n_sqls, compared = 0, []
+    for record in iter_workload_results(output_file):
+        n_sqls += 1
+        if 'compare' in record:
+            compared.append({'idx': record['idx'], 'sql': record['sql'], 'score': record['compare']['score'],
+                             'msg': record['compare']['msg']})
+    mismatches = sorted((c for c in compared if c['score'] < 1), key=lambda c: (c['score'], c['idx']))
+    return {'n_sqls': n_sqls, 'n_compared': len(compared), 'n_matched': len(compared) - len(mismatches),
+            'avg_score': sum(c['score'] for c in compared) / len(compared) if compared else None,
+            'mismatches': mismatches[:top] if top is not None else mismatches}
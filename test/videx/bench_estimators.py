@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Microbenchmarks of the estimator hot paths of the statistic server, on the checked-in fixtures.
+
+Results are saved as json, and a run can be compared with a baseline run:
+
+    PYTHONPATH=src python -m test.videx.bench_estimators --output /tmp/bench_base.json
+    PYTHONPATH=src python -m test.videx.bench_estimators --output /tmp/bench_new.json \
+        --baseline /tmp/bench_base.json --threshold 0.2
+
+With --baseline, benchmarks slower than the baseline by more than `threshold` are flagged and the exit code is 1.
+Logging is disabled while timing.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from sub_platforms.sql_server.histogram.ndv_estimator import NDVEstimator
+from sub_platforms.sql_server.videx.model.videx_model_innodb import VidexModelInnoDB
+from sub_platforms.sql_server.videx.videx_metadata import VidexDBTaskStats, VidexTableStats, \
+    EXTRA_INFO_KEY_mulcol, EXTRA_INFO_KEY_pct_cached, EXTRA_INFO_KEY_gt_rec_in_ranges, \
+    construct_videx_task_meta_from_local_files
+from sub_platforms.sql_server.videx.videx_utils import BTreeKeySide, GT_Table_Return, IndexRangeCond, \
+    load_json_from_file, data_type_is_int
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+REPO_DATA_DIR = os.path.join(os.path.dirname(__file__), '../../data')
+RANGE_REQUESTS_FILE = os.path.join(DATA_DIR, 'test_tpch_1024/test_cases_tpch_rec_in_range_requests.json')
+RECORDS_IN_RANGE_FUNC = "virtual ha_rows ha_videx::records_in_range(uint, key_range *, key_range *)"
+INFO_LOW_FUNC = "virtual int ha_videx::info_low(uint, bool)"
+
+# a benchmark: (function of one run, number of operations of a run)
+Bench = Tuple[Callable[[], object], int]
+
+
+def _fixture_files() -> Dict[str, Tuple]:
+    """fixture -> (stats, hist, ndv_single, ndv_mulcol), files or dicts"""
+    tpch_64 = os.path.join(DATA_DIR, 'tpch_64')
+    tpch_1024 = os.path.join(DATA_DIR, 'test_tpch_1024')
+    imdb = os.path.join(DATA_DIR, 'test_imdbload_1024_b10')
+    tiny = load_json_from_file(os.path.join(REPO_DATA_DIR, 'tpch_tiny/videx_metadata_tpch_tiny.json'))
+    return {
+        # stats of tpch_64 have no DDL, the schema is the same as test_tpch_1024, whose histograms are not checked in
+        'tpch_64': (os.path.join(tpch_1024, 'videx_tpch_info_stats.json'),
+                    os.path.join(tpch_64, 'videx_tpch_histogram.json'),
+                    os.path.join(tpch_64, 'videx_tpch_ndv_single.json'),
+                    os.path.join(tpch_64, 'videx_tpch_ndv_mulcol.json')),
+        'imdbload_1024_b10': (os.path.join(imdb, 'videx_imdbload_info_stats.json'),
+                              os.path.join(imdb, 'videx_imdbload_histogram_b10.json'),
+                              os.path.join(imdb, 'videx_imdbload_ndv_single.json'),
+                              os.path.join(imdb, 'videx_imdbload_ndv_mulcol.json')),
+        'tpch_tiny': (tiny['stats_dict'], tiny['hist_dict'], tiny['ndv_single_dict'], tiny['ndv_mulcol_dict']),
+    }
+
+
+def load_fixture(name: str) -> VidexDBTaskStats:
+    stats, hist, ndv_single, ndv_mulcol = _fixture_files()[name]
+    return construct_videx_task_meta_from_local_files(task_id=None, videx_db=name, stats_file=stats,
+                                                      hist_file=hist, ndv_single_file=ndv_single,
+                                                      ndv_mulcol_file=ndv_mulcol, raise_error=True)
+
+
+def _sql_literal(value, data_type: str) -> str:
+    """value as in the requests of videx mysql"""
+    if data_type_is_int(data_type) or data_type in ['float', 'double', 'decimal']:
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _key(item_type: str, index_name: str, op: str, col: str, value: str) -> dict:
+    return {"item_type": item_type, "properties": {"index_name": index_name, "length": "4", "operator": op},
+            "data": [{"item_type": "column_and_bound", "properties": {"column": col, "value": value}, "data": []}]}
+
+
+def _range_requests(db: str, meta: VidexDBTaskStats, max_cols: int = 8) -> List[dict]:
+    """equality and range requests on histogram values of the first `max_cols` columns of each table"""
+    res = []
+    for table, stats_info in meta.stats_dict[db].items():
+        hists = [(col, h) for col, h in stats_info.histogram_dict.items() if h is not None and h.buckets]
+        for col, hist in hists[:max_cols]:
+            n = len(hist.buckets)
+            mid = _sql_literal(hist.buckets[n // 2].min_value, hist.data_type)
+            lo = _sql_literal(hist.buckets[n // 4].min_value, hist.data_type)
+            hi = _sql_literal(hist.buckets[n * 3 // 4].max_value, hist.data_type)
+            index_name = f"idx_{col}"
+            for min_key, max_key in [(_key('min_key', index_name, '=', col, mid), _key('max_key', index_name, '>', col, mid)),
+                                     (_key('min_key', index_name, '>', col, lo), _key('max_key', index_name, '<', col, hi))]:
+                res.append({"item_type": "videx_request",
+                            "properties": {"dbname": db, "function": RECORDS_IN_RANGE_FUNC, "table_name": table,
+                                           "target_storage_engine": "INNODB"},
+                            "data": [min_key, max_key]})
+    if db.startswith('tpch'):
+        for req in load_json_from_file(RANGE_REQUESTS_FILE):
+            req = json.loads(json.dumps(req))
+            req['properties']['dbname'] = db
+            res.append(req)
+    return res
+
+
+def _info_low_requests(db: str, meta: VidexDBTaskStats) -> List[dict]:
+    """info_low of each table, keys are the indexes of ndv_mulcol"""
+    res = []
+    for table, stats_info in meta.stats_dict[db].items():
+        keys = []
+        for index_name, cols in (stats_info.extra_info.get(EXTRA_INFO_KEY_mulcol) or {}).items():
+            fields = sorted(cols.items(), key=lambda kv: kv[1]['n_field'])
+            keys.append({"item_type": "key", "properties": {"key_length": "4", "name": index_name},
+                         "data": [{"item_type": "field", "properties": {"name": col, "store_length": "4"},
+                                   "data": []} for col, _ in fields]})
+        res.append({"item_type": "videx_request",
+                    "properties": {"dbname": db, "function": INFO_LOW_FUNC, "table_name": table,
+                                   "target_storage_engine": "INNODB"},
+                    "data": keys})
+    return res
+
+
+def build_table_stats(meta: VidexDBTaskStats, db: str, table: str) -> VidexTableStats:
+    """same as VidexSingleton.get_videx_table_stats"""
+    stats_info = meta.get_table_stats_info(db, table)
+    gt_rr_dict = GT_Table_Return.parse_raw_gt_rec_in_range_list(
+        stats_info.extra_info.get(EXTRA_INFO_KEY_gt_rec_in_ranges, []))
+    return VidexTableStats.from_json(dbname=db, table_name=table, raw_meta_dict=meta.get_table_meta(db, table),
+                                     hist_columns=stats_info.histogram_dict,
+                                     sample_file_info=meta.sample_file_info, db_config=meta.db_config,
+                                     ideal_ndvs=stats_info.extra_info.get(EXTRA_INFO_KEY_mulcol),
+                                     single_ndvs=stats_info.ndv_dict,
+                                     pct_cached=stats_info.extra_info.get(EXTRA_INFO_KEY_pct_cached),
+                                     gt_rec_in_ranges=gt_rr_dict[table])
+
+
+def _fixture_benches(db: str, hist_probes: Dict[str, list], range_keys: List[Tuple[dict, dict]]) -> Dict[str, Bench]:
+    meta = load_fixture(db)
+    tables = list(meta.stats_dict[db].keys())
+    meta_dict = meta.to_dict()
+    for stats_info in meta.stats_dict[db].values():
+        for hist in stats_info.histogram_dict.values():
+            if hist is None or not hist.buckets:
+                continue
+            for bucket in hist.buckets[::max(1, len(hist.buckets) // 16)]:
+                for value in [bucket.min_value, bucket.max_value]:
+                    value = _sql_literal(value, hist.data_type)
+                    try:
+                        hist.find_nearest_key_pos(value, BTreeKeySide.left)
+                    except Exception:
+                        continue
+                    hist_probes[hist.data_type].append((hist, value))
+
+    models = {table: VidexModelInnoDB(build_table_stats(meta, db, table)) for table in tables}
+    cardinality_cases = []
+    for req in _range_requests(db, meta):
+        model = models.get(req['properties']['table_name'].lower())
+        min_key, max_key = req['data']
+        range_keys.append((min_key, max_key))
+        if model is None:
+            continue
+        cond = IndexRangeCond.from_dict(min_key, max_key)
+        try:
+            model.cardinality(cond)
+        except Exception:
+            # e.g. string ranges reversed by the collation of the histogram
+            continue
+        cardinality_cases.append((model, cond))
+    info_low_cases = [(models[req['properties']['table_name']], req) for req in _info_low_requests(db, meta)]
+
+    def run_cardinality():
+        for model, cond in cardinality_cases:
+            model.cardinality(cond)
+
+    def run_info_low():
+        for model, req in info_low_cases:
+            model.info_low(req)
+
+    def run_from_json():
+        for table in tables:
+            build_table_stats(meta, db, table)
+
+    return {
+        f'VidexModelInnoDB.cardinality[{db}]': (run_cardinality, len(cardinality_cases)),
+        f'VidexModelInnoDB.info_low[{db}]': (run_info_low, len(info_low_cases)),
+        f'VidexTableStats.from_json[{db}]': (run_from_json, len(tables)),
+        f'VidexDBTaskStats.from_dict[{db}]': (lambda: VidexDBTaskStats.from_dict(meta_dict), 1),
+    }
+
+
+def _ndv_benches(n_rows: int = 10000, original_num: int = 10 ** 6) -> Dict[str, Bench]:
+    rng = np.random.default_rng(0)
+    sample = pd.DataFrame({'a': rng.zipf(1.5, n_rows) % 100000, 'b': rng.integers(0, 1000, n_rows)})
+    estimator = NDVEstimator(original_num)
+    values = sample['a'].tolist()
+    tuples = list(zip(sample['a'], sample['b']))
+    profile = estimator.build_column_profile(values)
+    res = {
+        'NDVEstimator.build_column_profile': (lambda: estimator.build_column_profile(values), 1),
+        'NDVEstimator.block_split_estimate': (lambda: estimator.block_split_estimate(tuples), 1),
+        'NDVEstimator.estimate': (lambda: estimator.estimate(sample), 1),
+        'NDVEstimator.estimate_multi_columns': (lambda: estimator.estimate_multi_columns(sample, ['a', 'b']), 1),
+    }
+    for method in ['error_bound', 'GEE', 'Chao', 'scale', 'shlosser', 'ChaoLee', 'LS']:
+        res[f'NDVEstimator.estimator[{method}]'] = \
+            (lambda method=method: estimator.estimator(n_rows, profile, method), 1)
+    return res
+
+
+def collect_benches(fixtures: List[str] = None) -> Dict[str, Bench]:
+    fixtures = fixtures or list(_fixture_files().keys())
+    hist_probes: Dict[str, list] = defaultdict(list)
+    range_keys: List[Tuple[dict, dict]] = []
+    benches: Dict[str, Bench] = {}
+    for db in fixtures:
+        benches.update(_fixture_benches(db, hist_probes, range_keys))
+
+    def find_nearest_key_pos(probes):
+        for hist, value in probes:
+            hist.find_nearest_key_pos(value, BTreeKeySide.left)
+
+    for data_type, probes in sorted(hist_probes.items()):
+        benches[f'HistogramStats.find_nearest_key_pos[{data_type}]'] = \
+            (lambda probes=probes: find_nearest_key_pos(probes), len(probes))
+
+    def from_dict():
+        for min_key, max_key in range_keys:
+            IndexRangeCond.from_dict(min_key, max_key)
+
+    benches['IndexRangeCond.from_dict'] = (from_dict, len(range_keys))
+    benches.update(_ndv_benches())
+    return benches
+
+
+def time_bench(func: Callable[[], object], n_ops: int, repeat: int = 5, min_time: float = 0.2) -> dict:
+    """
+    Args:
+        repeat: timed runs, each of `number` calls, where `number` is chosen so that a run takes at least min_time
+        min_time: 0 to time single calls, e.g. in tests
+
+    Returns:
+        time per operation of the fastest and the median run, in microseconds
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    if min_time > 0:
+        number, elapsed = timer.autorange()
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    runs = timer.repeat(repeat=repeat, number=number)
+    per_op = [t / number / max(n_ops, 1) * 1e6 for t in runs]
+    return {'n_ops': n_ops, 'number': number, 'repeat': repeat,
+            'min_us': min(per_op), 'median_us': statistics.median(per_op)}
+
+
+def run_suite(fixtures: List[str] = None, names: List[str] = None, repeat: int = 5, min_time: float = 0.2) -> dict:
+    """
+    Args:
+        fixtures: fixtures to load, None for all
+        names: only run benchmarks whose name contains one of these, None for all
+
+    Returns:
+        {'meta': {...}, 'results': {name: time_bench result}}
+    """
+    logging.disable(logging.CRITICAL)
+    try:
+        benches = collect_benches(fixtures)
+        results = {}
+        for name, (func, n_ops) in benches.items():
+            if names and not any(n in name for n in names):
+                continue
+            results[name] = time_bench(func, n_ops, repeat=repeat, min_time=min_time)
+    finally:
+        logging.disable(logging.NOTSET)
+    meta = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'platform': platform.platform()}
+    return {'meta': meta, 'results': results}
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.2) -> List[dict]:
+    """
+    Compares the median time per operation of the benchmarks in both runs.
+
+    Returns:
+        one row for each benchmark, `regression` is True if it is slower than baseline by more than threshold
+    """
+    rows = []
+    for name, cur in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = cur['median_us'] / base['median_us'] if base['median_us'] > 0 else float('inf')
+        rows.append({'name': name, 'baseline_us': base['median_us'], 'current_us': cur['median_us'],
+                     'ratio': ratio, 'regression': ratio > 1 + threshold})
+    return rows
+
+
+def format_results(results: dict, comparison: Optional[List[dict]] = None) -> str:
+    lines = [f"{'benchmark':<56} {'ops':>6} {'min(us)':>12} {'median(us)':>12}"]
+    compared = {row['name']: row for row in comparison or []}
+    for name, res in results['results'].items():
+        line = f"{name:<56} {res['n_ops']:>6} {res['min_us']:>12.2f} {res['median_us']:>12.2f}"
+        if name in compared:
+            row = compared[name]
+            line += f"  x{row['ratio']:.2f} vs {row['baseline_us']:.2f}" + ("  REGRESSION" if row['regression'] else "")
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the VIDEX estimators.')
+    parser.add_argument('--output', type=str, default=None, help='save the results as json')
+    parser.add_argument('--baseline', type=str, default=None, help='results json of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='flag benchmarks slower than the baseline by more than this ratio')
+    parser.add_argument('--fixtures', type=str, nargs='*', default=None, help='fixtures to load, default all')
+    parser.add_argument('--filter', type=str, nargs='*', default=None, help='only run benchmarks matching these')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    current = run_suite(fixtures=args.fixtures, names=args.filter, repeat=args.repeat)
+    comparison = None
+    if args.baseline:
+        comparison = compare_results(load_json_from_file(args.baseline), current, args.threshold)
+    print(format_results(current, comparison))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    if comparison and any(row['regression'] for row in comparison):
+        sys.exit(1)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Scale harness of the statistic server on synthetic schemas (see synthetic_meta). For each schema size, it measures
+the ingest time of the task metadata (json body of /create_task_meta to VidexSingleton.add_task_meta), the peak RSS
+and the latency of the first requests, which build the table model:
+
+    PYTHONPATH=src python -m test.videx.bench_scale --tables 10 100 1000 --columns 50 --output /tmp/scale.json
+
+Each size is measured in a fresh process, so that peak RSS is not inherited from the previous ones.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import List
+
+from sub_platforms.sql_server.videx.videx_metadata import construct_videx_task_meta_from_local_files
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton
+from test.videx.bench_estimators import _range_requests, _info_low_requests
+from test.videx.synthetic_meta import generate_synthetic_meta
+
+SCAN_TIME_FUNC = "virtual double ha_videx::scan_time()"
+
+
+def _rss_mb() -> float:
+    """current RSS on linux, peak RSS elsewhere"""
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024 / 1024
+    return _max_rss_mb()
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is in KB on linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _measure_ingest(body_file: str, db: str) -> dict:
+    """runs in a fresh process"""
+    logging.disable(logging.CRITICAL)
+    with open(body_file, 'r') as f:
+        body = f.read()
+    rss_before = _rss_mb()
+
+    st = time.perf_counter()
+    singleton = VidexSingleton()
+    singleton.add_task_meta(json.loads(body))
+    ingest_s = time.perf_counter() - st
+    rss_after_ingest = _max_rss_mb()
+
+    meta = singleton.non_task_cache.db_tasks_stats
+    table = sorted(meta.stats_dict[db])[0]
+    scan_time_req = {"item_type": "videx_request", "data": [],
+                     "properties": {"dbname": db, "function": SCAN_TIME_FUNC, "table_name": table,
+                                    "target_storage_engine": "INNODB"}}
+    range_req = next(req for req in _range_requests(db, meta) if req['properties']['table_name'] == table)
+    info_low_req = next(req for req in _info_low_requests(db, meta) if req['properties']['table_name'] == table)
+    latencies = {}
+    # the first request builds the table model, the next ones reuse it
+    for name, req in [('first_request', scan_time_req), ('records_in_range', range_req),
+                      ('info_low', info_low_req), ('next_request', scan_time_req)]:
+        st = time.perf_counter()
+        code, message, _ = singleton.ask(req)
+        latencies[f'{name}_ms'] = (time.perf_counter() - st) * 1000
+        if code != 200:
+            raise Exception(f"{name} failed: {code} {message}")
+    return {'body_mb': len(body) / 1024 / 1024, 'ingest_s': ingest_s,
+            'rss_before_mb': rss_before, 'peak_rss_mb': _max_rss_mb(),
+            'ingest_rss_mb': rss_after_ingest - rss_before, 'rss_after_ingest_mb': _rss_mb(), **latencies}
+
+
+def measure_scale(n_tables: int, n_columns: int, db: str = 'synthetic', **generate_kwargs) -> dict:
+    """
+    Args:
+        generate_kwargs: other arguments of generate_synthetic_meta
+
+    Returns:
+        sizes of the schema, ingest time, peak RSS and latencies of the first requests
+    """
+    st = time.perf_counter()
+    metadata = generate_synthetic_meta(n_tables=n_tables, n_columns=n_columns, db=db, **generate_kwargs)
+    meta = construct_videx_task_meta_from_local_files(task_id=None, videx_db=db,
+                                                      stats_file=metadata['stats_dict'],
+                                                      hist_file=metadata['hist_dict'],
+                                                      ndv_single_file=metadata['ndv_single_dict'],
+                                                      ndv_mulcol_file=metadata['ndv_mulcol_dict'],
+                                                      raise_error=True)
+    generate_s = time.perf_counter() - st
+    n_buckets = sum(len(h['buckets']) for hists in metadata['hist_dict'].values() for h in hists.values())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        body_file = os.path.join(tmp_dir, 'body.json')
+        with open(body_file, 'w') as f:
+            f.write(meta.to_json())
+        del metadata, meta
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            res = pool.apply(_measure_ingest, (body_file, db))
+    return {'tables': n_tables, 'columns': n_tables * n_columns, 'buckets': n_buckets,
+            'generate_s': generate_s, **res}
+
+
+SCALE_RESULT_KEYS = ['tables', 'columns', 'buckets', 'body_mb', 'ingest_s', 'peak_rss_mb', 'ingest_rss_mb',
+                     'first_request_ms', 'records_in_range_ms', 'info_low_ms', 'next_request_ms']
+
+
+def format_scale_results(results: List[dict], header: bool = True) -> str:
+    keys = SCALE_RESULT_KEYS
+    lines = [' '.join(f"{k:>19}" for k in keys)] if header else []
+    for res in results:
+        lines.append(' '.join(f"{res[k]:>19}" if isinstance(res[k], int) else f"{res[k]:>19.3f}" for k in keys))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest time, peak RSS and first request latency by schema size.')
+    parser.add_argument('--tables', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--columns', type=int, default=50, help='columns of each table')
+    parser.add_argument('--buckets', type=int, default=64, help='buckets of each histogram')
+    parser.add_argument('--indexes', type=int, default=4, help='secondary indexes of each table')
+    parser.add_argument('--skew', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='save the results as json')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    results = []
+    for n_tables in args.tables:
+        results.append(measure_scale(n_tables, args.columns, n_buckets=args.buckets, n_indexes=args.indexes,
+                                     skew=args.skew, seed=args.seed))
+        print(format_scale_results(results[-1:], header=len(results) == 1), flush=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+
+Synthetic metadata of large schemas, in the format of the checked-in fixtures (e.g. data/tpch_tiny):
+{'stats_dict', 'hist_dict', 'ndv_single_dict', 'ndv_mulcol_dict'}, each keyed by table.
+
+    metadata = generate_synthetic_meta(n_tables=2000, n_columns=200, skew=1.5)
+    meta = construct_videx_task_meta_from_local_files(task_id=None, videx_db='synthetic',
+                                                      stats_file=metadata['stats_dict'], ...)
+    write_meta_bundle('/tmp/synthetic.arrow', metadata)
+
+The output only depends on the arguments.
+"""
+import datetime
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# data type of the histogram -> column type in the DDL
+SYNTHETIC_COLUMN_TYPES = {
+    'int': 'int',
+    'bigint': 'bigint',
+    'decimal': 'decimal(15,2)',
+    'double': 'double',
+    'string': 'varchar(64)',
+    'date': 'date',
+    'datetime': 'datetime',
+}
+INNODB_PAGE_SIZE = 16384
+MAX_DATE_NDV = 500000
+_BASE_DATETIME = datetime.datetime(2000, 1, 1)
+
+
+def _values(data_type: str, codes: np.ndarray) -> list:
+    """increasing integer codes to increasing values of data_type"""
+    if data_type in ['int', 'bigint']:
+        return [int(c) for c in codes]
+    elif data_type == 'decimal':
+        return [round(float(c) / 100, 2) for c in codes]
+    elif data_type == 'double':
+        return [float(c) * 0.5 for c in codes]
+    elif data_type == 'string':
+        return [f"v{int(c):012d}" for c in codes]
+    elif data_type == 'date':
+        return [(_BASE_DATETIME + datetime.timedelta(days=int(c))).strftime('%Y-%m-%d') for c in codes]
+    elif data_type == 'datetime':
+        return [(_BASE_DATETIME + datetime.timedelta(seconds=int(c))).strftime('%Y-%m-%d %H:%M:%S.%f')
+                for c in codes]
+    raise ValueError(f"unsupported data type: {data_type}")
+
+
+def _histogram(rng: np.random.Generator, data_type: str, rows: int, ndv: int, n_buckets: int, skew: float,
+               null_ratio: float) -> dict:
+    """
+    singleton histogram with zipf(skew) frequencies if ndv <= n_buckets, otherwise an equi-height histogram whose
+    buckets are narrower at small values as skew grows
+    """
+    not_null = 1 - null_ratio
+    if ndv <= n_buckets:
+        codes = np.sort(rng.choice(max(ndv * 10, 100), size=ndv, replace=False))
+        weights = 1 / np.arange(1, ndv + 1) ** skew
+        weights = rng.permutation(weights / weights.sum())
+        cum_freqs = np.cumsum(weights) * not_null
+        buckets = [{'min_value': v, 'max_value': v, 'cum_freq': float(f), 'row_count': 1, 'size': 0}
+                   for v, f in zip(_values(data_type, codes), cum_freqs)]
+        histogram_type = 'singleton'
+    else:
+        # bucket boundaries at (k / n) ** (1 + skew) of the value domain
+        domain = ndv * 4
+        bounds = np.floor(domain * (np.arange(n_buckets + 1) / n_buckets) ** (1 + skew)).astype(np.int64)
+        bounds = np.maximum.accumulate(bounds + np.arange(n_buckets + 1))
+        mins, maxs = bounds[:-1] + (np.arange(n_buckets) > 0), bounds[1:]
+        row_counts = np.maximum(1, np.minimum(maxs - mins + 1, ndv // n_buckets))
+        cum_freqs = np.arange(1, n_buckets + 1) / n_buckets * not_null
+        buckets = [{'min_value': lo, 'max_value': hi, 'cum_freq': float(f), 'row_count': int(rc), 'size': 0}
+                   for lo, hi, f, rc in zip(_values(data_type, mins), _values(data_type, maxs), cum_freqs, row_counts)]
+        histogram_type = 'equi-height'
+    return {'buckets': buckets, 'data_type': data_type,
+            'null_values': null_ratio, 'collation_id': 255, 'last_updated': '2024-01-01 00:00:00.000000',
+            'sampling_rate': 1.0, 'histogram_type': histogram_type, 'number_of_buckets_specified': n_buckets}
+
+
+def _ndv_mulcol(index_cols: List[str], ndvs: Dict[str, int], rows: int, sample_size: int = 20) -> dict:
+    """n_diff_pfx of an index, the primary key (the first column) is appended to secondary indexes like InnoDB"""
+    res, ndv = {}, 1
+    for i, col in enumerate(index_cols):
+        ndv = min(rows, max(ndv, ndv * ndvs[col]))
+        res[col] = {'stat_name': f'n_diff_pfx{i + 1:02d}', 'stat_value': int(ndv), 'sample_size': sample_size,
+                    'stat_description': ','.join(index_cols[:i + 1]), 'n_field': i + 1}
+    return res
+
+
+def _ddl(table: str, columns: List[Tuple[str, str, bool]], indexes: Dict[str, List[str]]) -> str:
+    lines = [f"  `{name}` {SYNTHETIC_COLUMN_TYPES[data_type]} {'DEFAULT NULL' if nullable else 'NOT NULL'}"
+             for name, data_type, nullable in columns]
+    for index_name, cols in indexes.items():
+        key = 'PRIMARY KEY' if index_name == 'PRIMARY' else f"KEY `{index_name}`"
+        lines.append(f"  {key} ({','.join(f'`{c}`' for c in cols)})")
+    return f"CREATE TABLE `{table}` (\n" + ",\n".join(lines) + \
+        "\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"
+
+
+def _table_stats(db: str, table: str, rows: int, n_columns: int, ddl: str, indexes: Dict[str, List[str]]) -> dict:
+    avg_row_length = 8 * n_columns + 20
+    data_pages = max(1, math.ceil(rows * avg_row_length / INNODB_PAGE_SIZE))
+    index_pages = max(1, math.ceil(rows * 16 * (len(indexes) - 1) / INNODB_PAGE_SIZE))
+    return {
+        'TABLE_CATALOG': 'def', 'TABLE_SCHEMA': db, 'TABLE_NAME': table, 'TABLE_TYPE': 'BASE TABLE',
+        'ENGINE': 'InnoDB', 'VERSION': 10, 'ROW_FORMAT': 'Dynamic', 'TABLE_ROWS': rows,
+        'AVG_ROW_LENGTH': avg_row_length, 'DATA_LENGTH': data_pages * INNODB_PAGE_SIZE, 'MAX_DATA_LENGTH': 0,
+        'INDEX_LENGTH': index_pages * INNODB_PAGE_SIZE, 'DATA_FREE': 0, 'AUTO_INCREMENT': rows + 1,
+        'CREATE_TIME': 1704067200, 'UPDATE_TIME': 1704067200, 'CHECK_TIME': None,
+        'TABLE_COLLATION': 'utf8mb4_0900_ai_ci', 'CHECKSUM': None, 'CREATE_OPTIONS': '', 'TABLE_COMMENT': '',
+        'innodb_page_size': INNODB_PAGE_SIZE, 'myisam_max_sort_file_size': 9223372036853727232,
+        'innodb_buffer_pool_size': 134217728, 'N_ROWS': rows,
+        'CLUSTERED_INDEX_SIZE': data_pages, 'SUM_OF_OTHER_INDEX_SIZES': index_pages,
+        'pct_cached': {index_name: {'page_type': 'INDEX', 'pct_cached': 1.0, 'pool_rows': float(rows)}
+                       for index_name in indexes},
+        'DDL': ddl,
+    }
+
+
+def generate_synthetic_meta(n_tables: int = 100, n_columns: int = 20, n_indexes: int = 4, n_buckets: int = 64,
+                            min_rows: int = 1000, max_rows: int = 10 ** 7, skew: float = 1.0,
+                            data_types: List[str] = None, db: str = 'synthetic', seed: int = 0) -> dict:
+    """
+    Args:
+        n_tables: number of tables, named t00000, t00001, ...
+        n_columns: columns of each table, c000 is the primary key and the others cycle through data_types
+        n_indexes: secondary indexes of each table, on 1 or 2 columns
+        n_buckets: buckets of each histogram
+        min_rows, max_rows: rows of each table, log-uniform in between
+        skew: skew of column values. 0 is uniform, the zipf exponent of singleton histograms and the
+            concentration of equi-height buckets grow with it
+        data_types: histogram data types of the columns, default SYNTHETIC_COLUMN_TYPES
+        db: TABLE_SCHEMA of the tables
+        seed: seed of the random generator
+
+    Returns:
+        {'stats_dict', 'hist_dict', 'ndv_single_dict', 'ndv_mulcol_dict'}
+    """
+    rng = np.random.default_rng(seed)
+    data_types = data_types or list(SYNTHETIC_COLUMN_TYPES.keys())
+    res = {'stats_dict': {}, 'hist_dict': {}, 'ndv_single_dict': {}, 'ndv_mulcol_dict': {}}
+    for t in range(n_tables):
+        table = f"t{t:05d}"
+        rows = int(math.exp(rng.uniform(math.log(min_rows), math.log(max_rows))))
+        columns = [('c000', 'bigint', False)] + \
+                  [(f"c{i:03d}", data_types[(i - 1) % len(data_types)], bool(rng.random() < 0.3))
+                   for i in range(1, n_columns)]
+
+        hists, ndvs = {}, {}
+        for i, (col, data_type, nullable) in enumerate(columns):
+            # ndv ratio of other columns is log-uniform in [1e-6, 1]
+            ndv = rows if i == 0 else max(1, int(rows * 10 ** rng.uniform(-6, 0)))
+            if data_type == 'date':
+                # the value domain of ndv * 4 days stays before the year 9999
+                ndv = min(ndv, MAX_DATE_NDV)
+            null_ratio = float(rng.uniform(0, 0.2)) if nullable else 0.
+            hists[col] = _histogram(rng, data_type, rows, ndv, n_buckets, 0 if i == 0 else skew, null_ratio)
+            ndvs[col] = ndv
+
+        indexes = {'PRIMARY': ['c000']}
+        for k in range(min(n_indexes, n_columns - 1)):
+            cols = [columns[int(c)][0] for c in rng.choice(np.arange(1, n_columns), size=min(2, 1 + k % 2),
+                                                            replace=False)]
+            indexes[f"idx_{table}_{k}"] = cols
+
+        res['stats_dict'][table] = _table_stats(db, table, rows, n_columns, _ddl(table, columns, indexes), indexes)
+        res['hist_dict'][table] = hists
+        res['ndv_single_dict'][table] = ndvs
+        res['ndv_mulcol_dict'][table] = {
+            index_name: _ndv_mulcol(cols if index_name == 'PRIMARY' else cols + ['c000'], ndvs, rows)
+            for index_name, cols in indexes.items()}
+    return res
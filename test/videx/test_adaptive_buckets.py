@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from sub_platforms.sql_optimizer.meta import Table, Column
+from sub_platforms.sql_optimizer.videx.videx_histogram import allocate_bucket_counts, value_skew, probe_table_skew, \
+    MIN_ADAPTIVE_BUCKETS
+from sub_platforms.sql_optimizer.videx.videx_sampling import compute_table_stats_from_sample
+
+
+class FakeEnv:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.sqls = []
+
+    def query_for_dataframe(self, sql, params=None):
+        self.sqls.append(sql)
+        return self.df
+
+    def iter_rows(self, sql, params=None, as_dict=False, batch_size=1000):
+        self.sqls.append(sql)
+        yield from self.df.itertuples(index=False, name=None)
+
+    def get_table_meta(self, db_name, table_name):
+        return Table(name=table_name, db=db_name, rows=len(self.df), columns=[
+            Column(name=name, table=table_name, db=db_name, data_type='int') for name in self.df.columns])
+
+    def get_pk_columns(self, db_name, table_name):
+        # no primary key, the probe falls back to random rows
+        return []
+
+
+class TestAdaptiveBuckets(unittest.TestCase):
+    def test_value_skew(self):
+        self.assertEqual(value_skew(pd.Series([1, 2, 3, 4])), 0)
+        self.assertEqual(value_skew(pd.Series([None, None])), 0)
+        # 1 appears 7 times, the average is 10 / 4
+        self.assertAlmostEqual(value_skew(pd.Series([1] * 7 + [2, 3, 4])), 7 / 2.5 - 1)
+
+    def test_allocate(self):
+        ndvs = {'flag': 2, 'status': 10, 'uniform_id': 100000, 'skewed_id': 100000}
+        skews = {'uniform_id': 0, 'skewed_id': 50}
+        res = allocate_bucket_counts(ndvs, skews, budget=128)
+        # low-ndv columns are singleton
+        self.assertEqual(res['flag'], 2)
+        self.assertEqual(res['status'], 10)
+        self.assertGreater(res['skewed_id'], res['uniform_id'])
+        self.assertLessEqual(sum(res.values()), 128)
+
+        # not enough budget for singleton histograms of all columns
+        res = allocate_bucket_counts({'a': 30, 'b': 30, 'c': 30}, {}, budget=64)
+        self.assertEqual(sorted(res.values()), [MIN_ADAPTIVE_BUCKETS, 30, 30])
+        # at most 1024
+        self.assertEqual(allocate_bucket_counts({'a': 10 ** 6}, {}, budget=10 ** 6), {'a': 1024})
+
+    def test_allocate_within_budget(self):
+        # the budget can not give MIN_ADAPTIVE_BUCKETS to each column: the minimum is lowered
+        res = allocate_bucket_counts({f'c{i}': 10 ** 6 for i in range(10)}, {}, budget=10)
+        self.assertLessEqual(sum(res.values()), 10)
+        self.assertEqual(set(res.values()), {1})
+        # fewer buckets than columns: the highest-weight columns first
+        res = allocate_bucket_counts({'a': 10 ** 6, 'b': 10 ** 3, 'c': 10 ** 6}, {'c': 10}, budget=2)
+        self.assertEqual(res, {'a': 1, 'b': 0, 'c': 1})
+        # the minimum is kept for low-weight columns, and rounding does not lose buckets
+        ndvs = {'a': 10 ** 6, 'b': 10 ** 6, 'c': 10 ** 6, 'skewed': 10 ** 6}
+        for budget in [3, 7, 16, 17, 100, 333, 5000]:
+            with self.subTest(budget=budget):
+                res = allocate_bucket_counts(ndvs, {'skewed': 1000}, budget=budget)
+                self.assertLessEqual(sum(res.values()), budget)
+                self.assertEqual(sum(res.values()), min(budget, 4 * 1024))
+                self.assertGreaterEqual(min(res.values()), min(MIN_ADAPTIVE_BUCKETS, budget // 4))
+                self.assertLessEqual(max(res.values()), 1024)
+        res = allocate_bucket_counts({'a': 30, 'b': 30, 'c': 30, 'd': 10 ** 6}, {}, budget=64)
+        self.assertLessEqual(sum(res.values()), 64)
+
+    def test_probe(self):
+        env = FakeEnv(pd.DataFrame({'a': [1, 1, 1, 2], 'b': [1, 2, 3, 4]}))
+        self.assertEqual(probe_table_skew(env, 'db', 't', ['a', 'b'], probe_rows=4, table_rows=16),
+                         {'a': 0.5, 'b': 0})
+        self.assertEqual(probe_table_skew(env, 'db', 't', ['a'], probe_rows=4, table_rows=4), {'a': 0.5})
+        probe_table_skew(env, 'db', 't', ['a'], probe_rows=4)
+        self.assertEqual(env.sqls, ["SELECT `a`, `b` FROM `db`.`t` WHERE RAND(0) < 0.25 LIMIT 4",
+                                    "SELECT `a` FROM `db`.`t` LIMIT 4",
+                                    "SELECT `a` FROM `db`.`t` ORDER BY RAND(0) LIMIT 4"])
+
+    @patch('sub_platforms.sql_optimizer.videx.videx_sampling.sample_table_by_pk_range')
+    def test_probe_by_pk_range(self, mock_sample):
+        mock_sample.return_value = pd.DataFrame({'a': [1, 1, 1, 2], 'b': [1, 2, 3, 4]})
+        env = FakeEnv(pd.DataFrame())
+        self.assertEqual(probe_table_skew(env, 'db', 't', ['a', 'b'], probe_rows=4), {'a': 0.5, 'b': 0})
+        self.assertEqual(mock_sample.call_args.kwargs['sample_rows'], 4)
+        self.assertEqual(env.sqls, [])
+
+    def test_sample_stats_within_budget(self):
+        rng = np.random.default_rng(0)
+        n = 10000
+        df = pd.DataFrame({'flag': rng.integers(0, 3, n),
+                           'uniform': rng.permutation(n),
+                           'skewed': np.where(rng.random(n) < 0.5, 0, rng.integers(1, 10 ** 6, n))})
+        table_meta = Table(name='t', db='db', rows=n, columns=[
+            Column(name=name, table='t', db='db', data_type='int') for name in df.columns])
+        hist_dict, _ = compute_table_stats_from_sample(df, table_meta, n_buckets=16, bucket_budget=64)
+        self.assertEqual(hist_dict['flag']['histogram_type'], 'singleton')
+        self.assertEqual(len(hist_dict['flag']['buckets']), 3)
+        self.assertGreater(hist_dict['skewed']['number_of_buckets_specified'],
+                           hist_dict['uniform']['number_of_buckets_specified'])
+        self.assertLessEqual(sum(h['number_of_buckets_specified'] for h in hist_dict.values()), 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import json
+import unittest
+
+from test.videx.bench_estimators import run_suite, compare_results, format_results, load_fixture, \
+    build_table_stats
+
+
+class TestBenchEstimators(unittest.TestCase):
+    def test_fixture(self):
+        meta = load_fixture('tpch_tiny')
+        self.assertEqual(len(meta.stats_dict['tpch_tiny']), 8)
+        self.assertEqual(build_table_stats(meta, 'tpch_tiny', 'nation').table_name, 'nation')
+
+    def test_run_suite(self):
+        res = run_suite(fixtures=['tpch_tiny'], names=['cardinality', 'find_nearest_key_pos', 'estimator[GEE]'],
+                        repeat=1, min_time=0)
+        self.assertEqual(set(res['results']), {'VidexModelInnoDB.cardinality[tpch_tiny]',
+                                               'HistogramStats.find_nearest_key_pos[date]',
+                                               'HistogramStats.find_nearest_key_pos[decimal]',
+                                               'HistogramStats.find_nearest_key_pos[int]',
+                                               'HistogramStats.find_nearest_key_pos[string]',
+                                               'NDVEstimator.estimator[GEE]'})
+        for r in res['results'].values():
+            self.assertGreater(r['n_ops'], 0)
+            self.assertGreater(r['median_us'], 0)
+        # checked-in range requests and generated ones
+        self.assertGreater(res['results']['VidexModelInnoDB.cardinality[tpch_tiny]']['n_ops'], 15)
+        json.dumps(res)
+
+    def test_compare(self):
+        baseline = {'results': {'a': {'n_ops': 1, 'min_us': 1, 'median_us': 10},
+                                'b': {'n_ops': 1, 'min_us': 1, 'median_us': 10},
+                                'removed': {'n_ops': 1, 'min_us': 1, 'median_us': 10}}}
+        current = {'results': {'a': {'n_ops': 1, 'min_us': 1, 'median_us': 11},
+                               'b': {'n_ops': 1, 'min_us': 1, 'median_us': 13},
+                               'new': {'n_ops': 1, 'min_us': 1, 'median_us': 10}}}
+        rows = {row['name']: row for row in compare_results(baseline, current, threshold=0.2)}
+        self.assertEqual(set(rows), {'a', 'b'})
+        self.assertFalse(rows['a']['regression'])
+        self.assertTrue(rows['b']['regression'])
+        self.assertAlmostEqual(rows['b']['ratio'], 1.3)
+        text = format_results(current, list(rows.values()))
+        self.assertEqual(text.count('REGRESSION'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import unittest
+from typing import Dict, List
+
+from sub_platforms.sql_server.meta import Table, Column, Index, IndexColumn, IndexType
+from sub_platforms.sql_server.videx.videx_ddl_sync import sync_videx_db, index_definition
+from sub_platforms.sql_server.videx.videx_service import create_videx_env_multi_db
+
+
+def _columns(table: str, spec: str) -> List[Column]:
+    """'id:int,b:varchar(20)' -> columns"""
+    res = []
+    for item in spec.split(','):
+        name, column_type = item.split(':')
+        res.append(Column(name=name, table=table, db='d1', column_type=column_type, is_nullable='YES',
+                          data_type=column_type.split('(')[0]))
+    return res
+
+
+def _index(table: str, name: str, columns: List[str], unique: bool = False, **column_kwargs) -> Index:
+    index_type = IndexType.PRIMARY if name == 'PRIMARY' else IndexType.UNIQUE if unique else IndexType.NORMAL
+    index = Index(type=index_type, db_name='d1', table_name=table, name=name, is_unique=unique or name == 'PRIMARY',
+                  index_type='BTREE')
+    index.columns = [IndexColumn.simple_column(col, 'd1', table, **column_kwargs) for col in columns]
+    return index
+
+
+def _table(name: str, columns: str, indexes: Dict[str, List[str]]) -> Table:
+    return Table(name=name, db='d1', ddl=f"CREATE TABLE `{name}` (...) ENGINE=InnoDB",
+                 columns=_columns(name, columns),
+                 indexes=[_index(name, index_name, cols) for index_name, cols in indexes.items()])
+
+
+class FakeMySQLCommand:
+    def __init__(self, tables: List[Table]):
+        self.tables = tables
+
+    def get_schema_columns(self, db_name):
+        return {t.name.lower(): t.columns for t in self.tables}
+
+    def get_schema_indexes(self, db_name):
+        return {t.name.lower(): t.indexes for t in self.tables}
+
+
+class FakeEnv:
+    """VIDEX env holding `existing` tables, records the executed statements"""
+
+    def __init__(self, existing: List[Table], engines: Dict[str, str] = None):
+        self.default_db = 'videx'
+        self.existing = existing
+        self.engines = engines or {}
+        self.mysql_command = FakeMySQLCommand(existing)
+        self.executed: List[str] = []
+        self.batches: List[List[str]] = []
+        self.dbs: List[str] = []
+
+    def set_default_db(self, db_name):
+        self.default_db = db_name
+        self.dbs.append(db_name)
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+    def execute_batch(self, sql_list):
+        self.batches.append(list(sql_list))
+
+    def query_for_rows(self, sql, params=None):
+        return [(t.name, self.engines.get(t.name, 'VIDEX')) for t in self.existing]
+
+
+class TestDDLSync(unittest.TestCase):
+    def test_index_definition(self):
+        self.assertEqual(index_definition(_index('t', 'PRIMARY', ['id'])), "PRIMARY KEY (`id`)")
+        self.assertEqual(index_definition(_index('t', 'uk', ['a', 'b'], unique=True)), "UNIQUE KEY `uk` (`a`,`b`)")
+        index = _index('t', 'idx', ['a', 'b'])
+        index.columns[0].sub_part = 10
+        index.columns[1].collation = 'desc'
+        index.is_visible = False
+        self.assertEqual(index_definition(index), "KEY `idx` (`a`(10),`b` DESC) INVISIBLE")
+        index = _index('t', 'idx_expr', [None], expression='(`a` + 1)')
+        self.assertEqual(index_definition(index), "KEY `idx_expr` (((`a` + 1)))")
+
+    def test_sync(self):
+        existing = [
+            _table('same', 'id:int,a:int', {'PRIMARY': ['id'], 'idx_a': ['a']}),
+            _table('idx', 'id:int,a:int,b:int,c:int', {'PRIMARY': ['id'], 'idx_a': ['a'], 'idx_b': ['b']}),
+            _table('gone', 'id:int', {'PRIMARY': ['id']}),
+            _table('col', 'id:int,a:int', {'PRIMARY': ['id']}),
+            _table('pk', 'id:int,a:int', {'PRIMARY': ['id']}),
+            _table('Eng', 'id:int', {'PRIMARY': ['id']}),
+        ]
+        target = [
+            _table('same', 'id:int,a:int', {'PRIMARY': ['id'], 'idx_a': ['a']}),
+            _table('idx', 'id:int,a:int,b:int,c:int', {'PRIMARY': ['id'], 'idx_a': ['a', 'b'], 'idx_c': ['c']}),
+            _table('col', 'id:int,a:bigint', {'PRIMARY': ['id']}),
+            _table('pk', 'id:int,a:int', {'PRIMARY': ['id', 'a']}),
+            _table('eng', 'id:int', {'PRIMARY': ['id']}),
+            _table('new', 'id:int', {'PRIMARY': ['id']}),
+        ]
+        env = FakeEnv(existing, engines={'Eng': 'InnoDB'})
+        res = sync_videx_db(env, 'd1', {t.name: t for t in target}, batch_size=4)
+        self.assertEqual(res, {'created': ['new'], 'dropped': ['gone'], 'recreated': ['col', 'pk', 'eng'],
+                               'altered': ['idx'], 'unchanged': ['same']})
+        self.assertEqual(env.executed, ["CREATE DATABASE IF NOT EXISTS `d1`"])
+        statements = [sql for batch in env.batches for sql in batch]
+        self.assertEqual([len(batch) for batch in env.batches], [4, 4, 1])
+        self.assertEqual(statements, [
+            "DROP TABLE IF EXISTS `d1`.`gone`",
+            "DROP TABLE IF EXISTS `d1`.`col`",
+            "CREATE TABLE `col` (...) ENGINE=VIDEX",
+            "DROP TABLE IF EXISTS `d1`.`pk`",
+            "CREATE TABLE `pk` (...) ENGINE=VIDEX",
+            "DROP TABLE IF EXISTS `d1`.`Eng`",
+            "CREATE TABLE `eng` (...) ENGINE=VIDEX",
+            "CREATE TABLE `new` (...) ENGINE=VIDEX",
+            "ALTER TABLE `d1`.`idx` DROP INDEX `idx_a`, DROP INDEX `idx_b`, "
+            "ADD KEY `idx_a` (`a`,`b`), ADD KEY `idx_c` (`c`)",
+        ])
+        # CREATE TABLE runs in the target db, then the default db is restored
+        self.assertEqual(env.dbs, ['d1', 'videx'])
+
+        # nothing to do on the second run
+        env = FakeEnv(target)
+        res = sync_videx_db(env, 'd1', {t.name: t for t in target})
+        self.assertEqual(len(res['unchanged']), len(target))
+        self.assertEqual(env.batches, [])
+
+    def test_failed_statement_raised(self):
+        existing = [_table('a', 'id:int', {'PRIMARY': ['id']}), _table('b', 'id:int', {'PRIMARY': ['id']})]
+        target = [_table('a', 'id:bigint', {'PRIMARY': ['id']}), _table('b', 'id:bigint', {'PRIMARY': ['id']})]
+        env = FakeEnv(existing)
+        error = RuntimeError("CREATE failed")
+
+        def execute_batch(sql_list):
+            env.batches.append(list(sql_list))
+            raise error
+
+        env.execute_batch = execute_batch
+        with self.assertRaises(RuntimeError) as ctx:
+            sync_videx_db(env, 'd1', {t.name: t for t in target}, batch_size=2)
+        self.assertIs(ctx.exception, error)
+        # only the first table was dropped, its CREATE was sent next to the DROP
+        self.assertEqual(env.batches, [["DROP TABLE IF EXISTS `d1`.`a`", "CREATE TABLE `a` (...) ENGINE=VIDEX"]])
+        self.assertEqual(env.dbs, ['d1', 'videx'])
+
+    def test_table_without_columns_recreated(self):
+        env = FakeEnv([_table('t', 'id:int', {'PRIMARY': ['id']})])
+        target = _table('t', 'id:int', {'PRIMARY': ['id']})
+        target.columns = []
+        self.assertEqual(sync_videx_db(env, 'd1', {'t': target})['recreated'], ['t'])
+
+    def test_create_videx_env_multi_db(self):
+        target = {'d1': {'t': _table('t', 'id:int', {'PRIMARY': ['id']})}}
+        env = FakeEnv([])
+        create_videx_env_multi_db(env, target)
+        self.assertEqual(env.executed, ["DROP DATABASE IF EXISTS `d1`", "CREATE DATABASE `d1`"])
+        self.assertEqual(env.batches, [["CREATE TABLE `t` (...) ENGINE=VIDEX"]])
+
+        env = FakeEnv([])
+        res = create_videx_env_multi_db(env, target, sync=True)
+        self.assertEqual(res, {'d1': {'created': ['t'], 'dropped': [], 'recreated': [], 'altered': [],
+                                      'unchanged': []}})
+        self.assertEqual(env.executed, ["CREATE DATABASE IF NOT EXISTS `d1`"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from sub_platforms.sql_optimizer.videx import videx_histogram as optimizer_histogram
+from sub_platforms.sql_server.videx.videx_histogram import HistogramStats, HistogramBucket, compact_histogram, \
+    compact_hist_dict
+from sub_platforms.sql_server.videx.videx_metadata import construct_videx_task_meta_from_local_files
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton
+from sub_platforms.sql_server.videx.videx_utils import BTreeKeySide, load_json_from_file, join_path
+
+
+def _histogram(values, data_type: str = 'int', n_buckets: int = 64) -> HistogramStats:
+    hist = optimizer_histogram.generate_histogram_from_sample(pd.Series(values), data_type, n_buckets)
+    return HistogramStats.from_dict(hist.to_dict())
+
+
+def _cum_freqs(hist: HistogramStats, values) -> np.ndarray:
+    return np.array([hist.find_nearest_key_pos(str(v), BTreeKeySide.right) for v in values])
+
+
+class TestHistogramCompaction(unittest.TestCase):
+    def test_uniform_is_merged(self):
+        values = np.random.default_rng(0).integers(0, 100000, 100000)
+        hist = _histogram(values)
+        original = HistogramStats.from_dict(hist.to_dict())
+        res = compact_histogram(hist, epsilon=0.01)
+        self.assertEqual(res.buckets_before, 64)
+        self.assertLess(res.buckets_after, 8)
+        self.assertEqual(len(hist.buckets), res.buckets_after)
+        self.assertLessEqual(res.max_error, 0.01)
+        self.assertGreater(res.reduction, 0.8)
+
+        # estimates stay within epsilon (plus the width of one value)
+        probes = np.linspace(0, 100000, 1001).astype(int)
+        self.assertLess(np.max(np.abs(_cum_freqs(hist, probes) - _cum_freqs(original, probes))), 0.011)
+        self.assertAlmostEqual(hist.buckets[-1].cum_freq, original.buckets[-1].cum_freq)
+        self.assertEqual(sum(b.row_count for b in hist.buckets), sum(b.row_count for b in original.buckets))
+
+    def test_skew_is_kept(self):
+        rng = np.random.default_rng(0)
+        # half of the rows are in [0, 1000), the others in [1000, 100000)
+        values = np.concatenate([rng.integers(0, 1000, 50000), rng.integers(1000, 100000, 50000)])
+        hist = _histogram(values)
+        res = compact_histogram(hist, epsilon=0.01)
+        self.assertGreaterEqual(res.buckets_after, 2)
+        self.assertTrue(any(b.max_value < 1000 <= hist.buckets[i + 1].min_value + 1
+                            for i, b in enumerate(hist.buckets[:-1])))
+        # tighter epsilon keeps more buckets
+        self.assertGreater(compact_histogram(_histogram(values), epsilon=0.001).buckets_after, res.buckets_after)
+
+    def test_exact_buckets_are_kept(self):
+        singleton = _histogram([1, 2, 2, 3, 3, 3])
+        self.assertEqual(compact_histogram(singleton, epsilon=0.5).buckets_after, 3)
+
+        # 7 is a frequent value with its own bucket
+        hist = HistogramStats(buckets=[HistogramBucket(min_value=0, max_value=3, cum_freq=0.1, row_count=4),
+                                       HistogramBucket(min_value=4, max_value=6, cum_freq=0.2, row_count=3),
+                                       HistogramBucket(min_value=7, max_value=7, cum_freq=0.6, row_count=1),
+                                       HistogramBucket(min_value=8, max_value=10, cum_freq=0.8, row_count=3),
+                                       HistogramBucket(min_value=11, max_value=13, cum_freq=1, row_count=3)],
+                              data_type='int', histogram_type='equi-height')
+        self.assertAlmostEqual(hist.point_freq('7'), 0.4)
+        self.assertEqual(compact_histogram(hist, epsilon=0.5).buckets_after, 3)
+        self.assertEqual([(b.min_value, b.max_value) for b in hist.buckets], [(0, 6), (7, 7), (8, 13)])
+        self.assertAlmostEqual(hist.point_freq('7'), 0.4)
+
+    def test_strings_and_json(self):
+        hist = _histogram([f'v{i:05d}' for i in range(10000)], data_type='string')
+        hist_dict = {'c': hist.to_dict(), 'empty': None}
+        res = compact_hist_dict(hist_dict, epsilon=0.5)
+        self.assertLess(res.buckets_after, res.buckets_before)
+        self.assertEqual(len(hist_dict['c']['buckets']), res.buckets_after)
+        self.assertIsNone(hist_dict['empty'])
+        self.assertEqual(compact_hist_dict(hist_dict, epsilon=0).buckets_after, res.buckets_after)
+
+    def test_compact_at_ingest(self):
+        req_dict = load_json_from_file(join_path(__file__, 'data/videx_metadata_test_null_db.json'))
+        meta = construct_videx_task_meta_from_local_files(task_id='task1', videx_db='videx_test_null_db',
+                                                          stats_file=req_dict['stats_dict'],
+                                                          hist_file=req_dict['hist_dict'],
+                                                          ndv_single_file=req_dict['ndv_single_dict'],
+                                                          ndv_mulcol_file={}, raise_error=True)
+        singleton = VidexSingleton(hist_compact_epsilon=0.01)
+        singleton.add_task_meta(meta.to_dict())
+        stats = singleton.cache['task1'].db_tasks_stats.get_table_stats_info('videx_test_null_db', 'test_columns')
+        # id is uniform from 1 to 50
+        self.assertEqual(len(stats.histogram_dict['id'].buckets), 1)
+        self.assertLess(singleton.hist_compaction.buckets_after, singleton.hist_compaction.buckets_before)
+        self.assertLessEqual(singleton.hist_compaction.max_error, 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from sub_platforms.sql_optimizer.videx import videx_histogram as optimizer_histogram
+from sub_platforms.sql_server.videx.videx_histogram import HistogramStats, HistogramBucket, HistogramMCV
+from sub_platforms.sql_server.videx.videx_meta_bundle import write_meta_bundle, read_meta_bundle
+from sub_platforms.sql_server.videx.videx_utils import BTreeKeySide
+
+
+def _skewed_sample() -> pd.Series:
+    """1000 rows: 7 for 40%, 100 for 10%, 400 distinct values for 40%, 10% NULL"""
+    values = [7] * 400 + [100] * 100 + list(range(1000, 1400)) + [None] * 100
+    return pd.Series(values, dtype=object)
+
+
+def generate_histogram_from_sample(values: pd.Series, data_type: str, n_buckets: int,
+                                   n_mcv: int = 0) -> HistogramStats:
+    """histogram collected by the optimizer, as loaded by the statistic server"""
+    hist = optimizer_histogram.generate_histogram_from_sample(values, data_type, n_buckets, n_mcv=n_mcv)
+    return HistogramStats.from_dict(hist.to_dict())
+
+
+class FakeMCVEnv:
+    def __init__(self, rows):
+        self.rows = rows
+        self.sqls = []
+
+    def query_for_dicts(self, sql):
+        self.sqls.append(sql)
+        return self.rows
+
+
+class TestHistogramMCV(unittest.TestCase):
+    def test_singleton_point_freq(self):
+        hist = HistogramStats(buckets=[HistogramBucket(min_value=1, max_value=1, cum_freq=0.2, row_count=1),
+                                       HistogramBucket(min_value=3, max_value=3, cum_freq=0.5, row_count=1),
+                                       HistogramBucket(min_value=5, max_value=5, cum_freq=0.9, row_count=1)],
+                              data_type='int', histogram_type='singleton', null_values=0.1)
+        for value in ['1', '3', '5']:
+            expected = hist.find_nearest_key_pos(value, BTreeKeySide.right) - \
+                       hist.find_nearest_key_pos(value, BTreeKeySide.left)
+            self.assertAlmostEqual(hist.point_freq(value), expected)
+        self.assertAlmostEqual(hist.point_freq('NULL'), 0.1)
+        # not in the histogram, left to find_nearest_key_pos
+        self.assertIsNone(hist.point_freq('2'))
+
+    def test_mcv_from_sample(self):
+        hist = generate_histogram_from_sample(_skewed_sample(), 'int', n_buckets=8, n_mcv=2)
+        self.assertEqual(hist.histogram_type, 'equi-height')
+        self.assertEqual([(m.value, m.freq) for m in hist.mcvs], [(7, 0.4), (100, 0.1)])
+        self.assertAlmostEqual(hist.point_freq('7'), 0.4)
+        self.assertAlmostEqual(hist.point_freq('100'), 0.1)
+        self.assertIsNone(hist.point_freq('1001'))
+
+        # bucket interpolation spreads the MCV over the other values in its bucket
+        interpolated = hist.find_nearest_key_pos('100', BTreeKeySide.right) - \
+                       hist.find_nearest_key_pos('100', BTreeKeySide.left)
+        self.assertLess(interpolated, 0.1)
+
+        # mcvs survive serialization
+        restored = HistogramStats.from_dict(hist.to_dict())
+        self.assertAlmostEqual(restored.point_freq('7'), 0.4)
+        self.assertIsNone(generate_histogram_from_sample(_skewed_sample(), 'int', n_buckets=8).mcvs)
+
+    def test_string_mcv(self):
+        values = pd.Series(['a'] * 50 + [f'v{i:03d}' for i in range(50)])
+        hist = generate_histogram_from_sample(values, 'string', n_buckets=4, n_mcv=1)
+        self.assertEqual(hist.mcvs, [HistogramMCV(value='a', freq=0.5)])
+        self.assertAlmostEqual(hist.point_freq("'a'"), 0.5)
+
+    def test_point_freqs_rebuilt(self):
+        hist = generate_histogram_from_sample(_skewed_sample(), 'int', n_buckets=8)
+        self.assertIsNone(hist.point_freq('1001'))
+        hist.mcvs = [HistogramMCV(value=1001, freq=0.001)]
+        hist.build_point_freqs()
+        self.assertAlmostEqual(hist.point_freq('1001'), 0.001)
+
+    def test_meta_bundle_keeps_mcvs(self):
+        hist = generate_histogram_from_sample(_skewed_sample(), 'int', n_buckets=8, n_mcv=2).to_dict()
+        metadata = {'stats_dict': {'t1': {'TABLE_ROWS': 1000}}, 'hist_dict': {'t1': {'a': hist}},
+                    'ndv_single_dict': {'t1': {'a': 402}}, 'ndv_mulcol_dict': {}}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'meta.arrow')
+            write_meta_bundle(path, metadata)
+            res = read_meta_bundle(path)
+        self.assertEqual(res['hist_dict']['t1']['a']['mcvs'], hist['mcvs'])
+        self.assertTrue(np.isclose(HistogramStats.from_dict(res['hist_dict']['t1']['a']).point_freq('7'), 0.4))
+
+    def test_fetch_mcvs_with_table_rows(self):
+        env = FakeMCVEnv([{'value': '7', 'cnt': 400}, {'value': '100', 'cnt': 100}])
+        mcvs = optimizer_histogram.fetch_col_mcvs(env, 'db1', 't1', 'a', 2, 'int', total_rows=1000)
+        self.assertEqual([(mcv.value, mcv.freq) for mcv in mcvs], [(7, 0.4), (100, 0.1)])
+        # only the GROUP BY, the rows of the table are not counted again
+        self.assertEqual(len(env.sqls), 1)
+        self.assertIn('GROUP BY `a`', env.sqls[0])
+        # rows is an estimate
+        self.assertEqual(optimizer_histogram.fetch_col_mcvs(env, 'db1', 't1', 'a', 2, 'int', total_rows=200)[0].freq,
+                         1.0)
+        self.assertEqual(optimizer_histogram.fetch_col_mcvs(env, 'db1', 't1', 'a', 2, 'int', total_rows=0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
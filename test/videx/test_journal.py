@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sub_platforms.sql_optimizer.databases.mysql.mysql_command import MySQLVersion
+from sub_platforms.sql_optimizer.meta import Table, Column
+from sub_platforms.sql_optimizer.videx.videx_histogram import generate_fetch_histogram, HistogramStats
+from sub_platforms.sql_optimizer.videx.videx_journal import FetchJournal, JOURNAL_SECTION_HIST, \
+    JOURNAL_SECTION_NDV_SINGLE, JOURNAL_SECTION_STATS
+from sub_platforms.sql_optimizer.videx.videx_metadata import fetch_ndv_single
+from sub_platforms.sql_server.videx import videx_journal as server_journal
+from sub_platforms.sql_server.videx import videx_metadata as server_metadata
+
+
+def _hist(col_name) -> HistogramStats:
+    return HistogramStats.init_from_mysql_json({
+        'buckets': [[f'{col_name}_1', 0.5], [f'{col_name}_2', 1.0]],
+        'data-type': 'string', 'null-values': 0.0, 'collation-id': 8,
+        'last-updated': '2024-01-01 00:00:00.000000', 'sampling-rate': 1.0,
+        'histogram-type': 'singleton', 'number-of-buckets-specified': 2,
+    })
+
+
+class FakeEnv:
+    def __init__(self):
+        self.tables = {t: Table(name=t, db='db1', columns=[Column(name=c, table=t, db='db1', data_type='varchar')
+                                                            for c in ['a', 'b', 'c']])
+                       for t in ['t1', 't2']}
+        self.executed = []
+
+    def get_version(self):
+        return MySQLVersion.MySQL_8
+
+    def get_table_meta(self, db_name, table_name):
+        return self.tables[table_name.lower()]
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        if '`t2`' in sql and len(self.executed) > 4:
+            raise KeyboardInterrupt()
+        return [[3]]
+
+
+class TestFetchJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'meta.json.journal')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_replay(self):
+        journal = FetchJournal(self.path)
+        journal.record(JOURNAL_SECTION_STATS, None, {'t1': {'TABLE_ROWS': 10}})
+        journal.record(JOURNAL_SECTION_HIST, 'T1', {'x': 1}, column='a')
+        # killed while writing the next record
+        with open(self.path, 'a') as f:
+            f.write('{"section": "hist", "table": "t1", "col')
+
+        journal = FetchJournal(self.path, resume=True)
+        self.assertEqual(journal.get(JOURNAL_SECTION_STATS), {'t1': {'TABLE_ROWS': 10}})
+        self.assertEqual(journal.columns(JOURNAL_SECTION_HIST, 't1'), {'a': {'x': 1}})
+        self.assertFalse(journal.has(JOURNAL_SECTION_HIST, 't1'))
+        journal.record(JOURNAL_SECTION_HIST, 't1', None, column='b')
+        self.assertEqual(FetchJournal(self.path).columns(JOURNAL_SECTION_HIST, 't1'), {'a': {'x': 1}, 'b': None})
+
+        self.assertFalse(FetchJournal(self.path, resume=False).has(JOURNAL_SECTION_STATS))
+        self.assertFalse(os.path.exists(self.path))
+
+    @patch('sub_platforms.sql_optimizer.videx.videx_histogram.drop_histogram')
+    @patch('sub_platforms.sql_optimizer.videx.videx_histogram.fetch_col_histogram')
+    @patch('sub_platforms.sql_optimizer.videx.videx_histogram.target_env_available_for_videx', return_value=True)
+    def test_resume_histogram(self, _, mock_fetch, __):
+        env = FakeEnv()
+        fetched = []
+        failed = []
+
+        def fetch_fail_on_t2_b(env, dbname, table_name, col_name, *args, **kwargs):
+            if (table_name, col_name) == ('t2', 'b') and not failed:
+                failed.append(col_name)
+                raise TimeoutError("read timeout")
+            fetched.append((table_name, col_name))
+            return _hist(col_name)
+
+        mock_fetch.side_effect = fetch_fail_on_t2_b
+        with self.assertRaises(TimeoutError):
+            generate_fetch_histogram(env, 'db1', ['t1', 't2'], n_buckets=2, force=True, drop_hist_after_fetch=True,
+                                     hist_mem_size=None, ret_json=True, journal=FetchJournal(self.path))
+        self.assertEqual(len(fetched), 4)
+
+        res = generate_fetch_histogram(env, 'db1', ['t1', 't2'], n_buckets=2, force=True, drop_hist_after_fetch=True,
+                                       hist_mem_size=None, ret_json=False,
+                                       journal=FetchJournal(self.path, resume=True))
+        # only t2.b and t2.c are fetched again
+        self.assertEqual(fetched[4:], [('t2', 'b'), ('t2', 'c')])
+        self.assertEqual(sorted(res.keys()), ['t1', 't2'])
+        self.assertIsInstance(res['t1']['a'], HistogramStats)
+        self.assertEqual(res['t1']['a'].to_dict(), _hist('a').to_dict())
+
+    @patch('sub_platforms.sql_optimizer.videx.videx_metadata.target_env_available_for_videx', return_value=True)
+    def test_resume_ndv_single(self, _):
+        env = FakeEnv()
+        with self.assertRaises(KeyboardInterrupt):
+            fetch_ndv_single(env, 'db1', ['t1', 't2'], journal=FetchJournal(self.path))
+        journal = FetchJournal(self.path, resume=True)
+        self.assertEqual(journal.get(JOURNAL_SECTION_NDV_SINGLE, 't1'), {'a': 3, 'b': 3, 'c': 3})
+        self.assertFalse(journal.has(JOURNAL_SECTION_NDV_SINGLE, 't2'))
+
+        env.executed = []
+        res = fetch_ndv_single(env, 'db1', ['t1', 't2'], journal=journal)
+        self.assertEqual(dict(res), {'t1': {'a': 3, 'b': 3, 'c': 3}, 't2': {'a': 3, 'b': 3, 'c': 3}})
+        self.assertTrue(all('`t2`' in sql for sql in env.executed))
+
+    @patch('sub_platforms.sql_server.videx.videx_metadata.target_env_available_for_videx', return_value=True)
+    def test_resume_ndv_single_sql_server(self, _):
+        env = FakeEnv()
+        with self.assertRaises(KeyboardInterrupt):
+            server_metadata.fetch_ndv_single(env, 'db1', ['t1', 't2'], journal=server_journal.FetchJournal(self.path))
+        env.executed = []
+        res = server_metadata.fetch_ndv_single(env, 'db1', ['t1', 't2'],
+                                               journal=server_journal.FetchJournal(self.path, resume=True))
+        self.assertEqual(dict(res), {'t1': {'a': 3, 'b': 3, 'c': 3}, 't2': {'a': 3, 'b': 3, 'c': 3}})
+        self.assertTrue(all('`t2`' in sql for sql in env.executed))
+
+
+if __name__ == '__main__':
+    unittest.main()
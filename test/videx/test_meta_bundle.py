@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import copy
+import io
+import os
+import tempfile
+import unittest
+
+from sub_platforms.sql_server.videx import videx_service
+from sub_platforms.sql_server.videx.videx_meta_bundle import write_meta_bundle, read_meta_bundle, \
+    convert_json_to_meta_bundle, convert_meta_bundle_to_json, meta_bundle_sidecar_path
+from sub_platforms.sql_server.videx.videx_metadata import construct_videx_task_meta_from_local_files, \
+    EXTRA_INFO_KEY_pct_cached_method, PCT_CACHED_METHOD_ESTIMATE
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton
+from sub_platforms.sql_server.videx.videx_utils import load_json_from_file, join_path
+
+META_FILES = ['data/videx_metadata_test_null_db.json', 'data/videx_metadata_desc_index.json']
+
+
+def _scan_time_req(db, table):
+    return {"item_type": "videx_request",
+            "properties": {"dbname": db, "function": "virtual double ha_videx::scan_time()",
+                           "table_name": table, "target_storage_engine": "INNODB", "videx_options": "{}"},
+            "data": []}
+
+
+class TestMetaBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'meta.arrow')
+        # the global singleton of the app is replaced by test_construct_and_create_endpoint
+        self.origin_singleton = getattr(videx_service, 'videx_meta_singleton', None)
+
+    def tearDown(self):
+        videx_service.videx_meta_singleton = self.origin_singleton
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        for meta_file in META_FILES:
+            metadata = load_json_from_file(join_path(__file__, meta_file))
+            write_meta_bundle(self.path, metadata)
+            self.assertEqual(read_meta_bundle(self.path), metadata, meta_file)
+
+    def test_mixed_values_and_selected_tables(self):
+        metadata = load_json_from_file(join_path(__file__, META_FILES[0]))
+        t2 = copy.deepcopy(metadata)
+        # other table with a None histogram, a stats key only in t2 and mixed bucket values
+        t2['stats_dict']['test_columns']['only_t2'] = 3.5
+        t2['hist_dict']['test_columns']['id'] = None
+        t2['hist_dict']['test_columns']['c_mixed'] = {
+            'buckets': [{'min_value': 1, 'max_value': 'a', 'cum_freq': 0.5, 'row_count': 1, 'size': 1},
+                        {'min_value': 2.5, 'max_value': 2 ** 70, 'cum_freq': 1.0, 'row_count': 1, 'size': 1}],
+            'data_type': 'string', 'histogram_type': 'equi-height', 'null_values': 0.0, 'collation_id': 8,
+            'last_updated': '2024-01-01 00:00:00.000000', 'sampling_rate': 1.0, 'number_of_buckets_specified': 2}
+        for key in metadata:
+            if 'test_columns' in metadata[key]:
+                metadata[key]['t2'] = t2[key]['test_columns']
+
+        write_meta_bundle(self.path, metadata)
+        self.assertEqual(read_meta_bundle(self.path), metadata)
+
+        only_t2 = read_meta_bundle(self.path, tables=['T2'])
+        for key in metadata:
+            self.assertEqual(only_t2[key], {t: v for t, v in metadata[key].items() if t == 't2'}, key)
+        self.assertNotIn('only_t2', read_meta_bundle(self.path, tables=['test_columns'])['stats_dict']['test_columns'])
+
+    def test_uint64_values(self):
+        metadata = load_json_from_file(join_path(__file__, META_FILES[0]))
+        uint64_max = 2 ** 64 - 1
+        metadata['stats_dict']['test_columns']['AUTO_INCREMENT'] = uint64_max
+        hist = {'data_type': 'bigint', 'histogram_type': 'equi-height', 'null_values': 0.0, 'collation_id': 8,
+                'last_updated': '2024-01-01 00:00:00.000000', 'sampling_rate': 1.0, 'number_of_buckets_specified': 2}
+        metadata['hist_dict']['test_columns']['c_uint64'] = {**hist, 'buckets': [
+            {'min_value': 0, 'max_value': 2 ** 63 + 1, 'cum_freq': 0.5, 'row_count': 1, 'size': 1},
+            {'min_value': uint64_max - 1, 'max_value': uint64_max, 'cum_freq': 1.0, 'row_count': 1, 'size': 1}]}
+        metadata['hist_dict']['test_columns']['c_mixed_uint64'] = {**hist, 'buckets': [
+            {'min_value': 0.5, 'max_value': uint64_max, 'cum_freq': 1.0, 'row_count': 1, 'size': 1}]}
+
+        write_meta_bundle(self.path, metadata)
+        res = read_meta_bundle(self.path)
+        self.assertEqual(res, metadata)
+        self.assertIs(type(res['stats_dict']['test_columns']['AUTO_INCREMENT']), int)
+        for col in ['c_uint64', 'c_mixed_uint64']:
+            max_value = res['hist_dict']['test_columns'][col]['buckets'][-1]['max_value']
+            self.assertIs(type(max_value), int)
+            self.assertEqual(max_value, uint64_max)
+
+    def test_converters(self):
+        json_path = join_path(__file__, META_FILES[1])
+        convert_json_to_meta_bundle(json_path, self.path)
+        self.assertTrue(os.path.exists(meta_bundle_sidecar_path(self.path)))
+        out_path = os.path.join(self.tmp_dir.name, 'meta.json')
+        convert_meta_bundle_to_json(self.path, out_path)
+        self.assertEqual(load_json_from_file(out_path), load_json_from_file(json_path))
+
+    def test_construct_and_create_endpoint(self):
+        metadata = load_json_from_file(join_path(__file__, META_FILES[1]))
+        metadata['stats_dict']['simple_message']['pct_cached_method'] = PCT_CACHED_METHOD_ESTIMATE
+        write_meta_bundle(self.path, metadata)
+        from_json = construct_videx_task_meta_from_local_files(
+            task_id=None, videx_db='desc_index', stats_file=metadata['stats_dict'], hist_file=metadata['hist_dict'],
+            ndv_single_file=metadata['ndv_single_dict'], ndv_mulcol_file=metadata['ndv_mulcol_dict'],
+            raise_error=True)
+        from_bundle = construct_videx_task_meta_from_local_files(
+            task_id=None, videx_db='desc_index', stats_file=None, hist_file=None, ndv_single_file=None,
+            raise_error=True, meta_bundle_file=self.path)
+        self.assertEqual(from_bundle.to_dict(), from_json.to_dict())
+        self.assertEqual(from_bundle.get_table_stats_info('desc_index', 'simple_message')
+                         .extra_info[EXTRA_INFO_KEY_pct_cached_method], PCT_CACHED_METHOD_ESTIMATE)
+
+        expected = VidexSingleton()
+        expected.add_task_meta(from_json.to_dict())
+        videx_service.videx_meta_singleton = VidexSingleton()
+        with open(self.path, 'rb') as bundle, open(meta_bundle_sidecar_path(self.path), 'rb') as sidecar:
+            resp = videx_service.app.test_client().post('/create_task_meta_bundle', data={
+                'videx_db': 'desc_index', 'bundle': bundle, 'sidecar': sidecar})
+        self.assertEqual(resp.json['code'], 200)
+        table_stats_info = videx_service.videx_meta_singleton.non_task_cache.db_tasks_stats.get_table_stats_info(
+            'desc_index', 'simple_message')
+        self.assertEqual(table_stats_info.extra_info[EXTRA_INFO_KEY_pct_cached_method], PCT_CACHED_METHOD_ESTIMATE)
+        req = _scan_time_req('desc_index', 'simple_message')
+        self.assertEqual(videx_service.videx_meta_singleton.ask(req, raise_out=True),
+                         expected.ask(req, raise_out=True))
+
+    def test_create_endpoint_invalid(self):
+        write_meta_bundle(self.path, load_json_from_file(join_path(__file__, META_FILES[1])))
+        with open(self.path, 'rb') as f:
+            bundle = f.read()
+        with open(meta_bundle_sidecar_path(self.path), 'rb') as f:
+            sidecar = f.read()
+        cases = {
+            'corrupt bundle': ({}, b'not arrow', sidecar),
+            'corrupt sidecar': ({}, bundle, b'{'),
+            'invalid sample_file_info': ({'sample_file_info': '{'}, bundle, sidecar),
+            'unknown table': ({'tables': 'simple_message,no_such_table'}, bundle, sidecar),
+        }
+        client = videx_service.app.test_client()
+        for case, (form, bundle_bytes, sidecar_bytes) in cases.items():
+            with self.subTest(case):
+                resp = client.post('/create_task_meta_bundle', data={
+                    'videx_db': 'desc_index', **form,
+                    'bundle': (io.BytesIO(bundle_bytes), 'meta.arrow'),
+                    'sidecar': (io.BytesIO(sidecar_bytes), 'meta.arrow.json')})
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(resp.json['code'], 400)
+                self.assertIn('invalid task meta bundle', resp.json['message'])
+        self.assertIn('no_such_table', resp.json['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import gzip
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import requests
+
+from sub_platforms.sql_jsonfiles import start_videx_files
+from sub_platforms.sql_jsonfiles.metadata_store import MetadataStore
+from sub_platforms.sql_server.videx.videx_meta_getter import FilesServerMetaGetter
+from sub_platforms.sql_server.videx.videx_metadata import construct_videx_task_meta_from_local_files
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton
+from sub_platforms.sql_server.videx.videx_utils import load_json_from_file, join_path
+
+IP_PORT = '127.0.0.1:5002'
+
+
+class FakeResponse:
+    def __init__(self, flask_resp):
+        self.status_code = flask_resp.status_code
+        self.headers = flask_resp.headers
+        self.content = flask_resp.data
+        if self.headers.get('Content-Encoding') == 'gzip':
+            self.content = gzip.decompress(self.content)
+        self.text = self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakeSession:
+    """routes requests to the files server app"""
+
+    def __init__(self):
+        self.client = start_videx_files.app.test_client()
+        self.requests = []
+        self.statuses = []
+        self.down = False
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        if self.down:
+            raise requests.exceptions.ConnectionError("connection refused")
+        self.requests.append(headers)
+        resp = FakeResponse(self.client.get('/' + url.split('/', 3)[-1], query_string=params, headers=headers))
+        self.statuses.append(resp.status_code)
+        return resp
+
+
+class TestFilesServerMetaGetter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        start_videx_files.metadata_store = MetadataStore(os.path.join(self.tmp_dir.name, 'files'))
+        req_dict = load_json_from_file(join_path(__file__, 'data/videx_metadata_desc_index.json'))
+        meta = construct_videx_task_meta_from_local_files(task_id='build_task', videx_db='desc_index',
+                                                          stats_file=req_dict['stats_dict'],
+                                                          hist_file=req_dict['hist_dict'],
+                                                          ndv_single_file=req_dict['ndv_single_dict'],
+                                                          ndv_mulcol_file=req_dict['ndv_mulcol_dict'],
+                                                          raise_error=True)
+        self.meta_json = meta.to_json()
+        start_videx_files.metadata_store.save(IP_PORT, 'desc_index', self.meta_json)
+        self.getter = FilesServerMetaGetter(IP_PORT, cache_dir=os.path.join(self.tmp_dir.name, 'cache'))
+        self.session = FakeSession()
+        self.getter._local.session = self.session
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_disk_cache(self):
+        meta = self.getter.get_meta_by_task_id('desc_index')
+        self.assertEqual(meta.task_id, 'desc_index')
+        self.assertIsNotNone(meta.get_table_meta('desc_index', 'simple_message'))
+        self.assertNotIn('If-None-Match', self.session.requests[0])
+
+        # not modified: the etag is sent and the body is not transferred
+        self.assertEqual(self.getter.get_meta_by_task_id('desc_index').to_dict(), meta.to_dict())
+        self.assertIn('If-None-Match', self.session.requests[1])
+
+        # the files server is down: served from the disk cache
+        self.session.down = True
+        self.assertEqual(self.getter.get_meta_by_task_id('desc_index').to_dict(), meta.to_dict())
+        self.assertIsNone(self.getter.get_meta_by_task_id('unknown_db'))
+
+    def test_unchanged_republish(self):
+        meta = self.getter.get_meta_by_task_id('desc_index')
+        # the collector publishes the same metadata again, a second later
+        time.sleep(1.1)
+        start_videx_files.metadata_store.save(IP_PORT, 'desc_index', self.meta_json)
+        self.assertEqual(self.getter.get_meta_by_task_id('desc_index').to_dict(), meta.to_dict())
+        self.assertEqual(self.session.statuses, [200, 304])
+
+    def test_unknown_task(self):
+        self.assertIsNone(self.getter.get_meta_by_task_id('unknown_db'))
+
+    def test_pull_by_statistic_server(self):
+        singleton = VidexSingleton(load_meta_by_task_id_func=self.getter.get_meta_by_task_id)
+        req = {"item_type": "videx_request",
+               "properties": {"dbname": "desc_index", "function": "virtual double ha_videx::scan_time()",
+                              "table_name": "simple_message", "target_storage_engine": "INNODB",
+                              "videx_options": json.dumps({"task_id": "desc_index"})},
+               "data": []}
+        code, message, _ = singleton.ask(req, raise_out=True)
+        self.assertEqual(code, 200, message)
+        self.assertIn('desc_index', singleton.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
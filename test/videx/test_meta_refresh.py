@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import copy
+import unittest
+from unittest.mock import patch
+
+from sub_platforms.sql_optimizer.videx.videx_metadata import detect_changed_tables, MetaRefreshThresholds, \
+    refresh_meta_for_videx, fetch_table_change_brief
+from sub_platforms.sql_server.videx.videx_utils import load_json_from_file, join_path
+
+# 2024-01-01 00:00:00 UTC
+T0 = 1704067200
+
+
+def _bundle() -> dict:
+    """two tables copied from videx_metadata_test_null_db.json, updated at T0"""
+    req_dict = load_json_from_file(join_path(__file__, 'data/videx_metadata_test_null_db.json'))
+    bundle = {'stats_dict': {}, 'hist_dict': {}, 'ndv_single_dict': {}, 'ndv_mulcol_dict': {}}
+    for table in ['t1', 't2']:
+        for key in bundle:
+            if 'test_columns' in req_dict[key]:
+                bundle[key][table] = copy.deepcopy(req_dict[key]['test_columns'])
+        bundle['stats_dict'][table].update({'TABLE_NAME': table, 'TABLE_ROWS': 1000, 'DATA_LENGTH': 16384,
+                                            'UPDATE_TIME': T0})
+        for hist in bundle['hist_dict'][table].values():
+            hist['last_updated'] = '2024-01-01 00:00:00.000000'
+    return bundle
+
+
+def _brief(table, rows=1000, data_length=16384, update_time=T0) -> dict:
+    return {'TABLE_NAME': table, 'TABLE_ROWS': rows, 'DATA_LENGTH': data_length, 'UPDATE_TIME': update_time}
+
+
+class TestDetectChangedTables(unittest.TestCase):
+    def test_detect(self):
+        bundle = _bundle()
+        live = {'t1': _brief('t1'), 't2': _brief('t2'), 't3': _brief('t3')}
+        self.assertEqual(detect_changed_tables(bundle, live), {'t3': 'new'})
+
+        # UPDATE_TIME moves but the drift is small
+        live['t1'] = _brief('t1', rows=1050, update_time=T0 + 100)
+        self.assertNotIn('t1', detect_changed_tables(bundle, live))
+        live['t1'] = _brief('t1', rows=1200, update_time=T0 + 100)
+        self.assertTrue(detect_changed_tables(bundle, live)['t1'].startswith('rows drift'))
+
+        # rows change without UPDATE_TIME moving is the fluctuation of estimation
+        live['t1'] = _brief('t1', rows=1200)
+        self.assertNotIn('t1', detect_changed_tables(bundle, live))
+
+        live['t2'] = _brief('t2', data_length=65536, update_time=T0 + 100)
+        self.assertTrue(detect_changed_tables(bundle, live)['t2'].startswith('data_length drift'))
+        self.assertNotIn('t2', detect_changed_tables(bundle, live, MetaRefreshThresholds(data_length_ratio=5)))
+
+    def test_hist_stale(self):
+        bundle = _bundle()
+        live = {'t1': _brief('t1', update_time=T0 + 7200)}
+        self.assertEqual(detect_changed_tables(bundle, live), {})
+        thresholds = MetaRefreshThresholds(hist_stale_seconds=3600)
+        self.assertEqual(detect_changed_tables(bundle, live, thresholds), {'t1': 'histogram stale 7200s'})
+
+    def test_missing_hist(self):
+        bundle = _bundle()
+        del bundle['hist_dict']['t2']
+        self.assertEqual(detect_changed_tables(bundle, {'t2': _brief('t2')}), {'t2': 'missing'})
+
+
+class FakeBriefEnv:
+    def __init__(self, rows):
+        self.rows = rows
+        self.sqls = []
+
+    def query_for_dicts(self, sql):
+        self.sqls.append(sql)
+        return [dict(row) for row in self.rows]
+
+
+class TestRefreshMeta(unittest.TestCase):
+    @patch('sub_platforms.sql_optimizer.videx.videx_metadata.fetch_all_meta_for_videx')
+    @patch('sub_platforms.sql_optimizer.videx.videx_metadata.fetch_table_change_brief')
+    @patch('sub_platforms.sql_optimizer.videx.videx_metadata.target_env_available_for_videx', return_value=True)
+    def test_refresh_merges_changed_tables(self, _, mock_brief, mock_fetch):
+        prev = _bundle()
+        prev['stats_dict']['t_dropped'] = prev['stats_dict']['t2']
+        # t1 is heavily updated, t2 is untouched
+        mock_brief.return_value = {'t1': _brief('t1', rows=5000, update_time=T0 + 10), 't2': _brief('t2')}
+        new_t1 = _bundle()
+        new_t1['stats_dict']['t1']['TABLE_ROWS'] = 5000
+        mock_fetch.return_value = ({'t1': new_t1['stats_dict']['t1']}, {'t1': new_t1['hist_dict']['t1']},
+                                   {'t1': new_t1['ndv_single_dict']['t1']}, {})
+
+        metadata, changed = refresh_meta_for_videx(None, 'db1', prev)
+        self.assertEqual(list(changed.keys()), ['t1'])
+        self.assertEqual(mock_fetch.call_args[0][2], ['t1'])
+        self.assertEqual(metadata['stats_dict']['t1']['TABLE_ROWS'], 5000)
+        self.assertEqual(metadata['stats_dict']['t2'], prev['stats_dict']['t2'])
+        self.assertNotIn('t_dropped', metadata['stats_dict'])
+        # prev bundle is not modified
+        self.assertEqual(prev['stats_dict']['t1']['TABLE_ROWS'], 1000)
+
+        mock_fetch.reset_mock()
+        mock_brief.return_value = {'t1': _brief('t1'), 't2': _brief('t2')}
+        metadata, changed = refresh_meta_for_videx(None, 'db1', _bundle())
+        self.assertEqual(changed, {})
+        mock_fetch.assert_not_called()
+
+    @patch('sub_platforms.sql_optimizer.videx.videx_metadata.fetch_all_meta_for_videx')
+    @patch('sub_platforms.sql_optimizer.videx.videx_metadata.target_env_available_for_videx', return_value=True)
+    def test_brief_of_given_tables(self, _, mock_fetch):
+        env = FakeBriefEnv([{'TABLE_NAME': 'T1', 'TABLE_ROWS': 1000, 'DATA_LENGTH': 16384, 'UPDATE_TIME': T0}])
+        metadata, changed = refresh_meta_for_videx(env, 'db1', _bundle(), all_table_names=['T1'])
+        self.assertEqual(changed, {})
+        mock_fetch.assert_not_called()
+        # only the given tables are queried, UPDATE_TIME is converted to unix timestamp by the server
+        self.assertIn("AND TABLE_NAME IN ('T1')", env.sqls[0])
+        self.assertIn("UNIX_TIMESTAMP(UPDATE_TIME) AS UPDATE_TIME", env.sqls[0])
+
+        env = FakeBriefEnv([{'TABLE_NAME': 't1', 'TABLE_ROWS': 1, 'DATA_LENGTH': 1, 'UPDATE_TIME': None}])
+        self.assertEqual(fetch_table_change_brief(env, 'db1')['t1']['UPDATE_TIME'], None)
+        self.assertNotIn('TABLE_NAME IN', env.sqls[0])
+        fetch_table_change_brief(env, 'db1', ["it's"])
+        self.assertIn("TABLE_NAME IN ('it''s')", env.sqls[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
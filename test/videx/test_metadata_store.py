@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import gzip
+import json
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from sub_platforms.sql_jsonfiles import start_videx_files
+from sub_platforms.sql_jsonfiles.metadata_store import MetadataStore, MANIFEST_FILE, LEGACY_MIGRATED_SUFFIX
+
+IP_PORT = '127.0.0.1:5002'
+
+
+def _metadata(tables, task_id='t') -> dict:
+    return {'task_id': task_id,
+            'meta_dict': {'db1': {t: {'name': t, 'ddl': f'CREATE TABLE {t} (a int)'} for t in tables}},
+            'stats_dict': {'db1': {t: {'table_name': t, 'num_of_rows': i} for i, t in enumerate(tables)}},
+            'db_config': {'innodb_page_size': 16384}}
+
+
+def _full_stats(table) -> dict:
+    return {'db_name': 'db1', 'table_name': table, 'num_of_rows': 10, 'ndv_dict': {'a': 3},
+            'histogram_dict': {'a': {'buckets': []}}, 'extra_info': {'mulcol': {'idx_a': {'a': 3}}, 'pct_cached': {}}}
+
+
+class TestMetadataStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = MetadataStore(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_save_and_load(self):
+        self.assertIsNone(self.store.load(IP_PORT, 'db1'))
+        self.store.save(IP_PORT, 'db1', _metadata(['t1', 't2']))
+        # a json string (as sent by save_metadata_to_file) is accepted as well
+        written = self.store.save(IP_PORT, 'db1', json.dumps(_metadata(['t3'], task_id='t_new')))
+        self.assertEqual(len(written), 3)
+
+        res = self.store.load(IP_PORT, 'db1')
+        self.assertEqual(sorted(res['meta_dict']['db1'].keys()), ['t1', 't2', 't3'])
+        self.assertEqual(res['stats_dict']['db1']['t2'], {'table_name': 't2', 'num_of_rows': 1})
+        self.assertEqual(res['task_id'], 't_new')
+        self.assertEqual(res['db_config'], {'innodb_page_size': 16384})
+
+        with self.assertRaises(ValueError):
+            self.store.save(IP_PORT, 'db1', [1, 2])
+
+    def test_concurrent_saves(self):
+        tables = [f't{i}' for i in range(32)]
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda t: self.store.save(IP_PORT, 'db1', _metadata([t])), tables))
+        res = self.store.load(IP_PORT, 'db1')
+        self.assertEqual(sorted(res['meta_dict']['db1'].keys()), sorted(tables))
+        self.assertEqual(sorted(res['stats_dict']['db1'].keys()), sorted(tables))
+
+    def test_names_stay_in_store(self):
+        self.store.save(IP_PORT, '..', _metadata(['../../x']))
+        db_dir = self.store.db_dir(IP_PORT, '..')
+        self.assertTrue(os.path.abspath(db_dir).startswith(os.path.abspath(self.tmp_dir.name)))
+        self.assertEqual(list(self.store.load(IP_PORT, '..')['meta_dict']['db1'].keys()), ['../../x'])
+        for dir_path, _, files in os.walk(self.tmp_dir.name):
+            self.assertTrue(os.path.abspath(dir_path).startswith(os.path.abspath(self.tmp_dir.name)))
+
+    def test_migrate_legacy_file(self):
+        with open(self.store.legacy_file(IP_PORT, 'db1'), 'w') as f:
+            json.dump(json.dumps(_metadata(['t1'])), f)
+        self.assertTrue(self.store.exists(IP_PORT, 'db1'))
+        self.assertEqual(self.store.load(IP_PORT, 'db1'), _metadata(['t1']))
+        self.assertTrue(os.path.exists(os.path.join(self.store.db_dir(IP_PORT, 'db1'), MANIFEST_FILE)))
+        legacy_file = self.store.legacy_file(IP_PORT, 'db1')
+        self.assertFalse(os.path.exists(legacy_file))
+        self.assertTrue(os.path.exists(legacy_file + LEGACY_MIGRATED_SUFFIX))
+
+    def test_migrate_legacy_once(self):
+        with open(self.store.legacy_file(IP_PORT, 'db1'), 'w') as f:
+            json.dump(_metadata(['t1']), f)
+        updated = _metadata(['t1'], task_id='new')
+        updated['stats_dict']['db1']['t1']['num_of_rows'] = 100
+        locked = self.store._locked
+        entered = []
+
+        def locked_after_other_save(db_dir, exclusive):
+            # another writer migrates and saves newer tables while this one is waiting for the lock
+            if not entered:
+                entered.append(db_dir)
+                self.store.save(IP_PORT, 'db1', updated)
+            return locked(db_dir, exclusive)
+
+        self.store._locked = locked_after_other_save
+        self.store.load(IP_PORT, 'db1')
+        self.assertEqual(self.store.load(IP_PORT, 'db1'), updated)
+
+    def test_select_tables_and_sections(self):
+        metadata = _metadata(['t1', 'T2'])
+        metadata['stats_dict']['db1'] = {'t1': _full_stats('t1'), 'T2': _full_stats('T2')}
+        self.store.save(IP_PORT, 'db1', metadata)
+
+        res = self.store.load(IP_PORT, 'db1', tables=['t2'])
+        self.assertEqual(list(res['meta_dict']['db1'].keys()), ['T2'])
+        self.assertEqual(res['stats_dict']['db1']['T2'], _full_stats('T2'))
+
+        res = self.store.load(IP_PORT, 'db1', sections=['hist', 'mulcol'])
+        self.assertEqual(res['meta_dict'], {})
+        self.assertEqual(res['stats_dict']['db1']['t1'],
+                         {'db_name': 'db1', 'table_name': 't1', 'histogram_dict': {'a': {'buckets': []}},
+                          'extra_info': {'mulcol': {'idx_a': {'a': 3}}}})
+        res = self.store.load(IP_PORT, 'db1', sections=['stats'])
+        self.assertEqual(res['stats_dict']['db1']['t1'],
+                         {'db_name': 'db1', 'table_name': 't1', 'num_of_rows': 10, 'extra_info': {'pct_cached': {}}})
+        # cached objects are not modified by projection
+        self.assertEqual(self.store.load(IP_PORT, 'db1')['stats_dict']['db1']['t1'], _full_stats('t1'))
+        with self.assertRaises(ValueError):
+            self.store.load(IP_PORT, 'db1', sections=['histogram'])
+
+    def test_etag_and_cache(self):
+        self.store.save(IP_PORT, 'db1', _metadata(['t1', 't2']))
+        res, etag = self.store.load_with_etag(IP_PORT, 'db1', tables=['t1'])
+        self.assertEqual(etag, self.store.etag(IP_PORT, 'db1', tables=['t1']))
+        etag_t2 = self.store.etag(IP_PORT, 'db1', tables=['t2'])
+        self.assertNotEqual(etag, self.store.etag(IP_PORT, 'db1', tables=['t1'], sections=['meta']))
+
+        # saving t2 changes neither the etag nor the (cached) objects of t1
+        self.store.save(IP_PORT, 'db1', {'meta_dict': {'db1': {'t2': {'name': 't2', 'ddl': 'new'}}}})
+        self.assertEqual(self.store.etag(IP_PORT, 'db1', tables=['t1']), etag)
+        self.assertIs(self.store.load(IP_PORT, 'db1', tables=['t1'])['meta_dict']['db1']['t1'],
+                      res['meta_dict']['db1']['t1'])
+        self.assertNotEqual(self.store.etag(IP_PORT, 'db1', tables=['t2']), etag_t2)
+        self.assertEqual(self.store.load(IP_PORT, 'db1', tables=['t2'])['meta_dict']['db1']['t2']['ddl'], 'new')
+
+    def test_etag_of_identical_saves(self):
+        self.store.save(IP_PORT, 'db1', _metadata(['t1', 't2']))
+        etag = self.store.etag(IP_PORT, 'db1')
+        etag_t1 = self.store.etag(IP_PORT, 'db1', tables=['t1'])
+        # the gzip header holds a timestamp, make sure a later save can not embed another one
+        time.sleep(1.1)
+        self.store.save(IP_PORT, 'db1', _metadata(['t1', 't2']))
+        self.assertEqual(self.store.etag(IP_PORT, 'db1'), etag)
+        self.assertEqual(self.store.etag(IP_PORT, 'db1', tables=['t1']), etag_t1)
+        self.store.save(IP_PORT, 'db1', _metadata(['t1', 't2'], task_id='t_new'))
+        self.assertNotEqual(self.store.etag(IP_PORT, 'db1'), etag)
+        self.assertNotEqual(self.store.etag(IP_PORT, 'db1', tables=['t1']), etag_t1)
+
+    def test_replace_tables(self):
+        self.store.save(IP_PORT, 'db1', _metadata(['t1', 't2', 't3']))
+        # an upsert keeps the tables absent from the upload
+        self.store.save(IP_PORT, 'db1', _metadata(['t1']))
+        self.assertEqual(sorted(self.store.load(IP_PORT, 'db1')['stats_dict']['db1'].keys()), ['t1', 't2', 't3'])
+
+        # a full upload deletes them, t3 was dropped from the source database
+        written = self.store.save(IP_PORT, 'db1', _metadata(['t1', 't2']), replace_tables=True)
+        res = self.store.load(IP_PORT, 'db1')
+        self.assertEqual(sorted(res['meta_dict']['db1'].keys()), ['t1', 't2'])
+        self.assertEqual(sorted(res['stats_dict']['db1'].keys()), ['t1', 't2'])
+        self.assertFalse(any('t3' in path for path in written))
+        db_dir = self.store.db_dir(IP_PORT, 'db1')
+        self.assertFalse(os.path.exists(os.path.join(db_dir, 'meta_dict', 'db1', 't3.json.gz')))
+
+        self.store.save(IP_PORT, 'db1', {'meta_dict': {}, 'stats_dict': {}}, replace_tables=True)
+        res = self.store.load(IP_PORT, 'db1')
+        self.assertEqual((res['meta_dict'], res['stats_dict']), ({}, {}))
+        self.assertEqual(res['task_id'], 't')
+
+    def test_not_modified_after_identical_upload(self):
+        start_videx_files.metadata_store = self.store
+        client = start_videx_files.app.test_client()
+        params = {'db_name': 'db1', 'files_server_ip_port': IP_PORT}
+        client.post('/save_metadata', query_string=params, json=_metadata(['t1', 't2']))
+        etag = client.get('/get_metadata', query_string=params).headers['ETag']
+        # a collector publishing the same metadata again, a second later
+        time.sleep(1.1)
+        self.assertEqual(client.post('/save_metadata', query_string=params, json=_metadata(['t1', 't2'])).status_code,
+                         200)
+        resp = client.get('/get_metadata', query_string=params, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], etag)
+
+    def test_endpoints(self):
+        start_videx_files.metadata_store = self.store
+        client = start_videx_files.app.test_client()
+        params = {'db_name': 'db1', 'files_server_ip_port': IP_PORT}
+        self.assertEqual(client.get('/get_metadata', query_string=params).status_code, 404)
+        for tables in [['t1'], ['t2']]:
+            resp = client.post('/save_metadata', query_string=params, json=json.dumps(_metadata(tables)))
+            self.assertEqual(resp.status_code, 200)
+        resp = client.get('/get_metadata', query_string=params)
+        self.assertEqual(sorted(json.loads(resp.data)['meta_dict']['db1'].keys()), ['t1', 't2'])
+
+        params.update({'tables': 't2', 'sections': 'meta'})
+        resp = client.get('/get_metadata', query_string=params, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        res = json.loads(gzip.decompress(resp.data))
+        self.assertEqual(list(res['meta_dict']['db1'].keys()), ['t2'])
+        self.assertEqual(res['stats_dict'], {})
+
+        etag = resp.headers['ETag']
+        resp = client.get('/get_metadata', query_string=params, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        client.post('/save_metadata', query_string=params, json=_metadata(['t2'], task_id='t_new'))
+        self.assertEqual(client.get('/get_metadata', query_string=params,
+                                    headers={'If-None-Match': etag}).status_code, 200)
+        # a full upload without t1
+        del params['tables'], params['sections']
+        client.post('/save_metadata', query_string={**params, 'replace': 'true'}, json=_metadata(['t2']))
+        resp = client.get('/get_metadata', query_string=params)
+        self.assertEqual(list(json.loads(resp.data)['meta_dict']['db1'].keys()), ['t2'])
+        params['sections'] = 'histogram'
+        self.assertEqual(client.get('/get_metadata', query_string=params).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import unittest
+from typing import List
+
+from sub_platforms.sql_optimizer.videx import videx_mysql_utils as optimizer_mysql_utils
+from sub_platforms.sql_server.videx import videx_mysql_utils as server_mysql_utils
+
+
+class FakeCursor:
+    def __init__(self, con: 'FakeConnection'):
+        self.con = con
+        self.rowcount = 1
+
+    def execute(self, sql, params=None):
+        self.con.sqls.append(sql)
+
+    def fetchall(self):
+        return ((self.con.database,),)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeConnection:
+    """DB-API connection that answers every query with its database"""
+    OperationalError = InterfaceError = InternalError = RuntimeError
+    threadsafety = 1
+
+    def __init__(self, database: str, opened: List['FakeConnection']):
+        self.database = database
+        self.sqls = []
+        self.closed = False
+        opened.append(self)
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def fake_mysql_utils(module, database: str, max_db_pools: int):
+    class FakeMySQLUtils(module.AbstractMySQLUtils):
+        def __init__(self):
+            super().__init__('fake', database, 'utf8', max_db_pools=max_db_pools)
+            self.opened: List[FakeConnection] = []
+
+        def get_connection(self, database: str = None):
+            return FakeConnection(database if database is not None else self.database, self.opened)
+
+    return FakeMySQLUtils()
+
+
+class TestMySQLPools(unittest.TestCase):
+    def test_switch_db_keeps_pools(self):
+        for module in [server_mysql_utils, optimizer_mysql_utils]:
+            with self.subTest(module=module.__name__):
+                util = fake_mysql_utils(module, 'd1', max_db_pools=4)
+                for _ in range(3):
+                    for db in ['d1', 'd2', 'd3']:
+                        util.switch_db(db)
+                        self.assertEqual(util.execute_query('select database()'), ((db,),))
+                # one connection per database, reused across switches
+                self.assertEqual(sorted(c.database for c in util.opened), ['d1', 'd2', 'd3'])
+                self.assertFalse(any(c.closed for c in util.opened))
+                self.assertEqual(list(util.db_pools), ['d1', 'd2', 'd3'])
+                util.destory()
+                self.assertTrue(all(c.closed for c in util.opened))
+                self.assertEqual(len(util.db_pools), 0)
+
+    def test_max_db_pools(self):
+        util = fake_mysql_utils(server_mysql_utils, 'd1', max_db_pools=2)
+        for db in ['d1', 'd2', 'd1', 'd3']:
+            util.switch_db(db)
+            util.execute_query('select 1')
+        # d2 is the least recently used
+        self.assertEqual(list(util.db_pools), ['d1', 'd3'])
+        self.assertEqual({c.database: c.closed for c in util.opened}, {'d1': False, 'd2': True, 'd3': False})
+
+        util.switch_db('d2')
+        self.assertEqual(util.execute_query('select database()'), (('d2',),))
+        self.assertEqual(list(util.db_pools), ['d3', 'd2'])
+
+    def test_reconstruct_pool(self):
+        util = fake_mysql_utils(server_mysql_utils, 'd1', max_db_pools=4)
+        util.execute_query('select 1')
+        util.switch_db('d2')
+        util.execute_query('select 1')
+        util.reconstruct_pool()
+        # only the connections of d2 are renewed
+        self.assertEqual([(c.database, c.closed) for c in util.opened], [('d1', False), ('d2', True), ('d2', False)])
+        self.assertEqual(util.execute_query('select database()'), (('d2',),))
+        self.assertEqual(util.pool_type, 'PooledDB')
+
+    def test_persistent_pool(self):
+        util = fake_mysql_utils(server_mysql_utils, 'd1', max_db_pools=4)
+        util.get_persistent_pool()
+        util.switch_db('d2')
+        self.assertEqual(util.execute_query('select database()'), (('d2',),))
+        self.assertEqual(util.pool_type, 'PersistentDB')
+        self.assertEqual(type(util.db_pools['d2']), type(util.db_pools['d1']))
+
+
+if __name__ == '__main__':
+    unittest.main()
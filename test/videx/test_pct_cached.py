@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import unittest
+
+import pandas as pd
+
+from sub_platforms.sql_optimizer.videx.videx_metadata import fetch_pct_cached, PCT_CACHED_METHOD_EXACT, \
+    PCT_CACHED_METHOD_TIMEBOXED, PCT_CACHED_METHOD_ESTIMATE, PCT_CACHED_METHOD_DEFAULT
+
+
+class FakePctCachedEnv:
+    """answers the pct_cached queries, INNODB_BUFFER_PAGE fails if buffer_page_timeout"""
+
+    def __init__(self, buffer_page_timeout=False):
+        self.buffer_page_timeout = buffer_page_timeout
+        self.sqls = []
+
+    def query_for_dataframe(self, sql, params=None):
+        self.sqls.append(sql)
+        if 'INNODB_BUFFER_PAGE\n' in sql:
+            if self.buffer_page_timeout:
+                raise Exception("(3024, 'Query execution was interrupted, maximum statement execution time exceeded')")
+            return pd.DataFrame([['db1', 't1', 'PRIMARY', 'INDEX', 80, 100, 0.8, 0.5],
+                                 ['db1', 't1', 'idx_a', 'INDEX_NOSTATS', 0, 100, None, 0]],
+                                columns=['db_name', 'table_name', 'index_name', 'page_type', 'pool_rows',
+                                         'total_rows', 'pct_cached', 'page_pct_cached'])
+        if 'INNODB_BUFFER_POOL_STATS' in sql:
+            return pd.DataFrame([[250]], columns=['pool_pages'])
+        if 'SUM(clustered_index_size' in sql:
+            return pd.DataFrame([[1000]], columns=['total_pages'])
+        if 'innodb_index_stats' in sql:
+            return pd.DataFrame([['t1', 'PRIMARY', 100], ['t1', 'idx_a', 100]],
+                                columns=['table_name', 'index_name', 'total_rows'])
+        raise ValueError(sql)
+
+    def query_for_rows(self, sql, params=None):
+        df = self.query_for_dataframe(sql, params)
+        return [tuple(None if pd.isna(v) else v for v in row) for row in df.itertuples(index=False, name=None)]
+
+    def query_for_dicts(self, sql, params=None):
+        df = self.query_for_dataframe(sql, params)
+        return [{k: None if pd.isna(v) else v for k, v in row.items()} for row in df.to_dict(orient='records')]
+
+
+class TestFetchPctCached(unittest.TestCase):
+    def test_exact(self):
+        env = FakePctCachedEnv()
+        res, method = fetch_pct_cached(env, 'db1', PCT_CACHED_METHOD_EXACT)
+        self.assertEqual(method, PCT_CACHED_METHOD_EXACT)
+        self.assertEqual(res['t1']['PRIMARY'], {'page_type': 'INDEX', 'pct_cached': 0.8, 'pool_rows': 80.})
+        self.assertEqual(res['t1']['idx_a']['pct_cached'], 0)
+        self.assertNotIn('MAX_EXECUTION_TIME', env.sqls[0])
+
+    def test_timeboxed(self):
+        env = FakePctCachedEnv()
+        res, method = fetch_pct_cached(env, 'db1', PCT_CACHED_METHOD_TIMEBOXED, timeout_ms=500)
+        self.assertEqual(method, PCT_CACHED_METHOD_TIMEBOXED)
+        self.assertIn('SELECT /*+ MAX_EXECUTION_TIME(500) */', env.sqls[0])
+        self.assertEqual(res['t1']['PRIMARY']['pct_cached'], 0.8)
+
+        res, method = fetch_pct_cached(FakePctCachedEnv(buffer_page_timeout=True), 'db1',
+                                       PCT_CACHED_METHOD_TIMEBOXED, timeout_ms=500)
+        self.assertEqual(method, PCT_CACHED_METHOD_DEFAULT)
+        self.assertEqual(res, {})
+
+    def test_estimate(self):
+        env = FakePctCachedEnv()
+        res, method = fetch_pct_cached(env, 'db1', PCT_CACHED_METHOD_ESTIMATE)
+        self.assertEqual(method, PCT_CACHED_METHOD_ESTIMATE)
+        # 250 pages in pool over 1000 index pages
+        self.assertEqual(res['t1']['PRIMARY'], {'page_type': 'INDEX', 'pct_cached': 0.25, 'pool_rows': 25.})
+        self.assertEqual(set(res['t1'].keys()), {'PRIMARY', 'idx_a'})
+        self.assertFalse(any('INNODB_BUFFER_PAGE\n' in sql for sql in env.sqls))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            fetch_pct_cached(FakePctCachedEnv(), 'db1', 'full_scan')
+
+
+if __name__ == '__main__':
+    unittest.main()
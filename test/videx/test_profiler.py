@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from sub_platforms.sql_server.videx import videx_service
+from sub_platforms.sql_server.videx.videx_profiler import PhaseTimer, RequestProfiler, PHASE_TASK_LOOKUP, \
+    PHASE_EXPECT_RESPONSE, PHASE_MODEL_BUILD, PHASE_ESTIMATE, PHASE_SERIALIZATION
+from test.videx.test_replay import _singleton, _eq_req, REQUESTS
+
+ALL_PHASES = [PHASE_TASK_LOOKUP, PHASE_EXPECT_RESPONSE, PHASE_MODEL_BUILD, PHASE_ESTIMATE, PHASE_SERIALIZATION]
+
+
+def _work():
+    return sum(i * i for i in range(1000))
+
+
+class TestPhaseTimer(unittest.TestCase):
+    def test_laps(self):
+        timer = PhaseTimer()
+        time.sleep(0.01)
+        timer.lap('a')
+        timer.lap('b')
+        timer.lap('a')
+        self.assertEqual(list(timer.phases), ['a', 'b'])
+        self.assertGreaterEqual(timer.phases['a'], 0.01)
+        header = timer.to_server_timing()
+        self.assertRegex(header, r'^a;dur=\d+\.\d{3}, b;dur=\d+\.\d{3}$')
+
+    def test_ask_phases(self):
+        singleton = _singleton()
+        timer = PhaseTimer()
+        code, _, resp = singleton.ask(_eq_req("'A'"), timer=timer)
+        self.assertEqual(code, 200)
+        # serialization is timed by /ask_videx, see TestProfileEndpoint
+        self.assertEqual(list(timer.phases), ALL_PHASES[:-1])
+
+    def test_skip(self):
+        timer = PhaseTimer()
+        timer.lap('a')
+        time.sleep(0.02)
+        timer.skip()
+        timer.lap('b')
+        self.assertLess(timer.phases['b'], 0.02)
+
+
+class TestRequestProfiler(unittest.TestCase):
+    def _run(self, profiler: RequestProfiler, n: int):
+        for _ in range(n):
+            profile = profiler.begin()
+            _work()
+            profiler.end(profile)
+
+    def test_n_requests(self):
+        profiler = RequestProfiler()
+        self._run(profiler, 3)
+        self.assertEqual(profiler.report()['profiled'], 0)
+
+        profiler.start(n_requests=4, sample_every=2)
+        self._run(profiler, 20)
+        report = profiler.report()
+        self.assertFalse(report['active'])
+        self.assertEqual(report['profiled'], 4)
+        self.assertEqual(profiler.seen, 7)
+        work = next(f for f in report['functions'] if f['func'].endswith('(_work)'))
+        self.assertEqual(work['ncalls'], 4)
+        self.assertEqual(len(profiler.report(top=1)['functions']), 1)
+
+    def test_seconds_and_output_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            profiler = RequestProfiler(output_dir=tmp_dir)
+            output_file = os.path.join(tmp_dir, 'profile.pstats')
+            profiler.start(seconds=0.05, output_file='profile.pstats')
+            self._run(profiler, 5)
+            self.assertTrue(profiler.report()['active'])
+            time.sleep(0.06)
+            self._run(profiler, 1)
+            report = profiler.report()
+            self.assertFalse(report['active'])
+            self.assertEqual(report['profiled'], 5)
+            stats = pstats.Stats(output_file)
+            self.assertTrue(any(name == '_work' for _, _, name in stats.stats))
+
+    def test_dump_failure(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            profiler = RequestProfiler(output_dir=tmp_dir)
+            profiler.start(n_requests=1, output_file='profile.pstats')
+            # the output dir is gone before the profile is dumped
+            os.rmdir(tmp_dir)
+            with self.assertLogs(level='ERROR'):
+                self._run(profiler, 1)
+            self.assertFalse(profiler.active)
+            self.assertEqual(profiler.report()['profiled'], 1)
+            os.mkdir(tmp_dir)
+
+    def test_output_file_in_output_dir(self):
+        with self.assertRaises(ValueError):
+            RequestProfiler().start(output_file='profile.pstats')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            profiler = RequestProfiler(output_dir=tmp_dir)
+            for output_file in ['/tmp/profile.pstats', '../profile.pstats', 'a/../../profile.pstats', '..']:
+                with self.subTest(output_file=output_file):
+                    with self.assertRaises(ValueError):
+                        profiler.start(output_file=output_file)
+                    self.assertFalse(profiler.active)
+            self.assertEqual(profiler.resolve_output_file('p.pstats'), os.path.join(tmp_dir, 'p.pstats'))
+
+    def test_stop(self):
+        profiler = RequestProfiler()
+        profiler.start()
+        self._run(profiler, 2)
+        profiler.stop()
+        self._run(profiler, 2)
+        self.assertEqual(profiler.report()['profiled'], 2)
+
+
+class TestProfileEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.origin_singleton = getattr(videx_service, 'videx_meta_singleton', None)
+        videx_service.videx_meta_singleton = _singleton()
+        self.client = videx_service.app.test_client()
+
+    def tearDown(self):
+        videx_service.videx_meta_singleton = self.origin_singleton
+
+    def test_timing_header(self):
+        resp = self.client.post('/ask_videx', json=REQUESTS[2])
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('Server-Timing', resp.headers)
+
+        resp = self.client.post('/ask_videx', json=REQUESTS[2], headers={'X-Videx-Timing': '1'})
+        self.assertEqual(resp.json['data'], {'value': '5'})
+        phases = [p.split(';')[0] for p in resp.headers['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ALL_PHASES)
+
+        videx_service.videx_meta_singleton.timing_header = True
+        self.assertIn('Server-Timing', self.client.post('/ask_videx', json=REQUESTS[0]).headers)
+
+    def test_profile(self):
+        resp = self.client.post('/admin/profile', json={'n_requests': 3})
+        self.assertTrue(resp.json['data']['active'])
+        for req in REQUESTS:
+            self.assertEqual(self.client.post('/ask_videx', json=req).status_code, 200)
+        report = self.client.get('/admin/profile?top=50&sort=tottime').json['data']
+        self.assertFalse(report['active'])
+        self.assertEqual(report['profiled'] + report['skipped'], 3)
+        if report['profiled']:
+            self.assertLessEqual(len(report['functions']), 50)
+            tottimes = [f['tottime'] for f in report['functions']]
+            self.assertEqual(tottimes, sorted(tottimes, reverse=True))
+
+        self.client.post('/admin/profile', json={})
+        resp = self.client.post('/admin/profile', json={'stop': True})
+        self.assertFalse(resp.json['data']['active'])
+
+    def test_profile_output_file(self):
+        # no profile directory: clients can not write files
+        resp = self.client.post('/admin/profile', json={'output_file': '/tmp/videx_profile.pstats'})
+        self.assertEqual(resp.json['code'], 400)
+        self.assertFalse(videx_service.videx_meta_singleton.profiler.active)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            videx_service.videx_meta_singleton.profiler.output_dir = tmp_dir
+            resp = self.client.post('/admin/profile', json={'output_file': '../videx_profile.pstats'})
+            self.assertEqual(resp.json['code'], 400)
+            resp = self.client.post('/admin/profile', json={'n_requests': 1, 'output_file': 'p.pstats'})
+            self.assertEqual(resp.json['data']['output_file'], os.path.join(tmp_dir, 'p.pstats'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import unittest
+from typing import List
+
+from pymysql.cursors import SSCursor
+
+from sub_platforms.sql_optimizer.videx import videx_mysql_utils as optimizer_mysql_utils
+from sub_platforms.sql_server.videx import videx_mysql_utils as server_mysql_utils
+
+ROWS = [(1, 'a'), (2, 'b'), (3, None), (4, 'd'), (5, 'e')]
+
+
+class FakeCursor:
+    def __init__(self, con: 'FakeConnection', cursor_class=None):
+        self.con = con
+        self.cursor_class = cursor_class
+        self.rowcount = len(ROWS)
+        self.description = (('id', 3), ('name', 253))
+        self.pos = 0
+        self.closed = False
+        con.cursors.append(self)
+
+    def execute(self, sql, params=None):
+        self.con.sqls.append(sql)
+
+    def fetchall(self):
+        return tuple(ROWS)
+
+    def fetchmany(self, size):
+        self.con.batches.append(size)
+        rows = ROWS[self.pos:self.pos + size]
+        self.pos += len(rows)
+        return tuple(rows)
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeConnection:
+    """DB-API connection that answers every query with ROWS"""
+    OperationalError = InterfaceError = InternalError = RuntimeError
+    threadsafety = 1
+
+    def __init__(self):
+        self.sqls = []
+        self.batches = []
+        self.cursors: List[FakeCursor] = []
+        self.commits = 0
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self, cursor_class)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def fake_mysql_utils(module):
+    class FakeMySQLUtils(module.AbstractMySQLUtils):
+        def __init__(self):
+            super().__init__('fake', 'd1', 'utf8')
+            self.con = FakeConnection()
+
+        def get_connection(self, database: str = None):
+            return self.con
+
+    return FakeMySQLUtils()
+
+
+class TestQueryRows(unittest.TestCase):
+    def test_rows_and_dicts(self):
+        for module in [server_mysql_utils, optimizer_mysql_utils]:
+            with self.subTest(module=module.__name__):
+                util = fake_mysql_utils(module)
+                self.assertEqual(util.query_for_rows('select id, name from t'), ROWS)
+                self.assertEqual(util.query_for_dicts('select id, name from t'),
+                                 [{'id': i, 'name': name} for i, name in ROWS])
+                self.assertEqual(util.con.cursors[0].cursor_class, None)
+
+    def test_iter_rows_streams(self):
+        for module in [server_mysql_utils, optimizer_mysql_utils]:
+            with self.subTest(module=module.__name__):
+                util = fake_mysql_utils(module)
+                it = util.iter_rows('select id, name from t', batch_size=2)
+                # nothing is executed before the iteration starts
+                self.assertEqual(util.con.sqls, [])
+                self.assertEqual(next(it), (1, 'a'))
+                cursor = util.con.cursors[-1]
+                self.assertIs(cursor.cursor_class, SSCursor)
+                self.assertEqual(util.con.batches, [2])
+                self.assertEqual(list(it), ROWS[1:])
+                self.assertEqual(util.con.batches, [2, 2, 2, 2])
+                self.assertTrue(cursor.closed)
+                self.assertEqual(util.con.commits, 1)
+
+                self.assertEqual(list(util.iter_rows('select id, name from t', as_dict=True))[2],
+                                 {'id': 3, 'name': None})
+
+    def test_iter_rows_closed_early(self):
+        util = fake_mysql_utils(optimizer_mysql_utils)
+        it = util.iter_rows('select id, name from t', batch_size=2)
+        next(it)
+        it.close()
+        self.assertTrue(util.con.cursors[-1].closed)
+        self.assertEqual(util.con.batches, [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
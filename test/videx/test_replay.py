@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from sub_platforms.sql_server.videx import videx_service
+from sub_platforms.sql_server.videx.videx_capture import RequestCapture, read_capture
+from sub_platforms.sql_server.videx.videx_metadata import construct_videx_task_meta_from_local_files
+from sub_platforms.sql_server.videx.videx_replay import replay, replay_in_process
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton
+from sub_platforms.sql_server.videx.videx_utils import load_json_from_file, join_path
+
+
+def _req(function: str, data: list = None) -> dict:
+    return {"item_type": "videx_request",
+            "properties": {"dbname": "videx_test_null_db", "function": function, "table_name": "test_columns",
+                           "target_storage_engine": "INNODB", "videx_options": json.dumps({"task_id": "task1"})},
+            "data": data or []}
+
+
+def _eq_req(value: str) -> dict:
+    key = lambda item_type, op: {"item_type": item_type,
+                                 "properties": {"index_name": "idx_nullable_code", "length": "5", "operator": op},
+                                 "data": [{"item_type": "column_and_bound",
+                                           "properties": {"column": "nullable_code", "value": value}, "data": []}]}
+    return _req("virtual ha_rows ha_videx::records_in_range(uint, key_range *, key_range *)",
+                [key("min_key", "="), key("max_key", ">")])
+
+
+REQUESTS = [_req("virtual double ha_videx::scan_time()"),
+            _req("virtual double ha_videx::get_memory_buffer_size()"),
+            _eq_req("'A'"), _eq_req("NULL"),
+            _req("virtual double ha_videx::unknown_func()")]
+
+
+def _singleton() -> VidexSingleton:
+    req_dict = load_json_from_file(join_path(__file__, 'data/videx_metadata_test_null_db.json'))
+    meta = construct_videx_task_meta_from_local_files(task_id='task1', videx_db='videx_test_null_db',
+                                                      stats_file=req_dict['stats_dict'],
+                                                      hist_file=req_dict['hist_dict'],
+                                                      ndv_single_file=req_dict['ndv_single_dict'],
+                                                      ndv_mulcol_file={}, raise_error=True)
+    singleton = VidexSingleton()
+    singleton.add_task_meta(meta.to_dict())
+    return singleton
+
+
+class TestRequestReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'capture.jsonl.gz')
+        # the global singleton of the app is replaced by _capture_over_http
+        self.origin_singleton = getattr(videx_service, 'videx_meta_singleton', None)
+
+    def tearDown(self):
+        videx_service.videx_meta_singleton = self.origin_singleton
+        self.tmp_dir.cleanup()
+
+    def _capture_over_http(self):
+        videx_service.videx_meta_singleton = _singleton()
+        videx_service.videx_meta_singleton.capture = RequestCapture(self.path)
+        client = videx_service.app.test_client()
+        for req in REQUESTS * 3:
+            self.assertEqual(client.post('/ask_videx', json=req).status_code, 200)
+        videx_service.videx_meta_singleton.capture.close()
+
+    def test_capture(self):
+        self._capture_over_http()
+        records = list(read_capture(self.path))
+        self.assertEqual(len(records), len(REQUESTS) * 3)
+        self.assertEqual([r['req'] for r in records], REQUESTS * 3)
+        self.assertEqual({r['task_id'] for r in records}, {'task1'})
+        self.assertEqual([r['code'] for r in records[:len(REQUESTS)]], [200, 200, 200, 200, 400])
+        self.assertEqual(records[3]['resp'], {'value': '25'})
+
+        # appended as a new gzip member
+        capture = RequestCapture(self.path)
+        capture.record(REQUESTS[0], 'task1', 200, {'value': '1'}, 0.001)
+        capture.close()
+        self.assertEqual(len(list(read_capture(self.path))), len(REQUESTS) * 3 + 1)
+
+    def test_truncated_capture(self):
+        self._capture_over_http()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        records = list(read_capture(self.path))
+        self.assertLess(len(records), len(REQUESTS) * 3)
+        self.assertEqual([r['req'] for r in records], (REQUESTS * 3)[:len(records)])
+
+    def test_replay_in_process(self):
+        self._capture_over_http()
+        records = list(read_capture(self.path))
+        report = replay_in_process(records, _singleton(), concurrency=4)
+        self.assertEqual(report.total.count, len(records))
+        # unknown_func is answered with 400
+        self.assertEqual(report.total.errors, 3)
+        self.assertEqual(report.total.mismatches, 0)
+        self.assertEqual(report.by_func['records_in_range'].count, 6)
+        self.assertEqual(set(report.by_func), {'scan_time', 'get_memory_buffer_size', 'records_in_range',
+                                               'not_supported'})
+        self.assertGreater(report.throughput, 0)
+        self.assertLessEqual(report.total.p50_ms, report.total.p99_ms)
+        self.assertIn('records_in_range', str(report))
+
+        # a changed model is reported as mismatches
+        records[3]['resp'] = {'value': '1'}
+        self.assertEqual(replay_in_process(records, _singleton()).by_func['records_in_range'].mismatches, 1)
+
+    def test_rate(self):
+        records = [{'req': req, 'code': 200, 'resp': {}} for req in REQUESTS * 4]
+        sent = []
+
+        def ask_func(req):
+            sent.append(req)
+            return 200, {}
+
+        st = time.perf_counter()
+        report = replay(records, ask_func, concurrency=2, rate=100)
+        # request i is sent at i / rate
+        self.assertGreaterEqual(time.perf_counter() - st, (len(records) - 1) / 100)
+        self.assertEqual(len(sent), len(records))
+        self.assertEqual(report.total.errors, 0)
+        self.assertLessEqual(report.throughput, 100 * len(records) / (len(records) - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
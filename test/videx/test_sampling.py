@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from sub_platforms.sql_optimizer.meta import Table, Column
+from sub_platforms.sql_optimizer.videx.videx_histogram import generate_histogram_from_sample
+from sub_platforms.sql_optimizer.videx.videx_sampling import compute_table_stats_from_sample, write_sample_file, \
+    sample_file_rel_path, gee_ndv_from_sample
+from sub_platforms.sql_server.common.sample_file_info import SampleFileInfo
+from sub_platforms.sql_server.histogram.histogram_utils import get_shared_sample, NULL_CODE, VidexSample
+from sub_platforms.sql_server.histogram.ndv_estimator import NDVEstimator
+from sub_platforms.sql_server.videx.videx_metadata import construct_videx_task_meta_from_local_files
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton
+from sub_platforms.sql_server.videx.videx_utils import load_json_from_file, join_path, IndexRangeCond, RangeCond, \
+    BTreeKeySide
+
+
+def _null_db_sample() -> pd.DataFrame:
+    """50 rows like test_null_db.test_columns: 50% NULL, 10% 'A', 'B', 'C', 'D', 'E' for nullable_code"""
+    codes = [None] * 25 + ['A', 'B', 'C', 'D', 'E'] * 5
+    return pd.DataFrame({
+        'id': np.arange(1, 51),
+        'nullable_code': codes,
+        'required_num': np.arange(50) % 5,
+    })
+
+
+class TestSampleStats(unittest.TestCase):
+    def setUp(self):
+        self.table_meta = Table(name='test_columns', db='test_null_db', rows=50, columns=[
+            Column(name='id', table='test_columns', db='test_null_db', data_type='int'),
+            Column(name='nullable_code', table='test_columns', db='test_null_db', data_type='char'),
+            Column(name='required_num', table='test_columns', db='test_null_db', data_type='int'),
+        ])
+
+    def test_gee_ndv(self):
+        # all values are repeated, the estimation equals the sample ndv
+        self.assertEqual(gee_ndv_from_sample(pd.Series([1, 1, 2, 2, 3, 3]), 1000), 3)
+        # all values are unique, scaled by sqrt(n / r)
+        self.assertAlmostEqual(gee_ndv_from_sample(pd.Series(range(100)), 10000), 1000)
+        self.assertEqual(gee_ndv_from_sample(pd.Series([None, None]), 1000), 0)
+
+    def test_hist_and_ndv_from_sample(self):
+        hist_dict, ndv_dict = compute_table_stats_from_sample(_null_db_sample(), self.table_meta, n_buckets=16)
+        self.assertEqual(ndv_dict, {'id': 50, 'nullable_code': 5, 'required_num': 5})
+
+        code_hist = hist_dict['nullable_code']
+        self.assertEqual(code_hist['histogram_type'], 'singleton')
+        self.assertAlmostEqual(code_hist['null_values'], 0.5)
+        self.assertEqual([b['min_value'] for b in code_hist['buckets']], ['A', 'B', 'C', 'D', 'E'])
+        self.assertAlmostEqual(code_hist['buckets'][-1]['cum_freq'], 0.5)
+
+        id_hist = hist_dict['id']
+        self.assertEqual(id_hist['histogram_type'], 'equi-height')
+        self.assertEqual(len(id_hist['buckets']), 16)
+        self.assertEqual(sum(b['row_count'] for b in id_hist['buckets']), 50)
+        self.assertAlmostEqual(id_hist['buckets'][-1]['cum_freq'], 1)
+
+    def test_binary_values_and_utc(self):
+        hist = generate_histogram_from_sample(pd.Series([b'ab', b'cd', b'ab', None]), 'string', n_buckets=4)
+        self.assertEqual([b.min_value for b in hist.buckets], ['ab', 'cd'])
+        # last_updated is in UTC as written by MySQL
+        last_updated = datetime.strptime(hist.last_updated, '%Y-%m-%d %H:%M:%S.%f').replace(tzinfo=timezone.utc)
+        self.assertLess(abs((datetime.now(timezone.utc) - last_updated).total_seconds()), 60)
+
+
+class TestLoadSample(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rel_path = sample_file_rel_path('test_null_db', 'test_columns')
+        write_sample_file(_null_db_sample(), os.path.join(self.tmp_dir.name, rel_path))
+        sample_file_info = SampleFileInfo(local_path_prefix=self.tmp_dir.name, tos_path_prefix='',
+                                          sample_file_dict={'test_null_db': {'test_columns': [rel_path]}})
+
+        req_dict = load_json_from_file(join_path(__file__, 'data/videx_metadata_test_null_db.json'))
+        self.meta = construct_videx_task_meta_from_local_files(task_id=None,
+                                                               videx_db='videx_test_null_db',
+                                                               stats_file=req_dict.get('stats_dict', {}),
+                                                               hist_file=req_dict.get('hist_dict', {}),
+                                                               ndv_single_file=req_dict.get('ndv_single_dict', {}),
+                                                               # no mulcol ndv, estimate it from the sample
+                                                               ndv_mulcol_file={},
+                                                               raise_error=True,
+                                                               sample_file_info=sample_file_info,
+                                                               )
+        self.singleton = VidexSingleton(sample_cardinality=True)
+        self.singleton.add_task_meta(self.meta.to_dict())
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_sample_file_info_rekeyed_to_videx_db(self):
+        self.assertEqual(self.meta.sample_file_info.sample_file_dict,
+                         {'videx_test_null_db': {'test_columns': ['test_null_db/test_columns.parquet']}})
+        stats_info = self.meta.get_table_stats_info('videx_test_null_db', 'test_columns')
+        self.assertEqual(stats_info.sample_file_list, ['test_null_db/test_columns.parquet'])
+
+    def test_model_ndv_from_sample(self):
+        model = self.singleton.get_videx_table_stats(self.singleton.non_task_cache,
+                                                     'videx_test_null_db', 'test_columns')
+        self.assertIsNotNone(model.df_sample_raw)
+        self.assertEqual(len(model.df_sample_raw), 50)
+        # sample covers the full table, (required_num, id) is unique
+        self.assertEqual(model.ndv('idx_required_num', ['required_num', 'id']), 50)
+
+    def test_sample_shared_across_tasks(self):
+        meta2 = self.meta.to_dict()
+        meta2['task_id'] = 'another_task'
+        self.singleton.add_task_meta(meta2)
+        model = self.singleton.get_videx_table_stats(self.singleton.non_task_cache,
+                                                     'videx_test_null_db', 'test_columns')
+        model2 = self.singleton.get_videx_table_stats(self.singleton.cache['another_task'],
+                                                      'videx_test_null_db', 'test_columns')
+        self.assertIs(model.df_sample_raw, model2.df_sample_raw)
+
+    def test_model_cardinality_from_sample(self):
+        # opt-in by the model kwargs of the singleton
+        default_singleton = VidexSingleton()
+        default_singleton.add_task_meta(self.meta.to_dict())
+        self.assertFalse(default_singleton.get_videx_table_stats(default_singleton.non_task_cache,
+                                                                 'videx_test_null_db',
+                                                                 'test_columns').sample_cardinality)
+        model = self.singleton.get_videx_table_stats(self.singleton.non_task_cache,
+                                                     'videx_test_null_db', 'test_columns')
+        self.assertTrue(model.sample_cardinality)
+        # nullable_code 'A'..'E' always comes with required_num 0..4, the histograms assume independence
+        ranges = IndexRangeCond('idx_code_num', [RangeCond.construct_eq('nullable_code', 'char', "'A'"),
+                                                 RangeCond.construct_eq('required_num', 'int', '0')])
+        model.sample_min_hits = 1
+        self.assertEqual(model.cardinality(ranges), 5)
+        model.sample_cardinality = False
+        self.assertLess(model.cardinality(ranges), 5)
+
+        # too few sample rows match, fallback to histograms
+        model.sample_cardinality = True
+        model.sample_min_hits = 10
+        self.assertEqual(model.cardinality_by_sample(ranges.ranges), None)
+        self.assertEqual(model.cardinality_by_sample([RangeCond.construct_eq('nullable_code', 'char', 'NULL')]), 25)
+        self.assertEqual(model.cardinality_by_sample([RangeCond.construct_eq('not_exist', 'int', '1')]), None)
+
+
+class TestVidexSample(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'test_columns.parquet')
+        write_sample_file(_null_db_sample(), self.path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_column_projection(self):
+        sample = get_shared_sample([self.path])
+        sample.load_columns(['NULLABLE_CODE', 'not_exist'])
+        self.assertEqual(sample.columns, ['nullable_code'])
+        self.assertEqual(len(sample), 50)
+        self.assertEqual(sorted(sample.sample_columns), ['id', 'nullable_code', 'required_num'])
+
+    def test_codes_and_profile(self):
+        sample = get_shared_sample([self.path])
+        codes = sample.codes('nullable_code')
+        self.assertEqual(codes.dtype, np.int32)
+        self.assertEqual(int((codes == NULL_CODE).sum()), 25)
+        self.assertEqual(list(sample.uniques('nullable_code')), ['A', 'B', 'C', 'D', 'E'])
+        self.assertEqual(sample.values('nullable_code').tolist()[24:27], [None, 'A', 'B'])
+        # NULL is one value appearing 25 times, 'A'-'E' appear 5 times each
+        profile = sample.value_profile(['nullable_code'])
+        self.assertEqual(profile[5], 5)
+        self.assertEqual(profile[25], 1)
+        self.assertEqual(sample.value_profile(['required_num', 'id'])[1], 50)
+
+    def test_concurrent_load(self):
+        # threads of the statistic server read columns while other threads load them
+        for _ in range(20):
+            sample = VidexSample([self.path])
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                res = list(pool.map(lambda col: (sample.values(col).tolist(), sample.value_profile([col, 'id'])),
+                                    ['nullable_code', 'required_num', 'id'] * 8))
+            self.assertEqual(res[0][0][24:27], [None, 'A', 'B'])
+            self.assertEqual(res[:3] * 8, res)
+
+    def test_shared_sample_key(self):
+        sample = get_shared_sample([self.path])
+        self.assertIs(sample, get_shared_sample([os.path.relpath(self.path)]))
+        self.assertIsNot(sample, get_shared_sample([self.path], load_rows=10))
+        self.assertEqual(len(get_shared_sample([self.path], load_rows=10)), 10)
+
+    def test_estimate_ndv_from_encoded_sample(self):
+        sample = get_shared_sample([self.path])
+        estimator = NDVEstimator(50)
+        self.assertEqual(estimator.estimate_multi_columns(sample, ['required_num', 'id']), 50)
+        self.assertEqual(estimator.estimate_multi_columns(sample, ['not_exist']), 1)
+        self.assertEqual(estimator.estimate_multi_columns(sample, ['required_num'], method='block_split'),
+                         estimator.estimate_multi_columns(sample.to_dataframe(['required_num']), ['required_num'],
+                                                          method='block_split'))
+
+    def test_count_in_ranges(self):
+        sample = get_shared_sample([self.path])
+        # NULL is the smallest value, 'A' = 0, ..., 'E' = 4
+        self.assertEqual(sample.code_range('nullable_code', None, None, None, None), (NULL_CODE, 4))
+        self.assertEqual(sample.code_range('nullable_code', 'NULL', '=', 'NULL', '='), (NULL_CODE, NULL_CODE))
+        self.assertEqual(sample.code_range('nullable_code', 'NULL', '>', "'C'", '<'), (0, 1))
+        self.assertEqual(sample.code_range('nullable_code', "'BB'", '>=', None, None), (2, 4))
+        self.assertEqual(sample.code_range('nullable_code', None, None, 'NULL', '<'), (NULL_CODE, NULL_CODE - 1))
+        self.assertEqual(sample.code_range('required_num', '2.5', '>', '3', '<='), (3, 3))
+
+        self.assertEqual(sample.count_in_ranges(['nullable_code'], [(NULL_CODE, NULL_CODE)]), 25)
+        self.assertEqual(sample.count_in_ranges(['nullable_code'], [(0, 1)]), 10)
+        self.assertEqual(sample.count_in_ranges(['nullable_code'], [(NULL_CODE, NULL_CODE - 1)]), 0)
+        # equality prefix
+        self.assertEqual(sample.count_in_ranges(['required_num', 'id'], [(0, 0), (sample.code_range(
+            'id', '30', '>=', None, None))]), 4)
+        # a range followed by other columns
+        self.assertEqual(sample.count_in_ranges(['required_num', 'nullable_code'], [(0, 1), (0, 0)]), 5)
+        self.assertEqual(sample.count_in_ranges(['required_num', 'nullable_code'], [(0, 1), (NULL_CODE, 4)]), 20)
+
+    def test_count_in_ranges_performance(self):
+        n = 1_000_000
+        rng = np.random.default_rng(0)
+        a = rng.integers(0, 100, n)
+        b = a * 10 + rng.integers(0, 10, n)
+        c = rng.integers(0, 1000, n).astype(str)
+        path = os.path.join(self.tmp_dir.name, 'large.parquet')
+        write_sample_file(pd.DataFrame({'a': a, 'b': b, 'c': c}), path)
+        sample = get_shared_sample([path])
+        c_range = RangeCond(col='c', data_type='varchar', min_value="'1'", min_op='>=')
+        c_range.add_max('<', "'5'", BTreeKeySide.left)
+        ranges = [RangeCond.construct_eq('a', 'int', '42'), RangeCond.construct_eq('b', 'int', '425'), c_range]
+
+        def count():
+            code_ranges = [sample.code_range(rc.col, rc.min_value, rc.min_op, rc.max_value, rc.max_op)
+                           for rc in ranges]
+            return sample.count_in_ranges(['a', 'b', 'c'], code_ranges)
+
+        expected = int(np.count_nonzero((a == 42) & (b == 425) & (c >= '1') & (c < '5')))
+        self.assertGreater(expected, 0)
+        self.assertEqual(count(), expected)
+        elapsed = []
+        for _ in range(50):
+            st = time.perf_counter()
+            count()
+            elapsed.append(time.perf_counter() - st)
+        self.assertLess(float(np.median(elapsed)), 1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
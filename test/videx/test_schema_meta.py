@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import unittest
+
+import pandas as pd
+
+from sub_platforms.sql_optimizer.databases.mysql.mysql_command import MySQLCommand, MySQLVersion
+from sub_platforms.sql_optimizer.env.rds_env import DirectConnectMySQLEnv
+
+_COLUMN_KEYS = ['TABLE_SCHEMA', 'TABLE_NAME', 'COLUMN_NAME', 'ORDINAL_POSITION', 'IS_NULLABLE', 'DATA_TYPE',
+                'CHARACTER_MAXIMUM_LENGTH', 'CHARACTER_OCTET_LENGTH', 'NUMERIC_PRECISION', 'NUMERIC_SCALE',
+                'DATETIME_PRECISION', 'CHARACTER_SET_NAME', 'COLLATION_NAME', 'COLUMN_TYPE', 'COLUMN_KEY', 'EXTRA']
+_INDEX_KEYS = ['dbname', 'table_name', 'index_name', 'non_unique', 'seq_in_index', 'column_name', 'cardinality',
+               'sub_part', 'is_visible', 'expression', 'collation', 'index_type']
+
+
+class FakeMySQLUtil:
+    """answers the metadata queries of MySQLCommand for two tables in db `d1`, counts round trips"""
+
+    def __init__(self):
+        self.sqls = []
+        self.columns = pd.DataFrame([
+            ['d1', 't1', 'id', 1, 'NO', 'int', None, None, 10, 0, None, None, None, 'int', 'PRI', 'auto_increment'],
+            ['d1', 't1', 'c', 2, 'YES', 'varchar', 20, 80, None, None, None, 'utf8mb4', 'utf8mb4_bin', 'varchar(20)',
+             'MUL', ''],
+            ['d1', 'T2', 'id', 1, 'NO', 'bigint', None, None, 19, 0, None, None, None, 'bigint', 'PRI', ''],
+        ], columns=_COLUMN_KEYS)
+        self.indexes = pd.DataFrame([
+            ['d1', 't1', 'PRIMARY', 0, 1, 'id', 100, None, 'YES', None, 'A', 'BTREE'],
+            ['d1', 't1', 'idx_c', 1, 1, 'c', 10, None, 'YES', None, 'A', 'BTREE'],
+            ['d1', 'T2', 'PRIMARY', 0, 1, 'id', 5, None, 'YES', None, 'A', 'BTREE'],
+        ], columns=_INDEX_KEYS)
+        self.status = pd.DataFrame([
+            ['t1', 'InnoDB', 'Dynamic', 'utf8mb4_bin', '', 90, 40, 16384, 16384, None, None, None],
+            ['T2', 'InnoDB', 'Dynamic', 'utf8mb4_bin', '', 5, 20, 16384, 0, None, None, None],
+        ], columns=['Name', 'Engine', 'Row_format', 'Collation', 'Comment', 'Rows', 'Avg_row_length', 'Data_length',
+                    'Index_length', 'Create_time', 'Update_time', 'Check_time'])
+        self.table_stats = pd.DataFrame([['t1', 100, 1, 1], ['T2', 5, 1, 0]],
+                                        columns=['table_name', 'n_rows', 'clustered_index_size',
+                                                 'sum_of_other_index_sizes'])
+
+    @staticmethod
+    def _filter_table(df: pd.DataFrame, sql: str, key: str) -> pd.DataFrame:
+        for name in df[key].unique():
+            if f"table_name='{name}'" in sql:
+                return df[df[key] == name].reset_index(drop=True)
+        return df
+
+    def query_for_dataframe(self, sql, params=None):
+        self.sqls.append(sql)
+        if 'version' in sql:
+            return pd.DataFrame([['version', '8.0.32']], columns=['Variable_name', 'Value'])
+        if 'information_schema.columns' in sql:
+            return self._filter_table(self.columns, sql, 'TABLE_NAME')
+        if 'information_schema.statistics' in sql:
+            return self._filter_table(self.indexes, sql, 'table_name')
+        if 'innodb_table_stats' in sql:
+            df = self._filter_table(self.table_stats, sql, 'table_name')
+            return df if 'select table_name' in sql else df.drop(columns=['table_name'])
+        if sql.startswith('show table status'):
+            if ' like ' in sql:
+                name = sql.split("'")[1]
+                return self.status[self.status['Name'] == name].reset_index(drop=True)
+            return self.status
+        if sql.startswith('show create table'):
+            return pd.DataFrame([['t', 'CREATE TABLE t (id int) AUTO_INCREMENT=101']])
+        raise ValueError(sql)
+
+    def query_for_rows(self, sql, params=None):
+        df = self.query_for_dataframe(sql, params)
+        return [tuple(None if pd.isna(v) else v for v in row) for row in df.itertuples(index=False, name=None)]
+
+    def query_for_dicts(self, sql, params=None):
+        df = self.query_for_dataframe(sql, params)
+        return [{k: None if pd.isna(v) else v for k, v in row.items()} for row in df.to_dict(orient='records')]
+
+
+class FakeEnv(DirectConnectMySQLEnv):
+    def _get_instance(self):
+        return 'fake'
+
+
+class TestSchemaTableMetas(unittest.TestCase):
+    def setUp(self):
+        self.util = FakeMySQLUtil()
+        self.command = MySQLCommand(self.util, MySQLVersion.MySQL_8)
+
+    def test_bulk_equals_per_table(self):
+        tables = self.command.get_schema_table_metas('d1')
+        self.assertEqual(set(tables.keys()), {'t1', 't2'})
+        for name in ['t1', 'T2']:
+            expected = self.command.get_table_meta('d1', name)
+            actual = tables[name.lower()]
+            self.assertEqual(actual.to_json(), expected.to_json())
+        self.assertEqual(tables['t1'].rows, 100)
+        self.assertEqual([i.name for i in tables['t1'].indexes], ['PRIMARY', 'idx_c'])
+        self.assertEqual(tables['t1'].indexes[1].columns[0].column_ref.data_type, 'varchar')
+        self.assertNotIn('AUTO_INCREMENT=', tables['t1'].ddl)
+
+    def test_round_trips(self):
+        self.command.get_schema_table_metas('d1')
+        # status, columns, indexes, innodb_table_stats + one ddl per table
+        self.assertEqual(len(self.util.sqls), 4 + 2)
+
+        self.util.sqls = []
+        tables = self.command.get_schema_table_metas('d1', ['t2'])
+        self.assertEqual(list(tables.keys()), ['t2'])
+        self.assertEqual(len(self.util.sqls), 4 + 1)
+
+    def test_unsupported_table_skipped(self):
+        self.util.columns.loc[2, 'DATA_TYPE'] = 'geometry'
+        tables = self.command.get_schema_table_metas('d1')
+        self.assertEqual(list(tables.keys()), ['t1'])
+
+    def test_env_memoized(self):
+        env = FakeEnv('d1', self.util)
+        tables = env.get_schema_table_metas('d1')
+        self.assertEqual(set(tables.keys()), {'t1', 't2'})
+        self.util.sqls = []
+        self.assertIs(env.get_table_meta('d1', 'T2'), tables['t2'])
+        self.assertIs(env.get_schema_table_metas('d1', ['t1'])['t1'], tables['t1'])
+        self.assertEqual(set(env.get_schema_table_metas('d1').keys()), {'t1', 't2'})
+        self.assertEqual(self.util.sqls, [])
+
+        env.remove_table_meta('d1', 't1')
+        self.assertEqual(set(env.get_schema_table_metas('d1').keys()), {'t1', 't2'})
+        self.assertIs(env.get_table_meta('d1', 't2'), tables['t2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
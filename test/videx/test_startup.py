@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import json
+import os
+import subprocess
+import sys
+import unittest
+from typing import List
+
+import sub_platforms
+
+START_MODULE = 'sub_platforms.sql_server.videx.scripts.start_videx_server'
+# packages that the statistic server must import on use only
+LAZY_PACKAGES = ['pandas', 'sqlalchemy', 'sqlglot', 'requests', 'estndv', 'matplotlib', 'sklearn', 'lightgbm',
+                 'scipy', 'pyarrow.dataset']
+
+
+def imported_modules(module: str) -> List[str]:
+    """sys.modules after importing module in a fresh interpreter"""
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(sub_platforms.__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([src_dir, os.environ.get('PYTHONPATH', '')]))
+    code = f"import json, sys; import {module}; print(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run([sys.executable, '-W', 'ignore', '-c', code],
+                          env=env, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+class TestStartup(unittest.TestCase):
+    def test_lazy_imports(self):
+        modules = set(imported_modules(START_MODULE))
+        self.assertIn('sub_platforms.sql_server.videx.videx_service', modules)
+        imported = [pkg for pkg in LAZY_PACKAGES if pkg in modules]
+        self.assertEqual(imported, [], f"imported at the server start: {imported}")
+
+
+if __name__ == '__main__':
+    unittest.main()
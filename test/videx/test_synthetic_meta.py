@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import os
+import tempfile
+import unittest
+
+from sub_platforms.sql_server.videx.videx_histogram import HistogramStats
+from sub_platforms.sql_server.videx.videx_meta_bundle import write_meta_bundle
+from sub_platforms.sql_server.videx.videx_metadata import construct_videx_task_meta_from_local_files
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton
+from test.videx.bench_estimators import _range_requests, _info_low_requests
+from test.videx.bench_scale import measure_scale
+from test.videx.synthetic_meta import generate_synthetic_meta, SYNTHETIC_COLUMN_TYPES
+
+
+def _load(metadata: dict, meta_bundle_file: str = None):
+    return construct_videx_task_meta_from_local_files(task_id=None, videx_db='synthetic',
+                                                      stats_file=metadata['stats_dict'],
+                                                      hist_file=metadata['hist_dict'],
+                                                      ndv_single_file=metadata['ndv_single_dict'],
+                                                      ndv_mulcol_file=metadata['ndv_mulcol_dict'],
+                                                      raise_error=True, meta_bundle_file=meta_bundle_file)
+
+
+class TestSyntheticMeta(unittest.TestCase):
+    def test_generate(self):
+        metadata = generate_synthetic_meta(n_tables=3, n_columns=15, n_indexes=2, n_buckets=16)
+        self.assertEqual(metadata, generate_synthetic_meta(n_tables=3, n_columns=15, n_indexes=2, n_buckets=16))
+        self.assertEqual(sorted(metadata['stats_dict']), ['t00000', 't00001', 't00002'])
+        hists = [h for table_hists in metadata['hist_dict'].values() for h in table_hists.values()]
+        self.assertEqual({h['data_type'] for h in hists}, set(SYNTHETIC_COLUMN_TYPES))
+        self.assertEqual({h['histogram_type'] for h in hists}, {'singleton', 'equi-height'})
+        for hist in hists:
+            values = [b['min_value'] for b in hist['buckets']]
+            self.assertEqual(values, sorted(values))
+            self.assertAlmostEqual(hist['buckets'][-1]['cum_freq'] + hist['null_values'], 1)
+            self.assertLessEqual(len(hist['buckets']), 16)
+        # PRIMARY and 2 secondary indexes, in the DDL and ndv_mulcol
+        for table, stats in metadata['stats_dict'].items():
+            self.assertEqual(stats['DDL'].count('KEY'), 3)
+            self.assertEqual(len(metadata['ndv_mulcol_dict'][table]), 3)
+
+    def test_skew(self):
+        kwargs = dict(n_tables=1, n_columns=20, min_rows=10 ** 6, data_types=['int'])
+        uniform = generate_synthetic_meta(skew=0, **kwargs)['hist_dict']['t00000']
+        skewed = generate_synthetic_meta(skew=2, **kwargs)['hist_dict']['t00000']
+        col = next(col for col, hist in skewed.items()
+                   if col != 'c000' and hist['histogram_type'] == 'equi-height')
+        width = lambda hist: [b['max_value'] - b['min_value'] + 1 for b in hist[col]['buckets']]
+        # buckets of skewed columns are narrower at small values
+        self.assertLess(width(skewed)[0] / width(skewed)[-1], width(uniform)[0] / width(uniform)[-1])
+
+    def test_ingest_and_ask(self):
+        metadata = generate_synthetic_meta(n_tables=4, n_columns=15, n_buckets=16)
+        meta = _load(metadata)
+        singleton = VidexSingleton()
+        singleton.add_task_meta(meta.to_dict())
+        for table_stats in meta.stats_dict['synthetic'].values():
+            for hist in table_stats.histogram_dict.values():
+                self.assertIsInstance(hist, HistogramStats)
+        requests = _range_requests('synthetic', meta) + _info_low_requests('synthetic', meta)
+        for req in requests:
+            code, message, _ = singleton.ask(req)
+            self.assertEqual(code, 200, message)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'synthetic.arrow')
+            write_meta_bundle(path, metadata)
+            self.assertEqual(_load({k: None for k in metadata}, meta_bundle_file=path).to_dict(), meta.to_dict())
+
+    def test_measure_scale(self):
+        res = measure_scale(n_tables=2, n_columns=8, n_buckets=8)
+        self.assertEqual(res['tables'], 2)
+        self.assertEqual(res['columns'], 16)
+        for key in ['ingest_s', 'peak_rss_mb', 'first_request_ms', 'records_in_range_ms', 'info_low_ms']:
+            self.assertGreater(res[key], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
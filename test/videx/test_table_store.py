@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import gc
+import json
+import unittest
+from unittest.mock import patch
+
+from sub_platforms.sql_server.videx import videx_service
+from sub_platforms.sql_server.videx.videx_metadata import construct_videx_task_meta_from_local_files, \
+    VidexDBTaskStats
+from sub_platforms.sql_server.videx.videx_service import VidexSingleton
+from sub_platforms.sql_server.videx.videx_table_store import MissingTableDigestException, TABLE_REFS_KEY, \
+    task_table_digests, strip_known_tables
+from sub_platforms.sql_server.videx.videx_utils import load_json_from_file, join_path
+
+
+def _task_meta(task_id) -> dict:
+    req_dict = load_json_from_file(join_path(__file__, 'data/videx_metadata_desc_index.json'))
+    meta = construct_videx_task_meta_from_local_files(task_id=task_id,
+                                                      videx_db='desc_index',
+                                                      stats_file=req_dict['stats_dict'],
+                                                      hist_file=req_dict['hist_dict'],
+                                                      ndv_single_file=req_dict['ndv_single_dict'],
+                                                      ndv_mulcol_file=req_dict['ndv_mulcol_dict'],
+                                                      raise_error=True)
+    return json.loads(meta.to_json())
+
+
+class TestSharedTableStore(unittest.TestCase):
+    def setUp(self):
+        # the global singleton of the app is replaced by test_endpoints and test_post_dedup
+        self.origin_singleton = getattr(videx_service, 'videx_meta_singleton', None)
+
+    def tearDown(self):
+        videx_service.videx_meta_singleton = self.origin_singleton
+
+    def test_share_between_tasks(self):
+        singleton = VidexSingleton()
+        singleton.add_task_meta(_task_meta('task1'))
+        singleton.add_task_meta(_task_meta('task2'))
+        task1, task2 = singleton.cache['task1'].db_tasks_stats, singleton.cache['task2'].db_tasks_stats
+        self.assertIs(task1.get_table_meta('desc_index', 'simple_message'),
+                      task2.get_table_meta('desc_index', 'simple_message'))
+        self.assertIs(task1.get_table_stats_info('desc_index', 'simple_message'),
+                      task2.get_table_stats_info('desc_index', 'simple_message'))
+        self.assertEqual(singleton.table_store.stats(), {'tables': 1, 'hits': 1, 'misses': 1})
+
+        # released once no task refers to it
+        singleton.clear_cache({'key_list': ['task1']})
+        gc.collect()
+        self.assertEqual(len(singleton.table_store), 1)
+        singleton.clear_cache({'key_list': ['task2']})
+        gc.collect()
+        self.assertEqual(len(singleton.table_store), 0)
+
+    def test_refs(self):
+        singleton = VidexSingleton()
+        req_dict = _task_meta('task1')
+        digests = task_table_digests(req_dict)
+        stripped = strip_known_tables(_task_meta('task2'), digests)
+        self.assertEqual(stripped['meta_dict'], {'desc_index': {}})
+
+        with self.assertRaises(MissingTableDigestException):
+            singleton.add_task_meta(stripped)
+        singleton.add_task_meta(req_dict)
+        singleton.add_task_meta(stripped)
+        self.assertIs(singleton.cache['task1'].db_tasks_stats.get_table_meta('desc_index', 'simple_message'),
+                      singleton.cache['task2'].db_tasks_stats.get_table_meta('desc_index', 'simple_message'))
+
+    def test_refs_with_compaction(self):
+        # tables are keyed by the upload as received, not by their compacted histograms
+        singleton = VidexSingleton(hist_compact_epsilon=0.001)
+        req_dict = _task_meta('task1')
+        digests = task_table_digests(req_dict)
+        stripped = strip_known_tables(_task_meta('task2'), digests)
+        singleton.add_task_meta(req_dict)
+        self.assertGreater(singleton.hist_compaction.buckets_before, singleton.hist_compaction.buckets_after)
+        self.assertEqual(singleton.table_store.missing(list(digests['desc_index'].values())), [])
+        singleton.add_task_meta(stripped)
+        self.assertIs(singleton.cache['task1'].db_tasks_stats.get_table_meta('desc_index', 'simple_message'),
+                      singleton.cache['task2'].db_tasks_stats.get_table_meta('desc_index', 'simple_message'))
+
+    def test_merge_keeps_shared_objects(self):
+        singleton = VidexSingleton()
+        task1 = singleton.table_store.ingest(_task_meta(None))[0]
+        task2 = singleton.table_store.ingest(_task_meta(None))[0]
+        del task2.meta_dict['desc_index']['simple_message']
+        merged = task2.merge_with(task1)
+        self.assertIs(merged.get_table_meta('desc_index', 'simple_message'),
+                      task1.get_table_meta('desc_index', 'simple_message'))
+        self.assertEqual(task2.meta_dict['desc_index'], {})
+
+    def test_endpoints(self):
+        videx_service.videx_meta_singleton = VidexSingleton()
+        client = videx_service.app.test_client()
+        req_dict = _task_meta('task1')
+        digests = task_table_digests(req_dict)
+        digest = digests['desc_index']['simple_message']
+
+        resp = client.post('/check_table_digests', json={'digests': [digest]})
+        self.assertEqual(resp.json['data']['missing'], [digest])
+        stripped = strip_known_tables(_task_meta('task2'), digests)
+        self.assertEqual(client.post('/create_task_meta', json=stripped).json['code'], 409)
+
+        self.assertEqual(client.post('/create_task_meta', json=req_dict).json['code'], 200)
+        self.assertEqual(client.post('/check_table_digests', json={'digests': [digest]}).json['data']['missing'], [])
+        self.assertEqual(client.post('/create_task_meta', json=stripped).json['code'], 200)
+        self.assertIn(TABLE_REFS_KEY, stripped)
+        self.assertIn('task2', videx_service.videx_meta_singleton.cache)
+
+    def test_loaded_task_shared(self):
+        # tasks loaded by load_meta_by_task_id_func share tables with uploads and each other
+        def load_task(task_id):
+            return VidexDBTaskStats.from_dict(_task_meta(task_id))
+
+        singleton = VidexSingleton(load_meta_by_task_id_func=load_task)
+        # as posted by a client, e.g. fetch_metadata.py
+        singleton.add_task_meta(json.loads(load_task('task1').to_json()))
+        for task_id in ['task2', 'task3']:
+            req = {'item_type': 'videx_request', 'data': [],
+                   'properties': {'dbname': 'desc_index', 'table_name': 'simple_message', 'target_storage_engine':
+                                  'INNODB', 'function': 'virtual double ha_videx::scan_time()',
+                                  'videx_options': json.dumps({'task_id': task_id})}}
+            self.assertEqual(singleton.ask(req)[0], 200)
+        tables = [singleton.cache[task_id].db_tasks_stats.get_table_meta('desc_index', 'simple_message')
+                  for task_id in ['task1', 'task2', 'task3']]
+        self.assertIs(tables[1], tables[0])
+        self.assertIs(tables[2], tables[0])
+        self.assertIn(('desc_index', 'simple_message'), singleton.cache['task2'].shared_tables)
+        self.assertEqual(singleton.table_store.stats(), {'tables': 1, 'hits': 2, 'misses': 1})
+
+    def test_post_dedup(self):
+        videx_service.videx_meta_singleton = VidexSingleton()
+        client = videx_service.app.test_client()
+        posted = []
+
+        class _Response:
+            def __init__(self, resp):
+                self.status_code = resp.status_code
+                self._json = resp.json
+
+            def json(self):
+                return self._json
+
+        def post_json(url, req_dict, use_gzip):
+            posted.append(req_dict)
+            return _Response(client.post(url[len('http://127.0.0.1:5001'):], json=req_dict))
+
+        with patch('sub_platforms.sql_server.videx.videx_service._post_json', side_effect=post_json):
+            for task_id in ['task1', 'task2']:
+                resp = videx_service.post_add_videx_meta_dedup(
+                    VidexDBTaskStats.from_dict(_task_meta(task_id)), '127.0.0.1:5001', use_gzip=False)
+                self.assertEqual(resp.json()['code'], 200)
+        # task1 is sent in full, task2 by digest
+        self.assertEqual(len(posted[1]['meta_dict']['desc_index']), 1)
+        self.assertEqual(posted[3]['meta_dict']['desc_index'], {})
+        cache = videx_service.videx_meta_singleton.cache
+        self.assertIs(cache['task1'].db_tasks_stats.get_table_meta('desc_index', 'simple_message'),
+                      cache['task2'].db_tasks_stats.get_table_meta('desc_index', 'simple_message'))
+
+
+if __name__ == '__main__':
+    unittest.main()
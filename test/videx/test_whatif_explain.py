@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import json
+import re
+import unittest
+from typing import Dict, List
+
+from sub_platforms.sql_server.videx.videx_metadata import VidexDBTaskStats, VariablesAboutIndex
+from sub_platforms.sql_server.videx.videx_whatif import WhatIfExplainer, WhatIfExplainCache, parse_sql, \
+    simple_index, task_stats_version, rename_plan_keys
+
+BASE_INDEXES = {'t': ['PRIMARY'], 'u': ['PRIMARY']}
+
+
+class FakeCursor:
+    def __init__(self, server: 'FakeServer'):
+        self.server = server
+        self.result = None
+
+    def execute(self, sql, params=None):
+        self.server.sqls.append(sql)
+        match = re.match(r"ALTER TABLE `(\w+)`.`(\w+)` (.*)", sql)
+        if match:
+            indexes = self.server.indexes[match.group(2)]
+            for name in re.findall(r"DROP INDEX `(\w+)`", match.group(3)):
+                indexes.remove(name)
+            indexes.extend(re.findall(r"ADD KEY `(\w+)`", match.group(3)))
+        elif sql.startswith('EXPLAIN FORMAT=JSON'):
+            tables = [{'table': {'table_name': name, 'key': indexes[-1], 'possible_keys': list(indexes)}}
+                      for name, indexes in sorted(self.server.indexes.items()) if f" {name}" in sql]
+            plan = {'query_block': {'cost_info': {'query_cost': f"{10.0 * len(self.server.sqls):.2f}"},
+                                    'nested_loop': tables}}
+            self.result = (json.dumps(plan),)
+
+    def fetchone(self):
+        return self.result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeServer:
+    """VIDEX-MySQL holding the index names of tables t and u of d1"""
+
+    def __init__(self):
+        self.sqls: List[str] = []
+        self.indexes: Dict[str, List[str]] = {k: list(v) for k, v in BASE_INDEXES.items()}
+        self.closed = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed += 1
+
+
+class FakeEnv:
+    def __init__(self):
+        self.default_db = 'd1'
+        self.server = FakeServer()
+        self.mysql_util = self
+        self.mysql_command = self
+        self.loaded: List[str] = []
+
+    def get_connection(self):
+        return self.server
+
+    def get_table_indexes(self, db_name, table_name):
+        self.loaded.append(table_name)
+        return [simple_index(db_name, table_name, 'PRIMARY', ['id'], is_unique=True)]
+
+    def explains(self) -> List[str]:
+        return [sql for sql in self.server.sqls if sql.startswith('EXPLAIN')]
+
+
+SQL = "SELECT * FROM t WHERE a = 1 AND b > 2"
+
+
+class TestWhatIfExplain(unittest.TestCase):
+    def test_parse_sql(self):
+        fingerprint, tables = parse_sql(SQL, 'd1')
+        self.assertEqual(tables, [('d1', 't')])
+        # comments and formatting do not change the fingerprint, literals do
+        self.assertEqual(parse_sql("select *  from t /* advisor */\nwhere a=1 and b>2", 'd1')[0], fingerprint)
+        self.assertNotEqual(parse_sql("SELECT * FROM t WHERE a = 1 AND b > 3", 'd1')[0], fingerprint)
+        self.assertEqual(parse_sql("WITH c AS (SELECT * FROM d2.u) SELECT * FROM c JOIN t ON c.id = t.id", 'd1')[1],
+                         [('d1', 't'), ('d2', 'u')])
+
+    def test_rename_index_merge_keys(self):
+        plan = {'query_block': {'table': {
+            'table_name': 't', 'access_type': 'index_merge',
+            'possible_keys': ['idx_a', 'idx_a2', 'idx_b', 'union'],
+            'key': 'sort_union(idx_a,intersect(idx_a2,idx_b),union)', 'key_length': '5,5,5,5',
+            'used_key_parts': ['a', 'a2', 'b', 'c']}}}
+        names = {'idx_a': 'idx_x', 'idx_a2': 'idx_y', 'idx_b': 'idx_z', 'union': 'idx_union'}
+        table = rename_plan_keys(plan, names)['query_block']['table']
+        self.assertEqual(table['key'], 'sort_union(idx_x,intersect(idx_y,idx_z),idx_union)')
+        self.assertEqual(table['possible_keys'], ['idx_x', 'idx_y', 'idx_z', 'idx_union'])
+        self.assertEqual(table['used_key_parts'], ['a', 'a2', 'b', 'c'])
+        self.assertEqual(plan['query_block']['table']['key'], 'sort_union(idx_a,intersect(idx_a2,idx_b),union)')
+        self.assertEqual(rename_plan_keys({'key': 'idx_a'}, {'idx_a': 'idx_b', 'idx_b': 'idx_a'}), {'key': 'idx_b'})
+        self.assertEqual(rename_plan_keys({'key': 'union(idx_a,idx_b)'}, {'idx_a': 'idx_b', 'idx_b': 'idx_a'}),
+                         {'key': 'union(idx_b,idx_a)'})
+
+    def test_task_stats_version(self):
+        task = VidexDBTaskStats(task_id='t1', meta_dict={}, stats_dict={}, db_config=VariablesAboutIndex())
+        other_task_id = VidexDBTaskStats(task_id='t2', meta_dict={}, stats_dict={}, db_config=VariablesAboutIndex())
+        self.assertEqual(task_stats_version(task), task_stats_version(other_task_id))
+        changed = VidexDBTaskStats(task_id='t1', meta_dict={}, stats_dict={'d1': {}}, db_config=VariablesAboutIndex())
+        self.assertNotEqual(task_stats_version(task), task_stats_version(changed))
+
+    def test_repeated_configurations(self):
+        env = FakeEnv()
+        explainer = WhatIfExplainer(env, stats_version='v1', videx_py_ip_port='10.0.0.1:5001',
+                                    videx_options={'task_id': 't1'})
+        res = explainer.explain(SQL)
+        self.assertFalse(res['cached'])
+        self.assertEqual(res['plan']['query_block']['nested_loop'][0]['table']['key'], 'PRIMARY')
+
+        explainer.add_index(simple_index('d1', 't', 'idx_a_b', ['a', 'b']))
+        res_ab = explainer.explain(SQL)
+        self.assertFalse(res_ab['cached'])
+        self.assertEqual(res_ab['plan']['query_block']['nested_loop'][0]['table']['key'], 'idx_a_b')
+        self.assertEqual(env.server.indexes['t'], ['PRIMARY', 'idx_a_b'])
+
+        # back to the base configuration: cached, the index is not dropped yet
+        explainer.reset()
+        n_sqls = len(env.server.sqls)
+        self.assertEqual(explainer.explain("select * from t where a=1 and b>2 -- again"),
+                         {**res, 'cached': True})
+        self.assertEqual(len(env.server.sqls), n_sqls)
+
+        # the same index under another name: cached and renamed
+        explainer.add_index(simple_index('d1', 't', 'idx_tmp_x1', ['a', 'b']))
+        res_x1 = explainer.explain(SQL)
+        self.assertTrue(res_x1['cached'])
+        self.assertEqual(res_x1['cost'], res_ab['cost'])
+        self.assertEqual(res_x1['plan']['query_block']['nested_loop'][0]['table'],
+                         {'table_name': 't', 'key': 'idx_tmp_x1', 'possible_keys': ['PRIMARY', 'idx_tmp_x1']})
+        self.assertEqual(len(env.server.sqls), n_sqls)
+
+        # a new configuration applies the pending changes in one ALTER TABLE
+        explainer.drop_index('d1', 't', 'idx_tmp_x1')
+        explainer.add_index(simple_index('d1', 't', 'idx_b', ['b']))
+        self.assertFalse(explainer.explain(SQL)['cached'])
+        self.assertIn("ALTER TABLE `d1`.`t` DROP INDEX `idx_a_b`, ADD KEY `idx_b` (`b`)", env.server.sqls)
+        self.assertEqual(env.server.indexes['t'], ['PRIMARY', 'idx_b'])
+
+        # other statistics are not cached
+        explainer.stats_version = 'v2'
+        self.assertFalse(explainer.explain(SQL)['cached'])
+
+        self.assertEqual(explainer.cache.stats(), {'entries': 4, 'hits': 2, 'misses': 4})
+        self.assertEqual(env.loaded, ['t'])
+        self.assertEqual(len(env.explains()), 4)
+        self.assertEqual(env.server.sqls[:2], ["SET @VIDEX_SERVER='10.0.0.1:5001';",
+                                               "SET @VIDEX_OPTIONS='{\"task_id\": \"t1\"}';"])
+
+        explainer.close()
+        self.assertEqual(env.server.indexes, BASE_INDEXES)
+        self.assertEqual(env.server.closed, 1)
+
+    def test_tables_of_other_queries_not_altered(self):
+        env = FakeEnv()
+        explainer = WhatIfExplainer(env)
+        explainer.add_index(simple_index('d1', 'u', 'idx_c', ['c']))
+        explainer.explain(SQL)
+        self.assertEqual(env.server.indexes['u'], ['PRIMARY'])
+        res = explainer.explain("SELECT * FROM t JOIN u ON t.id = u.id WHERE u.c = 1")
+        self.assertEqual(env.server.indexes['u'], ['PRIMARY', 'idx_c'])
+        self.assertEqual([item['table']['key'] for item in res['plan']['query_block']['nested_loop']],
+                         ['PRIMARY', 'idx_c'])
+        with self.assertRaises(ValueError):
+            explainer.add_index(simple_index('d1', 'u', 'idx_c', ['a']))
+        with self.assertRaises(ValueError):
+            explainer.drop_index('d1', 't', 'idx_c')
+
+    def test_shared_cache_and_ambiguous_names(self):
+        cache = WhatIfExplainCache(max_entries=1)
+        env1, env2 = FakeEnv(), FakeEnv()
+        sql = "SELECT * FROM t JOIN u ON t.id = u.id WHERE t.a = 1 AND u.a = 1"
+        explainer1 = WhatIfExplainer(env1, cache=cache)
+        explainer1.add_index(simple_index('d1', 't', 'idx_a', ['a']))
+        explainer1.add_index(simple_index('d1', 'u', 'idx_a', ['a']))
+        self.assertFalse(explainer1.explain(sql)['cached'])
+
+        explainer2 = WhatIfExplainer(env2, cache=cache)
+        explainer2.add_index(simple_index('d1', 't', 'idx_a', ['a']))
+        explainer2.add_index(simple_index('d1', 'u', 'idx_a', ['a']))
+        self.assertTrue(explainer2.explain(sql)['cached'])
+        self.assertEqual(env2.explains(), [])
+
+        # idx_a of the cached plan would be renamed to both idx_t_a and idx_u_a, explain again
+        explainer2.reset()
+        explainer2.add_index(simple_index('d1', 't', 'idx_t_a', ['a']))
+        explainer2.add_index(simple_index('d1', 'u', 'idx_u_a', ['a']))
+        self.assertFalse(explainer2.explain(sql)['cached'])
+        # the oldest entry is evicted
+        self.assertFalse(explainer1.explain(SQL)['cached'])
+        self.assertEqual(cache.stats()['entries'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
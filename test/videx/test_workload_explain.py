@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+SPDX-License-Identifier: MIT
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from typing import List
+
+from sub_platforms.sql_server.videx.videx_utils import GT_Table_Return
+from sub_platforms.sql_server.videx.videx_workload import run_workload_explain, iter_workload_results, \
+    load_gt_rec_in_ranges, explain_diff_report
+
+with open(os.path.join(os.path.dirname(__file__), 'data/test_trace_range_rows_gt1.json')) as _f:
+    TRACE = json.load(_f)
+
+EXPLAIN_COLUMNS = ['id', 'select_type', 'table', 'type', 'possible_keys', 'key', 'key_len', 'ref', 'rows']
+
+
+class FakeCursor:
+    def __init__(self, con: 'FakeConnection'):
+        self.con = con
+        self.rowcount = 0
+        self.description = None
+        self.result = []
+
+    def execute(self, sql, params=None):
+        self.con.sqls.append(sql)
+        if sql.startswith('EXPLAIN'):
+            if 'bad' in sql:
+                raise Exception(1064, 'You have an error in your SQL syntax')
+            self.description = tuple((col, None) for col in EXPLAIN_COLUMNS)
+            key = self.con.env.key_of(sql)
+            self.result = [(1, 'SIMPLE', 'item', 'range', 'idx_I_IM_ID', key, '5', None, 21)]
+        elif sql.startswith('SELECT trace'):
+            self.result = [(json.dumps(TRACE),)]
+        else:
+            self.result = []
+        self.rowcount = len(self.result)
+
+    def fetchall(self):
+        return tuple(self.result)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, env: 'FakeEnv'):
+        self.env = env
+        self.sqls: List[str] = []
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEnv:
+    def __init__(self, instance: str, mismatch_keyword: str = None):
+        self.instance = instance
+        self.mysql_util = self
+        self.mismatch_keyword = mismatch_keyword
+        self.lock = threading.Lock()
+        self.connections: List[FakeConnection] = []
+
+    def get_connection(self):
+        con = FakeConnection(self)
+        with self.lock:
+            self.connections.append(con)
+        return con
+
+    def key_of(self, sql):
+        return 'PRIMARY' if self.mismatch_keyword and self.mismatch_keyword in sql else 'idx_I_IM_ID'
+
+
+class TestWorkloadExplain(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output_file = os.path.join(self.tmp_dir, 'workload_explain.jsonl.gz')
+        self.sqls = [f"SELECT * FROM item WHERE I_IM_ID IN (70, 80) AND I_ID > {i}" for i in range(10)]
+        self.sqls[3] = "SELECT * FROM item WHERE I_IM_ID IN (70, 80) AND bad"
+        self.sqls[5] += " /* mismatch */"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_innodb_and_videx(self):
+        innodb_env, videx_env = FakeEnv('innodb:3306'), FakeEnv('videx:13308', mismatch_keyword='mismatch')
+        res = run_workload_explain(innodb_env, self.sqls, self.output_file, videx_env=videx_env, n_workers=3,
+                                   videx_py_ip_port='10.0.0.1:5001', videx_options={'task_id': 't1'})
+        self.assertEqual(res['n_sqls'], 10)
+        self.assertEqual(res['n_errors'], 1)
+        # no GT of the SQL failed to explain
+        self.assertEqual(res['n_gt'], 27)
+        self.assertAlmostEqual(res['avg_score'], 8 / 9)
+
+        for env in [innodb_env, videx_env]:
+            self.assertLessEqual(len(env.connections), 3)
+            self.assertTrue(all(con.closed for con in env.connections))
+            # optimizer_trace and the VIDEX session variables are set once per connection
+            for con in env.connections:
+                self.assertEqual(sum(sql.startswith('SET SESSION optimizer_trace') for sql in con.sqls), 1)
+                self.assertEqual(sum(sql.startswith('SET @VIDEX_SERVER') for sql in con.sqls), int(env is videx_env))
+                self.assertEqual(sum(sql.startswith('SET @VIDEX_OPTIONS') for sql in con.sqls), int(env is videx_env))
+            self.assertEqual(sum(sql.startswith('EXPLAIN') for con in env.connections for sql in con.sqls), 10)
+        self.assertFalse(any('@VIDEX' in sql for con in innodb_env.connections for sql in con.sqls))
+        self.assertTrue(any("@VIDEX_SERVER='10.0.0.1:5001'" in sql for sql in videx_env.connections[0].sqls))
+
+        records = sorted(iter_workload_results(self.output_file), key=lambda r: r['idx'])
+        self.assertEqual([r['idx'] for r in records], list(range(10)))
+        self.assertEqual(records[0]['sql'], self.sqls[0])
+        self.assertEqual(records[0]['innodb']['explain'][0]['key'], 'idx_I_IM_ID')
+        self.assertIsNone(records[0]['innodb']['error'])
+        self.assertEqual(records[0]['compare']['score'], 1.0)
+        self.assertEqual(records[0]['innodb']['gt_rec_in_ranges'][0]['ranges'], ['I_IM_ID = 70', 'I_IM_ID = 80'])
+        self.assertIn('syntax', records[3]['innodb']['error'])
+        self.assertEqual(records[3]['innodb']['gt_rec_in_ranges'], [])
+        self.assertNotIn('compare', records[3])
+        self.assertEqual(records[5]['compare']['diff']['0']['key'], {'expected': 'idx_I_IM_ID', 'actual': 'PRIMARY'})
+
+        report = explain_diff_report(self.output_file)
+        self.assertEqual((report['n_sqls'], report['n_compared'], report['n_matched']), (10, 9, 8))
+        self.assertEqual([m['idx'] for m in report['mismatches']], [5])
+
+    def test_gt_rec_in_ranges(self):
+        res = run_workload_explain(FakeEnv('innodb:3306'), self.sqls, self.output_file, n_workers=2)
+        self.assertIsNone(res['avg_score'])
+        records = list(iter_workload_results(self.output_file))
+        self.assertTrue(all('videx' not in r and 'compare' not in r for r in records))
+
+        # the same ranges in each SQL are kept once
+        gt = load_gt_rec_in_ranges(self.output_file)
+        self.assertEqual(len(gt), 3)
+        self.assertEqual(gt[0]['index'], 'idx_I_IM_ID')
+        self.assertEqual(gt[0]['rows'], 21)
+        gt_dict = GT_Table_Return.parse_raw_gt_rec_in_range_list(gt)
+        self.assertIn('item', gt_dict)
+
+        with gzip.open(self.output_file, 'rt') as f:
+            self.assertEqual(len(f.read().splitlines()), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()